@@ -0,0 +1,160 @@
+"""
+Async function views with DRF request handling.
+
+DRF's APIView is synchronous: under ASGI every request it serves holds a
+thread until the view returns, including the seconds spent waiting for the
+model. async_api_view() runs a coroutine view directly on the event loop
+while keeping what the AI endpoints rely on from @api_view:
+
+- request.data parsed with the configured DRF parsers (400 on bad input)
+- DRF authentication, permission_classes and throttle_classes, evaluated on
+  a worker thread because they may hit the database or the cache
+- returning a DRF Response (serialized with DRF's JSON encoder)
+- the APIView class in view.cls, so @extend_schema and drf-spectacular keep
+  documenting the endpoint
+
+event_stream_response() turns an async iterator of (event, data) pairs into
+a Server-Sent Events response for the streaming variants of these views.
+"""
+
+import json
+import logging
+from functools import wraps
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.decorators import api_view
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+STREAM_QUERY_VALUES = ('1', 'true', 'yes')
+
+
+def _error(exc: exceptions.APIException) -> JsonResponse:
+    response = JsonResponse({'detail': exc.detail}, status=exc.status_code, encoder=JSONEncoder)
+    wait = getattr(exc, 'wait', None)
+    if wait is not None:
+        response['Retry-After'] = str(int(wait))
+    return response
+
+
+def _check_request(view, request: Request) -> None:
+    """Authentication, permissions and throttling in APIView.initial() order."""
+    request.user
+    for permission in view.get_permissions():
+        if not permission.has_permission(request, view):
+            if request.authenticators and not request.successful_authenticator:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    waits = [throttle.wait() for throttle in view.get_throttles() if not throttle.allow_request(request, view)]
+    if waits:
+        waits = [wait for wait in waits if wait is not None]
+        raise exceptions.Throttled(max(waits, default=None))
+
+
+def async_api_view(http_method_names: Optional[List[str]] = None) -> Callable:
+    """
+    Decorator for async function views, used like @api_view.
+
+    Apply it below @extend_schema and above @permission_classes /
+    @throttle_classes, exactly where @api_view would go.
+
+    Args:
+        http_method_names: Allowed methods (default ['GET'])
+
+    Returns:
+        Decorator turning an ``async def view(request, ...)`` into an async
+        Django view
+    """
+    http_method_names = [method.upper() for method in (http_method_names or ['GET'])]
+
+    def decorator(func):
+        drf_view = api_view(http_method_names)(func)
+        view_class = drf_view.cls
+
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            if request.method not in http_method_names:
+                return _error(exceptions.MethodNotAllowed(request.method))
+
+            api = view_class(**drf_view.initkwargs)
+            api.args, api.kwargs = args, kwargs
+            drf_request = Request(
+                request,
+                parsers=api.get_parsers(),
+                authenticators=api.get_authenticators(),
+                negotiator=api.get_content_negotiator(),
+                parser_context=api.get_parser_context(request),
+            )
+            api.request = drf_request
+
+            try:
+                # Body parsing only reads the already-buffered request body
+                drf_request.data
+                await sync_to_async(_check_request)(api, drf_request)
+            except exceptions.APIException as exc:
+                return _error(exc)
+
+            response = await func(drf_request, *args, **kwargs)
+            if isinstance(response, Response):
+                json_response = JsonResponse(
+                    response.data, status=response.status_code, encoder=JSONEncoder, safe=False
+                )
+                for header, value in response.items():
+                    if header.lower() != 'content-type':
+                        json_response[header] = value
+                return json_response
+            return response
+
+        view.cls = view_class
+        view.initkwargs = drf_view.initkwargs
+        view.csrf_exempt = True
+        return view
+
+    return decorator
+
+
+def wants_event_stream(request: Request) -> bool:
+    """Whether the client asked for Server-Sent Events (?stream=true or Accept)."""
+    if request.query_params.get('stream', '').lower() in STREAM_QUERY_VALUES:
+        return True
+    return 'text/event-stream' in request.META.get('HTTP_ACCEPT', '')
+
+
+def _sse_frame(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+def event_stream_response(events: AsyncIterator[Tuple[str, Any]]) -> StreamingHttpResponse:
+    """
+    Server-Sent Events response for an async iterator of (event, data) pairs.
+
+    Each pair becomes one ``event:``/``data:`` frame with JSON data, sent as
+    soon as it is produced. An exception while iterating ends the stream
+    with an ``error`` event.
+
+    Args:
+        events: Async iterator such as AIAssistantService.astream_contextual_help()
+
+    Returns:
+        StreamingHttpResponse with content type text/event-stream
+    """
+    async def frames():
+        try:
+            async for event, data in events:
+                yield _sse_frame(event, data)
+        except Exception as e:
+            logger.error(f"Event stream failed: {e}", exc_info=True)
+            yield _sse_frame('error', {'error': 'Stream failed', 'message': str(e)})
+
+    response = StreamingHttpResponse(frames(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -130,6 +130,11 @@ class UMLCommandRequestSerializer(serializers.Serializer):
         default=None,
         help_text="AI model to use for processing (defaults to llama4-maverick if not specified)"
     )
+    critical = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Run the fallback model alongside the selected one from the start and keep the first answer"
+    )
     
     def validate_command(self, value):
         """Validate command content."""
@@ -1,5 +1,14 @@
 from .cache_service import CacheService
 from .rate_limiter import RateLimiter
+from .single_flight import SingleFlight
+from .diagram_context import count_tokens, render_diagram_context
+from .json_stream import JSONStreamExtractor, extract_json
+from .llm_executor import run_in_llm_pool
+from .hedging import ModelCallStats
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .llm_clients import PoolStats, get_bedrock_client
+from .vision_cache import VisionResultCache
+from .image_preprocessing import ImagePreprocessor
 from .openai_service import OpenAIService
 from .ai_assistant_service import AIAssistantService
 from .command_processor_service import UMLCommandProcessorService
@@ -15,10 +24,24 @@ from .llama4_command_service import Llama4CommandService
 from .nova_command_service import NovaCommandService
 from .model_router_service import ModelRouterService
 from .vision_model_router import VisionModelRouterService
+from .registry import ServiceRegistry, aget_service, get_service, warm_services
 
 __all__ = [
     "CacheService",
     "RateLimiter",
+    "SingleFlight",
+    "render_diagram_context",
+    "count_tokens",
+    "JSONStreamExtractor",
+    "extract_json",
+    "run_in_llm_pool",
+    "ModelCallStats",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "PoolStats",
+    "get_bedrock_client",
+    "VisionResultCache",
+    "ImagePreprocessor",
     "OpenAIService",
     "AIAssistantService",
     "UMLCommandProcessorService",
@@ -30,6 +53,10 @@ __all__ = [
     "NovaCommandService",
     "ModelRouterService",
     "VisionModelRouterService",
+    "ServiceRegistry",
+    "get_service",
+    "aget_service",
+    "warm_services",
     "ImageValidationError",
     "AWSBedrockError",
 ]
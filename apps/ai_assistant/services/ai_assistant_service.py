@@ -1,8 +1,11 @@
+import hashlib
 import logging
 import json
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from asgiref.sync import sync_to_async
 from .openai_service import OpenAIService
+from .diagram_context import STYLE_ASSISTANT, render_diagram_context
 from apps.uml_diagrams.models import UMLDiagram
 
 
@@ -11,9 +14,9 @@ class AIAssistantService:
     AI Assistant service for contextual help about UML diagrams and system functionality.
     """
     
-    def __init__(self):
+    def __init__(self, openai_service: Optional[OpenAIService] = None):
         try:
-            self.openai_service = OpenAIService()
+            self.openai_service = openai_service or OpenAIService()
             self.openai_available = True
         except ImportError as e:
             self.openai_service = None
@@ -65,25 +68,9 @@ class AIAssistantService:
         try:
 
             if not self.openai_available:
-                return {
-                    "answer": "El asistente de IA no está disponible en este momento. Por favor, contacta al administrador del sistema para configurar el servicio OpenAI.",
-                    "suggestions": ["Contactar administrador", "Consultar documentación"],
-                    "related_features": ["uml_editing", "system_help"]
-                }
+                return self._unavailable_response()
 
-            diagram_context = ""
-            diagram_data = None
-            
-            if diagram_id:
-                diagram_data = self._get_diagram_data(diagram_id)
-                diagram_context = self._build_diagram_context(diagram_data)
-
-            prompt = self._select_prompt_template(context_type, user_question, diagram_context)
-
-            messages = [
-                {"role": "system", "content": self.system_context},
-                {"role": "user", "content": prompt}
-            ]
+            messages, diagram_data = self._prepare_help_request(user_question, diagram_id, context_type)
             
             response = self.openai_service.call_api(messages)
 
@@ -94,16 +81,103 @@ class AIAssistantService:
             return formatted_response
             
         except Exception as e:
-            self.logger.error(f"Error in get_contextual_help: {e}", exc_info=True)
-            self.logger.error(f"Question was: {user_question}")
-            self.logger.error(f"Diagram ID: {diagram_id}, Context type: {context_type}")
-            return {
-                "answer": "Lo siento, hubo un error al procesar tu pregunta. Por favor, inténtalo de nuevo.",
-                "suggestions": ["Reformular la pregunta", "Verificar conexión"],
-                "related_features": [],
-                "error_type": str(type(e).__name__),
-                "error_message": str(e) if __debug__ else "Internal error"
-            }
+            return self._error_response(e, user_question, diagram_id, context_type)
+
+    async def aget_contextual_help(self, user_question: str, diagram_id: Optional[str] = None,
+                                   context_type: str = "general") -> Dict:
+        """
+        Async variant of get_contextual_help for async views.
+
+        The diagram is loaded on a worker thread (ORM access) and the model
+        call is awaited with OpenAIService.acall_api.
+        """
+        try:
+
+            if not self.openai_available:
+                return self._unavailable_response()
+
+            messages, diagram_data = await sync_to_async(self._prepare_help_request)(
+                user_question, diagram_id, context_type
+            )
+
+            response = await self.openai_service.acall_api(messages)
+
+            formatted_response = self._format_response(response, context_type, diagram_data)
+
+            self.logger.info(f"AI Assistant responded to question: {user_question[:50]}...")
+
+            return formatted_response
+
+        except Exception as e:
+            return self._error_response(e, user_question, diagram_id, context_type)
+
+    async def astream_contextual_help(self, user_question: str, diagram_id: Optional[str] = None,
+                                      context_type: str = "general") -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of get_contextual_help.
+
+        Yields ("token", {"delta": text}) as the answer is generated, then
+        ("done", response) with the same dict get_contextual_help returns.
+        """
+        if not self.openai_available:
+            yield "done", self._unavailable_response()
+            return
+
+        try:
+            messages, diagram_data = await sync_to_async(self._prepare_help_request)(
+                user_question, diagram_id, context_type
+            )
+
+            parts = []
+            async for delta in self.openai_service.astream_api(messages):
+                parts.append(delta)
+                yield "token", {"delta": delta}
+
+            response = self._format_response("".join(parts), context_type, diagram_data)
+            self.logger.info(f"AI Assistant streamed answer to question: {user_question[:50]}...")
+
+        except Exception as e:
+            response = self._error_response(e, user_question, diagram_id, context_type)
+
+        yield "done", response
+
+    def _prepare_help_request(self, user_question: str, diagram_id: Optional[str],
+                              context_type: str) -> Tuple[List[Dict], Optional[Dict]]:
+        """Build the model messages, loading the diagram when one is given."""
+        diagram_context = ""
+        diagram_data = None
+        
+        if diagram_id:
+            diagram_data = self._get_diagram_data(diagram_id)
+            diagram_context = self._build_diagram_context(diagram_data, focus=user_question)
+
+        prompt = self._select_prompt_template(context_type, user_question, diagram_context)
+
+        messages = [
+            {"role": "system", "content": self.system_context},
+            {"role": "user", "content": prompt}
+        ]
+        return messages, diagram_data
+
+    def _unavailable_response(self) -> Dict:
+        return {
+            "answer": "El asistente de IA no está disponible en este momento. Por favor, contacta al administrador del sistema para configurar el servicio OpenAI.",
+            "suggestions": ["Contactar administrador", "Consultar documentación"],
+            "related_features": ["uml_editing", "system_help"]
+        }
+
+    def _error_response(self, e: Exception, user_question: str, diagram_id: Optional[str],
+                        context_type: str) -> Dict:
+        self.logger.error(f"Error in get_contextual_help: {e}", exc_info=True)
+        self.logger.error(f"Question was: {user_question}")
+        self.logger.error(f"Diagram ID: {diagram_id}, Context type: {context_type}")
+        return {
+            "answer": "Lo siento, hubo un error al procesar tu pregunta. Por favor, inténtalo de nuevo.",
+            "suggestions": ["Reformular la pregunta", "Verificar conexión"],
+            "related_features": [],
+            "error_type": str(type(e).__name__),
+            "error_message": str(e) if __debug__ else "Internal error"
+        }
     
     def _get_diagram_data(self, diagram_id: str) -> Optional[Dict]:
         """Retrieve diagram data by ID."""
@@ -115,6 +189,7 @@ class AIAssistantService:
                 'description': diagram.description,
                 'diagram_type': diagram.diagram_type,
                 'content': diagram.content,
+                'content_hash': diagram.get_content_hash(),
                 'classes': diagram.get_classes(),
                 'relationships': diagram.get_relationships(),
                 'active_sessions': diagram.active_sessions,
@@ -127,98 +202,17 @@ class AIAssistantService:
             self.logger.error(f"Error retrieving diagram {diagram_id}: {e}")
             return None
     
-    def _build_diagram_context(self, diagram_data: Optional[Dict]) -> str:
+    def _build_diagram_context(self, diagram_data: Optional[Dict], focus: Optional[str] = None) -> str:
         """Build context from current diagram data."""
-        if not diagram_data:
-            return ""
-        
-        classes = diagram_data.get('classes', [])
-        relationships = diagram_data.get('relationships', [])
-        active_sessions = diagram_data.get('active_sessions', [])
-
-        class_details = []
-        for cls in classes:
-            if isinstance(cls, dict):
-                class_name = cls.get('name', cls.get('label', 'Unknown'))
-                attributes = cls.get('attributes', [])
-                methods = cls.get('methods', [])
-                is_abstract = cls.get('isAbstract', False)
-
-                attr_list = []
-                for attr in attributes:
-                    if isinstance(attr, dict):
-                        attr_name = attr.get('name', 'unknown')
-                        attr_type = attr.get('type', 'unknown')
-                        visibility = attr.get('visibility', 'private')
-                        attr_list.append(f"{visibility} {attr_name}: {attr_type}")
-
-                method_list = []
-                for method in methods:
-                    if isinstance(method, dict):
-                        method_name = method.get('name', 'unknown')
-                        return_type = method.get('returnType', 'void')
-                        visibility = method.get('visibility', 'public')
-                        method_list.append(f"{visibility} {method_name}(): {return_type}")
-                
-                class_info = f"  * {class_name}"
-                if is_abstract:
-                    class_info += " (abstracta)"
-                if attr_list:
-                    class_info += f"\n    - Atributos: {', '.join(attr_list)}"
-                if method_list:
-                    class_info += f"\n    - Métodos: {', '.join(method_list)}"
-                
-                class_details.append(class_info)
-
-        relationship_details = []
-        for rel in relationships:
-            if isinstance(rel, dict):
-                rel_type = rel.get('type', rel.get('relationship_type', 'Unknown'))
-                source = rel.get('source_id', 'Unknown')
-                target = rel.get('target_id', 'Unknown')
-                source_mult = rel.get('source_multiplicity', '1')
-                target_mult = rel.get('target_multiplicity', '1')
-
-                source_name = source
-                target_name = target
-                for cls in classes:
-                    if cls.get('id') == source:
-                        source_name = cls.get('name', cls.get('label', source))
-                    if cls.get('id') == target:
-                        target_name = cls.get('name', cls.get('label', target))
-                
-                relationship_details.append(f"  * {source_name} --[{rel_type}]-> {target_name} ({source_mult}:{target_mult})")
-
-        complexity = "Simple"
-        total_attributes = sum(len(cls.get('attributes', [])) for cls in classes if isinstance(cls, dict))
-        if len(classes) > 10 or total_attributes > 30:
-            complexity = "Complejo"
-        elif len(classes) > 5 or total_attributes > 15:
-            complexity = "Moderado"
-
-        context = f"""
-        CONTEXTO DEL DIAGRAMA ACTUAL:
-        
-        INFORMACIÓN GENERAL:
-        - Título: "{diagram_data.get('title', 'Sin título')}"
-        - Tipo: {diagram_data.get('diagram_type', 'CLASS')}
-        - Nivel de complejidad: {complexity}
-        - Última modificación: {diagram_data.get('last_modified', 'Desconocida')}
-        - Sesiones activas: {len(active_sessions)} usuarios colaborando
-        
-        CLASES DEFINIDAS ({len(classes)}):
-        {chr(10).join(class_details) if class_details else '  * No hay clases definidas todavía'}
-        
-        RELACIONES ({len(relationships)}):
-        {chr(10).join(relationship_details) if relationship_details else '  * No hay relaciones definidas todavía'}
-        
-        OBSERVACIONES:
-        - Total de atributos en el sistema: {sum(len(cls.get('attributes', [])) for cls in classes if isinstance(cls, dict))}
-        - Total de métodos en el sistema: {sum(len(cls.get('methods', [])) for cls in classes if isinstance(cls, dict))}
-        - Clases abstractas: {sum(1 for cls in classes if isinstance(cls, dict) and cls.get('isAbstract', False))}
-        """
-        
-        return context
+        content_key = None
+        if diagram_data and diagram_data.get('content_hash'):
+            # Content is covered by its stored hash; only the small header fields are serialized
+            header = {
+                key: value for key, value in diagram_data.items()
+                if key not in ('content', 'classes', 'relationships')
+            }
+            content_key = hashlib.sha256(json.dumps(header, sort_keys=True, default=str).encode()).hexdigest()
+        return render_diagram_context(diagram_data, STYLE_ASSISTANT, focus=focus, content_key=content_key)
     
     def _select_prompt_template(self, context_type: str, user_question: str, diagram_context: str) -> str:
         """Select appropriate prompt template based on context type."""
@@ -3,18 +3,43 @@ Servicio de caché Redis para AI Assistant.
 
 Proporciona funcionalidad de caché con TTL para reducir costos de API
 y mejorar tiempos de respuesta para consultas repetidas.
+
+Dos niveles:
+
+- Local: LRU en memoria del proceso, acotado por número de entradas y por
+  bytes, con un TTL corto (AI_CACHE_LOCAL_TTL) que limita cuánto puede
+  servir un valor invalidado desde otro proceso.
+- Compartido: el caché de Django (Redis, o la tabla de base de datos como
+  respaldo). Los valores grandes se guardan comprimidos con zlib.
 """
 
+import fnmatch
 import hashlib
 import json
 import logging
-from typing import Any, Optional
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 
 from django.core.cache import cache
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_LOCAL_MAX_ENTRIES = 1024
+DEFAULT_LOCAL_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_LOCAL_TTL = 30
+DEFAULT_COMPRESS_MIN_BYTES = 4096
+DEFAULT_CLEAR_BATCH_SIZE = 500
+
+# Prefijo de los valores comprimidos en el nivel compartido
+COMPRESSED_MAGIC = b"aiz1:"
+
+COUNTER_NAMES = ("local_hits", "shared_hits", "misses", "sets", "evictions")
+
 
 class CacheService:
     """Servicio de gestión de caché Redis con TTL configurable."""
@@ -22,6 +47,12 @@ class CacheService:
     DEFAULT_TTL = 300  # 5 minutos
     CACHE_PREFIX = "ai_assistant"
 
+    _lock = threading.Lock()
+    # cache_key -> (expira_en, pickle del valor, method)
+    _local: "OrderedDict[str, tuple]" = OrderedDict()
+    _local_bytes = 0
+    _stats: Dict[str, Dict[str, int]] = {}
+
     @classmethod
     def _generate_cache_key(cls, key_components: dict) -> str:
         """
@@ -31,21 +62,101 @@ class CacheService:
         key_hash = hashlib.sha256(key_string.encode()).hexdigest()
         return f"{cls.CACHE_PREFIX}:{key_hash}"
 
+    @classmethod
+    def _count(cls, method: str, name: str, amount: int = 1) -> None:
+        """Incrementa un contador por method; llamar con _lock tomado."""
+        counters = cls._stats.get(method)
+        if counters is None:
+            counters = cls._stats[method] = dict.fromkeys(COUNTER_NAMES, 0)
+        counters[name] += amount
+
+    @classmethod
+    def _local_get(cls, cache_key: str, method: str) -> Optional[bytes]:
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._local.get(cache_key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                cls._local_drop(cache_key)
+                return None
+            cls._local.move_to_end(cache_key)
+            cls._count(method, "local_hits")
+            return entry[1]
+
+    @classmethod
+    def _local_put(cls, cache_key: str, payload: bytes, method: str, ttl: int) -> None:
+        max_entries = getattr(settings, "AI_CACHE_LOCAL_MAX_ENTRIES", DEFAULT_LOCAL_MAX_ENTRIES)
+        max_bytes = getattr(settings, "AI_CACHE_LOCAL_MAX_BYTES", DEFAULT_LOCAL_MAX_BYTES)
+        local_ttl = min(ttl, getattr(settings, "AI_CACHE_LOCAL_TTL", DEFAULT_LOCAL_TTL))
+        if max_entries <= 0 or local_ttl <= 0 or len(payload) > max_bytes:
+            return
+
+        with cls._lock:
+            cls._local_drop(cache_key)
+            cls._local[cache_key] = (time.monotonic() + local_ttl, payload, method)
+            cls._local_bytes += len(payload)
+            while len(cls._local) > max_entries or cls._local_bytes > max_bytes:
+                evicted_key, evicted = next(iter(cls._local.items()))
+                cls._local_drop(evicted_key)
+                cls._count(evicted[2], "evictions")
+
+    @classmethod
+    def _local_drop(cls, cache_key: str) -> None:
+        """Quita una entrada del nivel local; llamar con _lock tomado."""
+        entry = cls._local.pop(cache_key, None)
+        if entry is not None:
+            cls._local_bytes -= len(entry[1])
+
+    @classmethod
+    def _encode_shared(cls, payload: bytes, value: Any) -> Any:
+        """Valor a guardar en el nivel compartido: comprimido si es grande."""
+        min_bytes = getattr(settings, "AI_CACHE_COMPRESS_MIN_BYTES", DEFAULT_COMPRESS_MIN_BYTES)
+        if min_bytes and len(payload) >= min_bytes:
+            return COMPRESSED_MAGIC + zlib.compress(payload)
+        return value
+
+    @classmethod
+    def _decode_shared(cls, stored: Any) -> Any:
+        if isinstance(stored, bytes) and stored.startswith(COMPRESSED_MAGIC):
+            return pickle.loads(zlib.decompress(stored[len(COMPRESSED_MAGIC):]))
+        return stored
+
     @classmethod
     def get(cls, key_components: dict) -> Optional[Any]:
         """
         Obtiene valor del caché.
+
+        Consulta primero el nivel local y después el compartido; un acierto
+        en el compartido se copia al local. Cada llamada devuelve una copia
+        nueva del valor.
         """
         cache_key = cls._generate_cache_key(key_components)
+        method = str(key_components.get("method", "unknown"))
+
+        payload = cls._local_get(cache_key, method)
+        if payload is not None:
+            return pickle.loads(payload)
+
         try:
-            value = cache.get(cache_key)
-            if value is not None:
-                logger.info(f"Cache hit: {cache_key[:50]}...")
-            return value
+            value = cls._decode_shared(cache.get(cache_key))
         except Exception as e:
             logger.warning(f"Cache get error: {e}")
             return None
 
+        if value is None:
+            with cls._lock:
+                cls._count(method, "misses")
+            return None
+
+        logger.info(f"Cache hit: {cache_key[:50]}...")
+        with cls._lock:
+            cls._count(method, "shared_hits")
+        cls._local_put(
+            cache_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), method, cls.DEFAULT_TTL
+        )
+        return value
+
     @classmethod
     def set(
         cls, key_components: dict, value: Any, ttl: int = DEFAULT_TTL
@@ -54,20 +165,28 @@ class CacheService:
         Guarda valor en caché con TTL.
         """
         cache_key = cls._generate_cache_key(key_components)
+        method = str(key_components.get("method", "unknown"))
         try:
-            cache.set(cache_key, value, timeout=ttl)
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            cache.set(cache_key, cls._encode_shared(payload, value), timeout=ttl)
             logger.info(f"Cache set: {cache_key[:50]}... (TTL: {ttl}s)")
-            return True
         except Exception as e:
             logger.error(f"Cache set error: {e}")
             return False
 
+        with cls._lock:
+            cls._count(method, "sets")
+        cls._local_put(cache_key, payload, method, ttl)
+        return True
+
     @classmethod
     def delete(cls, key_components: dict) -> bool:
         """
         Elimina valor del caché.
         """
         cache_key = cls._generate_cache_key(key_components)
+        with cls._lock:
+            cls._local_drop(cache_key)
         try:
             cache.delete(cache_key)
             logger.info(f"Cache delete: {cache_key[:50]}...")
@@ -80,15 +199,69 @@ class CacheService:
     def clear_pattern(cls, pattern: str) -> int:
         """
         Elimina todas las claves que coinciden con patrón.
+
+        Recorre Redis con SCAN y borra por lotes de AI_CACHE_CLEAR_BATCH_SIZE
+        claves, sin bloquear el servidor como KEYS. En otros procesos el
+        nivel local conserva sus copias hasta que vence AI_CACHE_LOCAL_TTL.
         """
-        try:
-            full_pattern = f"{cls.CACHE_PREFIX}:{pattern}"
-            keys = cache.keys(full_pattern)
-            if keys:
-                cache.delete_many(keys)
-                logger.info(f"Cleared {len(keys)} cache keys matching: {pattern}")
-                return len(keys)
+        full_pattern = f"{cls.CACHE_PREFIX}:{pattern}"
+        with cls._lock:
+            for cache_key in [key for key in cls._local if fnmatch.fnmatchcase(key, full_pattern)]:
+                cls._local_drop(cache_key)
+
+        if not hasattr(cache, "iter_keys"):
+            logger.warning("Cache clear pattern needs a Redis cache backend")
             return 0
+
+        batch_size = getattr(settings, "AI_CACHE_CLEAR_BATCH_SIZE", DEFAULT_CLEAR_BATCH_SIZE)
+        deleted = 0
+        batch = []
+        try:
+            for cache_key in cache.iter_keys(full_pattern, itersize=batch_size):
+                batch.append(cache_key)
+                if len(batch) >= batch_size:
+                    cache.delete_many(batch)
+                    deleted += len(batch)
+                    batch = []
+            if batch:
+                cache.delete_many(batch)
+                deleted += len(batch)
         except Exception as e:
             logger.error(f"Cache clear pattern error: {e}")
-            return 0
+            return deleted
+
+        if deleted:
+            logger.info(f"Cleared {deleted} cache keys matching: {pattern}")
+        return deleted
+
+    @classmethod
+    def clear_local(cls) -> None:
+        """Vacía el nivel local de este proceso."""
+        with cls._lock:
+            cls._local.clear()
+            cls._local_bytes = 0
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """
+        Contadores del caché en este proceso.
+
+        Returns:
+            Diccionario con los contadores por method (local_hits,
+            shared_hits, misses, sets, evictions), sus totales y el tamaño
+            actual del nivel local
+        """
+        with cls._lock:
+            by_method = {method: dict(counters) for method, counters in cls._stats.items()}
+            local = {"entries": len(cls._local), "bytes": cls._local_bytes}
+
+        totals = dict.fromkeys(COUNTER_NAMES, 0)
+        for counters in by_method.values():
+            for name, amount in counters.items():
+                totals[name] += amount
+        return {"by_method": by_method, "totals": totals, "local": local}
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls._stats.clear()
@@ -0,0 +1,239 @@
+"""
+Per-model circuit breaker shared by all workers through the cache.
+
+A Bedrock region or Azure deployment that keeps timing out used to be tried
+on every request. Each model now has a circuit:
+
+- closed: calls go through; every result is counted in time buckets of the
+  shared cache (cache.incr, so concurrent workers do not lose updates) and
+  the last AI_CIRCUIT_WINDOW seconds are summed after each call
+- open: once the window holds at least AI_CIRCUIT_MIN_CALLS calls and the
+  failure rate reaches AI_CIRCUIT_FAILURE_RATE, or the rate of calls slower
+  than AI_CIRCUIT_SLOW_CALL_SECONDS reaches AI_CIRCUIT_SLOW_CALL_RATE, the
+  routers skip the model for AI_CIRCUIT_OPEN_SECONDS
+- half-open: after that, a single worker wins cache.add() on the probe key
+  and sends one call; its success closes the circuit and clears the window,
+  its failure opens it again
+
+Any cache error leaves the circuit closed, so the breaker never turns into
+an outage of its own.
+"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+COUNTER_NAMES = ('calls', 'failures', 'slow')
+
+DEFAULTS = {
+    'AI_CIRCUIT_ENABLED': True,
+    'AI_CIRCUIT_WINDOW': 60,
+    'AI_CIRCUIT_BUCKETS': 6,
+    'AI_CIRCUIT_MIN_CALLS': 5,
+    'AI_CIRCUIT_FAILURE_RATE': 0.5,
+    'AI_CIRCUIT_SLOW_CALL_SECONDS': 30.0,
+    'AI_CIRCUIT_SLOW_CALL_RATE': 0.8,
+    'AI_CIRCUIT_OPEN_SECONDS': 30,
+}
+
+
+def _setting(name: str) -> Any:
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open."""
+    pass
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit per model, stored in the shared cache."""
+
+    CIRCUIT_PREFIX = "ai_circuit"
+
+    @classmethod
+    def _state_key(cls, model: str) -> str:
+        return f"{cls.CIRCUIT_PREFIX}:{model}:state"
+
+    @classmethod
+    def _probe_key(cls, model: str) -> str:
+        return f"{cls.CIRCUIT_PREFIX}:{model}:probe"
+
+    @classmethod
+    def _bucket_keys(cls, model: str, now: float) -> Dict[str, list]:
+        """Counter keys of the current bucket (first) and the rest of the window."""
+        width = _setting('AI_CIRCUIT_WINDOW') / _setting('AI_CIRCUIT_BUCKETS')
+        current = int(now // width)
+        buckets = range(current, current - _setting('AI_CIRCUIT_BUCKETS'), -1)
+        return {
+            name: [f"{cls.CIRCUIT_PREFIX}:{model}:{bucket}:{name}" for bucket in buckets]
+            for name in COUNTER_NAMES
+        }
+
+    @classmethod
+    def _get_open_state(cls, model: str) -> Optional[Dict[str, Any]]:
+        return cache.get(cls._state_key(model))
+
+    @classmethod
+    def get_state(cls, model: str) -> str:
+        """
+        Current state of the model's circuit, without claiming the probe.
+
+        Returns:
+            'closed', 'open', or 'half_open' once the open period is over
+        """
+        if not _setting('AI_CIRCUIT_ENABLED'):
+            return CLOSED
+        try:
+            open_state = cls._get_open_state(model)
+        except Exception as e:
+            logger.warning(f"Circuit state unavailable for {model}: {e}")
+            return CLOSED
+        if open_state is None:
+            return CLOSED
+        return OPEN if time.time() < open_state['until'] else HALF_OPEN
+
+    @classmethod
+    def is_open(cls, model: str) -> bool:
+        """Whether routers should skip the model right now."""
+        return cls.get_state(model) == OPEN
+
+    @classmethod
+    def allow(cls, model: str) -> bool:
+        """
+        Decide whether a call to the model may go out.
+
+        In the half-open state only the caller that claims the probe is
+        allowed; everyone else is turned away until the probe reports.
+        """
+        state = cls.get_state(model)
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        try:
+            return cache.add(cls._probe_key(model), 1, timeout=_setting('AI_CIRCUIT_OPEN_SECONDS'))
+        except Exception as e:
+            logger.warning(f"Circuit probe claim failed for {model}: {e}")
+            return True
+
+    @classmethod
+    def record(cls, model: str, seconds: float, failed: bool) -> None:
+        """
+        Count one finished call and move the circuit if the window says so.
+
+        Args:
+            model: Model identifier
+            seconds: Wall time of the call
+            failed: Whether the backend failed (raised or answered an error)
+        """
+        if not _setting('AI_CIRCUIT_ENABLED'):
+            return
+        try:
+            state = cls.get_state(model)
+            if state == HALF_OPEN:
+                cls._finish_probe(model, failed)
+            elif state == CLOSED:
+                cls._count(model, seconds, failed)
+        except Exception as e:
+            logger.warning(f"Circuit update failed for {model}: {e}")
+
+    @classmethod
+    def _count(cls, model: str, seconds: float, failed: bool) -> None:
+        now = time.time()
+        keys = cls._bucket_keys(model, now)
+        ttl = int(_setting('AI_CIRCUIT_WINDOW') * 2)
+        counted = {
+            'calls': True,
+            'failures': failed,
+            'slow': seconds >= _setting('AI_CIRCUIT_SLOW_CALL_SECONDS'),
+        }
+        for name, hit in counted.items():
+            if hit:
+                key = keys[name][0]
+                cache.add(key, 0, timeout=ttl)
+                cache.incr(key)
+
+        window = cls._window(keys)
+        if window['calls'] < _setting('AI_CIRCUIT_MIN_CALLS'):
+            return
+        if window['failures'] / window['calls'] >= _setting('AI_CIRCUIT_FAILURE_RATE'):
+            cls._open(model, 'failure_rate', window)
+        elif window['slow'] / window['calls'] >= _setting('AI_CIRCUIT_SLOW_CALL_RATE'):
+            cls._open(model, 'slow_calls', window)
+
+    @classmethod
+    def _window(cls, keys: Dict[str, list]) -> Dict[str, int]:
+        values = cache.get_many([key for name in COUNTER_NAMES for key in keys[name]])
+        return {name: sum(values.get(key, 0) for key in keys[name]) for name in COUNTER_NAMES}
+
+    @classmethod
+    def _open(cls, model: str, reason: str, window: Optional[Dict[str, int]] = None) -> None:
+        open_seconds = _setting('AI_CIRCUIT_OPEN_SECONDS')
+        now = time.time()
+        cache.set(cls._state_key(model), {
+            'until': now + open_seconds,
+            'opened_at': now,
+            'reason': reason,
+            'window': window,
+        }, timeout=max(open_seconds * 10, 600))
+        cache.delete(cls._probe_key(model))
+        logger.warning(f"[CIRCUIT] {model} opened for {open_seconds}s ({reason}, window={window})")
+
+    @classmethod
+    def _finish_probe(cls, model: str, failed: bool) -> None:
+        if failed:
+            cls._open(model, 'probe_failed')
+            return
+        keys = cls._bucket_keys(model, time.time())
+        cache.delete_many([key for name in COUNTER_NAMES for key in keys[name]])
+        cache.delete_many([cls._state_key(model), cls._probe_key(model)])
+        logger.info(f"[CIRCUIT] {model} closed after a successful probe")
+
+    @classmethod
+    def get_states(cls, models: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Circuit state and rolling window of each model, for the health endpoint.
+
+        Returns:
+            Dictionary per model with state, calls, failures, slow,
+            failure_rate, slow_rate and, when not closed, reason and
+            open_until (Unix time)
+        """
+        states = {}
+        now = time.time()
+        for model in models:
+            entry = {'state': cls.get_state(model)}
+            try:
+                entry.update(cls._window(cls._bucket_keys(model, now)))
+                open_state = cls._get_open_state(model) if entry['state'] != CLOSED else None
+            except Exception as e:
+                entry['error'] = str(e)
+                states[model] = entry
+                continue
+            calls = entry['calls']
+            entry['failure_rate'] = round(entry['failures'] / calls, 3) if calls else None
+            entry['slow_rate'] = round(entry['slow'] / calls, 3) if calls else None
+            if open_state is not None:
+                entry['reason'] = open_state['reason']
+                entry['open_until'] = round(open_state['until'], 3)
+            states[model] = entry
+        return states
+
+    @classmethod
+    def reset(cls, model: str) -> None:
+        """Close the model's circuit and forget its window."""
+        keys = cls._bucket_keys(model, time.time())
+        cache.delete_many(
+            [key for name in COUNTER_NAMES for key in keys[name]]
+            + [cls._state_key(model), cls._probe_key(model)]
+        )
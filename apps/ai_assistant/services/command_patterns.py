@@ -3,10 +3,14 @@ Command patterns for incremental UML modifications.
 
 Regex patterns for parsing natural language commands in English and Spanish.
 Supports bilingual command processing with automatic language detection.
+
+match_command() runs every rule of both languages as one precompiled
+alternation with a named group per rule, so a command is scanned once and
+the matched group names the rule and its language.
 """
 
 import re
-from typing import Dict, Optional, Pattern, Tuple
+from typing import Dict, List, Match, NamedTuple, Optional, Pattern, Tuple
 
 COMMAND_PATTERNS_EN: Dict[str, Pattern] = {
     "add_attribute": re.compile(
@@ -176,3 +180,164 @@ def get_command_patterns(language: str) -> Dict[str, Pattern]:
     if language == "es":
         return COMMAND_PATTERNS_ES
     return COMMAND_PATTERNS_EN
+
+
+COMMAND_PATTERNS: Dict[str, Dict[str, Pattern]] = {
+    "en": COMMAND_PATTERNS_EN,
+    "es": COMMAND_PATTERNS_ES,
+}
+
+_GROUP_SEPARATOR = "__"
+_LEADING_KEYWORD = re.compile(r"[a-z]+")
+
+# (language, rule, index of the rule's named group, number of rule groups)
+RuleInfo = Tuple[str, str, int, int]
+
+
+class RuleMatch:
+    """
+    Groups of one rule inside a combined match.
+
+    Group numbers are those of the rule's own pattern in
+    COMMAND_PATTERNS_EN/ES, so handlers can keep using group(1), group(2)
+    and lastindex as with a plain re.Match.
+    """
+
+    __slots__ = ("_match", "_offset", "_count")
+
+    def __init__(self, match: Match, offset: int, count: int):
+        self._match = match
+        self._offset = offset
+        self._count = count
+
+    def group(self, index: int = 0) -> Optional[str]:
+        return self._match.group(self._offset + index)
+
+    def groups(self) -> Tuple[Optional[str], ...]:
+        return self._match.groups()[self._offset:self._offset + self._count]
+
+    @property
+    def lastindex(self) -> Optional[int]:
+        for index in range(self._count, 0, -1):
+            if self._match.group(self._offset + index) is not None:
+                return index
+        return None
+
+    def start(self) -> int:
+        return self._match.start(self._offset)
+
+    def end(self) -> int:
+        return self._match.end(self._offset)
+
+
+class CommandMatch(NamedTuple):
+    """
+    Rule matched by match_command().
+
+    Attributes:
+        rule: Pattern name, e.g. "add_attribute"
+        language: "en" or "es"
+        match: Groups of the rule, numbered as in its own pattern
+    """
+
+    rule: str
+    language: str
+    match: RuleMatch
+
+    @property
+    def rule_id(self) -> str:
+        return f"{self.language}:{self.rule}"
+
+
+def _compile_alternation(rules: List[Tuple[str, str, Pattern]]) -> Tuple[Pattern, Dict[str, RuleInfo]]:
+    """
+    Join rules into one alternation with a named group per rule.
+
+    Each rule keeps its own unnamed groups inside the named group
+    "<language>__<rule>"; that outer group closes last, so it is the
+    match's lastgroup.
+    """
+    combined = re.compile(
+        "|".join(f"(?P<{language}{_GROUP_SEPARATOR}{rule}>{pattern.pattern})" for language, rule, pattern in rules),
+        re.IGNORECASE,
+    )
+    info = {}
+    for name, index in combined.groupindex.items():
+        language, rule = name.split(_GROUP_SEPARATOR, 1)
+        info[name] = (language, rule, index, COMMAND_PATTERNS[language][rule].groups)
+    return combined, info
+
+
+def _build_matcher() -> Tuple[Pattern, Dict[str, Tuple[Pattern, Dict[str, RuleInfo]]]]:
+    """
+    Build the keyword prefilter and one alternation per leading keyword.
+
+    Every rule starts with a literal keyword ("add", "eliminar"...). A
+    command can only match where a keyword occurs, and there only the rules
+    of that keyword (or of a keyword it starts with) can match, tried in
+    COMMAND_PATTERNS order: English first, then Spanish.
+
+    Returns:
+        Tuple (keyword pattern, {keyword: (alternation, rule info by group name)})
+    """
+    rules = [
+        (language, rule, pattern)
+        for language, patterns in COMMAND_PATTERNS.items()
+        for rule, pattern in patterns.items()
+    ]
+    keywords = {_LEADING_KEYWORD.match(pattern.pattern).group(0) for _, _, pattern in rules}
+
+    by_keyword = {}
+    for keyword in keywords:
+        keyword_rules = [
+            (language, rule, pattern)
+            for language, rule, pattern in rules
+            if keyword.startswith(_LEADING_KEYWORD.match(pattern.pattern).group(0))
+        ]
+        by_keyword[keyword] = _compile_alternation(keyword_rules)
+
+    keyword_pattern = re.compile("|".join(sorted(keywords, key=len, reverse=True)))
+    return keyword_pattern, by_keyword
+
+
+# The keyword pattern is case-sensitive and runs over the lowercased
+# command: an IGNORECASE alternation is several times slower to search
+COMMAND_KEYWORD_PATTERN, COMMAND_MATCHERS = _build_matcher()
+_COMMAND_KEYWORD_PATTERN_IGNORECASE = re.compile(COMMAND_KEYWORD_PATTERN.pattern, re.IGNORECASE)
+
+
+def match_command(command: str) -> Optional[CommandMatch]:
+    """
+    Match a command against every English and Spanish rule in one pass.
+
+    Keyword occurrences are visited left to right and the first position
+    where a rule matches wins, as with a search over all rules combined.
+    The language comes from the rule that matched, so no separate language
+    detection is needed.
+
+    Args:
+        command: Natural language command
+
+    Returns:
+        CommandMatch, or None when no rule matches
+    """
+    lowered = command.lower()
+    if len(lowered) == len(command):
+        keyword_pattern, haystack = COMMAND_KEYWORD_PATTERN, lowered
+    else:
+        # A few characters change length when lowercased; keep positions aligned
+        keyword_pattern, haystack = _COMMAND_KEYWORD_PATTERN_IGNORECASE, command
+
+    position = 0
+    while True:
+        keyword = keyword_pattern.search(haystack, position)
+        if keyword is None:
+            return None
+
+        pattern, rules = COMMAND_MATCHERS[keyword.group(0).lower()]
+        combined = pattern.match(command, keyword.start())
+        if combined is not None:
+            language, rule, index, count = rules[combined.lastgroup]
+            return CommandMatch(rule, language, RuleMatch(combined, index, count))
+
+        position = keyword.start() + 1
@@ -1,7 +1,6 @@
-import json
 import logging
-import re
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional, Tuple
+from .json_stream import JSONStreamExtractor, extract_json
 from .openai_service import OpenAIService
 
 
@@ -14,9 +13,9 @@ class UMLCommandProcessorService:
     Replaces complex pattern matching with single powerful AI call.
     """
     
-    def __init__(self):
+    def __init__(self, openai_service: Optional[OpenAIService] = None):
         try:
-            self.openai_service = OpenAIService()
+            self.openai_service = openai_service or OpenAIService()
             self.openai_available = True
         except ImportError:
             self.openai_service = None
@@ -30,14 +29,7 @@ class UMLCommandProcessorService:
         """
         try:
             if not self.openai_available:
-                return {
-                    'action': 'error',
-                    'elements': [],
-                    'confidence': 0.0,
-                    'interpretation': 'OpenAI service unavailable',
-                    'error': 'AI service unavailable. Install OpenAI dependencies.',
-                    'suggestion': 'Install openai and tiktoken packages to enable AI command processing.'
-                }
+                return self._unavailable_result()
 
             self.logger.info(f"Processing command with o4-mini: {command[:100]}")
             
@@ -46,152 +38,106 @@ class UMLCommandProcessorService:
                 current_diagram_data=current_diagram_data
             )
             
-            self.logger.info(f"Received response from o4-mini ({len(response)} chars)")
-            self.logger.debug(f"Response preview: {response[:200]}...")
+            return self._build_result(response, command)
+                    
+        except Exception as e:
+            return self._error_result(e)
 
-            result = self._extract_and_parse_json(response)
-            
-            if result is None:
-                self.logger.error(f"Failed to extract JSON from o4-mini response")
-                self.logger.error(f"Full response: {response[:1000]}")
-                return {
-                    'action': 'error',
-                    'elements': [],
-                    'confidence': 0.0,
-                    'interpretation': 'Failed to parse AI response',
-                    'error': 'Could not extract valid JSON from o4-mini response',
-                    'suggestion': 'Try rephrasing your command more clearly.',
-                    'raw_response_preview': response[:500]
-                }
+    async def astream_command(
+        self, command: str, diagram_id: Optional[str] = None, current_diagram_data: Optional[Dict] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of process_command.
 
-            if result.get('action') != 'error' and not result.get('elements'):
-                self.logger.warning(f"AI returned empty elements for command: {command[:50]}")
-                result['confidence'] = 0.3
-                result['interpretation'] = result.get('interpretation', '') + ' (Warning: No elements generated)'
-            
-            self.logger.info(f"Command processed successfully: {command[:50]}... (confidence: {result.get('confidence', 0)})")
-            return result
-                    
+        Yields ("token", {"delta": text}) for every piece of model output,
+        ("element", element) as soon as an item of the "elements" array is
+        complete, and finally ("done", result) with what process_command
+        would have returned for the full output.
+        """
+        if not self.openai_available:
+            yield "done", self._unavailable_result()
+            return
+
+        extractor = JSONStreamExtractor()
+        parts = []
+        try:
+            async for delta in self.openai_service.astream_command_processing_api(
+                command=command,
+                current_diagram_data=current_diagram_data
+            ):
+                parts.append(delta)
+                yield "token", {"delta": delta}
+                for element in extractor.feed(delta):
+                    yield "element", element
+            result = self._build_result("".join(parts), command, extractor.finish())
         except Exception as e:
-            self.logger.error(f"Error processing command: {e}")
+            result = self._error_result(e)
+
+        yield "done", result
+
+    def _build_result(self, response: str, command: str, result: Optional[Dict] = None) -> Dict:
+        """Parse the model output into the command result (result: already extracted JSON)."""
+        self.logger.info(f"Received response from o4-mini ({len(response)} chars)")
+        self.logger.debug(f"Response preview: {response[:200]}...")
+
+        if result is None:
+            result = self._extract_and_parse_json(response)
+        
+        if result is None:
+            self.logger.error(f"Failed to extract JSON from o4-mini response")
+            self.logger.error(f"Full response: {response[:1000]}")
             return {
                 'action': 'error',
                 'elements': [],
                 'confidence': 0.0,
-                'interpretation': f'Error: {str(e)}',
-                'error': f'Error processing command: {str(e)}',
-                'suggestion': 'Please try again or contact support if the issue persists.'
+                'interpretation': 'Failed to parse AI response',
+                'error': 'Could not extract valid JSON from o4-mini response',
+                'suggestion': 'Try rephrasing your command more clearly.',
+                'raw_response_preview': response[:500]
             }
+
+        if result.get('action') != 'error' and not result.get('elements'):
+            self.logger.warning(f"AI returned empty elements for command: {command[:50]}")
+            result['confidence'] = 0.3
+            result['interpretation'] = result.get('interpretation', '') + ' (Warning: No elements generated)'
+        
+        self.logger.info(f"Command processed successfully: {command[:50]}... (confidence: {result.get('confidence', 0)})")
+        return result
+
+    def _unavailable_result(self) -> Dict:
+        return {
+            'action': 'error',
+            'elements': [],
+            'confidence': 0.0,
+            'interpretation': 'OpenAI service unavailable',
+            'error': 'AI service unavailable. Install OpenAI dependencies.',
+            'suggestion': 'Install openai and tiktoken packages to enable AI command processing.'
+        }
+
+    def _error_result(self, e: Exception) -> Dict:
+        self.logger.error(f"Error processing command: {e}")
+        return {
+            'action': 'error',
+            'elements': [],
+            'confidence': 0.0,
+            'interpretation': f'Error: {str(e)}',
+            'error': f'Error processing command: {str(e)}',
+            'suggestion': 'Please try again or contact support if the issue persists.'
+        }
     
     def _extract_and_parse_json(self, response_text: str) -> Optional[Dict]:
         """
-        Robustly extract and parse JSON from o4-mini response text.
+        Extract the JSON object from o4-mini response text (see json_stream).
         """
         if not response_text or not response_text.strip():
             self.logger.error("Empty response text received")
             return None
         
-        self.logger.info(f"Attempting JSON extraction from response ({len(response_text)} chars)")
-        self.logger.debug(f"First 200 chars: {response_text[:200]}")
-        
-        # STRATEGY 1: Direct JSON parse
-        try:
-            result = json.loads(response_text)
-            self.logger.info("Strategy 1 SUCCESS: Direct JSON parse")
-            return result
-        except json.JSONDecodeError:
-            self.logger.debug("Strategy 1 failed: Not direct JSON")
-        
-        # STRATEGY 2: Extract from markdown code block
-        try:
-            # Pattern: ```json ... ``` or ``` ... ```
-            markdown_pattern = r'```(?:json)?\s*\n?(.*?)\n?```'
-            match = re.search(markdown_pattern, response_text, re.DOTALL)
-            if match:
-                json_str = match.group(1).strip()
-                result = json.loads(json_str)
-                self.logger.info("✓ Strategy 2 SUCCESS: Markdown extraction")
-                return result
-            else:
-                self.logger.debug("✗ Strategy 2 failed: No markdown blocks found")
-        except (json.JSONDecodeError, AttributeError) as e:
-            self.logger.debug(f"✗ Strategy 2 failed: {e}")
-        
-        # STRATEGY 3: Find first { and matching }
-        try:
-            first_brace = response_text.find('{')
-            if first_brace == -1:
-                self.logger.debug("✗ Strategy 3 failed: No opening brace found")
-            else:
-                # Count braces to find matching closing brace
-                brace_count = 0
-                end_pos = first_brace
-                
-                for i in range(first_brace, len(response_text)):
-                    if response_text[i] == '{':
-                        brace_count += 1
-                    elif response_text[i] == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end_pos = i + 1
-                            break
-                
-                if brace_count == 0:
-                    json_str = response_text[first_brace:end_pos]
-                    result = json.loads(json_str)
-                    self.logger.info("✓ Strategy 3 SUCCESS: Brace counting extraction")
-                    return result
-                else:
-                    self.logger.debug("✗ Strategy 3 failed: Unmatched braces")
-        except json.JSONDecodeError as e:
-            self.logger.debug(f"✗ Strategy 3 failed: {e}")
-        
-        # STRATEGY 4: Regex pattern for JSON object
-        try:
-            # Find JSON-like patterns
-            json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-            matches = re.finditer(json_pattern, response_text, re.DOTALL)
-            
-            for match in matches:
-                try:
-                    json_str = match.group(0)
-                    result = json.loads(json_str)
-                    # Validate it looks like our expected structure
-                    if 'action' in result or 'elements' in result:
-                        self.logger.info("✓ Strategy 4 SUCCESS: Regex pattern extraction")
-                        return result
-                except json.JSONDecodeError:
-                    continue
-            
-            self.logger.debug("✗ Strategy 4 failed: No valid JSON patterns found")
-        except Exception as e:
-            self.logger.debug(f"✗ Strategy 4 failed: {e}")
-        
-        # STRATEGY 5: Clean and retry
-        try:
-            # Remove everything before first { and after last }
-            first_brace = response_text.find('{')
-            last_brace = response_text.rfind('}')
-            
-            if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                json_str = response_text[first_brace:last_brace + 1]
-                
-                # Try to fix common issues
-                # Remove trailing commas before } or ]
-                json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-                
-                result = json.loads(json_str)
-                self.logger.info("✓ Strategy 5 SUCCESS: Clean and retry")
-                return result
-            else:
-                self.logger.debug("✗ Strategy 5 failed: No valid brace positions")
-        except json.JSONDecodeError as e:
-            self.logger.debug(f"✗ Strategy 5 failed: {e}")
-        
-        # All strategies failed
-        self.logger.error("✗ ALL EXTRACTION STRATEGIES FAILED")
-        self.logger.error(f"Full response text:\n{response_text}")
-        return None
+        result = extract_json(response_text)
+        if result is None:
+            self.logger.error("No JSON object found in response")
+            self.logger.error(f"Full response text:\n{response_text}")
+        return result
     
     def get_supported_commands(self) -> Dict:
         """
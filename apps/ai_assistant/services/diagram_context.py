@@ -0,0 +1,547 @@
+"""
+Diagram context rendering for LLM prompts.
+
+Every service that puts the current diagram into a prompt renders it here.
+The diagram is normalized once (React Flow nodes/edges or the model's
+classes/relationships), endpoint names are resolved through an id -> label
+map, and the rendered blocks with their token counts are memoized by a hash
+of the diagram content (or by a key the caller derives from the stored
+structural hash).
+
+Large diagrams are fitted to a token budget deterministically: classes named
+in the user's command are rendered in full first, so the class being edited
+keeps its attributes; every other class is then listed in compact form
+(name, ID and member counts) and upgraded to full detail in diagram order
+while the budget allows, and the remaining budget goes to relationships,
+those touching the named classes first. Whatever does not fit is reported as
+a count of omitted elements. Callers can also cap the number of classes and
+of relationships listed, chosen in the same order.
+"""
+
+import hashlib
+import json
+import logging
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+STYLE_DETAILED = 'detailed'
+STYLE_ASSISTANT = 'assistant'
+STYLE_SUMMARY = 'summary'
+STYLE_NAMES = 'names'
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_CACHE_SIZE = 256
+
+# Reserved for the omission notes, which are only known after fitting
+NOTE_TOKENS = 48
+
+_UNSET = object()
+_encoding = _UNSET
+_encoding_lock = threading.Lock()
+
+
+def get_token_encoding():
+    """
+    Shared tiktoken encoding (gpt-4o, falling back to cl100k_base).
+
+    Returns None when tiktoken or its encoding files are unavailable; token
+    counts are then estimated from the text length.
+    """
+    global _encoding
+    if _encoding is _UNSET:
+        with _encoding_lock:
+            if _encoding is _UNSET:
+                encoding = None
+                if tiktoken is not None:
+                    try:
+                        encoding = tiktoken.encoding_for_model("gpt-4o")
+                    except Exception:
+                        try:
+                            encoding = tiktoken.get_encoding("cl100k_base")
+                        except Exception as e:
+                            logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+                _encoding = encoding
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text (estimated as len/4 without tiktoken)."""
+    if not text:
+        return 0
+    encoding = get_token_encoding()
+    if encoding is not None:
+        try:
+            return len(encoding.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return len(text) // 4 + 1
+
+
+@dataclass
+class _Class:
+    id: Any
+    label: str
+    position: Dict[str, Any]
+    attributes: List[Dict[str, Any]]
+    methods: List[Dict[str, Any]]
+    is_abstract: bool
+
+
+@dataclass
+class _Relationship:
+    id: Any
+    source: Any
+    target: Any
+    source_name: str
+    target_name: str
+    type: str
+    source_multiplicity: str
+    target_multiplicity: str
+    label: str
+
+
+def _dicts(items: Any) -> List[Dict[str, Any]]:
+    return [item for item in (items or []) if isinstance(item, dict)]
+
+
+def _normalize(diagram: Dict[str, Any]) -> Tuple[List[_Class], List[_Relationship]]:
+    """Classes and relationships from either diagram shape, names resolved once."""
+    if diagram.get('classes'):
+        classes = [
+            _Class(
+                id=cls.get('id'),
+                label=cls.get('name', cls.get('label', 'Unknown')),
+                position=cls.get('position') or {},
+                attributes=_dicts(cls.get('attributes')),
+                methods=_dicts(cls.get('methods')),
+                is_abstract=bool(cls.get('isAbstract', False)),
+            )
+            for cls in _dicts(diagram.get('classes'))
+        ]
+        raw_relationships = [
+            (rel.get('id'), rel.get('source_id', 'Unknown'), rel.get('target_id', 'Unknown'),
+             rel.get('type', rel.get('relationship_type', 'Unknown')),
+             rel.get('source_multiplicity', '1'), rel.get('target_multiplicity', '1'), rel.get('label', ''))
+            for rel in _dicts(diagram.get('relationships'))
+        ]
+    else:
+        classes = []
+        for node in _dicts(diagram.get('nodes')):
+            data = node.get('data') or {}
+            classes.append(_Class(
+                id=node.get('id', 'unknown'),
+                label=data.get('label', 'Unknown'),
+                position=node.get('position') or {},
+                attributes=_dicts(data.get('attributes')),
+                methods=_dicts(data.get('methods')),
+                is_abstract=bool(data.get('isAbstract', False)),
+            ))
+        raw_relationships = []
+        for edge in _dicts(diagram.get('edges')):
+            data = edge.get('data') or {}
+            raw_relationships.append(
+                (edge.get('id'), edge.get('source', ''), edge.get('target', ''),
+                 data.get('relationshipType', 'ASSOCIATION'), data.get('sourceMultiplicity', '1'),
+                 data.get('targetMultiplicity', '1'), data.get('label', ''))
+            )
+
+    labels = {}
+    for cls in classes:
+        labels.setdefault(cls.id, cls.label)
+
+    relationships = [
+        _Relationship(
+            id=rel_id, source=source, target=target,
+            source_name=labels.get(source, source), target_name=labels.get(target, target),
+            type=rel_type, source_multiplicity=source_mult, target_multiplicity=target_mult, label=label,
+        )
+        for rel_id, source, target, rel_type, source_mult, target_mult, label in raw_relationships
+    ]
+    return classes, relationships
+
+
+@dataclass
+class _Rendered:
+    """Rendered blocks of one diagram in one style, with token counts."""
+
+    classes: List[_Class]
+    relationships: List[_Relationship]
+    class_full: List[str]
+    class_compact: List[str]
+    relationship_lines: List[str]
+    assemble: Callable[[List[str], List[str], int, int], str]
+    class_full_tokens: List[int] = field(default_factory=list)
+    class_compact_tokens: List[int] = field(default_factory=list)
+    relationship_tokens: List[int] = field(default_factory=list)
+    overhead_tokens: int = 0
+    full_tokens: int = 0
+
+    def count(self):
+        self.class_full_tokens = [count_tokens(text) for text in self.class_full]
+        self.class_compact_tokens = [count_tokens(text) for text in self.class_compact]
+        self.relationship_tokens = [count_tokens(text) for text in self.relationship_lines]
+        self.overhead_tokens = count_tokens(self.assemble([], [], 0, 0))
+        self.full_tokens = sum(self.class_full_tokens) + sum(self.relationship_tokens)
+        return self
+
+
+def _detailed(diagram, classes, relationships) -> _Rendered:
+    class_full, class_compact = [], []
+    for idx, cls in enumerate(classes, 1):
+        text = f"{idx}. {cls.label} (ID: {cls.id})\n"
+        if cls.is_abstract:
+            text += "   Type: Abstract Class\n"
+        text += f"   Position: x={cls.position.get('x', 0)}, y={cls.position.get('y', 0)}\n"
+
+        if cls.attributes:
+            text += "   Attributes:\n"
+            for attr in cls.attributes:
+                modifiers = [name for name, key in (('static', 'isStatic'), ('final', 'isFinal')) if attr.get(key, False)]
+                text += f"   - {attr.get('name', 'unknown')}: {attr.get('type', 'String')} ({attr.get('visibility', 'private')})"
+                if modifiers:
+                    text += f" [{' '.join(modifiers)}]"
+                text += "\n"
+        else:
+            text += "   Attributes: (none)\n"
+
+        if cls.methods:
+            text += "   Methods:\n"
+            for method in cls.methods:
+                parameters = _dicts(method.get('parameters'))
+                param_str = ', '.join(f"{p.get('name', 'param')}: {p.get('type', 'String')}" for p in parameters)
+                text += f"   - {method.get('name', 'unknown')}({param_str}): {method.get('returnType', 'void')} ({method.get('visibility', 'public')})\n"
+        else:
+            text += "   Methods: (none)\n"
+
+        class_full.append(text + "\n")
+        class_compact.append(
+            f"{idx}. {cls.label} (ID: {cls.id}) - {len(cls.attributes)} attributes, "
+            f"{len(cls.methods)} methods (detail omitted)\n"
+        )
+
+    relationship_lines = []
+    for idx, rel in enumerate(relationships, 1):
+        text = f"{idx}. {rel.source_name} → {rel.target_name} ({rel.type})\n"
+        text += f"   Source ID: {rel.source}\n"
+        text += f"   Target ID: {rel.target}\n"
+        text += f"   Source Multiplicity: {rel.source_multiplicity}\n"
+        text += f"   Target Multiplicity: {rel.target_multiplicity}\n"
+        if rel.label:
+            text += f"   Label: {rel.label}\n"
+        relationship_lines.append(text + "\n")
+
+    def assemble(class_texts, relationship_texts, omitted_classes, omitted_relationships):
+        context = "\n\n" + "=" * 70 + "\n"
+        context += "EXISTING DIAGRAM CONTEXT\n"
+        context += "=" * 70 + "\n\n"
+        context += f"Total Classes: {len(classes)}\n"
+        context += f"Total Relationships: {len(relationships)}\n\n"
+        context += "CLASSES DETAIL:\n\n"
+        context += "".join(class_texts)
+        if omitted_classes:
+            context += f"... {omitted_classes} more classes not shown (context budget)\n\n"
+        if relationships:
+            context += "RELATIONSHIPS:\n\n"
+            context += "".join(relationship_texts)
+            if omitted_relationships:
+                context += f"... {omitted_relationships} more relationships not shown (context budget)\n\n"
+        else:
+            context += "RELATIONSHIPS: (none)\n\n"
+        return context
+
+    return _Rendered(classes, relationships, class_full, class_compact, relationship_lines, assemble)
+
+
+def _assistant(diagram, classes, relationships) -> _Rendered:
+    class_full, class_compact = [], []
+    for cls in classes:
+        attr_list = [
+            f"{attr.get('visibility', 'private')} {attr.get('name', 'unknown')}: {attr.get('type', 'unknown')}"
+            for attr in cls.attributes
+        ]
+        method_list = [
+            f"{method.get('visibility', 'public')} {method.get('name', 'unknown')}(): {method.get('returnType', 'void')}"
+            for method in cls.methods
+        ]
+        class_info = f"  * {cls.label}"
+        if cls.is_abstract:
+            class_info += " (abstracta)"
+        class_compact.append(f"{class_info} - {len(attr_list)} atributos, {len(method_list)} métodos")
+        if attr_list:
+            class_info += f"\n    - Atributos: {', '.join(attr_list)}"
+        if method_list:
+            class_info += f"\n    - Métodos: {', '.join(method_list)}"
+        class_full.append(class_info)
+
+    relationship_lines = [
+        f"  * {rel.source_name} --[{rel.type}]-> {rel.target_name} ({rel.source_multiplicity}:{rel.target_multiplicity})"
+        for rel in relationships
+    ]
+
+    total_attributes = sum(len(cls.attributes) for cls in classes)
+    total_methods = sum(len(cls.methods) for cls in classes)
+    complexity = "Simple"
+    if len(classes) > 10 or total_attributes > 30:
+        complexity = "Complejo"
+    elif len(classes) > 5 or total_attributes > 15:
+        complexity = "Moderado"
+
+    def assemble(class_texts, relationship_texts, omitted_classes, omitted_relationships):
+        class_texts = list(class_texts)
+        if omitted_classes:
+            class_texts.append(f"  * ... y {omitted_classes} clases más (omitidas por longitud)")
+        relationship_texts = list(relationship_texts)
+        if omitted_relationships:
+            relationship_texts.append(f"  * ... y {omitted_relationships} relaciones más (omitidas por longitud)")
+
+        return f"""
+        CONTEXTO DEL DIAGRAMA ACTUAL:
+        
+        INFORMACIÓN GENERAL:
+        - Título: "{diagram.get('title', 'Sin título')}"
+        - Tipo: {diagram.get('diagram_type', 'CLASS')}
+        - Nivel de complejidad: {complexity}
+        - Última modificación: {diagram.get('last_modified', 'Desconocida')}
+        - Sesiones activas: {len(diagram.get('active_sessions') or [])} usuarios colaborando
+        
+        CLASES DEFINIDAS ({len(classes)}):
+        {chr(10).join(class_texts) if class_texts else '  * No hay clases definidas todavía'}
+        
+        RELACIONES ({len(relationships)}):
+        {chr(10).join(relationship_texts) if relationship_texts else '  * No hay relaciones definidas todavía'}
+        
+        OBSERVACIONES:
+        - Total de atributos en el sistema: {total_attributes}
+        - Total de métodos en el sistema: {total_methods}
+        - Clases abstractas: {sum(1 for cls in classes if cls.is_abstract)}
+        """
+
+    return _Rendered(classes, relationships, class_full, class_compact, relationship_lines, assemble)
+
+
+def _summary(diagram, classes, relationships) -> _Rendered:
+    class_lines = [f"- {cls.label}: {len(cls.attributes)} attributes, {len(cls.methods)} methods" for cls in classes]
+    relationship_lines = [f"- {rel.type}: {rel.source_name} -> {rel.target_name}" for rel in relationships]
+
+    def assemble(class_texts, relationship_texts, omitted_classes, omitted_relationships):
+        parts = [f"The diagram has {len(classes)} classes and {len(relationships)} relationships."]
+        if classes:
+            parts.append("\nCLASSES:")
+            parts.extend(class_texts)
+            if omitted_classes:
+                parts.append(f"- ... {omitted_classes} more classes")
+        if relationships:
+            parts.append("\nRELATIONSHIPS:")
+            parts.extend(relationship_texts)
+            if omitted_relationships:
+                parts.append(f"- ... {omitted_relationships} more relationships")
+        return "\n".join(parts)
+
+    return _Rendered(classes, relationships, class_lines, class_lines, relationship_lines, assemble)
+
+
+def _names(diagram, classes, relationships) -> _Rendered:
+    labels = [cls.label for cls in classes]
+
+    def assemble(class_texts, relationship_texts, omitted_classes, omitted_relationships):
+        names = ', '.join(class_texts)
+        if omitted_classes:
+            names += f" (+{omitted_classes} more)"
+        return f"AVAILABLE CLASSES: {names}\nTOTAL NODES: {len(classes)}"
+
+    return _Rendered(classes, [], labels, labels, [], assemble)
+
+
+_RENDERERS = {
+    STYLE_DETAILED: _detailed,
+    STYLE_ASSISTANT: _assistant,
+    STYLE_SUMMARY: _summary,
+    STYLE_NAMES: _names,
+}
+
+
+def _fit(rendered: _Rendered, budget: int, focus_text: Optional[str],
+         max_items: Optional[int] = None) -> Tuple[str, bool]:
+    """Choose which blocks to render within budget (see module docstring)."""
+    within_count = max_items is None or max(len(rendered.class_full), len(rendered.relationship_lines)) <= max_items
+    if within_count and rendered.overhead_tokens + rendered.full_tokens <= budget:
+        return rendered.assemble(rendered.class_full, rendered.relationship_lines, 0, 0), False
+
+    remaining = budget - rendered.overhead_tokens - NOTE_TOKENS
+    focus = _focus_indexes(rendered.classes, focus_text)[:max_items]
+    focus_set = set(focus)
+    class_order = (focus + [i for i in range(len(rendered.class_full)) if i not in focus_set])[:max_items]
+
+    # Keep some room for relationships so wide diagrams still show structure
+    relationship_reserve = min(sum(rendered.relationship_tokens), max(remaining, 0) // 4)
+    class_budget = remaining - relationship_reserve
+
+    level = {}
+    for i in focus:
+        cost = rendered.class_full_tokens[i]
+        if cost > class_budget:
+            break
+        level[i] = 'full'
+        class_budget -= cost
+    for i in class_order:
+        if i in level:
+            continue
+        cost = rendered.class_compact_tokens[i]
+        if cost > class_budget:
+            break
+        level[i] = 'compact'
+        class_budget -= cost
+    for i in class_order:
+        if i not in level:
+            break
+        if level[i] == 'full':
+            continue
+        extra = rendered.class_full_tokens[i] - rendered.class_compact_tokens[i]
+        if extra <= class_budget:
+            level[i] = 'full'
+            class_budget -= extra
+
+    relationship_budget = class_budget + relationship_reserve
+    focus_class_ids = {rendered.classes[i].id for i in focus_set}
+    relationship_order = sorted(
+        range(len(rendered.relationship_lines)),
+        key=lambda i: (rendered.relationships[i].source not in focus_class_ids
+                       and rendered.relationships[i].target not in focus_class_ids, i),
+    )[:max_items]
+    included_relationships = set()
+    for i in relationship_order:
+        cost = rendered.relationship_tokens[i]
+        if cost > relationship_budget:
+            break
+        included_relationships.add(i)
+        relationship_budget -= cost
+
+    class_texts = [
+        rendered.class_full[i] if level[i] == 'full' else rendered.class_compact[i]
+        for i in range(len(rendered.class_full)) if i in level
+    ]
+    relationship_texts = [rendered.relationship_lines[i] for i in sorted(included_relationships)]
+    context = rendered.assemble(
+        class_texts,
+        relationship_texts,
+        len(rendered.class_full) - len(level),
+        len(rendered.relationship_lines) - len(included_relationships),
+    )
+    return context, True
+
+
+_cache: "OrderedDict[Tuple[str, str], _Rendered]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'truncated': 0}
+
+
+def _content_hash(diagram: Dict[str, Any]) -> str:
+    # pickle is several times faster than canonical JSON on large diagrams and
+    # is exact; equal diagrams built differently may hash apart (a cache miss)
+    try:
+        payload = pickle.dumps(diagram, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        payload = json.dumps(diagram, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _prepare(diagram: Dict[str, Any], style: str, content_key: Optional[str] = None) -> _Rendered:
+    key = (style, content_key or _content_hash(diagram))
+    with _cache_lock:
+        rendered = _cache.get(key)
+        if rendered is not None:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return rendered
+        _stats['misses'] += 1
+
+    classes, relationships = _normalize(diagram)
+    rendered = _RENDERERS[style](diagram, classes, relationships).count()
+
+    max_size = getattr(settings, 'AI_DIAGRAM_CONTEXT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    with _cache_lock:
+        _cache[key] = rendered
+        while len(_cache) > max_size:
+            _cache.popitem(last=False)
+    return rendered
+
+
+def _focus_indexes(classes: List[_Class], focus: Optional[str]) -> List[int]:
+    if not focus:
+        return []
+    text = focus.lower()
+    indexes = []
+    for i, cls in enumerate(classes):
+        label = str(cls.label).lower() if cls.label else ''
+        if label and label in text and re.search(rf"(?<!\w){re.escape(label)}(?!\w)", text):
+            indexes.append(i)
+    return indexes
+
+
+def render_diagram_context(
+    diagram_data: Optional[Dict[str, Any]],
+    style: str = STYLE_DETAILED,
+    token_budget: Optional[int] = None,
+    focus: Optional[str] = None,
+    content_key: Optional[str] = None,
+    max_items: Optional[int] = None,
+) -> str:
+    """
+    Render a diagram for inclusion in a prompt.
+
+    Args:
+        diagram_data: Diagram with nodes/edges or classes/relationships
+        style: One of STYLE_DETAILED, STYLE_ASSISTANT, STYLE_SUMMARY, STYLE_NAMES
+        token_budget: Maximum tokens for the rendered context
+            (default: AI_DIAGRAM_CONTEXT_TOKEN_BUDGET)
+        focus: Text (usually the user's command) whose class names are kept
+            in full detail first when the diagram exceeds the budget
+        content_key: Identity of diagram_data when the caller already has one
+            (built from UMLDiagram.content_hash); the diagram is hashed otherwise.
+            Only pass keys derived from server-side data.
+        max_items: Most classes, and most relationships, to list; the rest
+            are reported as omitted like those that exceed the budget
+
+    Returns:
+        Rendered context, or "" when there is no diagram
+    """
+    if not diagram_data:
+        return ""
+    if style not in _RENDERERS:
+        raise ValueError(f"Unknown diagram context style '{style}'")
+
+    if token_budget is None:
+        token_budget = getattr(settings, 'AI_DIAGRAM_CONTEXT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+
+    rendered = _prepare(diagram_data, style, content_key)
+    context, truncated = _fit(rendered, token_budget, focus, max_items)
+    if truncated:
+        with _cache_lock:
+            _stats['truncated'] += 1
+    return context
+
+
+def get_diagram_context_stats() -> Dict[str, int]:
+    """Memo hits/misses, truncated renders and current cache size."""
+    with _cache_lock:
+        return {**_stats, 'cached': len(_cache)}
+
+
+def clear_diagram_context_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,261 @@
+"""
+Hedged model calls for the command router.
+
+A command used to go to one model, and only when that model raised or
+answered without elements did the router call the fallback, so a slow or
+failing primary doubled the tail latency. run_hedged() starts the primary
+and, if it has not produced a usable answer after the hedge delay, starts
+the fallback next to it and returns whichever usable answer arrives first.
+A failed or empty primary starts the fallback at once, and a delay of 0
+(critical paths) starts both together.
+
+Blocking calls cannot be interrupted: the loser is cancelled if it has not
+started yet and otherwise left to finish on its thread, with its answer
+ignored. Its latency is still recorded.
+
+ModelCallStats keeps, per process, recent latencies per model (p50/p95/p99)
+and how often each model wins a race, so AI_HEDGE_DELAY can be tuned from
+data: a delay near the primary's p95 hedges about one call in twenty.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .llm_executor import _call_and_release
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_DELAY = 6.0
+DEFAULT_POOL_SIZE = 32
+DEFAULT_STATS_WINDOW = 500
+
+REASON_SLOW = 'slow_primary'
+REASON_ERROR = 'primary_error'
+REASON_EMPTY = 'empty_elements'
+REASON_CRITICAL = 'critical'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide executor for hedged model calls, created on first use.
+
+    Separate from the LLM pool because the router itself usually runs on an
+    LLM pool thread; waiting there for work queued on the same pool could
+    deadlock once the pool is full.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AI_HEDGE_THREAD_POOL_SIZE', DEFAULT_POOL_SIZE),
+                    thread_name_prefix='llm-hedge',
+                )
+    return _executor
+
+
+def is_usable(result: Any) -> bool:
+    """Whether a command result can be returned without trying another model."""
+    return isinstance(result, dict) and bool(result.get('elements')) and 'error' not in result
+
+
+def _percentile(ordered: list, pct: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ModelCallStats:
+    """Latency percentiles and race outcomes per model for this process."""
+
+    _lock = threading.Lock()
+    _latencies: Dict[str, deque] = {}
+    _calls: Dict[str, Dict[str, int]] = {}
+    _hedges = {
+        'launched': 0,
+        REASON_SLOW: 0,
+        REASON_ERROR: 0,
+        REASON_EMPTY: 0,
+        REASON_CRITICAL: 0,
+        'primary_wins': 0,
+        'hedge_wins': 0,
+        'no_winner': 0,
+    }
+
+    @classmethod
+    def _model(cls, model: str) -> Dict[str, int]:
+        counters = cls._calls.get(model)
+        if counters is None:
+            counters = cls._calls[model] = {'calls': 0, 'errors': 0, 'empty': 0, 'races': 0, 'wins': 0}
+            cls._latencies[model] = deque(
+                maxlen=getattr(settings, 'AI_HEDGE_STATS_WINDOW', DEFAULT_STATS_WINDOW)
+            )
+        return counters
+
+    @classmethod
+    def record_call(cls, model: str, seconds: float, outcome: str) -> None:
+        """
+        Record one finished model call.
+
+        Args:
+            model: Model identifier
+            seconds: Wall time of the call
+            outcome: 'ok', 'empty' (answer without usable elements) or 'error'
+        """
+        with cls._lock:
+            counters = cls._model(model)
+            counters['calls'] += 1
+            if outcome == 'error':
+                counters['errors'] += 1
+                return
+            if outcome == 'empty':
+                counters['empty'] += 1
+            cls._latencies[model].append(seconds)
+
+    @classmethod
+    def record_hedge(cls, reason: str) -> None:
+        with cls._lock:
+            cls._hedges['launched'] += 1
+            cls._hedges[reason] += 1
+
+    @classmethod
+    def record_race(cls, primary: str, hedge: str, winner: Optional[str]) -> None:
+        """Record the outcome of a call where primary and hedge both ran."""
+        with cls._lock:
+            for model in (primary, hedge):
+                cls._model(model)['races'] += 1
+            if winner is None:
+                cls._hedges['no_winner'] += 1
+                return
+            cls._calls[winner]['wins'] += 1
+            cls._hedges['primary_wins' if winner == primary else 'hedge_wins'] += 1
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """
+        Per-model latency and race counters for this process.
+
+        Returns:
+            Dictionary with 'models' (calls, errors, empty, p50_ms, p95_ms,
+            p99_ms over the last AI_HEDGE_STATS_WINDOW answers, races, wins
+            and win_rate) and 'hedges' (launched, by reason, who won, and the
+            enabled and delay settings in effect)
+        """
+        with cls._lock:
+            calls = {model: dict(counters) for model, counters in cls._calls.items()}
+            latencies = {model: sorted(samples) for model, samples in cls._latencies.items()}
+            hedges = dict(cls._hedges)
+        hedges['enabled'] = getattr(settings, 'AI_HEDGE_ENABLED', True)
+        hedges['delay'] = getattr(settings, 'AI_HEDGE_DELAY', DEFAULT_HEDGE_DELAY)
+
+        models = {}
+        for model, counters in calls.items():
+            ordered = latencies[model]
+            for pct in (50, 95, 99):
+                counters[f'p{pct}_ms'] = round(_percentile(ordered, pct) * 1000, 1) if ordered else None
+            counters['win_rate'] = round(counters['wins'] / counters['races'], 3) if counters['races'] else None
+            models[model] = counters
+        return {'models': models, 'hedges': hedges}
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls._calls.clear()
+            cls._latencies.clear()
+            for name in cls._hedges:
+                cls._hedges[name] = 0
+
+
+def _timed_call(call: Callable[[str], Any], model: str) -> Tuple[Any, Optional[BaseException]]:
+    start = time.perf_counter()
+    try:
+        result = _call_and_release(call, model)
+    except Exception as e:
+        ModelCallStats.record_call(model, time.perf_counter() - start, 'error')
+        return None, e
+    ModelCallStats.record_call(model, time.perf_counter() - start, 'ok' if is_usable(result) else 'empty')
+    return result, None
+
+
+def run_hedged(
+    call: Callable[[str], Dict[str, Any]],
+    primary: str,
+    fallback: Optional[str],
+    delay: Optional[float],
+) -> Tuple[str, Any, Dict[str, Any]]:
+    """
+    Run call(primary), hedged with call(fallback).
+
+    Args:
+        call: Blocking function taking a model identifier and returning a
+            command result
+        primary: Model to try first
+        fallback: Model to hedge with, or None
+        delay: Seconds to wait for the primary before hedging; 0 starts both
+            at once, None only falls back after the primary fails
+
+    Returns:
+        (model, result, info): the model whose result is returned, the result
+        (None if every call raised) and info with 'hedge_reason' (None when
+        the fallback never ran), 'raced' (both ran at the same time) and
+        'error' (the primary's exception, if any)
+    """
+    executor = get_hedge_executor()
+    futures: Dict[Future, str] = {executor.submit(_timed_call, call, primary): primary}
+    answers: Dict[str, Tuple[Any, Optional[BaseException]]] = {}
+    info = {'hedge_reason': None, 'raced': False, 'error': None}
+
+    def launch(reason: str) -> None:
+        info['hedge_reason'] = reason
+        info['raced'] = primary not in answers
+        ModelCallStats.record_hedge(reason)
+        logger.info(f"[HEDGE] Starting {fallback} next to {primary} ({reason})")
+        futures[executor.submit(_timed_call, call, fallback)] = fallback
+
+    if fallback and delay == 0:
+        launch(REASON_CRITICAL)
+
+    pending = set(futures)
+    timeout = delay if fallback and info['hedge_reason'] is None else None
+    while pending:
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # The hedge delay passed without an answer from the primary
+            launch(REASON_SLOW)
+            pending = set(f for f in futures if futures[f] not in answers)
+            timeout = None
+            continue
+
+        for future in sorted(done, key=lambda f: futures[f] != primary):
+            model = futures[future]
+            answers[model] = future.result()
+            if is_usable(answers[model][0]):
+                for other in pending:
+                    other.cancel()
+                if info['raced']:
+                    ModelCallStats.record_race(primary, fallback, model)
+                info['error'] = answers.get(primary, (None, None))[1]
+                return model, answers[model][0], info
+
+        if fallback and info['hedge_reason'] is None:
+            result, error = answers[primary]
+            launch(REASON_ERROR if error is not None else REASON_EMPTY)
+            pending = set(f for f in futures if futures[f] not in answers)
+            timeout = None
+
+    if info['raced']:
+        ModelCallStats.record_race(primary, fallback, None)
+    info['error'] = answers[primary][1]
+    # Nothing usable: prefer the primary's own answer, as before hedging
+    for model in (primary, fallback):
+        if model in answers and answers[model][0] is not None:
+            return model, answers[model][0], info
+    return primary, None, info
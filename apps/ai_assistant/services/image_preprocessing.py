@@ -0,0 +1,268 @@
+"""
+Preprocessing of diagram images before they are sent to a vision model.
+
+Uploads are accepted up to 20 MB and 4096x4096 and used to be sent as
+uploaded, base64-encoded a second time from the decoded bytes. The models
+scale every image down to their own working resolution anyway, so the
+extra pixels only cost upload time and prompt tokens. Each image is:
+
+- decoded once: the service's validation hands over the opened image, and
+  an image that is not changed is sent as the base64 string it came in
+- flattened onto white if it has transparency, and converted to greyscale
+  (AI_IMAGE_GRAYSCALE); diagrams carry no meaning in colour
+- cropped to its content plus AI_IMAGE_CROP_PADDING pixels when the margins
+  are a uniform background (AI_IMAGE_CROP_MARGINS)
+- scaled down so its longer side is at most the model's working resolution
+  (the service's TARGET_DIMENSION); JPEGs are decoded at reduced scale
+- re-encoded as PNG, or as JPEG at AI_IMAGE_JPEG_QUALITY; with the default
+  AI_IMAGE_OUTPUT_FORMAT 'auto' the upload's own format is kept, PNG for
+  screenshots and JPEG for photos, since JPEG blurs thin lines and text of
+  screenshots and PNG inflates photos
+
+The original is sent when the result would not be smaller.
+"""
+
+import base64
+import io
+import logging
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'AI_IMAGE_PREPROCESSING_ENABLED': True,
+    'AI_IMAGE_GRAYSCALE': True,
+    'AI_IMAGE_CROP_MARGINS': True,
+    'AI_IMAGE_CROP_PADDING': 16,
+    'AI_IMAGE_OUTPUT_FORMAT': 'auto',
+    'AI_IMAGE_JPEG_QUALITY': 85,
+}
+
+# Grey levels a margin pixel may differ from the background (JPEG noise)
+BACKGROUND_TOLERANCE = 32
+
+
+def _setting(name: str) -> Any:
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class PreparedImage(NamedTuple):
+    """
+    Image as it is sent to the model.
+
+    crop_box is the part of the upload that was sent, in upload pixels: a
+    point (x, y) the model sees maps back to crop_box[0] + x * (crop width /
+    size[0]), and likewise for y.
+    """
+
+    data: bytes
+    base64: str
+    format: str
+    size: Tuple[int, int]
+    original_bytes: int
+    original_size: Tuple[int, int]
+    crop_box: Tuple[int, int, int, int]
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary for the result metadata."""
+        return {
+            'format': self.format,
+            'size': list(self.size),
+            'bytes': len(self.data),
+            'original_size': list(self.original_size),
+            'original_bytes': self.original_bytes,
+            'crop_box': list(self.crop_box),
+        }
+
+
+def split_base64(base64_image: str) -> str:
+    """Base64 payload of an upload, without a data: URL prefix."""
+    if ',' in base64_image:
+        base64_image = base64_image.split(',', 1)[1]
+    return base64_image.strip()
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    # Transparent screenshots would turn black in 'L' or 'RGB'
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, 'white')
+        return Image.alpha_composite(background, image)
+    return image
+
+
+def background_mask(grey: Image.Image) -> Optional[Image.Image]:
+    """
+    Mask (255) of everything that differs from the background colour.
+
+    The background is the most common of the four corner pixels; None when
+    fewer than three corners agree, i.e. there is no uniform background.
+    """
+    width, height = grey.size
+    corners = [grey.getpixel(point) for point in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1))]
+    background = max(set(corners), key=corners.count)
+    if corners.count(background) < 3:
+        return None
+    # One lookup-table pass marks every pixel away from the background
+    return grey.point([255 if abs(value - background) > BACKGROUND_TOLERANCE else 0 for value in range(256)])
+
+
+def content_box(grey: Image.Image, padding: int) -> Tuple[int, int, int, int]:
+    """
+    Bounding box of the content on a uniform background, plus padding.
+
+    The whole image is returned when there is no uniform background or
+    nothing differs from it.
+    """
+    width, height = grey.size
+    mask = background_mask(grey)
+    box = mask.getbbox() if mask is not None else None
+    if box is None:
+        return (0, 0, width, height)
+    left, top, right, bottom = box
+    return (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(width, right + padding),
+        min(height, bottom + padding),
+    )
+
+
+class ImagePreprocessor:
+    """Shrinks validated images for the vision services, with stats."""
+
+    _lock = threading.Lock()
+    _stats = {'images': 0, 'unchanged': 0, 'original_bytes': 0, 'sent_bytes': 0, 'total_ms': 0.0}
+
+    @classmethod
+    def prepare(
+        cls,
+        image: Image.Image,
+        image_data: bytes,
+        base64_data: str,
+        max_dimension: int,
+    ) -> PreparedImage:
+        """
+        Preprocess an opened, validated image.
+
+        Args:
+            image: Image opened from image_data, not yet loaded
+            image_data: Uploaded image bytes
+            base64_data: The same bytes as uploaded, without data: prefix
+            max_dimension: Longer side the model works at
+
+        Returns:
+            PreparedImage; the upload itself when preprocessing is disabled
+            or would not make it smaller
+        """
+        source_format = image.format.lower()
+        original = PreparedImage(
+            image_data, base64_data, source_format, image.size, len(image_data), image.size, (0, 0) + image.size
+        )
+        if not _setting('AI_IMAGE_PREPROCESSING_ENABLED'):
+            return original
+
+        start = time.perf_counter()
+        try:
+            prepared = cls._transform(image, original, max_dimension)
+        except Exception as e:
+            logger.warning(f"Image preprocessing failed, sending the original: {e}")
+            prepared = original
+        cls._record(prepared, original, (time.perf_counter() - start) * 1000)
+        return prepared
+
+    @classmethod
+    def _transform(cls, image: Image.Image, original: PreparedImage, max_dimension: int) -> PreparedImage:
+        output_format = _setting('AI_IMAGE_OUTPUT_FORMAT')
+        if output_format == 'auto':
+            output_format = original.format
+        output_format = 'jpeg' if output_format in ('jpeg', 'jpg') else 'png'
+        grayscale = _setting('AI_IMAGE_GRAYSCALE')
+
+        if image.format == 'JPEG' and max(image.size) > max_dimension:
+            # Decode at the smallest 1/2, 1/4 or 1/8 scale still above the target
+            scale = max_dimension / max(image.size)
+            image.draft('L' if grayscale else 'RGB', (round(image.width * scale), round(image.height * scale)))
+
+        image = _flatten(image)
+        image = image.convert('L' if grayscale else 'RGB')
+
+        crop_box = original.crop_box
+        if _setting('AI_IMAGE_CROP_MARGINS'):
+            grey = image if grayscale else image.convert('L')
+            box = content_box(grey, _setting('AI_IMAGE_CROP_PADDING'))
+            if box != (0, 0) + image.size:
+                # In upload pixels: draft() may have decoded at a smaller scale
+                scale_x = original.original_size[0] / image.width
+                scale_y = original.original_size[1] / image.height
+                crop_box = (
+                    round(box[0] * scale_x), round(box[1] * scale_y),
+                    round(box[2] * scale_x), round(box[3] * scale_y),
+                )
+                image = image.crop(box)
+
+        if max(image.size) > max_dimension:
+            scale = max_dimension / max(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            # Box-reduce by the integer part of the scale first: half the time
+            # of Lanczos over the full image, and no visible difference on
+            # lines and text
+            image = image.resize(size, Image.LANCZOS, reducing_gap=1.0)
+
+        buffer = io.BytesIO()
+        if output_format == 'jpeg':
+            image.save(buffer, 'JPEG', quality=_setting('AI_IMAGE_JPEG_QUALITY'))
+        else:
+            image.save(buffer, 'PNG')
+        data = buffer.getvalue()
+        if len(data) >= original.original_bytes:
+            return original
+        return PreparedImage(
+            data,
+            base64.b64encode(data).decode('ascii'),
+            output_format,
+            image.size,
+            original.original_bytes,
+            original.original_size,
+            crop_box,
+        )
+
+    @classmethod
+    def _record(cls, prepared: PreparedImage, original: PreparedImage, elapsed_ms: float) -> None:
+        with cls._lock:
+            cls._stats['images'] += 1
+            cls._stats['unchanged'] += prepared is original
+            cls._stats['original_bytes'] += original.original_bytes
+            cls._stats['sent_bytes'] += len(prepared.data)
+            cls._stats['total_ms'] += elapsed_ms
+        logger.info(
+            f"Image preprocessed in {elapsed_ms:.0f}ms: {original.size[0]}x{original.size[1]} "
+            f"{original.original_bytes} bytes -> {prepared.size[0]}x{prepared.size[1]} "
+            f"{prepared.format} {len(prepared.data)} bytes"
+        )
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """
+        Returns:
+            Dictionary with images preprocessed (unchanged of them sent as
+            uploaded), original_bytes, sent_bytes, the ratio of the two and
+            avg_ms spent per image
+        """
+        with cls._lock:
+            stats = dict(cls._stats)
+        total_ms = stats.pop('total_ms')
+        stats['ratio'] = round(stats['sent_bytes'] / stats['original_bytes'], 3) if stats['original_bytes'] else None
+        stats['avg_ms'] = round(total_ms / stats['images'], 1) if stats['images'] else None
+        stats['enabled'] = _setting('AI_IMAGE_PREPROCESSING_ENABLED')
+        return stats
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls._stats.update(images=0, unchanged=0, original_bytes=0, sent_bytes=0, total_ms=0.0)
@@ -10,30 +10,38 @@ Features:
 - Rate limiting per anonymous session
 """
 
-import hashlib
-import json
+import copy
 import logging
 import time
-from typing import Any, Dict, List, Optional
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from pydantic import BaseModel, Field, validator
 
+from apps.uml_diagrams.content_hash import compute_content_hash
+from apps.uml_diagrams.services.delta_applier import DeltaApplyError, apply_delta, normalize_content
+
 from .cache_service import CacheService
 from .command_patterns import (
-    detect_language,
-    get_command_patterns,
+    match_command,
     normalize_relationship_type,
     normalize_type,
     normalize_visibility,
 )
+from .diagram_context import STYLE_NAMES, render_diagram_context
+from .json_stream import extract_json
 from .openai_service import OpenAIService
 from .rate_limiter import RateLimiter
+from .single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 CACHE_TTL_COMMANDS = 300
 RATE_LIMIT_COMMANDS = 100
 RATE_LIMIT_WINDOW = 3600
+DEFAULT_BATCH_MAX_COMMANDS = 50
 
 
 class CommandRequest(BaseModel):
@@ -102,10 +110,33 @@ class IncrementalCommandProcessor:
         ... )
     """
 
-    def __init__(self):
-        """Initialize incremental command processor."""
+    PATTERN_HANDLERS: Dict[str, str] = {
+        "add_attribute": "_handle_add_attribute",
+        "remove_attribute": "_handle_remove_attribute",
+        "modify_attribute": "_handle_modify_attribute",
+        "add_method": "_handle_add_method",
+        "remove_method": "_handle_remove_method",
+        "add_relationship": "_handle_add_relationship",
+        "remove_relationship": "_handle_remove_relationship",
+        "rename_class": "_handle_rename_class",
+        "change_visibility": "_handle_change_visibility",
+    }
+
+    def __init__(self, openai_service: Optional[OpenAIService] = None):
+        """Initialize incremental command processor.
+
+        Args:
+            openai_service: Shared OpenAIService for the AI fallback; built on
+                first use when not given
+        """
+        self._openai_service = openai_service
         logger.info("Incremental Command Processor initialized")
 
+    def _get_openai_service(self) -> OpenAIService:
+        if self._openai_service is None:
+            self._openai_service = OpenAIService()
+        return self._openai_service
+
     def process_command(
         self,
         command: str,
@@ -113,6 +144,7 @@ class IncrementalCommandProcessor:
         current_diagram: Dict[str, Any],
         use_cache: bool = True,
         session_id: Optional[str] = None,
+        diagram_hash: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Process incremental command and return DELTA.
 
@@ -122,6 +154,8 @@ class IncrementalCommandProcessor:
             current_diagram: Current diagram with nodes/edges
             use_cache: Whether to use cache
             session_id: Session ID for rate limiting
+            diagram_hash: Structural hash of current_diagram when the caller
+                already has it (UMLDiagram.content_hash); computed otherwise
 
         Returns:
             DELTA dictionary with action, changes, description
@@ -151,14 +185,10 @@ class IncrementalCommandProcessor:
             current_diagram=current_diagram,
         )
 
-        diagram_hash = hashlib.md5(
-            json.dumps(current_diagram, sort_keys=True).encode()
-        ).hexdigest()
-
         cache_key = {
             "method": "process_incremental_command",
             "command": command.lower(),
-            "diagram_hash": diagram_hash,
+            "diagram_hash": diagram_hash or compute_content_hash(current_diagram),
         }
 
         if use_cache:
@@ -179,32 +209,258 @@ class IncrementalCommandProcessor:
                     f"Command rate limit exceeded. Retry after {retry_after}s"
                 )
 
+        if use_cache:
+            return SingleFlight.do(
+                cache_key,
+                lambda: self._compute_delta(command, current_diagram),
+                ttl=CACHE_TTL_COMMANDS,
+            )
+
+        return self._compute_delta(command, current_diagram)
+
+    async def aprocess_command(
+        self,
+        command: str,
+        diagram_id: str,
+        current_diagram: Dict[str, Any],
+        use_cache: bool = True,
+        session_id: Optional[str] = None,
+        diagram_hash: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Async version of process_command() for async views.
+
+        Cache and rate-limit lookups run on worker threads, concurrent
+        identical commands are coalesced with SingleFlight.ado() and the AI
+        fallback awaits the async Azure OpenAI client, so the event loop is
+        not blocked while the model answers.
+        """
+        CommandRequest(
+            command=command,
+            diagram_id=diagram_id,
+            current_diagram=current_diagram,
+        )
+
+        cache_key = {
+            "method": "process_incremental_command",
+            "command": command.lower(),
+            "diagram_hash": diagram_hash or compute_content_hash(current_diagram),
+        }
+
+        if use_cache:
+            cached_result = await sync_to_async(CacheService.get, thread_sensitive=False)(cache_key)
+            if cached_result:
+                logger.info("Returning cached command result")
+                return cached_result
+
+        if session_id:
+            allowed, retry_after = await sync_to_async(
+                RateLimiter.check_rate_limit, thread_sensitive=False
+            )(
+                session_id,
+                "process_command",
+                RATE_LIMIT_COMMANDS,
+                RATE_LIMIT_WINDOW,
+            )
+            if not allowed:
+                raise ValueError(
+                    f"Command rate limit exceeded. Retry after {retry_after}s"
+                )
+
+        if use_cache:
+            return await SingleFlight.ado(
+                cache_key,
+                lambda: self._acompute_delta(command, current_diagram),
+                ttl=CACHE_TTL_COMMANDS,
+            )
+
+        return await self._acompute_delta(command, current_diagram)
+
+    def process_batch(
+        self,
+        commands: List[str],
+        diagram_id: str,
+        current_diagram: Dict[str, Any],
+        use_cache: bool = True,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Process an ordered list of commands against one diagram.
+
+        Commands are applied in order to an in-memory copy of the diagram,
+        so each one sees the effect of the previous ones. Regex-matchable
+        commands are resolved locally; each run of consecutive commands
+        without a pattern is sent to the AI in one grouped call, against the
+        diagram as left by the commands before it. The diagram is hashed
+        once for the whole batch; every command counts against the rate
+        limit.
+
+        Args:
+            commands: Natural language commands, in order
+            diagram_id: Diagram ID
+            current_diagram: Current diagram with nodes/edges
+            use_cache: Whether to use cache
+            session_id: Session ID for rate limiting
+
+        Returns:
+            Dictionary with:
+            - deltas: applied DELTAs in command order
+            - results: one entry per command in the same order, with index,
+              command, status ("applied" or "error"), source ("pattern" or
+              "ai") and delta, or error
+            - ai_commands: number of commands sent to the AI
+            - ai_calls: number of grouped AI calls made
+
+        Raises:
+            ValueError: If the batch is empty, too large or rate limited
+        """
+        max_commands = getattr(settings, "AI_INCREMENTAL_BATCH_MAX_COMMANDS", DEFAULT_BATCH_MAX_COMMANDS)
+        if not commands:
+            raise ValueError("Batch must contain at least one command")
+        if len(commands) > max_commands:
+            raise ValueError(f"Batch exceeds {max_commands} commands")
+
+        cache_key = {
+            "method": "process_incremental_batch",
+            "commands": [command.lower() for command in commands],
+            "diagram_hash": compute_content_hash(current_diagram),
+        }
+
+        if use_cache:
+            cached_result = CacheService.get(cache_key)
+            if cached_result:
+                logger.info("Returning cached batch result")
+                return cached_result
+
+        if session_id:
+            allowed, retry_after = RateLimiter.check_rate_limit(
+                session_id,
+                "process_command",
+                RATE_LIMIT_COMMANDS,
+                RATE_LIMIT_WINDOW,
+                cost=len(commands),
+            )
+            if not allowed:
+                raise ValueError(
+                    f"Command rate limit exceeded. Retry after {retry_after}s"
+                )
+
+        if use_cache:
+            return SingleFlight.do(
+                cache_key,
+                lambda: self._compute_batch(commands, current_diagram),
+                ttl=CACHE_TTL_COMMANDS,
+            )
+
+        return self._compute_batch(commands, current_diagram)
+
+    def _compute_batch(
+        self, commands: List[str], current_diagram: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Resolve and apply a batch; see process_batch()."""
+        working = normalize_content(copy.deepcopy(current_diagram))
+        results: List[Dict[str, Any]] = []
+        run: List[Tuple[int, str]] = []
+        ai_commands = ai_calls = 0
+
+        for index, command in enumerate(commands):
+            # Whether a command has a pattern does not depend on the diagram,
+            # so runs of AI commands are known before anything is applied
+            if match_command(command) is None:
+                run.append((index, command))
+                continue
+            if run:
+                results.extend(self._apply_ai_run(working, run))
+                ai_commands, ai_calls, run = ai_commands + len(run), ai_calls + 1, []
+
+            try:
+                delta = self._try_pattern_match(command, working)
+            except (NodeNotFoundError, InvalidOperationError, CommandNotRecognizedError) as e:
+                results.append(self._batch_error(index, command, e))
+                continue
+            results.append(self._apply_batch_delta(working, index, command, delta, "pattern"))
+
+        if run:
+            results.extend(self._apply_ai_run(working, run))
+            ai_commands, ai_calls = ai_commands + len(run), ai_calls + 1
+
+        if ai_calls:
+            logger.info(f"Batch: {ai_commands} of {len(commands)} commands sent to AI in {ai_calls} calls")
+        return {
+            "deltas": [result["delta"] for result in results if result["status"] == "applied"],
+            "results": results,
+            "ai_commands": ai_commands,
+            "ai_calls": ai_calls,
+        }
+
+    def _apply_ai_run(
+        self, working: Dict[str, Any], run: List[Tuple[int, str]]
+    ) -> List[Dict[str, Any]]:
+        """Resolve consecutive commands with one AI call and apply them in order."""
+        try:
+            ai_deltas = self._process_batch_with_ai([command for _, command in run], working)
+        except CommandNotRecognizedError as e:
+            ai_deltas = [e] * len(run)
+
+        results = []
+        for (index, command), delta in zip(run, ai_deltas):
+            if isinstance(delta, Exception):
+                results.append(self._batch_error(index, command, delta))
+            else:
+                results.append(self._apply_batch_delta(working, index, command, delta, "ai"))
+        return results
+
+    def _apply_batch_delta(
+        self, working: Dict[str, Any], index: int, command: str, delta: Any, source: str
+    ) -> Dict[str, Any]:
+        try:
+            apply_delta(working, delta)
+        except DeltaApplyError as e:
+            return self._batch_error(index, command, e)
+        return {"index": index, "command": command, "status": "applied", "source": source, "delta": delta}
+
+    def _batch_error(self, index: int, command: str, error: Exception) -> Dict[str, Any]:
+        return {"index": index, "command": command, "status": "error", "error": str(error)}
+
+    def _new_element_id(self, prefix: str) -> str:
+        """Element ID unique even for several elements created in the same millisecond."""
+        return f"{prefix}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}"
+
+    def _compute_delta(
+        self, command: str, current_diagram: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Resolve a command with regex patterns, falling back to AI."""
         try:
             delta = self._try_pattern_match(command, current_diagram)
 
             if delta:
                 logger.info("Command matched with regex pattern")
-                if use_cache:
-                    CacheService.set(cache_key, delta, ttl=CACHE_TTL_COMMANDS)
                 return delta
 
         except (NodeNotFoundError, InvalidOperationError) as e:
             raise
 
         logger.info("Falling back to AI for complex command")
-        delta = self._process_with_ai(command, current_diagram)
+        return self._process_with_ai(command, current_diagram)
 
-        if use_cache:
-            CacheService.set(cache_key, delta, ttl=CACHE_TTL_COMMANDS)
+    async def _acompute_delta(
+        self, command: str, current_diagram: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Async version of _compute_delta(); pattern matching stays inline."""
+        delta = self._try_pattern_match(command, current_diagram)
+        if delta:
+            logger.info("Command matched with regex pattern")
+            return delta
 
-        return delta
+        logger.info("Falling back to AI for complex command")
+        return await self._aprocess_with_ai(command, current_diagram)
 
     def _try_pattern_match(
         self, command: str, diagram: Dict[str, Any]
     ) -> Optional[Dict[str, Any]]:
         """Try to match command with regex patterns (bilingual).
 
-        Detects language automatically and tries appropriate patterns.
+        English and Spanish rules are matched in a single pass; the rule
+        that matched is reported in the delta as "matched_rule"
+        (e.g. "es:add_attribute").
 
         Args:
             command: Command to process (English or Spanish)
@@ -213,43 +469,23 @@ class IncrementalCommandProcessor:
         Returns:
             Delta if match found, None otherwise
         """
-        language = detect_language(command)
-        patterns = get_command_patterns(language)
-
-        logger.debug(f"Detected language: {language}")
-
-        for pattern_name, pattern in patterns.items():
-            match = pattern.search(command)
-            if match:
-                logger.debug(f"Matched pattern: {pattern_name} ({language})")
-                return self._handle_pattern_match(pattern_name, match, diagram)
+        command_match = match_command(command)
+        if command_match is None:
+            return None
 
-        return None
+        logger.debug(f"Matched pattern: {command_match.rule_id}")
+        delta = self._handle_pattern_match(command_match.rule, command_match.match, diagram)
+        delta["matched_rule"] = command_match.rule_id
+        return delta
 
     def _handle_pattern_match(
         self, pattern_name: str, match, diagram: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Handle specific pattern match."""
-        if "add_attribute" in pattern_name:
-            return self._handle_add_attribute(match, diagram)
-        elif "remove_attribute" in pattern_name:
-            return self._handle_remove_attribute(match, diagram)
-        elif "modify_attribute" in pattern_name:
-            return self._handle_modify_attribute(match, diagram)
-        elif "add_method" in pattern_name:
-            return self._handle_add_method(match, diagram)
-        elif "remove_method" in pattern_name:
-            return self._handle_remove_method(match, diagram)
-        elif "add_relationship" in pattern_name:
-            return self._handle_add_relationship(match, diagram)
-        elif "remove_relationship" in pattern_name:
-            return self._handle_remove_relationship(match, diagram)
-        elif "rename_class" in pattern_name:
-            return self._handle_rename_class(match, diagram)
-        elif "change_visibility" in pattern_name:
-            return self._handle_change_visibility(match, diagram)
-
-        raise CommandNotRecognizedError(f"Pattern {pattern_name} not handled")
+        """Dispatch a pattern match to its handler."""
+        handler_name = self.PATTERN_HANDLERS.get(pattern_name)
+        if handler_name is None:
+            raise CommandNotRecognizedError(f"Pattern {pattern_name} not handled")
+        return getattr(self, handler_name)(match, diagram)
 
     def _handle_add_attribute(self, match, diagram: Dict[str, Any]) -> Dict[str, Any]:
         """Handle add attribute command."""
@@ -263,7 +499,7 @@ class IncrementalCommandProcessor:
             raise NodeNotFoundError(f"Class '{class_name}' not found")
 
         new_attribute = {
-            "id": f"attr-{int(time.time() * 1000)}",
+            "id": self._new_element_id("attr"),
             "name": attr_name,
             "type": normalize_type(attr_type),
             "visibility": "private",
@@ -349,7 +585,7 @@ class IncrementalCommandProcessor:
         parameters = self._parse_parameters(params_str)
 
         new_method = {
-            "id": f"method-{int(time.time() * 1000)}",
+            "id": self._new_element_id("method"),
             "name": method_name,
             "returnType": normalize_type(return_type),
             "visibility": "public",
@@ -407,7 +643,7 @@ class IncrementalCommandProcessor:
         rel_type = normalize_relationship_type(rel_type_raw)
 
         new_edge = {
-            "id": f"edge-{int(time.time() * 1000)}",
+            "id": self._new_element_id("edge"),
             "source": source_node["id"],
             "target": target_node["id"],
             "type": "umlRelationship",
@@ -500,22 +736,17 @@ class IncrementalCommandProcessor:
             "description": f"Changed visibility of '{element_name}' to {visibility} in class '{class_name}'",
         }
 
-    def _process_with_ai(
-        self, command: str, diagram: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Process command using AI as fallback.
-
-        Uses existing AzureOpenAIService which handles o-series models automatically.
-        """
-        nodes = diagram.get("nodes", [])
-        class_names = [n.get("data", {}).get("label", "") for n in nodes]
+    def _ai_command_prompt(self, command: str, diagram: Dict[str, Any]) -> str:
+        """Prompt asking the AI for the DELTA of a single command."""
+        available_classes = render_diagram_context(
+            {"nodes": diagram.get("nodes", [])}, STYLE_NAMES, focus=command
+        )
 
         prompt = f"""Convert this UML modification command to JSON DELTA format.
 
 COMMAND: {command}
 
-AVAILABLE CLASSES: {', '.join(class_names)}
-TOTAL NODES: {len(nodes)}
+{available_classes}
 
 OUTPUT JSON (no markdown, no explanation):
 {{
@@ -531,29 +762,132 @@ OUTPUT JSON (no markdown, no explanation):
   "description": "Human-readable change description"
 }}
 """
+        return prompt
+
+    def _parse_ai_content(self, content: str, item_key: Optional[str] = None) -> Dict[str, Any]:
+        """Extract the AI's JSON answer (see json_stream).
+
+        A truncated answer is only repaired when item_key names the array
+        of whole DELTAs to keep; a single cut-off DELTA is rejected.
+        """
+        result = extract_json(
+            content,
+            item_keys=(item_key,) if item_key else (),
+            repair=item_key is not None,
+        )
+        if result is None:
+            raise ValueError("No JSON object in AI answer")
+        return result
+
+    def _process_with_ai(
+        self, command: str, diagram: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Process command using AI as fallback.
 
+        Uses existing AzureOpenAIService which handles o-series models automatically.
+        """
         try:
-            openai_service = OpenAIService()
+            openai_service = self._get_openai_service()
             content = openai_service.call_api(
-                messages=[{"role": "user", "content": prompt}],
+                messages=[{"role": "user", "content": self._ai_command_prompt(command, diagram)}],
                 temperature=0.7,
                 max_tokens=4096,
                 response_format="json",
             )
 
-            if content.startswith("```json"):
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif content.startswith("```"):
-                content = content.split("```")[1].split("```")[0].strip()
+            return self._parse_ai_content(content)
 
-            result = json.loads(content)
+        except Exception as e:
+            logger.error(f"AI processing failed: {e}")
+            raise CommandNotRecognizedError(f"Could not interpret command: {command}")
+
+    async def _aprocess_with_ai(
+        self, command: str, diagram: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Async version of _process_with_ai() on the AsyncAzureOpenAI client."""
+        try:
+            openai_service = self._get_openai_service()
+            content = await openai_service.acall_api(
+                messages=[{"role": "user", "content": self._ai_command_prompt(command, diagram)}],
+                temperature=0.7,
+                max_tokens=4096,
+                response_format="json",
+            )
 
-            return result
+            return self._parse_ai_content(content)
 
         except Exception as e:
             logger.error(f"AI processing failed: {e}")
             raise CommandNotRecognizedError(f"Could not interpret command: {command}")
 
+    def _process_batch_with_ai(
+        self, commands: List[str], diagram: Dict[str, Any]
+    ) -> List[Any]:
+        """Resolve several commands with one AI call.
+
+        Returns:
+            One entry per command, in order: its DELTA, or a
+            CommandNotRecognizedError when the AI gave none
+
+        Raises:
+            CommandNotRecognizedError: If the AI call or its JSON fails
+        """
+        if len(commands) == 1:
+            return [self._process_with_ai(commands[0], diagram)]
+
+        available_classes = render_diagram_context(
+            {"nodes": diagram.get("nodes", [])}, STYLE_NAMES, focus=" ".join(commands)
+        )
+        numbered = "\n".join(f"{index}. {command}" for index, command in enumerate(commands, 1))
+
+        prompt = f"""Convert each of these UML modification commands to a JSON DELTA.
+Commands are applied in order; later commands may refer to elements created by earlier ones.
+
+COMMANDS:
+{numbered}
+
+{available_classes}
+
+OUTPUT JSON (no markdown, no explanation), one DELTA per command, in order:
+{{
+  "deltas": [
+    {{
+      "action": "update_node" | "add_node" | "delete_node" | "update_edge" | "add_edge" | "delete_edge",
+      "node_id": "<uuid if applicable>",
+      "edge_id": "<uuid if applicable>",
+      "changes": {{
+        "path.to.field": {{
+          "operation": "append" | "remove" | "replace" | "update",
+          "value": <new value>
+        }}
+      }},
+      "description": "Human-readable change description"
+    }}
+  ]
+}}
+"""
+
+        try:
+            openai_service = self._get_openai_service()
+            content = openai_service.call_api(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=4096,
+                response_format="json",
+            )
+
+            deltas = self._parse_ai_content(content, item_key="deltas").get("deltas", [])
+
+        except Exception as e:
+            logger.error(f"AI batch processing failed: {e}")
+            raise CommandNotRecognizedError(f"Could not interpret {len(commands)} commands")
+
+        return [
+            deltas[index] if index < len(deltas) and isinstance(deltas[index], dict)
+            else CommandNotRecognizedError(f"Could not interpret command: {command}")
+            for index, command in enumerate(commands)
+        ]
+
     def _find_node_by_label(
         self, label: str, diagram: Dict[str, Any]
     ) -> Optional[Dict]:
@@ -0,0 +1,364 @@
+"""
+Single-pass JSON extraction from model output.
+
+Every model answers with one JSON object, but the text around it varies:
+markdown fences, a sentence before or after it, Llama 4 format tags, or an
+answer cut off by the token limit. JSONStreamExtractor reads the output once,
+either all at once or chunk by chunk while it streams:
+
+- the scanner only stops at structural characters (quotes, backslashes,
+  brackets, braces, colons and commas) and tracks strings and escapes, so
+  braces inside strings and text outside the object are ignored; an object
+  or item that is already complete is decoded in place by the C decoder
+  (json.JSONDecoder.raw_decode) instead of being scanned
+- items of the item arrays (by default "elements") are returned by feed()
+  as soon as their closing brace arrives
+- finish() returns the first top-level object that has the required keys,
+  parsed with json.loads; trailing commas are dropped, and the direct
+  children of an object that is not valid JSON are tried too (a stray
+  brace in the prose before the answer)
+- when the output ends inside the object, it is repaired: cut back to the
+  last complete value (never inside an item, so a half-written element is
+  dropped rather than returned) and closed
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STRUCTURAL = re.compile(r'["\\{}\[\]:,]')
+_IN_STRING = re.compile(r'["\\]')
+_CLOSERS = {'{': '}', '[': ']'}
+_DECODER = json.JSONDecoder()
+
+
+def _closers(stack: str) -> str:
+    return ''.join(_CLOSERS[char] for char in reversed(stack))
+
+
+class JSONStreamExtractor:
+    """
+    Feed-as-you-go extractor for the JSON object in a model answer.
+
+    Args:
+        item_keys: Top-level arrays whose items are emitted by feed() and
+            kept whole when repairing
+        required_keys: Keys the returned object must have; objects without
+            them (examples in prose, nested fragments) are skipped
+        repair: Whether finish() may close a truncated object
+    """
+
+    def __init__(
+        self,
+        item_keys: Iterable[str] = ("elements",),
+        required_keys: Iterable[str] = (),
+        repair: bool = True,
+    ):
+        self.item_keys = frozenset(item_keys)
+        self.required_keys = tuple(required_keys)
+        self.repair = repair
+        self.emitted = 0
+        self.repaired = False
+
+        self._parts: List[str] = []
+        self._length = 0
+        # Open containers as a string, so a snapshot is just a reference
+        self._stack = ''
+        self._prev = ''
+        self._in_string = False
+        self._escaped = False
+        self._string_is_value = False
+        self._key_parts: Optional[List[str]] = None
+        self._last_key = None
+
+        self._root_start = None
+        self._root_count = 0
+        self._roots: List[tuple] = []
+        self._child_start = None
+        self._children: List[tuple] = []
+        self._safe = None
+        self._comma = None
+        self._trailing_commas: List[tuple] = []
+
+        self._item_root = None
+        self._array_depth = None
+        self._capturing = False
+        self._item_start = None
+        self._item_parts: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consume the next piece of model output.
+
+        Args:
+            chunk: Text as received from the stream
+
+        Returns:
+            Items completed by this chunk, in order (possibly empty)
+        """
+        items = []
+        base = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        capture_start = 0 if self._capturing else None
+        position = 0
+        length = len(chunk)
+
+        while position < length:
+            if self._in_string:
+                if self._escaped:
+                    # Escape sequence split across chunks
+                    self._collect_key(chunk[position])
+                    self._escaped = False
+                    position += 1
+                    continue
+                match = _IN_STRING.search(chunk, position)
+                if match is None:
+                    self._collect_key(chunk[position:])
+                    break
+                index = match.start()
+                self._collect_key(chunk[position:index])
+                if match.group() == '\\':
+                    self._collect_key(chunk[index:index + 2])
+                    self._escaped = index + 1 >= length
+                    position = index + 2
+                    continue
+                position = index + 1
+                self._close_string(base + position)
+                continue
+
+            match = _STRUCTURAL.search(chunk, position)
+            if match is None:
+                break
+            index = match.start()
+            char = match.group()
+            position = index + 1
+
+            if not self._stack:
+                # Outside the object only an opening brace matters
+                if char == '{':
+                    end = self._decode_root(chunk, index, base, items)
+                    if end is not None:
+                        position = end
+                        continue
+                    self._open_root(base + index)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_is_value = self._stack[-1] == '[' or self._prev == ':'
+                key_at_top = len(self._stack) == 1 and not self._string_is_value
+                self._key_parts = [] if key_at_top else None
+                continue
+
+            if char in '{[':
+                if (
+                    char == '{'
+                    and self._array_depth is not None
+                    and len(self._stack) == self._array_depth
+                ):
+                    item, end = self._decode(chunk, index)
+                    if item is not None:
+                        items.append(item)
+                        position = end
+                        self._safe = (base + end, self._stack)
+                        self._prev = '}'
+                        continue
+                    self._capturing = True
+                    self._item_start = base + index
+                    self._item_parts = []
+                    capture_start = index
+                elif char == '{' and len(self._stack) == 1:
+                    self._child_start = base + index
+                self._stack += char
+                if (
+                    char == '['
+                    and len(self._stack) == 2
+                    and self._last_key in self.item_keys
+                    and self._item_root in (None, self._root_count)
+                ):
+                    self._array_depth = 2
+                    self._item_root = self._root_count
+                if not self._capturing:
+                    self._safe = (base + position, self._stack)
+            elif char in '}]':
+                if self._prev == ',':
+                    self._trailing_commas.append((self._comma, base + index))
+                self._stack = self._stack[:-1]
+                depth = len(self._stack)
+                if self._capturing and char == '}' and depth == self._array_depth:
+                    self._item_parts.append(chunk[capture_start:position])
+                    self._capturing = False
+                    capture_start = None
+                    item = self._decode_item("".join(self._item_parts), base + position)
+                    if item is not None:
+                        items.append(item)
+                elif char == ']' and self._array_depth is not None and depth == self._array_depth - 1:
+                    self._array_depth = None
+                elif char == '}' and depth == 1 and self._child_start is not None:
+                    self._children.append((self._child_start, base + position, None))
+                    self._child_start = None
+                if not self._stack:
+                    self._roots.append((self._root_start, base + position, None))
+                    self._root_start = None
+                    self._array_depth = None
+                    self._capturing = False
+                    capture_start = None
+                elif not self._capturing:
+                    self._safe = (base + position, self._stack)
+            elif char == ',':
+                self._comma = base + index
+                if not self._capturing:
+                    self._safe = (base + index, self._stack)
+            self._prev = char
+
+        if self._capturing and capture_start is not None:
+            self._item_parts.append(chunk[capture_start:])
+
+        self.emitted += len(items)
+        return items
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """
+        Parse the object once the output is complete.
+
+        Returns:
+            The first complete top-level object with the required keys, or
+            the repaired unfinished object, or None when there is neither
+        """
+        text = "".join(self._parts)
+        for start, end, decoded in self._roots:
+            result = self._accept(decoded) if decoded is not None else self._load(text, start, end)
+            if result is not None:
+                return result
+
+        result = self._repair(text) if self.repair and self._root_start is not None else None
+        if result is not None:
+            self.repaired = True
+            return result
+
+        # A stray brace in the prose before the answer makes the real object
+        # a child of that "root"
+        for start, end, decoded in self._children:
+            result = self._accept(decoded) if decoded is not None else self._load(text, start, end)
+            if result is not None:
+                return result
+        return None
+
+    def _decode(self, chunk: str, index: int) -> tuple:
+        # Complete objects are decoded by the C decoder instead of scanned
+        try:
+            return _DECODER.raw_decode(chunk, index)
+        except ValueError:
+            return None, None
+
+    def _decode_root(self, chunk: str, index: int, base: int, items: List[Dict[str, Any]]) -> Optional[int]:
+        root, end = self._decode(chunk, index)
+        if root is None:
+            return None
+        self._root_count += 1
+        self._roots.append((base + index, base + end, root))
+        if any(key not in root for key in self.required_keys):
+            self._children.extend((None, None, value) for value in root.values() if isinstance(value, dict))
+
+        if self._item_root is None:
+            for key, value in root.items():
+                if key in self.item_keys and isinstance(value, list):
+                    self._item_root = self._root_count
+                    items.extend(item for item in value if isinstance(item, dict))
+        return end
+
+    def _repair(self, text: str) -> Optional[Dict[str, Any]]:
+        if self._in_string and self._string_is_value and not self._capturing:
+            # Keep the partial string value, minus a dangling backslash
+            end = len(text) - 1 if self._escaped else len(text)
+            result = self._load(text, self._root_start, end, '"' + _closers(self._stack))
+        elif self._safe is not None:
+            end, stack = self._safe
+            result = self._load(text, self._root_start, end, _closers(stack))
+        else:
+            result = None
+        return result
+
+    def _open_root(self, start: int) -> None:
+        self._root_start = start
+        self._root_count += 1
+        self._stack = '{'
+        self._prev = '{'
+        self._last_key = None
+        self._safe = (start + 1, self._stack)
+
+    def _collect_key(self, text: str) -> None:
+        # Only top-level keys are compared, so values are not kept
+        if self._key_parts is not None:
+            self._key_parts.append(text)
+
+    def _close_string(self, end: int) -> None:
+        self._in_string = False
+        if self._key_parts is not None:
+            self._last_key = "".join(self._key_parts)
+            self._key_parts = None
+        elif self._string_is_value and not self._capturing:
+            self._safe = (end, self._stack)
+        self._prev = '"'
+
+    def _without_trailing_commas(self, text: str, start: int, end: int, offset: int = 0) -> str:
+        # Positions are offsets in the whole output; text starts at offset
+        pieces = []
+        cursor = start
+        for comma, closer in self._trailing_commas:
+            if start <= comma and closer <= end and not text[comma + 1 - offset:closer - offset].strip():
+                pieces.append(text[cursor - offset:comma - offset])
+                cursor = comma + 1
+        pieces.append(text[cursor - offset:end - offset])
+        return "".join(pieces)
+
+    def _load(self, text: str, start: int, end: int, suffix: str = '') -> Optional[Dict[str, Any]]:
+        try:
+            result = json.loads(self._without_trailing_commas(text, start, end) + suffix)
+        except ValueError:
+            return None
+        return self._accept(result)
+
+    def _accept(self, result: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(result, dict) or any(key not in result for key in self.required_keys):
+            return None
+        return result
+
+    def _decode_item(self, text: str, end: int) -> Optional[Dict[str, Any]]:
+        if self._trailing_commas:
+            text = self._without_trailing_commas(text, self._item_start, end, offset=self._item_start)
+        try:
+            item = json.loads(text)
+        except ValueError:
+            return None
+        return item if isinstance(item, dict) else None
+
+
+def extract_json(
+    text: str,
+    required_keys: Iterable[str] = (),
+    item_keys: Iterable[str] = ("elements",),
+    repair: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """
+    Extract the JSON object from a complete model answer.
+
+    Args:
+        text: Model output
+        required_keys: Keys the object must have
+        item_keys: Arrays whose items are kept whole when repairing
+        repair: Whether a truncated object may be closed
+
+    Returns:
+        Parsed object, or None when the text holds no usable object
+    """
+    extractor = JSONStreamExtractor(item_keys=item_keys, required_keys=required_keys, repair=repair)
+    extractor.feed(text)
+    result = extractor.finish()
+    if extractor.repaired:
+        logger.warning(f"Repaired truncated JSON in model output ({len(text)} chars)")
+    return result
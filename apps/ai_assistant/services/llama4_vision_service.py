@@ -13,18 +13,18 @@ import base64
 import io
 import json
 import logging
-import re
 import time
 from typing import Any, Dict, Optional, Tuple
 
-import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
 from PIL import Image
-from django.conf import settings
+
+from .image_preprocessing import ImagePreprocessor, split_base64
+from .json_stream import extract_json
+from .llm_clients import get_bedrock_client
 
 logger = logging.getLogger(__name__)
 
-_llama4_vision_client = None
 _cost_tracking = {
     "total_input_tokens": 0,
     "total_output_tokens": 0,
@@ -35,29 +35,15 @@ _cost_tracking = {
 
 def get_llama4_vision_client():
     """
-    Get singleton Llama 4 Maverick vision client instance.
-    
-    Uses boto3 AWS SDK configured for Bedrock.
-    
+    Get the Llama 4 Maverick vision client.
+
+    All Bedrock services share one pooled bedrock-runtime client
+    (see llm_clients.get_bedrock_client).
+
     Returns:
         Bedrock runtime client or None if initialization fails
     """
-    global _llama4_vision_client
-    
-    if _llama4_vision_client is None:
-        try:
-            _llama4_vision_client = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=settings.AWS_DEFAULT_REGION,
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-            )
-            logger.info("Llama 4 Maverick vision client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Llama 4 vision client: {e}")
-            return None
-    
-    return _llama4_vision_client
+    return get_bedrock_client()
 
 
 class ImageValidationError(Exception):
@@ -93,6 +79,8 @@ class Llama4VisionService:
     MIN_DIMENSION = 100
     MAX_DIMENSION = 4096
     ALLOWED_FORMATS = {'PNG', 'JPEG', 'JPG'}
+    # Longer side sent to the model: 4 of Llama 4's 336px image tiles
+    TARGET_DIMENSION = 1344
     
     INPUT_COST_PER_1M_TOKENS = 0.24
     OUTPUT_COST_PER_1M_TOKENS = 0.97
@@ -113,12 +101,24 @@ class Llama4VisionService:
         Returns:
             Tuple of (image_bytes, format)
             
+        Raises:
+            ImageValidationError: If validation fails
+        """
+        _, image_data, image = self._open_image(base64_image)
+        return image_data, image.format.lower()
+    
+    def _open_image(self, base64_image: str) -> Tuple[str, bytes, Image.Image]:
+        """
+        Decode and validate an upload, keeping the opened image.
+        
+        Returns:
+            Tuple of (base64 payload without data: prefix, image_bytes, image)
+            
         Raises:
             ImageValidationError: If validation fails
         """
         try:
-            if ',' in base64_image:
-                base64_image = base64_image.split(',', 1)[1]
+            base64_image = split_base64(base64_image)
             
             image_data = base64.b64decode(base64_image)
             
@@ -147,7 +147,7 @@ class Llama4VisionService:
             
             logger.info(f"Image validation passed: {image.format} {width}x{height} ({len(image_data)} bytes)")
             
-            return image_data, image.format.lower()
+            return base64_image, image_data, image
             
         except Exception as e:
             if isinstance(e, ImageValidationError):
@@ -177,17 +177,17 @@ class Llama4VisionService:
         """
         start_time = time.time()
         
-        image_bytes, image_format = self.validate_image(base64_image)
+        base64_data, image_bytes, image = self._open_image(base64_image)
         
         if not self.client:
             return self._empty_result("Llama 4 vision service not configured - missing AWS credentials")
         
+        prepared = ImagePreprocessor.prepare(image, image_bytes, base64_data, self.TARGET_DIMENSION)
+        
         try:
             text_prompt = self._build_uml_extraction_prompt(existing_diagram)
             
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-            
-            formatted_prompt = self._format_multimodal_prompt(text_prompt, image_base64)
+            formatted_prompt = self._format_multimodal_prompt(text_prompt, prepared.base64)
             
             logger.info(f"Calling Llama 4 Maverick vision API for session {session_id}")
             
@@ -227,7 +227,8 @@ class Llama4VisionService:
                 'edge_count': len(result.get('edges', [])),
                 'input_tokens': prompt_tokens,
                 'output_tokens': completion_tokens,
-                'stop_reason': stop_reason
+                'stop_reason': stop_reason,
+                'image': prepared.describe()
             }
             
             result['cost_info'] = cost_info
@@ -411,7 +412,8 @@ CRITICAL RULES:
         """
         Parse Llama 4 vision response and extract JSON.
         
-        Uses multiple extraction strategies to handle various formats.
+        Takes the object with 'nodes' in one pass (see json_stream),
+        repairing output cut off by the token limit.
         
         Args:
             response_text: Raw response text from Llama 4
@@ -422,71 +424,13 @@ CRITICAL RULES:
         if not response_text or not response_text.strip():
             return self._empty_result("Empty response from Llama 4")
         
-        strategies = [
-            self._try_direct_parse,
-            self._try_markdown_extraction,
-            self._try_brace_counting,
-            self._try_json_block_extraction
-        ]
-        
-        for strategy in strategies:
-            try:
-                result = strategy(response_text)
-                if result and 'nodes' in result:
-                    return result
-            except Exception as e:
-                logger.debug(f"Strategy {strategy.__name__} failed: {e}")
-                continue
+        result = extract_json(response_text, required_keys=('nodes',), item_keys=('nodes', 'edges'))
+        if result is not None:
+            return result
         
-        logger.error(f"All parsing strategies failed for response: {response_text[:500]}")
+        logger.error(f"No JSON with nodes found in response: {response_text[:500]}")
         return self._empty_result("Could not parse Llama 4 response")
     
-    def _try_direct_parse(self, text: str) -> Optional[Dict]:
-        """Try parsing text directly as JSON."""
-        return json.loads(text.strip())
-    
-    def _try_markdown_extraction(self, text: str) -> Optional[Dict]:
-        """Extract JSON from markdown code blocks."""
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(1))
-        return None
-    
-    def _try_brace_counting(self, text: str) -> Optional[Dict]:
-        """Extract JSON by finding balanced braces."""
-        first_brace = text.find('{')
-        if first_brace == -1:
-            return None
-        
-        brace_count = 0
-        for i in range(first_brace, len(text)):
-            if text[i] == '{':
-                brace_count += 1
-            elif text[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    json_str = text[first_brace:i+1]
-                    return json.loads(json_str)
-        
-        return None
-    
-    def _try_json_block_extraction(self, text: str) -> Optional[Dict]:
-        """Look for JSON block patterns with nodes/edges."""
-        patterns = [
-            r'\{[^{}]*"nodes"[^{}]*"edges"[^{}]*\}',
-            r'\{.*?"nodes".*?\}',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.DOTALL)
-            if match:
-                try:
-                    return json.loads(match.group(0))
-                except:
-                    continue
-        
-        return None
-    
     def _calculate_cost(self, prompt_tokens: int, completion_tokens: int) -> Dict[str, float]:
         """
         Calculate cost for Llama 4 vision API usage.
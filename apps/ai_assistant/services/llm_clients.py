@@ -0,0 +1,341 @@
+"""
+Shared, pooled HTTP clients for the LLM backends.
+
+Each Bedrock service used to build its own default boto3 bedrock-runtime
+client: a pool of 10 connections, legacy retries and 60s timeouts, so the
+LLM and hedge pool threads (up to 32 each) ran out of connections and
+reopened TLS connections under load. Now:
+
+- get_bedrock_client() returns one bedrock-runtime client per process for
+  Llama 4 and Nova, commands and vision alike (boto3 clients are thread
+  safe), configured by get_bedrock_config(): AI_BEDROCK_MAX_POOL_CONNECTIONS,
+  connect/read timeouts, adaptive retries and TCP keep-alive
+- build_openai_http_client() and build_openai_async_http_client() give the
+  AzureOpenAI clients an httpx pool sized by AI_OPENAI_MAX_CONNECTIONS, with
+  keep-alive connections reused for AI_OPENAI_KEEPALIVE_EXPIRY seconds
+
+PoolStats counts, per pool, the connections in use, the peak, and how many
+requests arrived while every connection was busy, so the pool sizes can be
+set from the health endpoint's numbers.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+try:
+    import httpx
+except ImportError:
+    try:
+        # Newer openai releases are built on httpx2
+        import httpx2 as httpx
+    except ImportError:
+        httpx = None
+
+logger = logging.getLogger(__name__)
+
+BEDROCK_POOL = 'bedrock'
+OPENAI_POOL = 'azure_openai'
+OPENAI_ASYNC_POOL = 'azure_openai_async'
+
+DEFAULTS = {
+    'AI_BEDROCK_MAX_POOL_CONNECTIONS': 64,
+    'AI_BEDROCK_CONNECT_TIMEOUT': 5.0,
+    'AI_BEDROCK_READ_TIMEOUT': 60.0,
+    'AI_BEDROCK_MAX_ATTEMPTS': 3,
+    'AI_BEDROCK_RETRY_MODE': 'adaptive',
+    'AI_OPENAI_MAX_CONNECTIONS': 64,
+    'AI_OPENAI_MAX_KEEPALIVE_CONNECTIONS': 32,
+    'AI_OPENAI_KEEPALIVE_EXPIRY': 60.0,
+    'AI_OPENAI_CONNECT_TIMEOUT': 5.0,
+}
+
+_bedrock_client = None
+_bedrock_lock = threading.Lock()
+_openai_http_client = None
+_openai_lock = threading.Lock()
+
+
+def _setting(name: str) -> Any:
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class PoolStats:
+    """Connection use per client pool in this process."""
+
+    _lock = threading.Lock()
+    _pools: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def register(cls, pool: str, max_connections: int) -> None:
+        """Declare a pool and its size; counters of an existing pool are kept."""
+        with cls._lock:
+            counters = cls._counters(pool)
+            counters['max_connections'] = max_connections
+
+    @classmethod
+    def _counters(cls, pool: str) -> Dict[str, int]:
+        counters = cls._pools.get(pool)
+        if counters is None:
+            counters = cls._pools[pool] = {
+                'max_connections': 0,
+                'in_use': 0,
+                'peak_in_use': 0,
+                'requests': 0,
+                'saturated': 0,
+            }
+        return counters
+
+    @classmethod
+    def acquire(cls, pool: str) -> None:
+        """Count a request taking a connection of the pool."""
+        with cls._lock:
+            counters = cls._counters(pool)
+            if counters['max_connections'] and counters['in_use'] >= counters['max_connections']:
+                counters['saturated'] += 1
+            counters['requests'] += 1
+            counters['in_use'] += 1
+            counters['peak_in_use'] = max(counters['peak_in_use'], counters['in_use'])
+
+    @classmethod
+    def release(cls, pool: str) -> None:
+        """Count a request giving its connection back."""
+        with cls._lock:
+            counters = cls._counters(pool)
+            counters['in_use'] = max(0, counters['in_use'] - 1)
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns:
+            Dictionary per pool with max_connections, in_use, peak_in_use,
+            requests, saturated (requests that found every connection
+            busy) and utilisation / peak_utilisation (share of the pool)
+        """
+        with cls._lock:
+            pools = {pool: dict(counters) for pool, counters in cls._pools.items()}
+        for counters in pools.values():
+            size = counters['max_connections']
+            counters['utilisation'] = round(counters['in_use'] / size, 3) if size else None
+            counters['peak_utilisation'] = round(counters['peak_in_use'] / size, 3) if size else None
+        return pools
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        """Zero the counters; connections in use right now stay counted."""
+        with cls._lock:
+            for counters in cls._pools.values():
+                counters['peak_in_use'] = counters['in_use']
+                counters['requests'] = 0
+                counters['saturated'] = 0
+
+
+def get_bedrock_config() -> Any:
+    """botocore Config shared by the Bedrock clients."""
+    return Config(
+        max_pool_connections=_setting('AI_BEDROCK_MAX_POOL_CONNECTIONS'),
+        connect_timeout=_setting('AI_BEDROCK_CONNECT_TIMEOUT'),
+        read_timeout=_setting('AI_BEDROCK_READ_TIMEOUT'),
+        retries={
+            'mode': _setting('AI_BEDROCK_RETRY_MODE'),
+            'max_attempts': _setting('AI_BEDROCK_MAX_ATTEMPTS'),
+        },
+        tcp_keepalive=True,
+    )
+
+
+def _bedrock_request_sent(**kwargs) -> None:
+    # Must return None: a value from a before-send handler replaces the response
+    PoolStats.acquire(BEDROCK_POOL)
+
+
+def _bedrock_response_received(**kwargs) -> None:
+    PoolStats.release(BEDROCK_POOL)
+
+
+def meter_bedrock_client(client: Any) -> Any:
+    """Count the client's requests in PoolStats (every attempt, retries included)."""
+    PoolStats.register(BEDROCK_POOL, client.meta.config.max_pool_connections)
+    client.meta.events.register('before-send.bedrock-runtime', _bedrock_request_sent)
+    client.meta.events.register('response-received.bedrock-runtime', _bedrock_response_received)
+    return client
+
+
+def get_bedrock_client() -> Optional[Any]:
+    """
+    Get the process-wide bedrock-runtime client, created on first use.
+
+    Returns:
+        Bedrock runtime client, or None if it cannot be created (tried
+        again on the next call)
+    """
+    global _bedrock_client
+    if _bedrock_client is None:
+        with _bedrock_lock:
+            if _bedrock_client is None:
+                try:
+                    client = boto3.client(
+                        service_name='bedrock-runtime',
+                        region_name=settings.AWS_DEFAULT_REGION,
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                        config=get_bedrock_config(),
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to initialize Bedrock client: {e}")
+                    return None
+                _bedrock_client = meter_bedrock_client(client)
+                logger.info(
+                    f"Bedrock client initialized "
+                    f"(pool={_setting('AI_BEDROCK_MAX_POOL_CONNECTIONS')}, "
+                    f"retries={_setting('AI_BEDROCK_RETRY_MODE')})"
+                )
+    return _bedrock_client
+
+
+def get_openai_timeout(read_timeout: float) -> Any:
+    """Timeout for the AzureOpenAI clients: a short connect, a long read."""
+    if httpx is None:
+        return read_timeout
+    return httpx.Timeout(read_timeout, connect=_setting('AI_OPENAI_CONNECT_TIMEOUT'))
+
+
+def _openai_limits() -> Any:
+    return httpx.Limits(
+        max_connections=_setting('AI_OPENAI_MAX_CONNECTIONS'),
+        max_keepalive_connections=_setting('AI_OPENAI_MAX_KEEPALIVE_CONNECTIONS'),
+        keepalive_expiry=_setting('AI_OPENAI_KEEPALIVE_EXPIRY'),
+    )
+
+
+if httpx is not None:
+
+    class _ReleasingStream(httpx.SyncByteStream):
+        """Response body that gives the connection back to PoolStats once closed."""
+
+        def __init__(self, stream: Any, pool: str):
+            self._stream = stream
+            self._pool = pool
+            self._released = False
+
+        def __iter__(self):
+            yield from self._stream
+
+        def close(self) -> None:
+            try:
+                self._stream.close()
+            finally:
+                if not self._released:
+                    self._released = True
+                    PoolStats.release(self._pool)
+
+    class _AsyncReleasingStream(httpx.AsyncByteStream):
+        """Async response body that gives the connection back once closed."""
+
+        def __init__(self, stream: Any, pool: str):
+            self._stream = stream
+            self._pool = pool
+            self._released = False
+
+        async def __aiter__(self):
+            async for part in self._stream:
+                yield part
+
+        async def aclose(self) -> None:
+            try:
+                await self._stream.aclose()
+            finally:
+                if not self._released:
+                    self._released = True
+                    PoolStats.release(self._pool)
+
+    class MeteredTransport(httpx.HTTPTransport):
+        """httpx transport that counts its connections in PoolStats."""
+
+        def __init__(self, pool: str, **kwargs):
+            super().__init__(**kwargs)
+            self.pool = pool
+
+        def handle_request(self, request):
+            PoolStats.acquire(self.pool)
+            try:
+                response = super().handle_request(request)
+            except BaseException:
+                PoolStats.release(self.pool)
+                raise
+            response.stream = _ReleasingStream(response.stream, self.pool)
+            return response
+
+    class AsyncMeteredTransport(httpx.AsyncHTTPTransport):
+        """Async httpx transport that counts its connections in PoolStats."""
+
+        def __init__(self, pool: str, **kwargs):
+            super().__init__(**kwargs)
+            self.pool = pool
+
+        async def handle_async_request(self, request):
+            PoolStats.acquire(self.pool)
+            try:
+                response = await super().handle_async_request(request)
+            except BaseException:
+                PoolStats.release(self.pool)
+                raise
+            response.stream = _AsyncReleasingStream(response.stream, self.pool)
+            return response
+
+
+def build_openai_http_client() -> Optional[Any]:
+    """
+    Get the process-wide httpx client for the sync AzureOpenAI clients.
+
+    Returns:
+        Pooled httpx.Client, or None without httpx (the openai default
+        client is used then)
+    """
+    global _openai_http_client
+    if httpx is None:
+        return None
+    if _openai_http_client is None:
+        with _openai_lock:
+            if _openai_http_client is None:
+                PoolStats.register(OPENAI_POOL, _setting('AI_OPENAI_MAX_CONNECTIONS'))
+                _openai_http_client = httpx.Client(
+                    transport=MeteredTransport(OPENAI_POOL, limits=_openai_limits()),
+                    follow_redirects=True,
+                )
+    return _openai_http_client
+
+
+def build_openai_async_http_client() -> Optional[Any]:
+    """
+    Build a pooled httpx.AsyncClient for an AsyncAzureOpenAI client.
+
+    Async connections belong to one event loop, so each loop's client gets
+    its own pool; PoolStats adds them up under one name.
+
+    Returns:
+        httpx.AsyncClient, or None without httpx
+    """
+    if httpx is None:
+        return None
+    PoolStats.register(OPENAI_ASYNC_POOL, _setting('AI_OPENAI_MAX_CONNECTIONS'))
+    return httpx.AsyncClient(
+        transport=AsyncMeteredTransport(OPENAI_ASYNC_POOL, limits=_openai_limits()),
+        follow_redirects=True,
+    )
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting: str, **kwargs) -> None:
+    # The clients read their pool configuration once, when they are built
+    global _bedrock_client, _openai_http_client
+    if setting.startswith(('AI_BEDROCK_', 'AWS_')):
+        _bedrock_client = None
+    elif setting.startswith('AI_OPENAI_'):
+        _openai_http_client = None
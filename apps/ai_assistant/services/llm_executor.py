@@ -0,0 +1,62 @@
+"""
+Dedicated thread pool for blocking model calls made from async views.
+
+boto3 has no asyncio support, so Bedrock calls (Llama 4, Nova) and the model
+router that wraps them cannot be awaited directly. Async views hand them to
+this pool instead of Django's per-request sync_to_async threads: the event
+loop stays free, and the number of threads blocked on model calls is capped
+at AI_LLM_THREAD_POOL_SIZE per process.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import close_old_connections
+
+DEFAULT_POOL_SIZE = 32
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_llm_executor() -> ThreadPoolExecutor:
+    """Get the process-wide executor, created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AI_LLM_THREAD_POOL_SIZE', DEFAULT_POOL_SIZE),
+                    thread_name_prefix='llm-call',
+                )
+    return _executor
+
+
+def _call_and_release(func: Callable[..., Any], *args, **kwargs) -> Any:
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Pool threads outlive requests; do not let them hold DB connections
+        close_old_connections()
+
+
+async def run_in_llm_pool(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Await a blocking callable on the LLM thread pool.
+
+    Args:
+        func: Blocking callable, e.g. a Bedrock-backed process_command
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Whatever func returns; its exceptions propagate to the awaiting task
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_llm_executor(), functools.partial(_call_and_release, func, *args, **kwargs)
+    )
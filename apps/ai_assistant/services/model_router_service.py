@@ -5,10 +5,15 @@ Provides unified interface for multiple models (Nova Pro, o4-mini, etc.).
 """
 
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from django.conf import settings
 
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .hedging import DEFAULT_HEDGE_DELAY, run_hedged
+from .llm_executor import run_in_llm_pool
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,6 +34,8 @@ class ModelRouterService:
     Features:
         - Automatic model selection based on availability
         - Fallback to alternative models if primary fails
+        - Hedged requests: the fallback also runs when the primary is slow
+        - Models whose circuit breaker is open are skipped
         - Unified response format across all models
         - Performance and cost tracking per model
     
@@ -63,8 +70,8 @@ class ModelRouterService:
             self.logger.warning(f"Nova Pro service not available: {e}")
         
         try:
-            from .command_processor_service import UMLCommandProcessorService
-            self._services['o4-mini'] = UMLCommandProcessorService()
+            from .registry import COMMAND_PROCESSOR, get_service
+            self._services['o4-mini'] = get_service(COMMAND_PROCESSOR)
             self.logger.info("o4-mini service initialized")
         except Exception as e:
             self.logger.warning(f"o4-mini service not available: {e}")
@@ -77,22 +84,27 @@ class ModelRouterService:
         command: str,
         model: Optional[str] = None,
         diagram_id: Optional[str] = None,
-        current_diagram_data: Optional[Dict] = None
+        current_diagram_data: Optional[Dict] = None,
+        critical: bool = False
     ) -> Dict[str, Any]:
         """
         Process natural language command using selected model.
         
+        The call is hedged (see hedging.run_hedged): if the selected model
+        has no usable answer after AI_HEDGE_DELAY seconds, or fails or
+        returns no elements, the fallback model runs too and the first
+        answer with elements wins.
+        
         Args:
             command: Natural language command
             model: Model identifier (nova-pro, o4-mini) or None for default
             diagram_id: Optional diagram ID for context
             current_diagram_data: Current diagram state
+            critical: Start the fallback model right away instead of after
+                the hedge delay
             
         Returns:
             Dict with action, elements, confidence, interpretation, metadata
-            
-        Raises:
-            ModelNotAvailableError: If selected model is not available
         """
         selected_model = model or self._get_default_model()
         
@@ -115,89 +127,150 @@ class ModelRouterService:
                     }
                 }
         
-        try:
-            service = self._get_model_service(selected_model)
-            
-            result = service.process_command(
-                command=command,
-                diagram_id=diagram_id,
-                current_diagram_data=current_diagram_data
-            )
-            
-            if 'metadata' not in result:
-                result['metadata'] = {}
-            
-            result['metadata']['model_used'] = selected_model
-            result['metadata']['model_requested'] = model or 'default'
-            
-            # CRITICAL: Check if elements array is empty and fallback if needed
-            elements = result.get('elements', [])
-            if not elements or len(elements) == 0:
-                self.logger.warning(f"[FALLBACK] {selected_model} returned EMPTY elements array")
-                
-                # Check if error indicates need for fallback
-                requires_fallback = result.get('metadata', {}).get('requires_fallback', False)
-                error_reason = result.get('metadata', {}).get('error_reason', 'unknown')
-                
-                if requires_fallback or error_reason == 'empty_elements_array':
-                    fallback_model = self._get_fallback_model(selected_model)
-                    
-                    if fallback_model and fallback_model != selected_model:
-                        self.logger.info(f"[FALLBACK] Retrying with {fallback_model} due to empty elements")
-                        
-                        fallback_result = service.__class__.__name__
-                        if fallback_model in self._services:
-                            fallback_service = self._services[fallback_model]
-                            fallback_result = fallback_service.process_command(
-                                command=command,
-                                diagram_id=diagram_id,
-                                current_diagram_data=current_diagram_data
-                            )
-                            
-                            if 'metadata' not in fallback_result:
-                                fallback_result['metadata'] = {}
-                            
-                            fallback_result['metadata']['model_used'] = fallback_model
-                            fallback_result['metadata']['model_requested'] = selected_model
-                            fallback_result['metadata']['fallback_used'] = True
-                            fallback_result['metadata']['fallback_reason'] = 'empty_elements_from_llama4'
-                            fallback_result['metadata']['primary_model'] = selected_model
-                            
-                            self.logger.info(f"[FALLBACK] Successfully generated {len(fallback_result.get('elements', []))} elements with {fallback_model}")
-                            
-                            return fallback_result
-            
-            self.logger.info(f"Command processed successfully with {selected_model}: "
-                           f"action={result.get('action')}, "
-                           f"elements={len(result.get('elements', []))}")
-            
-            return result
-            
-        except Exception as e:
-            self.logger.error(f"Error processing command with {selected_model}: {e}", exc_info=True)
-            
-            fallback_model = self._get_fallback_model(selected_model)
-            if fallback_model and fallback_model != selected_model:
-                self.logger.info(f"Attempting fallback to {fallback_model}")
-                return self.process_command(
+        def call(model_id: str) -> Dict[str, Any]:
+            service = self._get_model_service(model_id)
+            if not CircuitBreaker.allow(model_id):
+                raise CircuitOpenError(f"Circuit for {model_id} is open")
+            start = time.perf_counter()
+            try:
+                result = service.process_command(
                     command=command,
-                    model=fallback_model,
                     diagram_id=diagram_id,
                     current_diagram_data=current_diagram_data
                 )
-            
+            except Exception:
+                CircuitBreaker.record(model_id, time.perf_counter() - start, failed=True)
+                raise
+            CircuitBreaker.record(model_id, time.perf_counter() - start, failed='error' in result)
+            return result
+        
+        used_model, result, hedge = run_hedged(
+            call,
+            primary=selected_model,
+            fallback=self._get_fallback_model(selected_model),
+            delay=self._get_hedge_delay(critical)
+        )
+        
+        if result is None:
+            error = hedge['error']
+            self.logger.error(f"Error processing command with {selected_model}: {error}", exc_info=error)
             return {
                 'action': 'error',
                 'elements': [],
                 'confidence': 0.0,
-                'interpretation': f'Command processing failed: {str(e)}',
-                'error': str(e),
+                'interpretation': f'Command processing failed: {str(error)}',
+                'error': str(error),
                 'suggestion': 'Please try again or rephrase your command.',
                 'metadata': {
                     'model_used': selected_model,
                     'error_occurred': True
                 }
             }
+        
+        if 'metadata' not in result:
+            result['metadata'] = {}
+        
+        result['metadata']['model_used'] = used_model
+        result['metadata']['model_requested'] = model or 'default'
+        if hedge['hedge_reason']:
+            result['metadata']['hedged'] = hedge['raced']
+            result['metadata']['hedge_reason'] = hedge['hedge_reason']
+        if used_model != selected_model:
+            result['metadata']['fallback_used'] = True
+            result['metadata']['fallback_reason'] = hedge['hedge_reason']
+            result['metadata']['primary_model'] = selected_model
+        
+        self.logger.info(f"Command processed with {used_model}: "
+                       f"action={result.get('action')}, "
+                       f"elements={len(result.get('elements', []))}")
+        
+        return result
+    
+    async def aprocess_command(
+        self,
+        command: str,
+        model: Optional[str] = None,
+        diagram_id: Optional[str] = None,
+        current_diagram_data: Optional[Dict] = None,
+        critical: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Async version of process_command() for async views.
+        
+        The model services are blocking (boto3 for Bedrock), so the call runs
+        on the bounded LLM thread pool instead of the event loop.
+        """
+        return await run_in_llm_pool(
+            self.process_command,
+            command=command,
+            model=model,
+            diagram_id=diagram_id,
+            current_diagram_data=current_diagram_data,
+            critical=critical,
+        )
+    
+    async def astream_command(
+        self,
+        command: str,
+        model: Optional[str] = None,
+        diagram_id: Optional[str] = None,
+        current_diagram_data: Optional[Dict] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of process_command.
+        
+        Services with an astream_command method (o4-mini on Azure OpenAI)
+        yield ("token", ...) and ("element", element) events while the model
+        writes. The Bedrock services have no streaming path here: the command
+        runs as in aprocess_command, with its fallbacks, and its elements are
+        yielded when it finishes. Streams are not hedged, since tokens are
+        already on their way to the client. Always ends with ("done", result).
+        """
+        selected_model, service = await run_in_llm_pool(self._get_streaming_service, model)
+        
+        if service is None:
+            result = await self.aprocess_command(
+                command=command,
+                model=model,
+                diagram_id=diagram_id,
+                current_diagram_data=current_diagram_data
+            )
+            for element in result.get('elements', []):
+                yield 'element', element
+            yield 'done', result
+            return
+        
+        self.logger.info(f"Streaming command with model: {selected_model}")
+        start = time.perf_counter()
+        async for event, data in service.astream_command(
+            command=command,
+            diagram_id=diagram_id,
+            current_diagram_data=current_diagram_data
+        ):
+            if event == 'done':
+                # The circuit is in the shared cache, which is blocking
+                await run_in_llm_pool(
+                    CircuitBreaker.record, selected_model, time.perf_counter() - start, 'error' in data
+                )
+                data.setdefault('metadata', {})
+                data['metadata']['model_used'] = selected_model
+                data['metadata']['model_requested'] = model or 'default'
+            yield event, data
+    
+    def _get_streaming_service(self, model: Optional[str]) -> Tuple[str, Any]:
+        """
+        Get (model, service) to stream from, with service None when the model
+        cannot stream, is unavailable or its circuit does not let the call out.
+        """
+        selected_model = model or self._get_default_model()
+        service = self._services.get(selected_model)
+        if (
+            not hasattr(service, 'astream_command')
+            or not self._is_model_available(selected_model)
+            or not CircuitBreaker.allow(selected_model)
+        ):
+            return selected_model, None
+        return selected_model, service
     
     def _get_model_service(self, model_id: str):
         """
@@ -225,7 +298,7 @@ class ModelRouterService:
             model_id: Model identifier
             
         Returns:
-            True if model is available and enabled
+            True if model is available, enabled and its circuit is not open
         """
         if model_id not in self._services:
             return False
@@ -233,7 +306,21 @@ class ModelRouterService:
         models_config = getattr(settings, 'COMMAND_PROCESSING_MODELS', {})
         model_config = models_config.get(model_id, {})
         
-        return model_config.get('enabled', True)
+        return model_config.get('enabled', True) and not CircuitBreaker.is_open(model_id)
+    
+    def _get_hedge_delay(self, critical: bool) -> Optional[float]:
+        """
+        Get seconds to wait for the primary model before hedging.
+        
+        Returns:
+            0 for critical calls, None when hedging is disabled (fallback
+            only after a failure), otherwise AI_HEDGE_DELAY
+        """
+        if not getattr(settings, 'AI_HEDGE_ENABLED', True):
+            return None
+        if critical:
+            return 0
+        return getattr(settings, 'AI_HEDGE_DELAY', DEFAULT_HEDGE_DELAY)
     
     def _get_default_model(self) -> str:
         """
@@ -15,13 +15,14 @@ import logging
 import time
 from typing import Any, Dict, Optional
 
-import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
-from django.conf import settings
+
+from .diagram_context import STYLE_DETAILED, render_diagram_context
+from .json_stream import extract_json
+from .llm_clients import get_bedrock_client
 
 logger = logging.getLogger(__name__)
 
-_nova_command_client = None
 _cost_tracking = {
     "total_input_tokens": 0,
     "total_output_tokens": 0,
@@ -32,29 +33,15 @@ _cost_tracking = {
 
 def get_nova_command_client():
     """
-    Get singleton Nova Pro client instance for command processing.
-    
-    Uses boto3 AWS SDK configured for Bedrock.
-    
+    Get the Nova Pro client for command processing.
+
+    All Bedrock services share one pooled bedrock-runtime client
+    (see llm_clients.get_bedrock_client).
+
     Returns:
         Bedrock runtime client or None if initialization fails
     """
-    global _nova_command_client
-    
-    if _nova_command_client is None:
-        try:
-            _nova_command_client = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=settings.AWS_DEFAULT_REGION,
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-            )
-            logger.info("Nova Pro command client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Nova Pro command client: {e}")
-            return None
-    
-    return _nova_command_client
+    return get_bedrock_client()
 
 
 class AWSBedrockError(Exception):
@@ -286,93 +273,9 @@ Just the raw JSON object starting with {{ and ending with }}.
         
         if current_diagram_data:
             nodes = current_diagram_data.get('nodes', [])
-            edges = current_diagram_data.get('edges', [])
             
             if nodes:
-                context = "\n\n" + "="*70 + "\n"
-                context += "EXISTING DIAGRAM CONTEXT\n"
-                context += "="*70 + "\n\n"
-                context += f"Total Classes: {len(nodes)}\n"
-                context += f"Total Relationships: {len(edges)}\n\n"
-                context += "CLASSES DETAIL:\n\n"
-                
-                for idx, node in enumerate(nodes, 1):
-                    node_id = node.get('id', 'unknown')
-                    data = node.get('data', {})
-                    label = data.get('label', 'Unknown')
-                    position = node.get('position', {'x': 0, 'y': 0})
-                    attributes = data.get('attributes', [])
-                    methods = data.get('methods', [])
-                    node_type = data.get('nodeType', 'class')
-                    is_abstract = data.get('isAbstract', False)
-                    
-                    context += f"{idx}. {label} (ID: {node_id})\n"
-                    if is_abstract:
-                        context += "   Type: Abstract Class\n"
-                    context += f"   Position: x={position['x']}, y={position['y']}\n"
-                    
-                    if attributes:
-                        context += "   Attributes:\n"
-                        for attr in attributes:
-                            attr_name = attr.get('name', 'unknown')
-                            attr_type = attr.get('type', 'String')
-                            visibility = attr.get('visibility', 'private')
-                            is_static = attr.get('isStatic', False)
-                            is_final = attr.get('isFinal', False)
-                            modifiers = []
-                            if is_static:
-                                modifiers.append('static')
-                            if is_final:
-                                modifiers.append('final')
-                            mod_str = ' '.join(modifiers)
-                            context += f"   - {attr_name}: {attr_type} ({visibility})"
-                            if mod_str:
-                                context += f" [{mod_str}]"
-                            context += "\n"
-                    else:
-                        context += "   Attributes: (none)\n"
-                    
-                    if methods:
-                        context += "   Methods:\n"
-                        for method in methods:
-                            method_name = method.get('name', 'unknown')
-                            return_type = method.get('returnType', 'void')
-                            visibility = method.get('visibility', 'public')
-                            parameters = method.get('parameters', [])
-                            if parameters:
-                                param_str = ', '.join([f"{p.get('name', 'param')}: {p.get('type', 'String')}" for p in parameters])
-                                context += f"   - {method_name}({param_str}): {return_type} ({visibility})\n"
-                            else:
-                                context += f"   - {method_name}(): {return_type} ({visibility})\n"
-                    else:
-                        context += "   Methods: (none)\n"
-                    
-                    context += "\n"
-                
-                if edges:
-                    context += "RELATIONSHIPS:\n\n"
-                    for idx, edge in enumerate(edges, 1):
-                        source_id = edge.get('source', '')
-                        target_id = edge.get('target', '')
-                        edge_data = edge.get('data', {})
-                        rel_type = edge_data.get('relationshipType', 'ASSOCIATION')
-                        source_mult = edge_data.get('sourceMultiplicity', '1')
-                        target_mult = edge_data.get('targetMultiplicity', '1')
-                        label = edge_data.get('label', '')
-                        
-                        source_name = next((n['data']['label'] for n in nodes if n['id'] == source_id), source_id)
-                        target_name = next((n['data']['label'] for n in nodes if n['id'] == target_id), target_id)
-                        
-                        context += f"{idx}. {source_name} → {target_name} ({rel_type})\n"
-                        context += f"   Source ID: {source_id}\n"
-                        context += f"   Target ID: {target_id}\n"
-                        context += f"   Source Multiplicity: {source_mult}\n"
-                        context += f"   Target Multiplicity: {target_mult}\n"
-                        if label:
-                            context += f"   Label: {label}\n"
-                        context += "\n"
-                else:
-                    context += "RELATIONSHIPS: (none)\n\n"
+                context = render_diagram_context(current_diagram_data, STYLE_DETAILED, focus=command)
                 
                 context += "="*70 + "\n"
                 context += "CRITICAL INSTRUCTIONS FOR THIS COMMAND\n"
@@ -440,16 +343,11 @@ Just the raw JSON object starting with {{ and ending with }}.
         Returns:
             Parsed dict with action, elements, confidence, interpretation
         """
-        import re
-        
         logger.info(f"Parsing Nova Pro response ({len(response_text)} chars)")
         
         try:
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                result = json.loads(json_str)
-                
+            result = extract_json(response_text)
+            if result is not None:
                 if not result.get('elements'):
                     logger.warning("Nova Pro returned empty elements array")
                     result['confidence'] = max(0.3, result.get('confidence', 0.5) * 0.6)
@@ -468,16 +366,6 @@ Just the raw JSON object starting with {{ and ending with }}.
                     'suggestion': 'Please try rephrasing your command.'
                 }
                 
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {e}")
-            return {
-                'action': 'error',
-                'elements': [],
-                'confidence': 0.0,
-                'interpretation': 'Invalid JSON in response',
-                'error': f'JSON parsing failed: {str(e)}',
-                'suggestion': 'Please try again or rephrase your command.'
-            }
         except Exception as e:
             logger.error(f"Response parsing error: {e}", exc_info=True)
             return {
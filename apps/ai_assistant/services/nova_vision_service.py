@@ -16,14 +16,15 @@ import logging
 import time
 from typing import Any, Dict, Optional, Tuple
 
-import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
 from PIL import Image
-from django.conf import settings
+
+from .image_preprocessing import ImagePreprocessor, split_base64
+from .json_stream import extract_json
+from .llm_clients import get_bedrock_client
 
 logger = logging.getLogger(__name__)
 
-_nova_client = None
 _cost_tracking = {
     "total_input_tokens": 0,
     "total_output_tokens": 0,
@@ -34,29 +35,15 @@ _cost_tracking = {
 
 def get_nova_client():
     """
-    Get singleton Nova Pro client instance.
-    
-    Uses boto3 AWS SDK configured for Bedrock.
-    
+    Get the Nova Pro client.
+
+    All Bedrock services share one pooled bedrock-runtime client
+    (see llm_clients.get_bedrock_client).
+
     Returns:
         Bedrock runtime client or None if initialization fails
     """
-    global _nova_client
-    
-    if _nova_client is None:
-        try:
-            _nova_client = boto3.client(
-                service_name='bedrock-runtime',
-                region_name=settings.AWS_DEFAULT_REGION,
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-            )
-            logger.info("Nova Pro client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Nova Pro client: {e}")
-            return None
-    
-    return _nova_client
+    return get_bedrock_client()
 
 
 class ImageValidationError(Exception):
@@ -92,6 +79,8 @@ class NovaVisionService:
     MIN_DIMENSION = 100
     MAX_DIMENSION = 4096
     ALLOWED_FORMATS = {'PNG', 'JPEG', 'JPG'}
+    # Longer side sent to the model; Nova scales larger images down itself
+    TARGET_DIMENSION = 1568
     
     INPUT_COST_PER_1M_TOKENS = 0.80
     OUTPUT_COST_PER_1M_TOKENS = 3.20
@@ -112,12 +101,24 @@ class NovaVisionService:
         Returns:
             Tuple of (image_bytes, format)
             
+        Raises:
+            ImageValidationError: If validation fails
+        """
+        _, image_data, image = self._open_image(base64_image)
+        return image_data, image.format.lower()
+    
+    def _open_image(self, base64_image: str) -> Tuple[str, bytes, Image.Image]:
+        """
+        Decode and validate an upload, keeping the opened image.
+        
+        Returns:
+            Tuple of (base64 payload without data: prefix, image_bytes, image)
+            
         Raises:
             ImageValidationError: If validation fails
         """
         try:
-            if ',' in base64_image:
-                base64_image = base64_image.split(',', 1)[1]
+            base64_image = split_base64(base64_image)
             
             image_data = base64.b64decode(base64_image)
             
@@ -146,7 +147,7 @@ class NovaVisionService:
             
             logger.info(f"Image validation passed: {image.format} {width}x{height} ({len(image_data)} bytes)")
             
-            return image_data, image.format.lower()
+            return base64_image, image_data, image
             
         except Exception as e:
             if isinstance(e, ImageValidationError):
@@ -174,18 +175,18 @@ class NovaVisionService:
         """
         start_time = time.time()
         
-        image_bytes, image_format = self.validate_image(base64_image)
+        base64_data, image_bytes, image = self._open_image(base64_image)
         
         if not self.client:
             return self._empty_result("Nova Pro service not configured - missing AWS credentials")
         
+        prepared = ImagePreprocessor.prepare(image, image_bytes, base64_data, self.TARGET_DIMENSION)
+        
         try:
             prompt = self._build_uml_extraction_prompt()
             
             logger.info(f"Calling Nova Pro API for session {session_id}")
             
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-            
             request_body = {
                 "messages": [
                     {
@@ -193,9 +194,9 @@ class NovaVisionService:
                         "content": [
                             {
                                 "image": {
-                                    "format": image_format,
+                                    "format": prepared.format,
                                     "source": {
-                                        "bytes": image_base64
+                                        "bytes": prepared.base64
                                     }
                                 }
                             },
@@ -238,7 +239,9 @@ class NovaVisionService:
                 'session_id': session_id,
                 'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
                 'node_count': len(result.get('nodes', [])),
-                'edge_count': len(result.get('edges', []))
+                'edge_count': len(result.get('edges', [])),
+                'stop_reason': response_body.get('stopReason', 'unknown'),
+                'image': prepared.describe()
             }
             
             result['cost_info'] = cost_info
@@ -341,15 +344,10 @@ Important:
             Dict with nodes and edges
         """
         try:
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0].strip()
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0].strip()
-            
-            data = json.loads(content)
+            data = extract_json(content, item_keys=('nodes', 'edges'))
             
-            if not isinstance(data, dict):
-                raise ValueError("Response is not a JSON object")
+            if data is None:
+                raise ValueError("Response has no JSON object")
             
             nodes = data.get('nodes', [])
             edges = data.get('edges', [])
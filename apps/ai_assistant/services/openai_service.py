@@ -14,22 +14,33 @@ CHANGES IN o1-mini vs GPT-4:
 - Temperature fixed at 1.0 (not configurable)
 """
 
-import hashlib
+import asyncio
 import json
 import logging
+import threading
 import time
+import weakref
 from functools import wraps
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from django.conf import settings
 from pydantic import BaseModel, Field, validator
 
+from apps.uml_diagrams.content_hash import compute_content_hash
+
 from .cache_service import CacheService
+from .diagram_context import STYLE_SUMMARY, get_token_encoding, render_diagram_context
+from .llm_clients import (
+    build_openai_async_http_client,
+    build_openai_http_client,
+    get_openai_timeout,
+)
 from .rate_limiter import RateLimiter
+from .single_flight import SingleFlight
 
 try:
     import tiktoken
-    from openai import AzureOpenAI
+    from openai import AsyncAzureOpenAI, AzureOpenAI
     from openai.types.chat import ChatCompletion
 
     OPENAI_AVAILABLE = True
@@ -37,6 +48,7 @@ except ImportError:
     OPENAI_AVAILABLE = False
     tiktoken = None
     AzureOpenAI = None
+    AsyncAzureOpenAI = None
     ChatCompletion = None
 
 logger = logging.getLogger(__name__)
@@ -50,6 +62,13 @@ REQUEST_TIMEOUT = 60  # seconds
 CACHE_TTL = 300  # 5 minutes
 RATE_LIMIT_MAX = 30  # requests per hour
 RATE_LIMIT_WINDOW = 3600  # 1 hour in seconds
+DIAGRAM_SUMMARY_MAX_ITEMS = 10  # classes and relationships listed in question prompts
+
+# Guards the lazy sync client of an OpenAIService shared between threads
+_client_lock = threading.Lock()
+
+# AsyncAzureOpenAI clients per event loop; their connection pools are bound to the loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
 
 
 class OpenAIRequest(BaseModel):
@@ -122,6 +141,49 @@ def retry_with_exponential_backoff(
     return decorator
 
 
+def async_retry_with_exponential_backoff(
+    max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0
+):
+    """
+    Async counterpart of retry_with_exponential_backoff.
+
+    Waits between attempts with asyncio.sleep, so a retrying call does not
+    block the event loop.
+
+    Args:
+        max_retries: Maximum number of retries
+        base_delay: Initial delay in seconds
+        max_delay: Maximum delay in seconds
+
+    Returns:
+        Configured decorator for coroutine functions
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            for attempt in range(max_retries):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == max_retries - 1:
+                        logger.error(
+                            f"Max retries ({max_retries}) exceeded: {e}"
+                        )
+                        raise
+
+                    delay = min(base_delay * (2**attempt), max_delay)
+                    logger.warning(
+                        f"Retry {attempt + 1}/{max_retries} "
+                        f"after {delay}s. Error: {e}"
+                    )
+                    await asyncio.sleep(delay)
+
+        return wrapper
+
+    return decorator
+
+
 class OpenAIService:
     """
     Service for OpenAI API interaction.
@@ -157,14 +219,15 @@ class OpenAIService:
                 "must be configured in settings"
             )
 
-        self.client = AzureOpenAI(
-            api_key=api_key,
-            api_version=getattr(
+        self._client_options = {
+            "api_key": api_key,
+            "api_version": getattr(
                 settings, "OPENAI_AZURE_API_VERSION", "2024-02-15-preview"
             ),
-            azure_endpoint=api_base,
-            timeout=REQUEST_TIMEOUT,
-        )
+            "azure_endpoint": api_base,
+            "timeout": get_openai_timeout(REQUEST_TIMEOUT),
+        }
+        self._client = None
 
         self.model = getattr(settings, "AI_ASSISTANT_DEFAULT_MODEL", O1_MINI_MODEL)
         self.is_o_series = self._is_o_series_model()
@@ -175,10 +238,7 @@ class OpenAIService:
         else:
             self.max_tokens = MAX_COMPLETION_TOKENS_GPT4
 
-        try:
-            self.encoding = tiktoken.encoding_for_model("gpt-4o")
-        except Exception:
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_token_encoding()
 
         logger.info(
             f"OpenAI Service initialized with model: {self.model} "
@@ -264,6 +324,35 @@ class OpenAIService:
             logger.warning(f"Token counting error: {e}")
             return len(text) // 4
 
+    @property
+    def client(self):
+        """
+        AzureOpenAI client, created on first use.
+
+        Building a client costs tens of milliseconds (TLS context), which
+        async callers that only use the async client should not pay on the
+        event loop. Its connections come from the process-wide httpx pool
+        (llm_clients.build_openai_http_client).
+        """
+        if self._client is None:
+            with _client_lock:
+                if self._client is None:
+                    self._client = AzureOpenAI(
+                        **self._client_options, http_client=build_openai_http_client()
+                    )
+        return self._client
+
+    def _get_async_client(self):
+        """AsyncAzureOpenAI client for the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        client = _async_clients.get(loop)
+        if client is None:
+            client = AsyncAzureOpenAI(
+                **self._client_options, http_client=build_openai_async_http_client()
+            )
+            _async_clients[loop] = client
+        return client
+
     @retry_with_exponential_backoff(max_retries=3, base_delay=1.0, max_delay=60.0)
     def _call_openai_api(
         self,
@@ -287,6 +376,68 @@ class OpenAIService:
         Raises:
             Exception: If fails after all retries
         """
+        completion_params = self._build_completion_params(
+            messages, max_tokens, temperature, response_format
+        )
+
+        response = self.client.chat.completions.create(**completion_params)
+
+        logger.info(
+            f"OpenAI API response: usage={response.usage.total_tokens} tokens"
+        )
+
+        return response
+
+    @async_retry_with_exponential_backoff(max_retries=3, base_delay=1.0, max_delay=60.0)
+    async def _acall_openai_api(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[str] = None,
+    ) -> ChatCompletion:
+        """
+        Async variant of _call_openai_api on AsyncAzureOpenAI.
+
+        Args:
+            messages: List of conversation messages
+            max_tokens: Maximum number of output tokens
+            temperature: Temperature for generation (0.0-2.0)
+            response_format: Response format ("json" or None)
+
+        Returns:
+            OpenAI ChatCompletion object
+
+        Raises:
+            Exception: If fails after all retries
+        """
+        completion_params = self._build_completion_params(
+            messages, max_tokens, temperature, response_format
+        )
+
+        response = await self._get_async_client().chat.completions.create(**completion_params)
+
+        logger.info(
+            f"OpenAI API response: usage={response.usage.total_tokens} tokens"
+        )
+
+        return response
+
+    @async_retry_with_exponential_backoff(max_retries=3, base_delay=1.0, max_delay=60.0)
+    async def _aopen_stream(self, completion_params: Dict[str, Any]):
+        """Open a streamed chat completion; only opening the stream is retried."""
+        return await self._get_async_client().chat.completions.create(
+            **completion_params, stream=True
+        )
+
+    def _build_completion_params(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        response_format: Optional[str],
+    ) -> Dict[str, Any]:
+        """Parameters for chat.completions.create, adapted to o-series models."""
         if self.is_o_series:
             messages = self._prepare_messages_for_o1(messages)
 
@@ -312,13 +463,7 @@ class OpenAIService:
         # Add timeout to prevent indefinite waiting (especially important for o4-mini)
         completion_params["timeout"] = 60.0  # 60 seconds timeout
 
-        response = self.client.chat.completions.create(**completion_params)
-
-        logger.info(
-            f"OpenAI API response: usage={response.usage.total_tokens} tokens"
-        )
-
-        return response
+        return completion_params
 
     def _extract_response_content(self, response) -> str:
         """
@@ -442,7 +587,8 @@ class OpenAIService:
         self,
         messages: List[Dict[str, str]],
         max_tokens: int = 4096,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        response_format: Optional[str] = None,
     ) -> str:
         """
         Generic API call method for AI Assistant service.
@@ -451,6 +597,7 @@ class OpenAIService:
             messages: List of conversation messages with role and content
             max_tokens: Maximum tokens for response
             temperature: Temperature for generation
+            response_format: Response format ("json" or None)
 
         Returns:
             Response content as string
@@ -465,7 +612,7 @@ class OpenAIService:
                 messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                response_format=None
+                response_format=response_format
             )
             
             # Use robust extraction for o-series compatibility
@@ -478,6 +625,87 @@ class OpenAIService:
             logger.error(f"Generic API call failed: {e}", exc_info=True)
             raise
 
+    async def acall_api(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        response_format: Optional[str] = None,
+    ) -> str:
+        """
+        Async variant of call_api for async views.
+
+        The request is awaited on AsyncAzureOpenAI, so no thread is held
+        while the model runs.
+
+        Args:
+            messages: List of conversation messages with role and content
+            max_tokens: Maximum tokens for response
+            temperature: Temperature for generation
+            response_format: Response format ("json" or None)
+
+        Returns:
+            Response content as string
+
+        Raises:
+            Exception: If API call fails
+        """
+        try:
+            logger.info(f"Async API call with {len(messages)} messages")
+
+            response = await self._acall_openai_api(
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                response_format=response_format
+            )
+
+            content = self._extract_response_content(response)
+            logger.info(f"Async API call successful: {len(content)} chars")
+
+            return content
+
+        except Exception as e:
+            logger.error(f"Async API call failed: {e}", exc_info=True)
+            raise
+
+    async def astream_api(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        response_format: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of call_api.
+
+        Yields the answer as text deltas in the order the model produces
+        them. Failures to open the stream are retried like acall_api; once
+        text has been yielded, errors propagate to the consumer.
+
+        Args:
+            messages: List of conversation messages with role and content
+            max_tokens: Maximum tokens for response
+            temperature: Temperature for generation
+            response_format: Response format ("json" or None)
+
+        Yields:
+            Non-empty pieces of the response content
+        """
+        completion_params = self._build_completion_params(
+            messages, max_tokens, temperature, response_format
+        )
+        stream = await self._aopen_stream(completion_params)
+        try:
+            async for chunk in stream:
+                # Azure sends content-filter chunks without choices
+                for choice in chunk.choices:
+                    content = getattr(choice.delta, "content", None)
+                    if content:
+                        yield content
+        finally:
+            await stream.close()
+
     def ask_question(
         self,
         question: str,
@@ -521,6 +749,15 @@ class OpenAIService:
                     f"Rate limit exceeded. Retry after {retry_after} seconds"
                 )
 
+        if use_cache:
+            return SingleFlight.do(
+                cache_key, lambda: self._answer_question(question, context), ttl=CACHE_TTL
+            )
+
+        return self._answer_question(question, context)
+
+    def _answer_question(self, question: str, context: Optional[str]) -> Dict[str, Any]:
+        """Calls the model for ask_question; caching is left to the caller."""
         prompt = self._build_question_prompt(question, context)
 
         messages = [{"role": "user", "content": prompt}]
@@ -559,9 +796,6 @@ class OpenAIService:
                 },
             }
 
-            if use_cache:
-                CacheService.set(cache_key, result, ttl=CACHE_TTL)
-
             return result
 
         except Exception as e:
@@ -612,6 +846,7 @@ RULES:
         diagram_data: Dict[str, Any],
         use_cache: bool = True,
         session_id: Optional[str] = None,
+        diagram_hash: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Asks contextual question about specific diagram.
@@ -621,18 +856,16 @@ RULES:
             diagram_data: Diagram data (nodes, edges)
             use_cache: Whether to use cache
             session_id: Session ID for rate limiting
+            diagram_hash: Structural hash of diagram_data when the caller
+                already has it (UMLDiagram.content_hash); computed otherwise
 
         Returns:
             Dictionary with answer, confidence, suggestions
         """
-        diagram_hash = hashlib.md5(
-            json.dumps(diagram_data, sort_keys=True).encode()
-        ).hexdigest()
-
         cache_key = {
             "method": "ask_about_diagram",
             "question": question,
-            "diagram_hash": diagram_hash,
+            "diagram_hash": diagram_hash or compute_content_hash(diagram_data),
         }
 
         if use_cache:
@@ -649,7 +882,16 @@ RULES:
                     f"Rate limit exceeded. Retry after {retry_after}s"
                 )
 
-        context = self._build_diagram_context(diagram_data)
+        if use_cache:
+            return SingleFlight.do(
+                cache_key, lambda: self._answer_diagram_question(question, diagram_data), ttl=CACHE_TTL
+            )
+
+        return self._answer_diagram_question(question, diagram_data)
+
+    def _answer_diagram_question(self, question: str, diagram_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Calls the model for ask_about_diagram; caching is left to the caller."""
+        context = self._build_diagram_context(diagram_data, focus=question)
         prompt = self._build_diagram_question_prompt(question, context)
 
         messages = [{"role": "user", "content": prompt}]
@@ -683,49 +925,28 @@ RULES:
                 },
             }
 
-            if use_cache:
-                CacheService.set(cache_key, result, ttl=CACHE_TTL)
-
             return result
 
         except Exception as e:
             logger.error(f"Error in ask_about_diagram: {e}")
             raise
 
-    def _build_diagram_context(self, diagram_data: Dict[str, Any]) -> str:
+    def _build_diagram_context(self, diagram_data: Dict[str, Any], focus: Optional[str] = None) -> str:
         """
         Builds diagram context for prompt.
 
         Args:
             diagram_data: Diagram data with nodes and edges
+            focus: Question or command whose classes are kept when truncating
 
         Returns:
-            String with formatted context
+            String with formatted context, within the diagram context token
+            budget and listing at most DIAGRAM_SUMMARY_MAX_ITEMS classes and
+            relationships
         """
-        nodes = diagram_data.get("nodes", [])
-        edges = diagram_data.get("edges", [])
-
-        context_parts = [f"The diagram has {len(nodes)} classes and {len(edges)} relationships."]
-
-        if nodes:
-            context_parts.append("\nCLASSES:")
-            for node in nodes[:10]:
-                node_data = node.get("data", {})
-                label = node_data.get("label", "Unknown")
-                attrs = node_data.get("attributes", [])
-                methods = node_data.get("methods", [])
-                context_parts.append(
-                    f"- {label}: {len(attrs)} attributes, {len(methods)} methods"
-                )
-
-        if edges:
-            context_parts.append("\nRELATIONSHIPS:")
-            for edge in edges[:10]:
-                edge_data = edge.get("data", {})
-                rel_type = edge_data.get("relationshipType", "UNKNOWN")
-                context_parts.append(f"- {rel_type}")
-
-        return "\n".join(context_parts)
+        return render_diagram_context(
+            diagram_data, STYLE_SUMMARY, focus=focus, max_items=DIAGRAM_SUMMARY_MAX_ITEMS
+        )
 
     def _build_diagram_question_prompt(self, question: str, context: str) -> str:
         """Builds prompt for diagram questions."""
@@ -829,12 +1050,7 @@ RESPOND IN JSON FORMAT:
         try:
             logger.info(f"Starting command processing API call for: {command[:100]}")
             
-            system_prompt = self._build_direct_json_prompt(current_diagram_data)
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": command}
-            ]
+            messages = self._command_processing_messages(command, current_diagram_data)
 
             logger.info("Calling OpenAI API for command processing...")
             
@@ -859,6 +1075,20 @@ RESPOND IN JSON FORMAT:
             logger.error(f"Command processing API call failed after {elapsed_time:.2f} seconds: {e}")
             raise
 
+    async def astream_command_processing_api(
+        self, command: str, current_diagram_data: dict = None
+    ) -> AsyncIterator[str]:
+        """Streaming variant of call_command_processing_api, yielding text deltas."""
+        messages = self._command_processing_messages(command, current_diagram_data)
+        async for content in self.astream_api(messages, max_tokens=5000, temperature=0.7):
+            yield content
+
+    def _command_processing_messages(self, command: str, current_diagram_data: dict = None) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self._build_direct_json_prompt(current_diagram_data)},
+            {"role": "user", "content": command}
+        ]
+
     def _build_direct_json_prompt(self, current_diagram_data: dict = None) -> str:
         """Build comprehensive prompt for direct React Flow JSON generation."""
         import time
@@ -1062,11 +1292,7 @@ CRITICAL: Generate timestamp-based unique IDs, create REAL attributes for all me
         Returns:
             Dictionary with analysis, patterns, SOLID violations
         """
-        diagram_hash = hashlib.md5(
-            json.dumps(diagram_data, sort_keys=True).encode()
-        ).hexdigest()
-
-        cache_key = {"method": "analyze_diagram", "diagram_hash": diagram_hash}
+        cache_key = {"method": "analyze_diagram", "diagram_hash": compute_content_hash(diagram_data)}
 
         if use_cache:
             cached_response = CacheService.get(cache_key)
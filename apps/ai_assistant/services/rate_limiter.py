@@ -3,21 +3,92 @@ Servicio de rate limiting para AI Assistant.
 
 Implementa límites de tasa por IP y sesión para prevenir abuso
 y controlar costos de API externa.
+
+Con Redis (django-redis) cada verificación es un único script Lua atómico
+sobre un sorted set con las marcas de tiempo de la ventana, de modo que
+varios workers concurrentes no pueden perder actualizaciones. Con otros
+backends de caché se usa la lista en caché de antes (leer, modificar,
+escribir), que no es atómica.
 """
 
 import logging
+import math
 import time
-from typing import Optional, Tuple
+import uuid
+from typing import Any, Optional, Tuple
 
+from django.conf import settings
 from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
+# KEYS[1]: sorted set de la ventana; ARGV: ahora (ms), ventana (ms), máximo, miembro, costo.
+# Devuelve {1, usados} si se admite o {0, marca_más_antigua_ms} si se rechaza.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local cost = tonumber(ARGV[5] or 1)
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local used = redis.call('ZCARD', key)
+if used + cost > limit then
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    return {0, tonumber(oldest[2]) or now}
+end
+for i = 1, cost do
+    redis.call('ZADD', key, now, ARGV[4] .. ':' .. i)
+end
+redis.call('PEXPIRE', key, window)
+return {1, used + cost}
+"""
+
 
 class RateLimiter:
     """Rate limiter basado en Redis con ventanas deslizantes."""
 
     RATE_LIMIT_PREFIX = "rate_limit"
+    WINDOW_KEY_SUFFIX = "window"
+
+    _script = None
+    _script_client = None
+
+    @classmethod
+    def _get_redis_client(cls) -> Optional[Any]:
+        """
+        Cliente Redis crudo de django-redis, o None para usar la caché genérica.
+
+        AI_RATE_LIMIT_BACKEND: 'auto' (Redis si el backend de caché es
+        django-redis), 'redis' o 'cache'.
+        """
+        backend = getattr(settings, "AI_RATE_LIMIT_BACKEND", "auto")
+        if backend == "cache":
+            return None
+        try:
+            from django_redis import get_redis_connection
+
+            return get_redis_connection("default")
+        except (ImportError, NotImplementedError):
+            if backend == "redis":
+                logger.warning("AI_RATE_LIMIT_BACKEND is 'redis' but the cache backend is not django-redis")
+            return None
+
+    @classmethod
+    def _get_script(cls, client: Any) -> Any:
+        if cls._script is None or cls._script_client is not client:
+            cls._script = client.register_script(SLIDING_WINDOW_SCRIPT)
+            cls._script_client = client
+        return cls._script
+
+    @classmethod
+    def _get_window_key(cls, identifier: str, endpoint: str) -> str:
+        """
+        Clave del sorted set, con el KEY_PREFIX de la caché.
+
+        Es distinta de la clave de la caché genérica, cuyo valor es un dict
+        serializado y no un sorted set.
+        """
+        return cache.make_key(f"{cls._get_cache_key(identifier, endpoint)}:{cls.WINDOW_KEY_SUFFIX}")
 
     @classmethod
     def _get_cache_key(cls, identifier: str, endpoint: str) -> str:
@@ -35,7 +106,7 @@ class RateLimiter:
 
     @classmethod
     def check_rate_limit(
-        cls, identifier: str, endpoint: str, max_requests: int, window: int
+        cls, identifier: str, endpoint: str, max_requests: int, window: int, cost: int = 1
     ) -> Tuple[bool, Optional[int]]:
         """
         Verifica si se excedió el límite de tasa.
@@ -45,6 +116,7 @@ class RateLimiter:
             endpoint: Nombre del endpoint
             max_requests: Número máximo de requests permitidos
             window: Ventana de tiempo en segundos
+            cost: Requests que consume esta llamada (p. ej. comandos de un lote)
 
         Returns:
             Tupla (permitido, segundos_hasta_reset)
@@ -58,6 +130,47 @@ class RateLimiter:
             >>> if not allowed:
             ...     print(f"Rate limit exceeded. Retry after {retry_after}s")
         """
+        try:
+            client = cls._get_redis_client()
+            if client is not None:
+                return cls._check_redis(client, identifier, endpoint, max_requests, window, cost)
+        except Exception as e:
+            logger.error(f"Rate limit check error: {e}. Allowing request.")
+            return True, None
+
+        return cls._check_cache(identifier, endpoint, max_requests, window, cost)
+
+    @classmethod
+    def _check_redis(
+        cls, client: Any, identifier: str, endpoint: str, max_requests: int, window: int, cost: int = 1
+    ) -> Tuple[bool, Optional[int]]:
+        """Verificación atómica con el script Lua (un solo viaje a Redis)."""
+        now_ms = int(time.time() * 1000)
+        window_ms = window * 1000
+        allowed, value = cls._get_script(client)(
+            keys=[cls._get_window_key(identifier, endpoint)],
+            args=[now_ms, window_ms, max_requests, f"{now_ms}-{uuid.uuid4().hex[:12]}", cost],
+        )
+
+        if not allowed:
+            retry_after = math.ceil((int(value) + window_ms - now_ms) / 1000)
+            logger.warning(
+                f"Rate limit exceeded for {identifier} on {endpoint}. "
+                f"Retry after {retry_after}s"
+            )
+            return False, max(1, retry_after)
+
+        logger.debug(
+            f"Rate limit check passed for {identifier}. "
+            f"Remaining: {max_requests - int(value)}/{max_requests}"
+        )
+        return True, None
+
+    @classmethod
+    def _check_cache(
+        cls, identifier: str, endpoint: str, max_requests: int, window: int, cost: int = 1
+    ) -> Tuple[bool, Optional[int]]:
+        """Verificación con la lista en caché (backends sin Redis)."""
         cache_key = cls._get_cache_key(identifier, endpoint)
         current_time = int(time.time())
 
@@ -73,8 +186,8 @@ class RateLimiter:
             cutoff_time = current_time - window
             requests = [req for req in requests if req > cutoff_time]
 
-            if len(requests) >= max_requests:
-                oldest_request = min(requests)
+            if len(requests) + cost > max_requests:
+                oldest_request = min(requests, default=current_time)
                 retry_after = window - (current_time - oldest_request)
                 logger.warning(
                     f"Rate limit exceeded for {identifier} on {endpoint}. "
@@ -82,7 +195,7 @@ class RateLimiter:
                 )
                 return False, max(1, retry_after)
 
-            requests.append(current_time)
+            requests.extend([current_time] * cost)
             data["requests"] = requests
             data["window_start"] = window_start
 
@@ -113,6 +226,9 @@ class RateLimiter:
         """
         cache_key = cls._get_cache_key(identifier, endpoint)
         try:
+            client = cls._get_redis_client()
+            if client is not None:
+                client.delete(cls._get_window_key(identifier, endpoint))
             cache.delete(cache_key)
             logger.info(f"Rate limit reset for {identifier} on {endpoint}")
             return True
@@ -140,6 +256,14 @@ class RateLimiter:
         current_time = int(time.time())
 
         try:
+            client = cls._get_redis_client()
+            if client is not None:
+                now_ms = int(time.time() * 1000)
+                used = client.zcount(
+                    cls._get_window_key(identifier, endpoint), f"({now_ms - window * 1000}", "+inf"
+                )
+                return max(0, max_requests - used)
+
             data = cache.get(cache_key)
             if data is None:
                 return max_requests
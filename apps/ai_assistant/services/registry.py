@@ -0,0 +1,202 @@
+"""
+Process-wide registry of warm AI services.
+
+The AI views used to build their services on every request:
+AIAssistantService, UMLCommandProcessorService and IncrementalCommandProcessor
+each made an OpenAIService, whose first sync call opened a new AzureOpenAI
+client (HTTP pool and TLS context), and ModelRouterService built every
+backend service again. The services keep no per-request state, so one
+instance of each is shared by all threads of the worker:
+
+- get_service(name) builds the instance on first use, under a lock so
+  concurrent first requests build it once; a failed build is not cached
+  and is retried by the next caller
+- aget_service(name) is the same for async views: an instance that is
+  already built is returned directly, a first build runs on the LLM pool
+- warm_services() builds them all at ASGI/WSGI startup
+  (AI_WARM_SERVICES_AT_STARTUP), so no request pays for the build
+
+Every service built here shares one OpenAIService. Changing a setting (for
+example with override_settings in tests) drops the instances.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .llm_executor import run_in_llm_pool
+
+logger = logging.getLogger(__name__)
+
+OPENAI = 'openai'
+AI_ASSISTANT = 'ai_assistant'
+COMMAND_PROCESSOR = 'command_processor'
+INCREMENTAL_PROCESSOR = 'incremental_processor'
+MODEL_ROUTER = 'model_router'
+
+
+def _build_openai() -> Any:
+    from .openai_service import OpenAIService
+    service = OpenAIService()
+    # Open the sync client now rather than on the first sync call
+    service.client
+    return service
+
+
+def _openai_or_none() -> Optional[Any]:
+    # The services fall back to their own handling when OpenAI is not installed
+    try:
+        return get_service(OPENAI)
+    except ImportError:
+        return None
+
+
+def _build_ai_assistant() -> Any:
+    from .ai_assistant_service import AIAssistantService
+    return AIAssistantService(openai_service=_openai_or_none())
+
+
+def _build_command_processor() -> Any:
+    from .command_processor_service import UMLCommandProcessorService
+    return UMLCommandProcessorService(openai_service=_openai_or_none())
+
+
+def _build_incremental_processor() -> Any:
+    from .incremental_command_processor import IncrementalCommandProcessor
+    try:
+        openai_service = _openai_or_none()
+    except ValueError:
+        # Pattern matching works without OpenAI; only the AI fallback needs it
+        openai_service = None
+    return IncrementalCommandProcessor(openai_service=openai_service)
+
+
+def _build_model_router() -> Any:
+    from .model_router_service import ModelRouterService
+    return ModelRouterService()
+
+
+FACTORIES: Dict[str, Callable[[], Any]] = {
+    OPENAI: _build_openai,
+    AI_ASSISTANT: _build_ai_assistant,
+    COMMAND_PROCESSOR: _build_command_processor,
+    INCREMENTAL_PROCESSOR: _build_incremental_processor,
+    MODEL_ROUTER: _build_model_router,
+}
+
+
+class ServiceRegistry:
+    """Shared service instances of this worker process."""
+
+    # Reentrant: building one service gets the ones it depends on
+    _lock = threading.RLock()
+    _instances: Dict[str, Any] = {}
+    _build_seconds: Dict[str, float] = {}
+
+    @classmethod
+    def get(cls, name: str) -> Any:
+        """
+        Get the shared instance, building it on first use.
+
+        Raises:
+            KeyError: Unknown service name
+            Exception: Whatever the service constructor raises
+        """
+        instance = cls._instances.get(name)
+        if instance is not None:
+            return instance
+        factory = FACTORIES[name]
+        with cls._lock:
+            instance = cls._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = factory()
+                cls._build_seconds[name] = time.perf_counter() - start
+                cls._instances[name] = instance
+                logger.info(f"Service '{name}' built in {cls._build_seconds[name] * 1000:.1f}ms")
+        return instance
+
+    @classmethod
+    async def aget(cls, name: str) -> Any:
+        """Async get(): an instance that is already built costs no thread hop."""
+        instance = cls._instances.get(name)
+        if instance is not None:
+            return instance
+        return await run_in_llm_pool(cls.get, name)
+
+    @classmethod
+    def warm(cls, names: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+        """
+        Build the services now, e.g. at startup.
+
+        Args:
+            names: Services to build; all of them by default
+
+        Returns:
+            Dictionary of service name to None when built, or the error
+            message when its constructor failed (the service is then built
+            on first use, as before)
+        """
+        outcome = {}
+        for name in names or FACTORIES:
+            try:
+                cls.get(name)
+                outcome[name] = None
+            except Exception as e:
+                logger.warning(f"Could not warm service '{name}': {e}")
+                outcome[name] = str(e)
+        return outcome
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drop every instance; the next get() builds it again."""
+        with cls._lock:
+            cls._instances.clear()
+            cls._build_seconds.clear()
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """
+        Returns:
+            Dictionary per service with built and build_ms
+        """
+        with cls._lock:
+            return {
+                name: {
+                    'built': name in cls._instances,
+                    'build_ms': round(cls._build_seconds[name] * 1000, 1) if name in cls._build_seconds else None,
+                }
+                for name in FACTORIES
+            }
+
+
+def get_service(name: str) -> Any:
+    """Shared instance of a registered service (see ServiceRegistry.get)."""
+    return ServiceRegistry.get(name)
+
+
+async def aget_service(name: str) -> Any:
+    """Shared instance of a registered service, for async callers."""
+    return await ServiceRegistry.aget(name)
+
+
+def warm_services() -> None:
+    """Build the shared services at worker startup unless AI_WARM_SERVICES_AT_STARTUP is off."""
+    from django.conf import settings
+
+    if not getattr(settings, 'AI_WARM_SERVICES_AT_STARTUP', True):
+        return
+    start = time.perf_counter()
+    outcome = ServiceRegistry.warm()
+    built = [name for name, error in outcome.items() if error is None]
+    logger.info(f"Warmed AI services {built} in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(**kwargs) -> None:
+    # Services read their configuration once, when they are built
+    ServiceRegistry.reset()
@@ -0,0 +1,329 @@
+"""
+Single-flight coalescing for cached AI calls.
+
+When several collaborators send the same command against the same diagram
+at the same time, all of them miss CacheService and would each pay for an
+LLM call. SingleFlight keys the work on CacheService._generate_cache_key()
+so only one caller computes; the others wait for its result.
+
+Two layers:
+
+- In-process: a table of futures per key. The first thread is the leader,
+  concurrent threads wait on its future and get a copy of its result (or its
+  exception).
+- Across processes: the leader takes a lock in the shared cache with
+  cache.add() (SET NX with a TTL on Redis). A process that finds the lock
+  held polls the cache for the result until it shows up, the lock goes away
+  or the wait times out, and computes itself in the last two cases.
+
+Any cache error makes the caller compute directly, so coalescing never
+turns into an outage.
+
+ado() is the same protocol for coroutines: followers in one event loop await
+the leader's asyncio future, and the shared-cache calls run on worker threads
+so the loop is never blocked.
+"""
+
+import asyncio
+import copy
+import logging
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TTL = 120
+DEFAULT_WAIT_TIMEOUT = 90
+
+POLL_INITIAL_INTERVAL = 0.05
+POLL_MAX_INTERVAL = 0.5
+
+
+def _in_thread(func: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    return sync_to_async(func, thread_sensitive=False)
+
+
+class SingleFlight:
+    """Run a computation once per cache key across concurrent callers."""
+
+    LOCK_PREFIX = "ai_assistant_lock"
+
+    _lock = threading.Lock()
+    _inflight: Dict[str, Future] = {}
+    _async_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+        weakref.WeakKeyDictionary()
+    )
+    _stats = {
+        "leaders": 0,
+        "coalesced_local": 0,
+        "coalesced_remote": 0,
+        "wait_timeouts": 0,
+        "lock_errors": 0,
+    }
+
+    @classmethod
+    def _count(cls, name: str) -> None:
+        with cls._lock:
+            cls._stats[name] += 1
+
+    @classmethod
+    def do(
+        cls,
+        key_components: dict,
+        compute: Callable[[], Any],
+        ttl: int = CacheService.DEFAULT_TTL,
+    ) -> Any:
+        """
+        Return the cached result for key_components, computing it at most once.
+
+        The caller is expected to have checked CacheService already. The
+        leader stores a non-None result with CacheService.set(ttl), which is
+        also how waiting processes receive it.
+
+        Args:
+            key_components: Same components passed to CacheService.get/set
+            compute: Zero-argument callable producing the result
+            ttl: Cache TTL for the result in seconds
+
+        Returns:
+            The leader's result; local followers receive a deep copy
+        """
+        cache_key = CacheService._generate_cache_key(key_components)
+
+        with cls._lock:
+            future = cls._inflight.get(cache_key)
+            leader = future is None
+            if leader:
+                future = Future()
+                cls._inflight[cache_key] = future
+                cls._stats["leaders"] += 1
+            else:
+                cls._stats["coalesced_local"] += 1
+
+        if not leader:
+            wait_timeout = getattr(settings, "AI_SINGLE_FLIGHT_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+            try:
+                return copy.deepcopy(future.result(timeout=wait_timeout))
+            except FutureTimeoutError:
+                cls._count("wait_timeouts")
+                logger.warning(f"Single-flight wait timed out: {cache_key[:50]}...")
+                return compute()
+
+        try:
+            value = cls._compute_shared(cache_key, key_components, compute, ttl)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with cls._lock:
+                cls._inflight.pop(cache_key, None)
+
+    @classmethod
+    async def ado(
+        cls,
+        key_components: dict,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: int = CacheService.DEFAULT_TTL,
+    ) -> Any:
+        """
+        Async counterpart of do() for coroutines running in an event loop.
+
+        Args:
+            key_components: Same components passed to CacheService.get/set
+            compute: Zero-argument coroutine function producing the result
+            ttl: Cache TTL for the result in seconds
+
+        Returns:
+            The leader's result; followers in the same loop receive a deep copy
+        """
+        cache_key = CacheService._generate_cache_key(key_components)
+        loop = asyncio.get_running_loop()
+
+        with cls._lock:
+            inflight = cls._async_inflight.setdefault(loop, {})
+        future = inflight.get(cache_key)
+
+        if future is not None:
+            cls._count("coalesced_local")
+            wait_timeout = getattr(settings, "AI_SINGLE_FLIGHT_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+            try:
+                value = await asyncio.wait_for(asyncio.shield(future), wait_timeout)
+            except asyncio.TimeoutError:
+                cls._count("wait_timeouts")
+                logger.warning(f"Single-flight wait timed out: {cache_key[:50]}...")
+                return await compute()
+            except asyncio.CancelledError:
+                # The leader was cancelled (client went away); only re-raise
+                # if it is this caller that is being cancelled
+                if not future.cancelled():
+                    raise
+                return await compute()
+            return copy.deepcopy(value)
+
+        future = loop.create_future()
+        inflight[cache_key] = future
+        cls._count("leaders")
+        try:
+            value = await cls._acompute_shared(cache_key, key_components, compute, ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case nobody was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            inflight.pop(cache_key, None)
+
+    @classmethod
+    async def _acompute_shared(
+        cls, cache_key: str, key_components: dict, compute: Callable[[], Awaitable[Any]], ttl: int
+    ) -> Any:
+        """Async version of _compute_shared()."""
+        lock_key = f"{cls.LOCK_PREFIX}:{cache_key}"
+        lock_ttl = getattr(settings, "AI_SINGLE_FLIGHT_LOCK_TTL", DEFAULT_LOCK_TTL)
+        wait_timeout = getattr(settings, "AI_SINGLE_FLIGHT_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+        token = uuid.uuid4().hex
+
+        deadline = time.monotonic() + wait_timeout
+        interval = POLL_INITIAL_INTERVAL
+        while True:
+            try:
+                acquired = await _in_thread(cache.add)(lock_key, token, timeout=lock_ttl)
+            except Exception as e:
+                cls._count("lock_errors")
+                logger.warning(f"Single-flight lock error: {e}. Computing without lock.")
+                return await cls._acompute_and_store(key_components, compute, ttl)
+
+            if acquired:
+                try:
+                    value = await _in_thread(CacheService.get)(key_components)
+                    if value is not None:
+                        cls._count("coalesced_remote")
+                        return value
+                    return await cls._acompute_and_store(key_components, compute, ttl)
+                finally:
+                    await _in_thread(cls._release)(lock_key, token)
+
+            if time.monotonic() >= deadline:
+                cls._count("wait_timeouts")
+                logger.warning(f"Single-flight lock wait timed out: {cache_key[:50]}...")
+                return await cls._acompute_and_store(key_components, compute, ttl)
+
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, POLL_MAX_INTERVAL)
+
+            value = await _in_thread(CacheService.get)(key_components)
+            if value is not None:
+                cls._count("coalesced_remote")
+                return value
+
+    @classmethod
+    async def _acompute_and_store(
+        cls, key_components: dict, compute: Callable[[], Awaitable[Any]], ttl: int
+    ) -> Any:
+        value = await compute()
+        if value is not None:
+            await _in_thread(CacheService.set)(key_components, value, ttl=ttl)
+        return value
+
+    @classmethod
+    def _compute_shared(
+        cls, cache_key: str, key_components: dict, compute: Callable[[], Any], ttl: int
+    ) -> Any:
+        """Compute under the cross-process lock, or wait for the holder."""
+        lock_key = f"{cls.LOCK_PREFIX}:{cache_key}"
+        lock_ttl = getattr(settings, "AI_SINGLE_FLIGHT_LOCK_TTL", DEFAULT_LOCK_TTL)
+        wait_timeout = getattr(settings, "AI_SINGLE_FLIGHT_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+        token = uuid.uuid4().hex
+
+        deadline = time.monotonic() + wait_timeout
+        interval = POLL_INITIAL_INTERVAL
+        while True:
+            try:
+                acquired = cache.add(lock_key, token, timeout=lock_ttl)
+            except Exception as e:
+                cls._count("lock_errors")
+                logger.warning(f"Single-flight lock error: {e}. Computing without lock.")
+                return cls._compute_and_store(key_components, compute, ttl)
+
+            if acquired:
+                try:
+                    # Another process may have stored the result between our
+                    # cache miss and taking the lock
+                    value = CacheService.get(key_components)
+                    if value is not None:
+                        cls._count("coalesced_remote")
+                        return value
+                    return cls._compute_and_store(key_components, compute, ttl)
+                finally:
+                    cls._release(lock_key, token)
+
+            if time.monotonic() >= deadline:
+                cls._count("wait_timeouts")
+                logger.warning(f"Single-flight lock wait timed out: {cache_key[:50]}...")
+                return cls._compute_and_store(key_components, compute, ttl)
+
+            time.sleep(interval)
+            interval = min(interval * 2, POLL_MAX_INTERVAL)
+
+            value = CacheService.get(key_components)
+            if value is not None:
+                cls._count("coalesced_remote")
+                return value
+
+    @classmethod
+    def _compute_and_store(cls, key_components: dict, compute: Callable[[], Any], ttl: int) -> Any:
+        value = compute()
+        if value is not None:
+            CacheService.set(key_components, value, ttl=ttl)
+        return value
+
+    @classmethod
+    def _release(cls, lock_key: str, token: str) -> None:
+        """Delete the lock if it is still ours (it may have expired and been retaken)."""
+        try:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+        except Exception as e:
+            logger.warning(f"Single-flight lock release error: {e}")
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """
+        Coalescing counters for this process.
+
+        Returns:
+            Dictionary with leaders, coalesced_local, coalesced_remote,
+            coalesced (their sum), wait_timeouts, lock_errors and inflight
+        """
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats["inflight"] = len(cls._inflight) + sum(
+                len(futures) for futures in cls._async_inflight.values()
+            )
+        stats["coalesced"] = stats["coalesced_local"] + stats["coalesced_remote"]
+        return stats
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            for name in cls._stats:
+                cls._stats[name] = 0
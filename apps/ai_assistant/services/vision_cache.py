@@ -0,0 +1,341 @@
+"""
+Result cache for UML image extraction keyed by a perceptual hash.
+
+Users upload the same screenshot again, or a recompressed copy of it, and
+each upload used to cost a multi-second vision call. The bytes of such
+copies differ, so images are matched perceptually, in two steps:
+
+- lookup: a 256-bit difference hash (dHash) of the image reduced to 17x16
+  grey pixels. Copies differ in a few bits, other diagrams in dozens. The
+  nearest stored hash within AI_VISION_CACHE_MAX_DISTANCE bits is found
+  without scanning: each hash is split into MAX_DISTANCE + 1 bands and
+  indexed under every band in the shared cache; two hashes within the
+  distance differ in at most MAX_DISTANCE bands, so they share one band
+  exactly and only those band keys are read
+- verification: at 17x16 pixels a renamed class or an added attribute does
+  not change the hash, so a candidate is only served when the 384px wide
+  grey thumbnails of both images differ by at most
+  AI_VISION_CACHE_MAX_BLOCK_DIFF (mean grey level of the worst 8x8 block).
+  JPEG recompression down to quality 60 stays within the default; a
+  renamed class or an added attribute does not.
+  Rescaled copies miss, since resampling shifts every line by a pixel, and
+  an edit of a single character can pass, like any perceptual match
+
+Different images can share a hash, so entries are keyed by the hash and a
+checksum of the thumbnail. Each band key keeps the last
+AI_VISION_CACHE_BUCKET_SIZE entry keys; results expire after
+AI_VISION_CACHE_TTL seconds.
+
+Results are cached per model and per diagram context (the existing diagram
+sent with the image), and only when the extraction found something: errors
+and empty results are computed again on the next upload.
+"""
+
+import base64
+import copy
+import io
+import logging
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageChops
+
+from apps.uml_diagrams.content_hash import compute_content_hash
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+THUMBNAIL_WIDTH = 384
+BLOCK_SIZE = 8
+
+DEFAULTS = {
+    'AI_VISION_CACHE_ENABLED': True,
+    'AI_VISION_CACHE_TTL': 86400,
+    'AI_VISION_CACHE_MAX_DISTANCE': 10,
+    'AI_VISION_CACHE_MAX_BLOCK_DIFF': 8.0,
+    'AI_VISION_CACHE_BUCKET_SIZE': 32,
+}
+
+COUNTER_NAMES = ('hits', 'near_hits', 'misses', 'rejected', 'stores', 'bypassed')
+
+
+def _setting(name: str) -> Any:
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def decode_image(base64_image: str) -> bytes:
+    """Image bytes of a base64 upload, with or without a data: URL prefix."""
+    if ',' in base64_image:
+        base64_image = base64_image.split(',', 1)[1]
+    return base64.b64decode(base64_image)
+
+
+class ImageFingerprint(NamedTuple):
+    """Perceptual hash and verification thumbnail of an image."""
+
+    hash: int
+    thumbnail: bytes
+    size: Tuple[int, int]
+
+
+def _difference_hash(grey: Image.Image) -> int:
+    # Each bit: is a pixel of the 17x16 thumbnail brighter than its right neighbour
+    pixels = grey.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(offset, offset + HASH_SIZE):
+            value = (value << 1) | (pixels[column] > pixels[column + 1])
+    return value
+
+
+def fingerprint(image_bytes: bytes) -> ImageFingerprint:
+    """
+    Fingerprint an image for the cache.
+
+    Raises:
+        Exception: Whatever Pillow raises for bytes that are not an image
+    """
+    # No draft() decoding: JPEG's reduced-scale decode would not match the
+    # thumbnail of the same image stored as PNG
+    grey = Image.open(io.BytesIO(image_bytes)).convert('L')
+    size = (THUMBNAIL_WIDTH, max(1, round(grey.height * THUMBNAIL_WIDTH / grey.width)))
+    thumbnail = grey.resize(size, Image.BOX)
+    return ImageFingerprint(_difference_hash(grey), thumbnail.tobytes(), size)
+
+
+def block_difference(first: ImageFingerprint, second: ImageFingerprint) -> float:
+    """
+    Mean grey-level difference of the most different 8x8 block of the two
+    thumbnails (0-255); images of another aspect ratio count as 255.
+    """
+    if abs(first.size[1] - second.size[1]) > 1:
+        return 255.0
+    one = Image.frombytes('L', first.size, first.thumbnail)
+    other = Image.frombytes('L', second.size, second.thumbnail)
+    if other.size != one.size:
+        other = other.resize(one.size, Image.BOX)
+    blocks = ImageChops.difference(one, other).resize(
+        (max(1, one.width // BLOCK_SIZE), max(1, one.height // BLOCK_SIZE)), Image.BOX
+    )
+    return float(max(blocks.tobytes()))
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Number of bits in which two hashes differ."""
+    return bin(first ^ second).count('1')
+
+
+def _bands(value: int, count: int) -> List[int]:
+    """Split a hash into `count` bands of (nearly) equal width."""
+    bands = []
+    start = 0
+    for index in range(count):
+        width = HASH_BITS // count + (1 if index < HASH_BITS % count else 0)
+        bands.append((value >> start) & ((1 << width) - 1))
+        start += width
+    return bands
+
+
+def _is_cacheable(result: Any) -> bool:
+    if not isinstance(result, dict) or not (result.get('nodes') or result.get('edges')):
+        return False
+    return not (result.get('metadata') or {}).get('error')
+
+
+class VisionResultCache:
+    """Near-duplicate cache of vision results in the shared cache."""
+
+    CACHE_PREFIX = "ai_vision"
+
+    _lock = threading.Lock()
+    _stats: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def _scope(cls, model: str, context: Optional[Dict[str, Any]]) -> str:
+        digest = compute_content_hash(context)[:16] if context else '-'
+        return f"{cls.CACHE_PREFIX}:{model}:{digest}"
+
+    @classmethod
+    def _count(cls, model: str, name: str, amount: float = 1) -> None:
+        with cls._lock:
+            counters = cls._stats.get(model)
+            if counters is None:
+                counters = cls._stats[model] = dict.fromkeys(COUNTER_NAMES + ('saved_ms', 'saved_cost_usd'), 0)
+            counters[name] += amount
+
+    @classmethod
+    def _band_keys(cls, scope: str, value: int) -> List[str]:
+        count = _setting('AI_VISION_CACHE_MAX_DISTANCE') + 1
+        return [f"{scope}:band{index}:{band:x}" for index, band in enumerate(_bands(value, count))]
+
+    @classmethod
+    def lookup(
+        cls, model: str, image: ImageFingerprint, context: Optional[Dict[str, Any]] = None
+    ) -> Optional[tuple]:
+        """
+        Find the cached result of the nearest matching image.
+
+        Args:
+            model: Vision model identifier
+            image: Fingerprint of the uploaded image
+            context: Existing diagram sent with the image, if any
+
+        Returns:
+            (result, distance) or None; candidates whose thumbnail differs
+            too much are counted as rejected
+        """
+        scope = cls._scope(model, context)
+        buckets = cache.get_many(cls._band_keys(scope, image.hash))
+        max_distance = _setting('AI_VISION_CACHE_MAX_DISTANCE')
+        candidates = {}
+        for bucket in buckets.values():
+            for stored in bucket:
+                distance = hamming_distance(image.hash, int(stored.split('-')[0], 16))
+                if distance <= max_distance:
+                    candidates[stored] = distance
+        if not candidates:
+            return None
+
+        nearest = sorted(candidates, key=candidates.get)
+        entries = cache.get_many([f"{scope}:{stored}" for stored in nearest])
+        max_block_diff = _setting('AI_VISION_CACHE_MAX_BLOCK_DIFF')
+        for stored in nearest:
+            entry = entries.get(f"{scope}:{stored}")
+            if entry is None:
+                continue
+            cached = ImageFingerprint(int(stored.split('-')[0], 16), zlib.decompress(entry['thumbnail']), tuple(entry['size']))
+            if block_difference(image, cached) <= max_block_diff:
+                return entry['result'], candidates[stored]
+            cls._count(model, 'rejected')
+        return None
+
+    @classmethod
+    def store(
+        cls,
+        model: str,
+        image: ImageFingerprint,
+        result: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Cache a result with the image's thumbnail and index its hash by band."""
+        scope = cls._scope(model, context)
+        stored = f"{image.hash:0{HASH_BITS // 4}x}-{zlib.crc32(image.thumbnail):08x}"
+        ttl = _setting('AI_VISION_CACHE_TTL')
+        bucket_size = _setting('AI_VISION_CACHE_BUCKET_SIZE')
+
+        cache.set(f"{scope}:{stored}", {
+            'result': result,
+            'thumbnail': zlib.compress(image.thumbnail),
+            'size': image.size,
+        }, timeout=ttl)
+        band_keys = cls._band_keys(scope, image.hash)
+        buckets = cache.get_many(band_keys)
+        updated = {}
+        for key in band_keys:
+            bucket = [entry for entry in buckets.get(key, []) if entry != stored]
+            bucket.append(stored)
+            # The oldest entries leave the index first; their results expire on their own
+            updated[key] = bucket[-bucket_size:]
+        cache.set_many(updated, timeout=ttl)
+
+    @classmethod
+    def get_or_process(
+        cls,
+        model: str,
+        base64_image: str,
+        compute: Callable[[], Dict[str, Any]],
+        context: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Return the cached result of a near-identical image, or compute it.
+
+        Args:
+            model: Vision model identifier
+            base64_image: Image as uploaded
+            compute: Runs the vision model on the image
+            context: Existing diagram sent with the image, if any
+            session_id: Session of this upload, set in the returned metadata
+
+        Returns:
+            compute()'s result, or a copy of the cached one with
+            metadata.cache_hit, cache_distance and a zero cost_info
+        """
+        if not _setting('AI_VISION_CACHE_ENABLED'):
+            return compute()
+        try:
+            image = fingerprint(decode_image(base64_image))
+            found = cls.lookup(model, image, context)
+        except Exception as e:
+            # Invalid images are reported by the vision service itself
+            logger.debug(f"Vision cache bypassed for {model}: {e}")
+            cls._count(model, 'bypassed')
+            return compute()
+
+        if found is not None:
+            result, distance = found
+            return cls._serve(model, copy.deepcopy(result), distance, session_id)
+
+        cls._count(model, 'misses')
+        result = compute()
+        if _is_cacheable(result):
+            try:
+                cls.store(model, image, result, context)
+                cls._count(model, 'stores')
+            except Exception as e:
+                logger.warning(f"Vision cache store failed for {model}: {e}")
+        return result
+
+    @classmethod
+    def _serve(cls, model: str, result: Dict[str, Any], distance: int, session_id: Optional[str]) -> Dict[str, Any]:
+        metadata = result.setdefault('metadata', {})
+        cost_info = result.get('cost_info') or {}
+        cls._count(model, 'hits')
+        if distance:
+            cls._count(model, 'near_hits')
+        cls._count(model, 'saved_ms', metadata.get('processing_time_ms', 0))
+        cls._count(model, 'saved_cost_usd', cost_info.get('request_cost_usd', 0.0))
+
+        metadata.update({
+            'cache_hit': True,
+            'cache_distance': distance,
+            'session_id': session_id,
+            'saved_processing_time_ms': metadata.get('processing_time_ms', 0),
+            'processing_time_ms': 0,
+        })
+        result['cost_info'] = {name: (0 if 'tokens' in name else 0.0) for name in cost_info}
+        logger.info(f"Vision cache hit for {model} (distance {distance})")
+        return result
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """
+        Returns:
+            Dictionary per model with hits (near_hits of them not exact),
+            misses, rejected (hash matches whose thumbnail differed),
+            stores, bypassed (image could not be read), hit_rate, saved_ms
+            and saved_cost_usd, plus the settings in effect
+        """
+        with cls._lock:
+            models = {model: dict(counters) for model, counters in cls._stats.items()}
+        for counters in models.values():
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else None
+            counters['saved_cost_usd'] = round(counters['saved_cost_usd'], 6)
+        return {
+            'models': models,
+            'enabled': _setting('AI_VISION_CACHE_ENABLED'),
+            'max_distance': _setting('AI_VISION_CACHE_MAX_DISTANCE'),
+            'max_block_diff': _setting('AI_VISION_CACHE_MAX_BLOCK_DIFF'),
+            'ttl': _setting('AI_VISION_CACHE_TTL'),
+        }
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls._stats.clear()
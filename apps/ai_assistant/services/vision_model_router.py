@@ -5,10 +5,28 @@ Primary: Llama 4 Maverick (70% cheaper) → Fallback: Nova Pro (reliable)
 """
 
 import logging
-from typing import Any, Dict, Optional
+import time
+from concurrent.futures import wait
+from typing import Any, Dict, List, Optional, Tuple
 
 from django.conf import settings
 
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .llama4_vision_service import ImageValidationError as Llama4ImageValidationError
+from .nova_vision_service import ImageValidationError
+from .vision_cache import VisionResultCache
+from .vision_tiling import (
+    Tile,
+    encode_tile,
+    get_tile_executor,
+    is_truncated,
+    merge_tile_results,
+    plan_tiles,
+    should_tile,
+    split_tile,
+    sum_cost_info,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +41,10 @@ class VisionModelRouterService:
     Features:
         - Automatic model selection
         - Transparent fallback on error
+        - Models whose circuit breaker is open are skipped
+        - Results of near-identical images come from VisionResultCache
+        - Large images are extracted in overlapping tiles, concurrently, and
+          merged into one diagram (see vision_tiling)
         - Unified response format
         - Cost tracking per model
     
@@ -64,7 +86,8 @@ class VisionModelRouterService:
         base64_image: str,
         model: Optional[str] = None,
         session_id: Optional[str] = None,
-        existing_diagram: Optional[Dict] = None
+        existing_diagram: Optional[Dict] = None,
+        tiled: Optional[bool] = None
     ) -> Dict[str, Any]:
         """
         Process image with selected model and automatic fallback.
@@ -74,6 +97,8 @@ class VisionModelRouterService:
             model: Model identifier (llama4-maverick, nova-pro) or None for default
             session_id: Optional session identifier
             existing_diagram: Optional existing diagram for merging
+            tiled: Extract in tiles (True), as one image (False) or in tiles
+                when the image is larger than AI_VISION_TILE_MIN_DIMENSION (None)
             
         Returns:
             Dict with nodes, edges, metadata, cost_info
@@ -97,10 +122,15 @@ class VisionModelRouterService:
                     }
                 }
         
+        if tiled is not False:
+            result = self._process_tiled(selected_model, base64_image, session_id, existing_diagram, force=bool(tiled))
+            if result is not None:
+                result['metadata']['model_requested'] = model or 'default'
+                return result
+        
         try:
-            service = self._get_model_service(selected_model)
-            
-            result = service.process_uml_diagram(
+            result = self._call_model(
+                selected_model,
                 base64_image=base64_image,
                 session_id=session_id,
                 existing_diagram=existing_diagram
@@ -128,9 +158,8 @@ class VisionModelRouterService:
                 self.logger.info(f"Attempting fallback to {fallback_model}")
                 
                 try:
-                    fallback_service = self._get_model_service(fallback_model)
-                    
-                    result = fallback_service.process_uml_diagram(
+                    result = self._call_model(
+                        fallback_model,
                         base64_image=base64_image,
                         session_id=session_id,
                         existing_diagram=existing_diagram
@@ -163,6 +192,152 @@ class VisionModelRouterService:
                 }
             }
     
+    def _process_tiled(
+        self,
+        model_id: str,
+        base64_image: str,
+        session_id: Optional[str],
+        existing_diagram: Optional[Dict],
+        force: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Extract the image tile by tile on the tile pool and merge the results.
+        
+        Tiles whose answer was cut off are extracted again in quarters, in
+        another round.
+        
+        Returns:
+            The merged result, or None to process the image as a whole: it
+            is small, fits in one tile, cannot be read (the service reports
+            why) or no tile could be extracted
+        """
+        start = time.time()
+        try:
+            # The service's size and format checks apply to the whole upload;
+            # one it rejects goes the single-image way and is rejected there
+            _, _, image = self._get_model_service(model_id)._open_image(base64_image)
+            if not force and not should_tile(image.size):
+                return None
+            tiles = plan_tiles(image)
+            if len(tiles) < 2:
+                return None
+        except Exception as e:
+            self.logger.debug(f"Tiled extraction skipped: {e}")
+            return None
+        
+        self.logger.info(f"Extracting {image.width}x{image.height} image in {len(tiles)} tiles with {model_id}")
+        executor = get_tile_executor()
+        extracted: List[Tuple[Tile, Dict[str, Any]]] = []
+        models_used = set()
+        failed = split = 0
+        depth = 0
+        while tiles:
+            futures = [
+                executor.submit(self._call_tile, model_id, encode_tile(image, tile), session_id, existing_diagram)
+                for tile in tiles
+            ]
+            wait(futures)
+            next_tiles = []
+            for tile, future in zip(tiles, futures):
+                try:
+                    tile_model, result = future.result()
+                except Exception as e:
+                    self.logger.warning(f"Tile {tile.box} failed: {e}")
+                    failed += 1
+                    continue
+                if (result.get('metadata') or {}).get('error'):
+                    failed += 1
+                    continue
+                models_used.add(tile_model)
+                extracted.append((tile, result))
+                if is_truncated(result):
+                    quarters = split_tile(tile, depth)
+                    split += bool(quarters)
+                    next_tiles.extend(quarters)
+            tiles = next_tiles
+            depth += 1
+        if not extracted:
+            self.logger.warning("No tile could be extracted, processing the image as a whole")
+            return None
+        
+        results = [result for _, result in extracted]
+        merged = merge_tile_results(extracted, existing_diagram)
+        merged['cost_info'] = sum_cost_info(results)
+        merged['metadata'] = {
+            'processing_time_ms': int((time.time() - start) * 1000),
+            'session_id': session_id,
+            'node_count': len(merged['nodes']),
+            'edge_count': len(merged['edges']),
+            'tiled': True,
+            'tiles': len(extracted) + failed,
+            'split_tiles': split,
+            'failed_tiles': failed,
+            'image_size': list(image.size),
+            'model_used': model_id if models_used == {model_id} else ', '.join(sorted(models_used)),
+            'fallback_used': models_used != {model_id},
+        }
+        self.logger.info(f"Tiled extraction: {merged['message']}, {failed} tiles failed")
+        return merged
+    
+    def _call_tile(
+        self,
+        model_id: str,
+        base64_image: str,
+        session_id: Optional[str],
+        existing_diagram: Optional[Dict]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Extract one tile, on the fallback model if the selected one fails.
+        
+        Returns:
+            (model that answered, result)
+        """
+        kwargs = {'base64_image': base64_image, 'session_id': session_id, 'existing_diagram': existing_diagram}
+        try:
+            return model_id, self._call_model(model_id, **kwargs)
+        except Exception as e:
+            fallback_model = self._get_fallback_model(model_id)
+            if not fallback_model:
+                raise
+            self.logger.info(f"Tile failed on {model_id} ({e}), trying {fallback_model}")
+            return fallback_model, self._call_model(fallback_model, **kwargs)
+    
+    def _call_model(self, model_id: str, **kwargs) -> Dict[str, Any]:
+        """
+        Run process_uml_diagram on the model, unless the result cache has
+        the answer for a near-identical image.
+        
+        Raises:
+            CircuitOpenError: If the circuit does not let the call out
+        """
+        service = self._get_model_service(model_id)
+        return VisionResultCache.get_or_process(
+            model_id,
+            kwargs['base64_image'],
+            lambda: self._call_service(model_id, service, **kwargs),
+            context=kwargs.get('existing_diagram'),
+            session_id=kwargs.get('session_id'),
+        )
+    
+    def _call_service(self, model_id: str, service, **kwargs) -> Dict[str, Any]:
+        """
+        Run process_uml_diagram through the model's circuit breaker.
+        
+        Invalid images are the caller's fault and do not count as failures.
+        """
+        if not CircuitBreaker.allow(model_id):
+            raise CircuitOpenError(f"Circuit for {model_id} is open")
+        start = time.perf_counter()
+        try:
+            result = service.process_uml_diagram(**kwargs)
+        except (ImageValidationError, Llama4ImageValidationError):
+            raise
+        except Exception:
+            CircuitBreaker.record(model_id, time.perf_counter() - start, failed=True)
+            raise
+        CircuitBreaker.record(model_id, time.perf_counter() - start, failed=False)
+        return result
+    
     def _get_model_service(self, model_id: str):
         """
         Get service instance for model.
@@ -186,7 +361,7 @@ class VisionModelRouterService:
             model_id: Model identifier
             
         Returns:
-            True if model is available and enabled
+            True if model is available, enabled and its circuit is not open
         """
         if model_id not in self._services:
             return False
@@ -194,7 +369,7 @@ class VisionModelRouterService:
         models_config = getattr(settings, 'VISION_PROCESSING_MODELS', {})
         model_config = models_config.get(model_id, {})
         
-        return model_config.get('enabled', True)
+        return model_config.get('enabled', True) and not CircuitBreaker.is_open(model_id)
     
     def _get_default_model(self) -> str:
         """
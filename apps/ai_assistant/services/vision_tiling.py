@@ -0,0 +1,381 @@
+"""
+Tiled extraction of large UML diagram images.
+
+A whiteboard photo or an exported diagram with dozens of classes used to go
+to the vision model as one image: the answer for every class had to fit in
+one generation (Llama 4's max_gen_len is 4096 tokens) and was often cut
+off, and the model saw each class at a fraction of its size. Above
+AI_VISION_TILE_MIN_DIMENSION pixels the router now extracts the diagram
+tile by tile:
+
+- plan_tiles() trims the background margins and splits the content into a
+  grid of cells of about AI_VISION_TILE_SIZE pixels. Each cut is moved to
+  the emptiest column or row near it (the whitespace between classes), and
+  each cell grows by AI_VISION_TILE_OVERLAP pixels on every side, so any
+  class up to twice the overlap wide lies whole in at least one tile. Blank
+  tiles are skipped and at most AI_VISION_MAX_TILES are made.
+- the tiles run concurrently on a process-wide pool of
+  AI_VISION_TILE_THREAD_POOL_SIZE threads, each through the router's
+  cache, circuit breaker and fallback like a whole image.
+- a tile whose answer was cut off by the token limit is split into four
+  overlapping quarters that are extracted in another round, up to
+  AI_VISION_TILE_SPLIT_DEPTH times; the classes of the cut-off answer are
+  kept.
+- merge_tile_results() maps positions back to the full image, merges the
+  classes seen in several tiles by name (attributes and methods are
+  united, the most complete view wins the position) and deduplicates
+  relationships by their endpoints and type. Ids are assigned once for the
+  whole diagram: classes of the existing diagram keep theirs, the others
+  are numbered in reading order.
+
+A relationship whose two classes share no tile, a long line across the
+diagram, is only found when a tile shows enough of it for the model to
+name both ends.
+"""
+
+import base64
+import io
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.conf import settings
+from PIL import Image
+
+from .image_preprocessing import background_mask
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'AI_VISION_TILING_ENABLED': True,
+    'AI_VISION_TILE_MIN_DIMENSION': 2400,
+    'AI_VISION_TILE_SIZE': 1280,
+    'AI_VISION_TILE_OVERLAP': 256,
+    'AI_VISION_MAX_TILES': 16,
+    'AI_VISION_TILE_THREAD_POOL_SIZE': 8,
+    'AI_VISION_TILE_SPLIT_DEPTH': 1,
+}
+
+# The vision services reject images under 100 pixels a side
+MIN_TILE_DIMENSION = 128
+
+# stop_reason of an answer cut off by the token limit (Llama 4, Nova)
+TRUNCATED_STOP_REASONS = frozenset({'length', 'max_tokens'})
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _setting(name: str) -> Any:
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def get_tile_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide executor for tile calls, created on first use.
+
+    Its size bounds the vision calls of all tiled requests together; like
+    the hedge pool it is separate from the LLM pool the router may run on.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_setting('AI_VISION_TILE_THREAD_POOL_SIZE'),
+                    thread_name_prefix='vision-tile',
+                )
+    return _executor
+
+
+class Tile(NamedTuple):
+    """Region of the full image, (left, top, right, bottom) in pixels."""
+
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    @property
+    def box(self) -> Tuple[int, int, int, int]:
+        return (self.left, self.top, self.right, self.bottom)
+
+
+def should_tile(size: Tuple[int, int]) -> bool:
+    """Whether an image of this size is extracted in tiles by default."""
+    return _setting('AI_VISION_TILING_ENABLED') and max(size) > _setting('AI_VISION_TILE_MIN_DIMENSION')
+
+
+def _snap(ink: Sequence[int], position: int, window: int) -> int:
+    """Emptiest index of the ink profile within window/2 of position, nearest on ties."""
+    start = max(1, position - window // 2)
+    end = min(len(ink) - 1, position + window // 2)
+    if start >= end:
+        return position
+    return min(range(start, end), key=lambda index: (ink[index], abs(index - position)))
+
+
+def _cuts(start: int, end: int, cells: int, ink: Optional[Sequence[int]], window: int) -> List[int]:
+    step = (end - start) / cells
+    cuts = [start]
+    for index in range(1, cells):
+        position = round(start + index * step)
+        if ink is not None:
+            position = start + _snap(ink, position - start, window)
+        cuts.append(position)
+    cuts.append(end)
+    return cuts
+
+
+def _expand(low: int, high: int, overlap: int, limit: int) -> Tuple[int, int]:
+    low, high = max(0, low - overlap), min(limit, high + overlap)
+    if high - low < MIN_TILE_DIMENSION:
+        low = max(0, min(low, high - MIN_TILE_DIMENSION))
+        high = min(limit, low + MIN_TILE_DIMENSION)
+    return low, high
+
+
+def plan_tiles(image: Image.Image) -> List[Tile]:
+    """
+    Split an image into overlapping tiles along the whitespace of the diagram.
+
+    Args:
+        image: Full image
+
+    Returns:
+        Tiles in reading order; a single tile when the content fits in one
+    """
+    grey = image.convert('L')
+    mask = background_mask(grey)
+    content = mask.getbbox() if mask is not None else None
+    left, top, right, bottom = content or (0, 0) + image.size
+    width, height = right - left, bottom - top
+
+    tile_size = _setting('AI_VISION_TILE_SIZE')
+    overlap = _setting('AI_VISION_TILE_OVERLAP')
+    max_tiles = max(1, _setting('AI_VISION_MAX_TILES'))
+    columns, rows = math.ceil(width / tile_size), math.ceil(height / tile_size)
+    while columns * rows > max_tiles:
+        tile_size = round(tile_size * 1.25)
+        columns, rows = math.ceil(width / tile_size), math.ceil(height / tile_size)
+    if columns * rows <= 1:
+        return [Tile(left, top, right, bottom)]
+
+    column_ink = row_ink = None
+    if content is not None:
+        # Share of content pixels per column and per row of the content area
+        area = mask.crop(content)
+        column_ink = area.resize((width, 1), Image.BOX).tobytes()
+        row_ink = area.resize((1, height), Image.BOX).tobytes()
+    x_cuts = _cuts(left, right, columns, column_ink, overlap)
+    y_cuts = _cuts(top, bottom, rows, row_ink, overlap)
+
+    tiles = []
+    for y0, y1 in zip(y_cuts, y_cuts[1:]):
+        for x0, x1 in zip(x_cuts, x_cuts[1:]):
+            tile_left, tile_right = _expand(x0, x1, overlap, image.width)
+            tile_top, tile_bottom = _expand(y0, y1, overlap, image.height)
+            tile = Tile(tile_left, tile_top, tile_right, tile_bottom)
+            if mask is not None and mask.crop(tile.box).getbbox() is None:
+                continue
+            tiles.append(tile)
+    return tiles
+
+
+def is_truncated(result: Dict[str, Any]) -> bool:
+    """Whether the model stopped at its token limit."""
+    return (result.get('metadata') or {}).get('stop_reason') in TRUNCATED_STOP_REASONS
+
+
+def split_tile(tile: Tile, depth: int) -> List[Tile]:
+    """
+    Four overlapping quarters of a tile whose answer was cut off.
+
+    Args:
+        tile: Tile to split
+        depth: How often its region has been split already
+
+    Returns:
+        The quarters, or [] after AI_VISION_TILE_SPLIT_DEPTH splits or when
+        the tile is too small for quarters that still overlap
+    """
+    overlap = _setting('AI_VISION_TILE_OVERLAP')
+    width, height = tile.right - tile.left, tile.bottom - tile.top
+    if depth >= _setting('AI_VISION_TILE_SPLIT_DEPTH') or min(width, height) < 2 * (overlap + MIN_TILE_DIMENSION):
+        return []
+    middle_x, middle_y = tile.left + width // 2, tile.top + height // 2
+    quarters = []
+    for top, bottom in ((tile.top, middle_y), (middle_y, tile.bottom)):
+        for left, right in ((tile.left, middle_x), (middle_x, tile.right)):
+            quarters.append(Tile(
+                max(tile.left, left - overlap),
+                max(tile.top, top - overlap),
+                min(tile.right, right + overlap),
+                min(tile.bottom, bottom + overlap),
+            ))
+    return quarters
+
+
+def encode_tile(image: Image.Image, tile: Tile) -> str:
+    """Base64 image of a tile, in the format of the full image (PNG or JPEG)."""
+    region = image.crop(tile.box)
+    buffer = io.BytesIO()
+    if image.format == 'JPEG':
+        region.convert('RGB').save(buffer, 'JPEG', quality=90)
+    else:
+        region.save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def _label_key(label: Any) -> Optional[str]:
+    if not isinstance(label, str) or not label.strip():
+        return None
+    return ' '.join(label.split()).casefold()
+
+
+def _mapping(result: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """
+    (left, top, scale x, scale y) from the pixels the model saw to tile
+    pixels: preprocessing may have cropped the tile's margins and scaled
+    what was left (see PreparedImage.crop_box).
+    """
+    image = (result.get('metadata') or {}).get('image') or {}
+    size, original = image.get('size'), image.get('original_size')
+    if not (size and original and size[0] and size[1]):
+        return 0.0, 0.0, 1.0, 1.0
+    left, top, right, bottom = image.get('crop_box') or (0, 0, original[0], original[1])
+    return left, top, (right - left) / size[0], (bottom - top) / size[1]
+
+
+def _position(node: Dict[str, Any], tile: Tile, mapping: Tuple[float, float, float, float]) -> Tuple[float, float]:
+    position = node.get('position') or {}
+    try:
+        x, y = float(position.get('x', 0)), float(position.get('y', 0))
+    except (TypeError, ValueError):
+        x = y = 0.0
+    left, top, scale_x, scale_y = mapping
+    return tile.left + left + x * scale_x, tile.top + top + y * scale_y
+
+
+def _unite(first: List[Any], second: List[Any]) -> List[Any]:
+    """Members of both lists, by name, in order of first appearance."""
+    seen = {member.get('name') for member in first if isinstance(member, dict)}
+    merged = list(first)
+    for member in second:
+        if isinstance(member, dict) and member.get('name') not in seen:
+            seen.add(member.get('name'))
+            merged.append(member)
+    return merged
+
+
+def _completeness(node: Dict[str, Any]) -> int:
+    data = node.get('data') or {}
+    return len(data.get('attributes') or []) + len(data.get('methods') or [])
+
+
+def merge_tile_results(
+    tile_results: Sequence[Tuple[Tile, Dict[str, Any]]],
+    existing_diagram: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Merge the extractions of overlapping tiles into one diagram.
+
+    Args:
+        tile_results: (tile, result) per tile that was extracted
+        existing_diagram: Diagram sent with the image, whose class ids are kept
+
+    Returns:
+        Dict with nodes, edges, success and message, positions in pixels of
+        the full image
+    """
+    groups: Dict[str, List[Tuple[Dict[str, Any], Tuple[float, float]]]] = {}
+    tile_edges = []
+    for index, (tile, result) in enumerate(tile_results):
+        mapping = _mapping(result)
+        local_keys = {}
+        for node in result.get('nodes') or []:
+            if not isinstance(node, dict):
+                continue
+            key = _label_key((node.get('data') or {}).get('label')) or f"#{index}:{node.get('id')}"
+            local_keys[node.get('id')] = key
+            groups.setdefault(key, []).append((node, _position(node, tile, mapping)))
+        tile_edges.append((local_keys, result.get('edges') or []))
+
+    existing_ids = {}
+    for node in (existing_diagram or {}).get('nodes') or []:
+        key = _label_key((node.get('data') or {}).get('label'))
+        if key and node.get('id'):
+            existing_ids.setdefault(key, node['id'])
+
+    merged = {}
+    for key, occurrences in groups.items():
+        ordered = sorted(occurrences, key=lambda occurrence: -_completeness(occurrence[0]))
+        node, (x, y) = ordered[0]
+        node = dict(node, data=dict(node.get('data') or {}))
+        for other, _ in ordered[1:]:
+            other_data = other.get('data') or {}
+            for field in ('attributes', 'methods'):
+                node['data'][field] = _unite(node['data'].get(field) or [], other_data.get(field) or [])
+        node['position'] = {'x': round(x), 'y': round(y)}
+        merged[key] = node
+
+    # Ids: the existing diagram's, then class-N in reading order
+    used = set(existing_ids.values())
+    counter = 0
+    ids = {}
+    for key in sorted(merged, key=lambda key: (merged[key]['position']['y'], merged[key]['position']['x'])):
+        if key in existing_ids:
+            ids[key] = existing_ids[key]
+            continue
+        counter += 1
+        while f"class-{counter}" in used:
+            counter += 1
+        ids[key] = f"class-{counter}"
+        used.add(ids[key])
+    nodes = []
+    for key in ids:
+        merged[key]['id'] = ids[key]
+        nodes.append(merged[key])
+
+    edges = {}
+    for local_keys, tile_edge_list in tile_edges:
+        for edge in tile_edge_list:
+            if not isinstance(edge, dict):
+                continue
+            # Models name the endpoint by its id in the tile, or by its class name
+            source = local_keys.get(edge.get('source')) or _label_key(edge.get('source'))
+            target = local_keys.get(edge.get('target')) or _label_key(edge.get('target'))
+            if source not in ids or target not in ids:
+                continue
+            data = dict(edge.get('data') or {})
+            signature = (ids[source], ids[target], str(data.get('relationshipType', '')).upper())
+            if signature in edges:
+                known = edges[signature]['data']
+                for field, value in data.items():
+                    if value and not known.get(field):
+                        known[field] = value
+                continue
+            edges[signature] = dict(edge, source=ids[source], target=ids[target], data=data)
+    edge_list = []
+    for number, edge in enumerate(edges.values(), start=1):
+        edge['id'] = f"edge-{number}"
+        edge_list.append(edge)
+
+    return {
+        'nodes': nodes,
+        'edges': edge_list,
+        'success': bool(nodes),
+        'message': f"Extracted {len(nodes)} classes and {len(edge_list)} relationships from {len(tile_results)} tiles",
+    }
+
+
+def sum_cost_info(results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add up the cost_info of several extractions."""
+    total: Dict[str, Any] = {}
+    for result in results:
+        for name, value in (result.get('cost_info') or {}).items():
+            if isinstance(value, (int, float)):
+                total[name] = total.get(name, 0) + value
+    return total
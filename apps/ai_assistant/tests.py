@@ -3,10 +3,10 @@ from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
 from apps.uml_diagrams.models import UMLDiagram
-from .services import AIAssistantService, UMLCommandProcessorService
+from .services import AIAssistantService, ServiceRegistry, UMLCommandProcessorService
 
 
 class AIAssistantServiceTests(TestCase):
@@ -101,6 +101,8 @@ class AIAssistantViewsTests(TestCase):
     
     def setUp(self):
         self.client = APIClient()
+        # Views share services built once; rebuild them with the mocks below
+        ServiceRegistry.reset()
 
         self.test_diagram = UMLDiagram.objects.create(
             title="Test Diagram",
@@ -119,12 +121,12 @@ class AIAssistantViewsTests(TestCase):
             }
         )
     
-    @patch('apps.ai_assistant.services.ai_assistant_service.OpenAIService')
+    @patch('apps.ai_assistant.services.openai_service.OpenAIService')
     def test_ask_ai_assistant_endpoint(self, mock_openai_service):
         """Test the main AI assistant ask endpoint."""
 
         mock_service_instance = MagicMock()
-        mock_service_instance.call_api.return_value = "Esta es una respuesta de prueba."
+        mock_service_instance.acall_api = AsyncMock(return_value="Esta es una respuesta de prueba.")
         mock_openai_service.return_value = mock_service_instance
         
         url = reverse('ai_assistant:ask')
@@ -136,9 +138,9 @@ class AIAssistantViewsTests(TestCase):
         response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("answer", response.data)
-        self.assertIn("suggestions", response.data)
-        self.assertIn("related_features", response.data)
+        self.assertIn("answer", response.json())
+        self.assertIn("suggestions", response.json())
+        self.assertIn("related_features", response.json())
     
     def test_ask_ai_assistant_invalid_data(self):
         """Test AI assistant endpoint with invalid data."""
@@ -151,14 +153,14 @@ class AIAssistantViewsTests(TestCase):
         response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertIn("error", response.data)
+        self.assertIn("error", response.json())
     
-    @patch('apps.ai_assistant.services.ai_assistant_service.OpenAIService')
+    @patch('apps.ai_assistant.services.openai_service.OpenAIService')
     def test_ask_about_diagram_endpoint(self, mock_openai_service):
         """Test the diagram-specific AI assistant endpoint."""
 
         mock_service_instance = MagicMock()
-        mock_service_instance.call_api.return_value = "Análisis del diagrama específico."
+        mock_service_instance.acall_api = AsyncMock(return_value="Análisis del diagrama específico.")
         mock_openai_service.return_value = mock_service_instance
         
         url = reverse('ai_assistant:ask_about_diagram', kwargs={'diagram_id': self.test_diagram.id})
@@ -170,7 +172,7 @@ class AIAssistantViewsTests(TestCase):
         response = self.client.post(url, data, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("answer", response.data)
+        self.assertIn("answer", response.json())
     
     def test_ask_about_nonexistent_diagram(self):
         """Test asking about a diagram that doesn't exist."""
@@ -391,10 +393,10 @@ class UMLCommandProcessorAPITests(TestCase):
         response = self.client.post('/api/ai-assistant/process-command/', data, format='json')
         
         self.assertEqual(response.status_code, 200)
-        self.assertIn('action', response.data)
-        self.assertIn('elements', response.data)
-        self.assertIn('confidence', response.data)
-        self.assertIn('interpretation', response.data)
+        self.assertIn('action', response.json())
+        self.assertIn('elements', response.json())
+        self.assertIn('confidence', response.json())
+        self.assertIn('interpretation', response.json())
     
     def test_process_uml_command_for_diagram_endpoint(self):
         """Test the diagram-specific command processing endpoint."""
@@ -18,4 +18,5 @@ urlpatterns = [
     path('diagrams/from-image/', views.process_diagram_image, name='process_diagram_image'),
     path('diagrams/<uuid:diagram_id>/update-from-image/', views.update_diagram_from_image, name='update_diagram_from_image'),
     path('incremental-command/', views.process_incremental_command, name='process_incremental_command'),
+    path('incremental-command/batch/', views.process_incremental_commands_batch, name='process_incremental_commands_batch'),
 ]
@@ -8,14 +8,28 @@ from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 from base.settings import env
 from .services import (
-    AIAssistantService,
-    UMLCommandProcessorService,
-    IncrementalCommandProcessor,
+    CacheService,
     get_nova_vision_service,
     ImageValidationError,
     AWSBedrockError,
+    SingleFlight,
+    ModelCallStats,
+    CircuitBreaker,
+    PoolStats,
+    VisionResultCache,
+    ImagePreprocessor,
 )
 from .services.model_router_service import ModelRouterService
+from .services.registry import (
+    AI_ASSISTANT,
+    COMMAND_PROCESSOR,
+    INCREMENTAL_PROCESSOR,
+    MODEL_ROUTER,
+    ServiceRegistry,
+    aget_service,
+    get_service,
+)
+from .async_views import async_api_view, event_stream_response, wants_event_stream
 from .serializers import (
     AIAssistantQuestionSerializer,
     AIAssistantResponseSerializer,
@@ -36,11 +50,25 @@ class AIAssistantRateThrottle(AnonRateThrottle):
     rate = env('AI_ASSISTANT_RATE_LIMIT', default='100/minute')
 
 
+STREAM_PARAMETER = OpenApiParameter(
+    name='stream',
+    type=OpenApiTypes.BOOL,
+    location=OpenApiParameter.QUERY,
+    required=False,
+    description=(
+        'Stream the result as Server-Sent Events (also selected by Accept: text/event-stream): '
+        '"token" events with {"delta"} as the model writes, "element" events with each UML '
+        'element once complete (commands only), then "done" with the usual response body'
+    )
+)
+
+
 @extend_schema(
     tags=['AI Assistant'],
     summary='Ask AI Assistant for Help',
     description='Get contextual help from AI assistant about UML diagrams and system functionality',
     request=AIAssistantQuestionSerializer,
+    parameters=[STREAM_PARAMETER],
     responses={
         200: AIAssistantResponseSerializer,
         400: {
@@ -59,10 +87,10 @@ class AIAssistantRateThrottle(AnonRateThrottle):
         }
     }
 )
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
 # @throttle_classes([AIAssistantRateThrottle])  # Disabled for debugging
-def ask_ai_assistant(request):
+async def ask_ai_assistant(request):
     """
     Main endpoint for asking AI assistant questions.
     """
@@ -77,9 +105,16 @@ def ask_ai_assistant(request):
         
         validated_data = serializer.validated_data
 
-        ai_service = AIAssistantService()
+        ai_service = await aget_service(AI_ASSISTANT)
 
-        response_data = ai_service.get_contextual_help(
+        if wants_event_stream(request):
+            return event_stream_response(ai_service.astream_contextual_help(
+                user_question=validated_data['question'],
+                diagram_id=validated_data.get('diagram_id'),
+                context_type=validated_data.get('context_type', 'general')
+            ))
+
+        response_data = await ai_service.aget_contextual_help(
             user_question=validated_data['question'],
             diagram_id=validated_data.get('diagram_id'),
             context_type=validated_data.get('context_type', 'general')
@@ -126,13 +161,14 @@ def ask_ai_assistant(request):
             type=OpenApiTypes.UUID,
             location=OpenApiParameter.PATH,
             description='UUID of the diagram to ask about'
-        )
+        ),
+        STREAM_PARAMETER
     ]
 )
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
 # @throttle_classes([AIAssistantRateThrottle])  # Disabled for debugging
-def ask_about_diagram(request, diagram_id):
+async def ask_about_diagram(request, diagram_id):
     """
     Get AI assistant help about a specific diagram.
     """
@@ -147,9 +183,16 @@ def ask_about_diagram(request, diagram_id):
         
         validated_data = serializer.validated_data
 
-        ai_service = AIAssistantService()
+        ai_service = await aget_service(AI_ASSISTANT)
+
+        if wants_event_stream(request):
+            return event_stream_response(ai_service.astream_contextual_help(
+                user_question=validated_data['question'],
+                diagram_id=str(diagram_id),
+                context_type='diagram'
+            ))
 
-        response_data = ai_service.get_contextual_help(
+        response_data = await ai_service.aget_contextual_help(
             user_question=validated_data['question'],
             diagram_id=str(diagram_id),
             context_type='diagram'
@@ -206,7 +249,7 @@ def get_diagram_analysis(request, diagram_id):
     Get AI-powered analysis of a specific diagram.
     """
     try:
-        ai_service = AIAssistantService()
+        ai_service = get_service(AI_ASSISTANT)
 
         analysis_data = ai_service.get_diagram_analysis(str(diagram_id))
 
@@ -242,7 +285,7 @@ def get_system_statistics(request):
     Get system statistics for AI assistant context.
     """
     try:
-        ai_service = AIAssistantService()
+        ai_service = get_service(AI_ASSISTANT)
 
         stats_data = ai_service.get_system_statistics()
 
@@ -281,13 +324,24 @@ def ai_assistant_health(request):
     """Health check for AI assistant service."""
     try:
         from datetime import datetime
+        from django.conf import settings
 
-        ai_service = AIAssistantService()
+        get_service(AI_ASSISTANT)
         
         return Response({
             'status': 'healthy',
             'service': 'AI Assistant',
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            'cache': CacheService.get_stats(),
+            'single_flight': SingleFlight.get_stats(),
+            'models': ModelCallStats.get_stats(),
+            'circuits': CircuitBreaker.get_states(
+                sorted(set(settings.COMMAND_PROCESSING_MODELS) | set(settings.VISION_PROCESSING_MODELS))
+            ),
+            'services': ServiceRegistry.get_stats(),
+            'connection_pools': PoolStats.get_stats(),
+            'vision_cache': VisionResultCache.get_stats(),
+            'image_preprocessing': ImagePreprocessor.get_stats()
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -303,6 +357,7 @@ def ai_assistant_health(request):
     summary='Process Natural Language UML Command',
     description='Convert natural language commands into UML diagram elements using AI processing',
     request=UMLCommandRequestSerializer,
+    parameters=[STREAM_PARAMETER],
     responses={
         200: UMLCommandResponseSerializer,
         400: {
@@ -321,10 +376,10 @@ def ai_assistant_health(request):
         }
     }
 )
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
 # @throttle_classes([AIAssistantRateThrottle])  # Disabled for debugging
-def process_uml_command(request):
+async def process_uml_command(request):
     """
     Process natural language commands for UML diagram generation.
     """
@@ -339,13 +394,23 @@ def process_uml_command(request):
         
         validated_data = serializer.validated_data
 
-        router_service = ModelRouterService()
+        # A first build creates the Bedrock clients, which is blocking too
+        router_service = await aget_service(MODEL_ROUTER)
 
-        result = router_service.process_command(
+        if wants_event_stream(request):
+            return event_stream_response(router_service.astream_command(
+                command=validated_data['command'],
+                model=validated_data.get('model'),
+                diagram_id=validated_data.get('diagram_id'),
+                current_diagram_data=validated_data.get('current_diagram_data')
+            ))
+
+        result = await router_service.aprocess_command(
             command=validated_data['command'],
             model=validated_data.get('model'),
             diagram_id=validated_data.get('diagram_id'),
-            current_diagram_data=validated_data.get('current_diagram_data')
+            current_diagram_data=validated_data.get('current_diagram_data'),
+            critical=validated_data.get('critical', False)
         )
 
         if 'error' in result:
@@ -409,7 +474,7 @@ def process_uml_command_for_diagram(request, diagram_id):
         
         validated_data = serializer.validated_data
 
-        processor_service = UMLCommandProcessorService()
+        processor_service = get_service(COMMAND_PROCESSOR)
 
         result = processor_service.process_command(
             command=validated_data['command'],
@@ -454,7 +519,7 @@ def get_supported_commands(request):
     Get documentation of supported command patterns.
     """
     try:
-        processor_service = UMLCommandProcessorService()
+        processor_service = get_service(COMMAND_PROCESSOR)
 
         commands_data = processor_service.get_supported_commands()
 
@@ -507,8 +572,13 @@ def process_diagram_image(request):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         vision_service = get_nova_vision_service()
-        result = vision_service.process_uml_diagram(
-            base64_image=image_data,
+        result = VisionResultCache.get_or_process(
+            'nova-pro',
+            image_data,
+            lambda: vision_service.process_uml_diagram(
+                base64_image=image_data,
+                session_id=session_id
+            ),
             session_id=session_id
         )
         
@@ -578,8 +648,13 @@ def update_diagram_from_image(request, diagram_id):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         vision_service = get_nova_vision_service()
-        result = vision_service.process_uml_diagram(
-            base64_image=image_data,
+        result = VisionResultCache.get_or_process(
+            'nova-pro',
+            image_data,
+            lambda: vision_service.process_uml_diagram(
+                base64_image=image_data,
+                session_id=session_id
+            ),
             session_id=session_id
         )
         
@@ -632,10 +707,10 @@ def update_diagram_from_image(request, diagram_id):
     },
     responses={200: {'type': 'object'}}
 )
-@api_view(['POST'])
+@async_api_view(['POST'])
 @permission_classes([AllowAny])
 # @throttle_classes([AIAssistantRateThrottle])  # Disabled for debugging
-def process_incremental_command(request):
+async def process_incremental_command(request):
     """Process incremental UML modification command (English or Spanish).
     """
     import time
@@ -657,8 +732,8 @@ def process_incremental_command(request):
                 'error': 'Missing required field: current_diagram'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        processor = IncrementalCommandProcessor()
-        delta = processor.process_command(
+        processor = await aget_service(INCREMENTAL_PROCESSOR)
+        delta = await processor.aprocess_command(
             command=command,
             diagram_id=diagram_id,
             current_diagram=current_diagram,
@@ -683,6 +758,89 @@ def process_incremental_command(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@extend_schema(
+    tags=['AI Assistant - Incremental Commands'],
+    summary='Process Batch of Incremental UML Commands',
+    description='Apply an ordered list of bilingual (English/Spanish) UML modification commands '
+                'to one diagram and return the combined DELTAs. Regex-matchable commands are '
+                'resolved locally; the rest go to the AI in a single call.',
+    request={
+        'application/json': {
+            'type': 'object',
+            'properties': {
+                'commands': {'type': 'array', 'items': {'type': 'string'}, 'description': 'Commands, in order'},
+                'diagram_id': {'type': 'string', 'format': 'uuid'},
+                'current_diagram': {'type': 'object', 'description': 'Current diagram state'}
+            },
+            'required': ['commands', 'current_diagram']
+        }
+    },
+    responses={200: {'type': 'object'}}
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def process_incremental_commands_batch(request):
+    """Process an ordered batch of incremental UML modification commands.
+    """
+    import time
+    start_time = time.time()
+
+    try:
+        commands = request.data.get('commands')
+        diagram_id = request.data.get('diagram_id', 'temp')
+        current_diagram = request.data.get('current_diagram', {})
+        session_id = request.data.get('session_id', 'anonymous')
+
+        if not isinstance(commands, list) or not commands:
+            return Response({
+                'error': 'Missing required field: commands (non-empty list)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not all(isinstance(command, str) and command.strip() for command in commands):
+            return Response({
+                'error': 'Every command must be a non-empty string'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if not current_diagram:
+            return Response({
+                'error': 'Missing required field: current_diagram'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        processor = get_service(INCREMENTAL_PROCESSOR)
+        try:
+            result = processor.process_batch(
+                commands=[command.strip() for command in commands],
+                diagram_id=diagram_id,
+                current_diagram=current_diagram,
+                use_cache=True,
+                session_id=session_id
+            )
+        except ValueError as e:
+            return Response({
+                'error': 'Invalid batch',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        processing_time = int((time.time() - start_time) * 1000)
+        logger.info(
+            f"Batch of {len(commands)} commands processed in {processing_time}ms "
+            f"({result['ai_commands']} via AI)"
+        )
+
+        return Response({
+            'success': True,
+            **result,
+            'processing_time_ms': processing_time
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        logger.error(f"Batch command processing failed: {str(e)}")
+        return Response({
+            'error': 'Batch command processing failed',
+            'message': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @extend_schema(
     tags=['AI Assistant'],
     summary='Get Available AI Models',
@@ -707,7 +865,7 @@ def get_available_models(request):
     try:
         from django.conf import settings
         
-        router_service = ModelRouterService()
+        router_service = get_service(MODEL_ROUTER)
         
         available_models = router_service.get_available_models()
         default_model = settings.DEFAULT_COMMAND_MODEL
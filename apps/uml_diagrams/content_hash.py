@@ -0,0 +1,149 @@
+"""
+Structural hash of a diagram content document.
+
+Every element of the node, edge, class and relationship lists is hashed on
+its own (SHA-256 over its canonical JSON, prefixed with the list name), and
+every other top-level field is hashed together with its key. The root is the
+SHA-256 of these leaf digests in sorted order, so:
+
+- the root of a document does not depend on key order or element order
+- replacing, adding or removing one element updates the set of leaves from
+  the old and new leaf alone, without serializing the rest of the document
+- two documents share a root only if SHA-256 collides; the root is safe to
+  use as a cache key for diagrams sent by clients
+
+The leaves themselves are not stored. ContentHash keeps them while a
+document is edited and remembers the leaves of the last roots it produced
+(AI_CONTENT_HASH_LEAF_CACHE_SIZE), so a series of edits to one diagram
+serializes it once.
+
+UMLDiagram stores the root in content_hash; the DELTA paths keep it current
+by passing a ContentHash as the observer of apply_delta().
+"""
+
+import hashlib
+import json
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Optional
+
+from django.conf import settings
+
+ELEMENT_COLLECTIONS = ('nodes', 'edges', 'classes', 'relationships')
+
+DEFAULT_LEAF_CACHE_SIZE = 64
+
+_leaf_cache: "OrderedDict[str, Counter]" = OrderedDict()
+_leaf_cache_lock = threading.Lock()
+
+
+def _digest(prefix: bytes, value: Any) -> bytes:
+    payload = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(prefix + payload.encode('utf-8')).digest()
+
+
+def element_hash(collection: str, element: Any) -> bytes:
+    """Leaf digest of one element of a content list."""
+    return _digest(collection.encode('utf-8') + b'\x00', element)
+
+
+def _leaves(content: Any) -> Counter:
+    if isinstance(content, str):
+        try:
+            content = json.loads(content) if content.strip() else {}
+        except ValueError:
+            return Counter([_digest(b'raw\x00', content)])
+    if not isinstance(content, dict):
+        return Counter()
+
+    leaves = Counter()
+    for key, value in content.items():
+        if key in ELEMENT_COLLECTIONS and isinstance(value, list):
+            for element in value:
+                leaves[element_hash(key, element)] += 1
+        else:
+            leaves[_digest(b'field\x00', [key, value])] += 1
+    return leaves
+
+
+def _root(leaves: Counter) -> str:
+    # Fixed-width digests in sorted order: the multiset of leaves determines
+    # the input, and the input determines the multiset
+    return hashlib.sha256(b''.join(sorted(leaves.elements()))).hexdigest()
+
+
+def compute_content_hash(content: Any) -> str:
+    """Root hash of content (dict or its JSON string) as 64 hex characters."""
+    return _root(_leaves(content))
+
+
+def _remember(root: str, leaves: Counter) -> None:
+    max_size = getattr(settings, 'AI_CONTENT_HASH_LEAF_CACHE_SIZE', DEFAULT_LEAF_CACHE_SIZE)
+    with _leaf_cache_lock:
+        _leaf_cache[root] = Counter(leaves)
+        _leaf_cache.move_to_end(root)
+        while len(_leaf_cache) > max_size:
+            _leaf_cache.popitem(last=False)
+
+
+def _recall(root: str) -> Optional[Counter]:
+    with _leaf_cache_lock:
+        leaves = _leaf_cache.get(root)
+        if leaves is None:
+            return None
+        _leaf_cache.move_to_end(root)
+        return Counter(leaves)
+
+
+def clear_leaf_cache() -> None:
+    with _leaf_cache_lock:
+        _leaf_cache.clear()
+
+
+class ContentHash:
+    """
+    Running root hash of a document that is being edited.
+
+    Implements the observer interface of apply_delta(): discard() before an
+    element is changed or removed, include() once it is in its new state, and
+    reset() when the whole document is replaced.
+
+    Args:
+        value: Known root of the document, as stored in UMLDiagram.content_hash
+        content: The document; hashed when the leaves of value are not
+            remembered from an earlier edit
+
+    Raises:
+        ValueError: If neither the leaves of value nor content are available
+    """
+
+    def __init__(self, value: Optional[str] = None, content: Any = None):
+        leaves = _recall(value) if value else None
+        if leaves is None:
+            if content is None and value:
+                raise ValueError("The document is needed to update a root whose leaves are not remembered")
+            leaves = _leaves(content)
+        self._leaves = leaves
+        self._hexdigest = None
+
+    def discard(self, collection: str, element: Any) -> None:
+        leaf = element_hash(collection, element)
+        self._leaves[leaf] -= 1
+        if self._leaves[leaf] <= 0:
+            del self._leaves[leaf]
+        self._hexdigest = None
+
+    def include(self, collection: str, element: Any) -> None:
+        self._leaves[element_hash(collection, element)] += 1
+        self._hexdigest = None
+
+    def reset(self, content: Any) -> None:
+        self._leaves = _leaves(content)
+        self._hexdigest = None
+
+    @property
+    def hexdigest(self) -> str:
+        if self._hexdigest is None:
+            self._hexdigest = _root(self._leaves)
+            _remember(self._hexdigest, self._leaves)
+        return self._hexdigest
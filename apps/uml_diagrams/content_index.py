@@ -0,0 +1,180 @@
+"""
+Lookup index over a diagram content document.
+
+Diagram content is a JSON document with either explicit "classes" and
+"relationships" lists or React Flow style "nodes" and "edges". The index
+resolves both shapes once and answers id, label and incidence queries in
+O(1). Single-element replacements can be applied to the index in place;
+any other change to the document needs a rebuild (UMLDiagram.content_index
+does this after invalidate_content_index()).
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+def _as_document(content: Any) -> Dict[str, Any]:
+    if isinstance(content, str):
+        try:
+            content = json.loads(content) if content.strip() else {}
+        except ValueError:
+            return {}
+    return content if isinstance(content, dict) else {}
+
+
+def _class_from_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    data = node.get('data', {})
+    return {
+        'id': node.get('id'),
+        'name': data.get('label', 'Unknown'),
+        'label': data.get('label', 'Unknown'),
+        'attributes': data.get('attributes', []),
+        'methods': data.get('methods', []),
+        'nodeType': data.get('nodeType', 'class'),
+        'isAbstract': data.get('isAbstract', False)
+    }
+
+
+def _relationship_from_edge(edge: Dict[str, Any]) -> Dict[str, Any]:
+    data = edge.get('data', {})
+    return {
+        'id': edge.get('id'),
+        'source_id': edge.get('source'),
+        'target_id': edge.get('target'),
+        'type': data.get('relationshipType', 'ASSOCIATION'),
+        'relationship_type': data.get('relationshipType', 'ASSOCIATION'),
+        'source_multiplicity': data.get('sourceMultiplicity', '1'),
+        'target_multiplicity': data.get('targetMultiplicity', '1'),
+        'label': data.get('label', '')
+    }
+
+
+def _class_label(cls: Dict[str, Any]) -> Optional[str]:
+    label = cls.get('name') or cls.get('label')
+    return str(label).lower() if label is not None else None
+
+
+class DiagramContentIndex:
+    """
+    Lazily built maps over a content document.
+
+    Classes and relationships follow UMLDiagram.get_classes() and
+    get_relationships(): explicit lists win, otherwise they are derived from
+    nodes of type 'class' and edges of type 'umlRelationship'. Raw nodes and
+    edges are indexed as well.
+    """
+
+    def __init__(self, content: Any):
+        document = _as_document(content)
+        self.document = document
+
+        explicit_classes = document.get('classes') or []
+        self.classes_are_derived = not explicit_classes
+        self.classes: List[Dict[str, Any]] = explicit_classes or [
+            _class_from_node(node) for node in document.get('nodes', []) if node.get('type') == 'class'
+        ]
+
+        explicit_relationships = document.get('relationships') or []
+        self.relationships_are_derived = not explicit_relationships
+        self.relationships: List[Dict[str, Any]] = explicit_relationships or [
+            _relationship_from_edge(edge) for edge in document.get('edges', []) if edge.get('type') == 'umlRelationship'
+        ]
+
+        self.class_position: Dict[Any, int] = {}
+        self.class_by_label: Dict[str, Dict[str, Any]] = {}
+        for position, cls in enumerate(self.classes):
+            self.class_position.setdefault(cls.get('id'), position)
+            label = _class_label(cls)
+            if label is not None:
+                self.class_by_label.setdefault(label, cls)
+
+        self.relationship_position: Dict[Any, int] = {}
+        self.relationships_by_class: Dict[Any, List[Dict[str, Any]]] = {}
+        for position, rel in enumerate(self.relationships):
+            self.relationship_position.setdefault(rel.get('id'), position)
+            for endpoint in {rel.get('source_id'), rel.get('target_id')}:
+                if endpoint is not None:
+                    self.relationships_by_class.setdefault(endpoint, []).append(rel)
+
+        nodes = document.get('nodes', []) or []
+        edges = document.get('edges', []) or []
+        self.node_by_id: Dict[Any, Dict[str, Any]] = {}
+        self.node_by_label: Dict[str, Dict[str, Any]] = {}
+        for node in nodes:
+            self.node_by_id.setdefault(node.get('id'), node)
+            label = node.get('data', {}).get('label')
+            if label is not None:
+                self.node_by_label.setdefault(str(label).lower(), node)
+
+        self.edge_by_id: Dict[Any, Dict[str, Any]] = {}
+        self.edges_by_node: Dict[Any, List[Dict[str, Any]]] = {}
+        for edge in edges:
+            self.edge_by_id.setdefault(edge.get('id'), edge)
+            for endpoint in {edge.get('source'), edge.get('target')}:
+                if endpoint is not None:
+                    self.edges_by_node.setdefault(endpoint, []).append(edge)
+
+    def replace_class(self, position: int, cls: Dict[str, Any]) -> bool:
+        """
+        Replace the class at position, keeping the maps current.
+
+        Derived classes are materialized into an owned list first, so callers
+        can store self.classes as the document's "classes". Returns False
+        when the replacement changes the id or label; the index is then stale
+        and must be rebuilt.
+        """
+        old = self.classes[position]
+        if self.classes_are_derived:
+            self.classes = list(self.classes)
+            self.classes_are_derived = False
+        self.classes[position] = cls
+
+        if cls.get('id') != old.get('id') or _class_label(cls) != _class_label(old):
+            return False
+        label = _class_label(cls)
+        if label is not None and self.class_by_label.get(label) is old:
+            self.class_by_label[label] = cls
+        return True
+
+    def replace_relationship(self, position: int, rel: Dict[str, Any]) -> bool:
+        """Relationship counterpart of replace_class()."""
+        old = self.relationships[position]
+        if self.relationships_are_derived:
+            self.relationships = list(self.relationships)
+            self.relationships_are_derived = False
+        self.relationships[position] = rel
+
+        if any(rel.get(key) != old.get(key) for key in ('id', 'source_id', 'target_id')):
+            return False
+        for endpoint in {rel.get('source_id'), rel.get('target_id')}:
+            incident = self.relationships_by_class.get(endpoint, [])
+            for i, candidate in enumerate(incident):
+                if candidate is old:
+                    incident[i] = rel
+        return True
+
+    def get_class(self, class_id: Any) -> Optional[Dict[str, Any]]:
+        position = self.class_position.get(class_id)
+        return self.classes[position] if position is not None else None
+
+    def get_relationship(self, relationship_id: Any) -> Optional[Dict[str, Any]]:
+        position = self.relationship_position.get(relationship_id)
+        return self.relationships[position] if position is not None else None
+
+    def find_class_by_label(self, label: str) -> Optional[Dict[str, Any]]:
+        return self.class_by_label.get(str(label).lower())
+
+    def find_node_by_label(self, label: str) -> Optional[Dict[str, Any]]:
+        return self.node_by_label.get(str(label).lower())
+
+    def get_relationships_for_class(self, class_id: Any) -> List[Dict[str, Any]]:
+        return self.relationships_by_class.get(class_id, [])
+
+    def get_edges_for_node(self, node_id: Any) -> List[Dict[str, Any]]:
+        return self.edges_by_node.get(node_id, [])
+
+    def find_edge_between(self, node_a: Any, node_b: Any) -> Optional[Dict[str, Any]]:
+        for edge in self.edges_by_node.get(node_a, []):
+            if {edge.get('source'), edge.get('target')} == {node_a, node_b}:
+                return edge
+        return None
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uml_diagrams', '0004_rename_uml_diagrams_session_created_idx_uml_diagram_session_615b88_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='umldiagram',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Content revision, incremented on every content write'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uml_diagrams', '0005_umldiagram_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='umldiagram',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', help_text='Structural hash of content, kept current on every content write', max_length=64),
+        ),
+    ]
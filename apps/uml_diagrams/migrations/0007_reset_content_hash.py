@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def reset_content_hash(apps, schema_editor):
+    # Roots written by the additive hash are not comparable with the sorted
+    # digest ones; an empty value is recomputed on the next read or write
+    UMLDiagram = apps.get_model('uml_diagrams', 'UMLDiagram')
+    UMLDiagram.objects.exclude(content_hash='').update(content_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uml_diagrams', '0006_umldiagram_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_content_hash, migrations.RunPython.noop),
+    ]
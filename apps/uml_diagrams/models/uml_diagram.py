@@ -8,6 +8,9 @@ import uuid
 import json
 from typing import Dict, List, Optional
 
+from ..content_hash import compute_content_hash
+from ..content_index import DiagramContentIndex
+
 
 class UMLDiagram(models.Model):
     """
@@ -46,6 +49,16 @@ class UMLDiagram(models.Model):
         default=dict,
         help_text="Diagram layout and positioning"
     )
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text="Content revision, incremented on every content write"
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Structural hash of content, kept current on every content write"
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
@@ -73,6 +86,14 @@ class UMLDiagram(models.Model):
 
         if self.diagram_type:
             self.diagram_type = self.diagram_type.upper()
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.content_hash = compute_content_hash(self.content)
+            if not self._state.adding:
+                self.version += 1
+                if update_fields is not None:
+                    kwargs['update_fields'] = [*update_fields, 'version', 'content_hash']
         super().save(*args, **kwargs)
     
     @classmethod
@@ -100,100 +121,94 @@ class UMLDiagram(models.Model):
         
         return type_aliases.get(normalized, cls.DiagramType.CLASS)
     
+    def get_content_hash(self) -> str:
+        """Stored structural hash of content, computed for rows saved before it existed."""
+        return self.content_hash or compute_content_hash(self.content)
+
+    @property
+    def content_index(self) -> DiagramContentIndex:
+        """
+        Lookup index over the current content, built on first use.
+
+        The methods below invalidate it when they change content, and
+        assigning a new content object is detected automatically. Code that
+        mutates content in place must call invalidate_content_index().
+        """
+        index = self.__dict__.get('_content_index')
+        if index is None or self.__dict__.get('_content_index_source') is not self.content:
+            index = DiagramContentIndex(self.content)
+            self.__dict__['_content_index'] = index
+            self.__dict__['_content_index_source'] = self.content
+        return index
+
+    def invalidate_content_index(self) -> None:
+        self.__dict__.pop('_content_index', None)
+        self.__dict__.pop('_content_index_source', None)
+
     def get_classes(self) -> List[Dict]:
         """Extract UML classes from diagram data."""
         if not self.content:
             return []
-
-        classes = self.content.get('classes', [])
-        if not classes:
-
-            nodes = self.content.get('nodes', [])
-            classes = [
-                {
-                    'id': node.get('id'),
-                    'name': node.get('data', {}).get('label', 'Unknown'),
-                    'label': node.get('data', {}).get('label', 'Unknown'),
-                    'attributes': node.get('data', {}).get('attributes', []),
-                    'methods': node.get('data', {}).get('methods', []),
-                    'nodeType': node.get('data', {}).get('nodeType', 'class'),
-                    'isAbstract': node.get('data', {}).get('isAbstract', False)
-                }
-                for node in nodes if node.get('type') == 'class'
-            ]
-        return classes
+        return list(self.content_index.classes)
     
     def get_relationships(self) -> List[Dict]:
         """Extract UML relationships from diagram data."""
         if not self.content:
             return []
-
-        relationships = self.content.get('relationships', [])
-        if not relationships:
-
-            edges = self.content.get('edges', [])
-            relationships = [
-                {
-                    'id': edge.get('id'),
-                    'source_id': edge.get('source'),
-                    'target_id': edge.get('target'),
-                    'type': edge.get('data', {}).get('relationshipType', 'ASSOCIATION'),
-                    'relationship_type': edge.get('data', {}).get('relationshipType', 'ASSOCIATION'),
-                    'source_multiplicity': edge.get('data', {}).get('sourceMultiplicity', '1'),
-                    'target_multiplicity': edge.get('data', {}).get('targetMultiplicity', '1'),
-                    'label': edge.get('data', {}).get('label', '')
-                }
-                for edge in edges if edge.get('type') == 'umlRelationship'
-            ]
-        return relationships
+        return list(self.content_index.relationships)
     
     def add_class(self, class_data: Dict) -> None:
         """Add UML class to diagram."""
         classes = self.get_classes()
         classes.append(class_data)
         self.content['classes'] = classes
+        self.invalidate_content_index()
         self.save()
     
     def update_class(self, class_id: str, class_data: Dict) -> bool:
         """Update existing UML class."""
-        classes = self.get_classes()
-        for i, cls in enumerate(classes):
-            if cls.get('id') == class_id:
-                classes[i] = {**cls, **class_data}
-                self.content['classes'] = classes
-                self.save()
-                return True
-        return False
+        index = self.content_index
+        position = index.class_position.get(class_id)
+        if position is None:
+            return False
+
+        if not index.replace_class(position, {**index.classes[position], **class_data}):
+            self.invalidate_content_index()
+        self.content['classes'] = index.classes
+        self.save()
+        return True
     
     def remove_class(self, class_id: str) -> bool:
         """Remove UML class from diagram."""
-        classes = self.get_classes()
-        original_count = len(classes)
-        classes = [cls for cls in classes if cls.get('id') != class_id]
-        
-        if len(classes) < original_count:
-            self.content['classes'] = classes
+        if class_id not in self.content_index.class_position:
+            return False
 
-            self.remove_relationships_for_class(class_id)
-            self.save()
-            return True
-        return False
+        self.content['classes'] = [cls for cls in self.get_classes() if cls.get('id') != class_id]
+        self.remove_relationships_for_class(class_id)
+        self.invalidate_content_index()
+        self.save()
+        return True
     
     def add_relationship(self, relationship_data: Dict) -> None:
         """Add UML relationship to diagram."""
         relationships = self.get_relationships()
         relationships.append(relationship_data)
         self.content['relationships'] = relationships
+        self.invalidate_content_index()
         self.save()
     
     def remove_relationships_for_class(self, class_id: str) -> None:
         """Remove all relationships involving a specific class."""
-        relationships = self.get_relationships()
-        relationships = [
-            rel for rel in relationships
-            if rel.get('source_id') != class_id and rel.get('target_id') != class_id
+        index = self.content_index
+        incident = index.get_relationships_for_class(class_id)
+        if not incident and not index.relationships_are_derived:
+            return
+
+        incident_ids = {id(rel) for rel in incident}
+        self.content['relationships'] = [
+            rel for rel in index.relationships if id(rel) not in incident_ids
         ]
-        self.content['relationships'] = relationships
+        self.invalidate_content_index()
     
     def export_to_plantuml(self) -> str:
         """Export diagram to PlantUML format."""
@@ -204,32 +219,41 @@ class UMLDiagram(models.Model):
     
     def get_element_by_id(self, element_id: str) -> Optional[Dict]:
         """Find diagram element by ID."""
-
-        for cls in self.get_classes():
-            if cls.get('id') == element_id:
-                return cls
-
-        for rel in self.get_relationships():
-            if rel.get('id') == element_id:
-                return rel
-        
-        return None
+        if not self.content:
+            return None
+        index = self.content_index
+        return index.get_class(element_id) or index.get_relationship(element_id)
     
     def update_element(self, element_id: str, element_data: Dict) -> bool:
         """Update any diagram element by ID."""
+        if not self.content:
+            return False
 
         if self.update_class(element_id, element_data):
             return True
 
-        relationships = self.get_relationships()
-        for i, rel in enumerate(relationships):
-            if rel.get('id') == element_id:
-                relationships[i] = {**rel, **element_data}
-                self.content['relationships'] = relationships
-                self.save()
-                return True
-        
-        return False
+        index = self.content_index
+        position = index.relationship_position.get(element_id)
+        if position is None:
+            return False
+
+        if not index.replace_relationship(position, {**index.relationships[position], **element_data}):
+            self.invalidate_content_index()
+        self.content['relationships'] = index.relationships
+        self.save()
+        return True
+    
+    def find_class_by_label(self, label: str) -> Optional[Dict]:
+        """Find a UML class by name (case-insensitive)."""
+        if not self.content:
+            return None
+        return self.content_index.find_class_by_label(label)
+    
+    def get_relationships_for_class(self, class_id: str) -> List[Dict]:
+        """Relationships with the class as source or target."""
+        if not self.content:
+            return []
+        return list(self.content_index.get_relationships_for_class(class_id))
     
     def add_active_session(self, session_id: str, nickname: str = None) -> None:
         """Add session to active sessions list."""
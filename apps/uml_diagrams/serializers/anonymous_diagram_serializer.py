@@ -52,13 +52,14 @@ class AnonymousDiagramDetailSerializer(serializers.ModelSerializer):
             'diagram_type',
             'content',
             'layout_config',
+            'version',
             'created_at',
             'last_modified',
             'session_id',
             'active_sessions',
             'active_sessions_count'
         ]
-        read_only_fields = ['id', 'created_at', 'last_modified', 'session_id']
+        read_only_fields = ['id', 'version', 'created_at', 'last_modified', 'session_id']
     
     def get_active_sessions_count(self, obj) -> int:
         return obj.get_active_sessions_count()
@@ -131,8 +132,10 @@ class AnonymousDiagramUpdateSerializer(serializers.ModelSerializer):
             'title',
             'description',
             'content',
-            'layout_config'
+            'layout_config',
+            'version'
         ]
+        read_only_fields = ['version']
     
     def update(self, instance, validated_data):
         request = self.context.get('request')
@@ -1,3 +1,20 @@
 from .diagram_service import DiagramAutoCreationService
+from .delta_applier import DeltaApplyError, apply_delta, apply_deltas
+from .json_patch import JSONPatchError, apply_json_patch
+from .diagram_patch import PatchFormatError, VersionConflictError, patch_diagram_content
+from .session_store import DiagramSessionStore, get_diagram_session_store, is_session_store_enabled
 
-__all__ = ['DiagramAutoCreationService']
+__all__ = [
+    'DiagramAutoCreationService',
+    'DeltaApplyError',
+    'apply_delta',
+    'apply_deltas',
+    'JSONPatchError',
+    'apply_json_patch',
+    'PatchFormatError',
+    'VersionConflictError',
+    'patch_diagram_content',
+    'DiagramSessionStore',
+    'get_diagram_session_store',
+    'is_session_store_enabled',
+]
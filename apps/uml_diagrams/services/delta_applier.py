@@ -0,0 +1,236 @@
+"""
+Server-side application of diagram DELTAs.
+
+A DELTA is the change format produced by the incremental command processor:
+
+    {
+        "action": "update_node" | "add_node" | "delete_node" |
+                  "update_edge" | "add_edge" | "delete_edge" | "replace_content",
+        "node_id": "...",
+        "edge_id": "...",
+        "changes": {
+            "data.attributes": {"operation": "append", "value": {...}},
+            "data.label": {"operation": "replace", "value": "Customer"},
+        },
+    }
+
+Operations on a dotted path are append, remove (by filter or value), update
+(merge into matching list items, or into a dict) and replace.
+
+An optional observer is told which elements a DELTA touches: discard() with
+an element before it is changed or removed, include() once it is in its new
+state, and reset() when the whole content is replaced. ContentHash uses this
+to keep UMLDiagram.content_hash current without rehashing the document.
+"""
+
+import copy
+import json
+from typing import Any, Dict, List, Optional
+
+
+class DeltaApplyError(ValueError):
+    """Raised when a DELTA cannot be applied to the document."""
+
+
+NODE_ACTIONS = ('add_node', 'update_node', 'delete_node')
+EDGE_ACTIONS = ('add_edge', 'update_edge', 'delete_edge')
+
+
+def normalize_content(content: Any) -> Dict[str, Any]:
+    """
+    Return diagram content as a dict with node and edge lists.
+
+    Content may be stored as a JSON string by the auto-save path.
+    """
+    if isinstance(content, str):
+        try:
+            content = json.loads(content) if content.strip() else {}
+        except ValueError as e:
+            raise DeltaApplyError(f"Diagram content is not valid JSON: {e}")
+    if not isinstance(content, dict):
+        content = {}
+    content.setdefault('nodes', [])
+    content.setdefault('edges', [])
+    return content
+
+
+def _matches(item: Any, filter_spec: Dict[str, Any]) -> bool:
+    return isinstance(item, dict) and all(item.get(k) == v for k, v in filter_spec.items())
+
+
+def _resolve_parent(target: Dict[str, Any], path: str, create: bool):
+    parts = path.split('.')
+    current = target
+    for part in parts[:-1]:
+        if not isinstance(current, dict):
+            raise DeltaApplyError(f"Path '{path}' crosses a non-object value")
+        if part not in current or current[part] is None:
+            if not create:
+                return None, parts[-1]
+            current[part] = {}
+        current = current[part]
+    if not isinstance(current, dict):
+        raise DeltaApplyError(f"Path '{path}' crosses a non-object value")
+    return current, parts[-1]
+
+
+def apply_change(target: Dict[str, Any], path: str, change: Dict[str, Any]) -> None:
+    """Apply one path operation of a DELTA's changes to target in place."""
+    if not isinstance(change, dict):
+        change = {'operation': 'replace', 'value': change}
+
+    operation = change.get('operation', 'replace')
+    value = change.get('value')
+    filter_spec = change.get('filter')
+
+    parent, key = _resolve_parent(target, path, create=operation in ('append', 'replace', 'update'))
+    if parent is None:
+        return
+
+    if operation == 'replace':
+        parent[key] = copy.deepcopy(value)
+        return
+
+    if operation == 'append':
+        items = parent.setdefault(key, [])
+        if not isinstance(items, list):
+            raise DeltaApplyError(f"Cannot append to non-list field '{path}'")
+        items.append(copy.deepcopy(value))
+        return
+
+    if operation == 'remove':
+        items = parent.get(key)
+        if items is None:
+            return
+        if not isinstance(items, list):
+            parent.pop(key, None)
+            return
+        if filter_spec:
+            parent[key] = [item for item in items if not _matches(item, filter_spec)]
+        else:
+            parent[key] = [item for item in items if item != value]
+        return
+
+    if operation == 'update':
+        current = parent.get(key)
+        if isinstance(current, list):
+            if not filter_spec:
+                raise DeltaApplyError(f"Update of list field '{path}' requires a filter")
+            for item in current:
+                if _matches(item, filter_spec) and isinstance(value, dict):
+                    item.update(copy.deepcopy(value))
+            return
+        if isinstance(current, dict) and isinstance(value, dict):
+            current.update(copy.deepcopy(value))
+            return
+        parent[key] = copy.deepcopy(value)
+        return
+
+    raise DeltaApplyError(f"Unknown operation '{operation}' for '{path}'")
+
+
+def _find_index(items: List[Dict[str, Any]], element_id: Optional[str]) -> int:
+    for index, item in enumerate(items):
+        if item.get('id') == element_id:
+            return index
+    return -1
+
+
+def _created_value(delta: Dict[str, Any], field: str) -> Optional[Dict[str, Any]]:
+    change = delta.get('changes', {}).get(field)
+    if isinstance(change, dict) and 'value' in change:
+        return change['value']
+    return delta.get(field)
+
+
+def apply_delta(content: Any, delta: Dict[str, Any], observer=None) -> Dict[str, Any]:
+    """
+    Apply a DELTA to diagram content in place.
+
+    Args:
+        content: Diagram content (dict with nodes/edges, or its JSON string)
+        delta: DELTA dictionary
+        observer: Optional object notified of discarded and included elements
+
+    Returns:
+        The updated content dict
+
+    Raises:
+        DeltaApplyError: If the DELTA is malformed or targets a missing element
+    """
+    if not isinstance(delta, dict):
+        raise DeltaApplyError("DELTA must be an object")
+
+    content = normalize_content(content)
+    action = delta.get('action')
+    changes = delta.get('changes') or {}
+
+    if action == 'replace_content':
+        replacement = normalize_content(copy.deepcopy(_created_value(delta, 'content') or {}))
+        content.clear()
+        content.update(replacement)
+        if observer is not None:
+            observer.reset(content)
+        return content
+
+    if action in NODE_ACTIONS:
+        collection, element_id, created_field = 'nodes', delta.get('node_id'), 'node'
+    elif action in EDGE_ACTIONS:
+        collection, element_id, created_field = 'edges', delta.get('edge_id'), 'edge'
+    else:
+        raise DeltaApplyError(f"Unknown DELTA action '{action}'")
+    items = content[collection]
+
+    if action.startswith('add_'):
+        element = copy.deepcopy(_created_value(delta, created_field))
+        if not isinstance(element, dict):
+            raise DeltaApplyError(f"{action} requires the new {created_field} as value")
+        if element_id and not element.get('id'):
+            element['id'] = element_id
+        index = _find_index(items, element.get('id'))
+        if index >= 0:
+            if observer is not None:
+                observer.discard(collection, items[index])
+            items[index] = element
+        else:
+            items.append(element)
+        if observer is not None:
+            observer.include(collection, element)
+        return content
+
+    index = _find_index(items, element_id)
+    if index < 0:
+        raise DeltaApplyError(f"{created_field.capitalize()} '{element_id}' not found")
+
+    if action.startswith('delete_'):
+        removed = items.pop(index)
+        if observer is not None:
+            observer.discard(collection, removed)
+        if action == 'delete_node':
+            kept = []
+            for edge in content['edges']:
+                if edge.get('source') != element_id and edge.get('target') != element_id:
+                    kept.append(edge)
+                elif observer is not None:
+                    observer.discard('edges', edge)
+            content['edges'] = kept
+        return content
+
+    element = items[index]
+    if observer is not None:
+        observer.discard(collection, element)
+    try:
+        for path, change in changes.items():
+            apply_change(element, path, change)
+    finally:
+        if observer is not None:
+            observer.include(collection, element)
+    return content
+
+
+def apply_deltas(content: Any, deltas: List[Dict[str, Any]], observer=None) -> Dict[str, Any]:
+    """Apply a sequence of DELTAs in order."""
+    content = normalize_content(content)
+    for delta in deltas:
+        apply_delta(content, delta, observer)
+    return content
@@ -0,0 +1,127 @@
+"""
+Incremental content updates for the diagram auto-save endpoint.
+
+Clients send either an RFC 6902 JSON Patch or DELTAs in the incremental
+command processor's format together with the content version they edited.
+The patch is applied to the stored content and written with a single
+conditional UPDATE, so a concurrent writer turns into a version conflict
+instead of a lost update. DELTAs update the stored content hash from the
+elements they touch; a JSON Patch rehashes the patched document.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from django.db.models import F
+from django.utils import timezone
+
+from ..content_hash import ContentHash
+from .delta_applier import DeltaApplyError, apply_deltas, normalize_content
+from .json_patch import JSONPatchError, apply_json_patch
+from .session_store import VersionConflictError, get_diagram_session_store, is_session_store_enabled
+
+
+class PatchFormatError(ValueError):
+    """Raised when the patch cannot be parsed or applied."""
+
+
+def apply_patch_to_content(content: Any, json_patch: Optional[List] = None,
+                           deltas: Optional[Union[Dict, List]] = None,
+                           content_hash: Optional[ContentHash] = None) -> Dict[str, Any]:
+    """
+    Apply a JSON Patch or DELTA(s) to content, returning the new content.
+
+    When content_hash is given it is updated to the hash of the new content.
+    """
+    content = normalize_content(content)
+    try:
+        if json_patch is not None:
+            patched = apply_json_patch(content, json_patch)
+            if content_hash is not None:
+                content_hash.reset(patched)
+            return patched
+        if isinstance(deltas, dict):
+            deltas = [deltas]
+        if not isinstance(deltas, list) or not deltas:
+            raise PatchFormatError("Expected a JSON Patch array or one or more DELTAs")
+        return apply_deltas(content, deltas, content_hash)
+    except (JSONPatchError, DeltaApplyError) as e:
+        raise PatchFormatError(str(e))
+
+
+def patch_diagram_content(diagram, expected_version: int, json_patch: Optional[List] = None,
+                          deltas: Optional[Union[Dict, List]] = None) -> Tuple[Dict[str, Any], int, bool]:
+    """
+    Patch a diagram's content with an optimistic version check.
+
+    Args:
+        diagram: UMLDiagram instance (as loaded for the request)
+        expected_version: Content version the patch was computed against
+        json_patch: RFC 6902 operations
+        deltas: DELTA or list of DELTAs
+
+    Returns:
+        Tuple of (new content, new version, persisted). persisted is False
+        when the diagram has a live session and the write is deferred to
+        the session store's flush.
+
+    Raises:
+        PatchFormatError: If the patch is malformed or does not apply
+        VersionConflictError: If the content changed since expected_version
+    """
+    if is_session_store_enabled():
+        store = get_diagram_session_store()
+        if store.is_live(diagram.pk):
+            try:
+                return _patch_live_session(store, diagram.pk, expected_version, json_patch, deltas)
+            except KeyError:
+                # The session was flushed and closed in the meantime
+                diagram.refresh_from_db(fields=['content', 'content_hash', 'version'])
+
+    if diagram.version != expected_version:
+        raise VersionConflictError(diagram.version)
+
+    content_hash = ContentHash(diagram.content_hash, content=diagram.content)
+    content = apply_patch_to_content(diagram.content, json_patch, deltas, content_hash)
+
+    model = type(diagram)
+    now = timezone.now()
+    updated = model.objects.filter(pk=diagram.pk, version=expected_version).update(
+        content=content,
+        content_hash=content_hash.hexdigest,
+        version=F('version') + 1,
+        last_modified=now,
+    )
+    if not updated:
+        current = model.objects.filter(pk=diagram.pk).values_list('version', flat=True).first()
+        raise VersionConflictError(current)
+
+    diagram.content = content
+    diagram.content_hash = content_hash.hexdigest
+    diagram.version = expected_version + 1
+    diagram.last_modified = now
+    return content, diagram.version, True
+
+
+def _patch_live_session(store, diagram_id, expected_version, json_patch, deltas):
+    if json_patch is not None:
+        # JSON Patch is resolved against the live document and recorded as a
+        # content replacement so the session journal stays DELTA-only. The
+        # store still checks the version when applying it, so a write that
+        # lands in between turns into a conflict.
+        snapshot = store.get_snapshot(diagram_id)
+        if snapshot is None:
+            raise KeyError(diagram_id)
+        if snapshot[1] != expected_version:
+            raise VersionConflictError(snapshot[1])
+        content = apply_patch_to_content(snapshot[0], json_patch=json_patch)
+        deltas = [{'action': 'replace_content', 'changes': {'content': {'operation': 'replace', 'value': content}}}]
+    elif isinstance(deltas, dict):
+        deltas = [deltas]
+    if not isinstance(deltas, list) or not deltas:
+        raise PatchFormatError("Expected a JSON Patch array or one or more DELTAs")
+
+    try:
+        content, version = store.apply_if_version(diagram_id, expected_version, deltas)
+    except DeltaApplyError as e:
+        raise PatchFormatError(str(e))
+    return content, version, False
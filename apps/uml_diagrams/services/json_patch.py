@@ -0,0 +1,130 @@
+"""
+RFC 6902 JSON Patch for diagram content.
+
+Implements add, remove, replace, move, copy and test over RFC 6901 JSON
+Pointers. Patches are applied to a copy so a failing operation leaves the
+document untouched.
+"""
+
+import copy
+from typing import Any, Dict, List, Tuple
+
+
+class JSONPatchError(ValueError):
+    """Raised when a patch is malformed or cannot be applied."""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    if pointer == '':
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith('/'):
+        raise JSONPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container: list, token: str, allow_end: bool) -> int:
+    if token == '-' and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise JSONPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise JSONPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document: Any, tokens: List[str]) -> Any:
+    current = document
+    for token in tokens:
+        if isinstance(current, dict):
+            if token not in current:
+                raise JSONPatchError(f"Path not found: /{'/'.join(tokens)}")
+            current = current[token]
+        elif isinstance(current, list):
+            current = current[_array_index(current, token, allow_end=False)]
+        else:
+            raise JSONPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return current
+
+
+def _parent(document: Any, pointer: str) -> Tuple[Any, str]:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise JSONPatchError("Operation on the document root is not supported")
+    return _resolve(document, tokens[:-1]), tokens[-1]
+
+
+def _add(document: Any, pointer: str, value: Any) -> None:
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, token, allow_end=True), value)
+    else:
+        raise JSONPatchError(f"Cannot add to non-container at {pointer}")
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JSONPatchError(f"Path not found: {pointer}")
+        return parent.pop(token)
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, token, allow_end=False))
+    raise JSONPatchError(f"Cannot remove from non-container at {pointer}")
+
+
+def apply_json_patch(document: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply an RFC 6902 patch.
+
+    Args:
+        document: Diagram content
+        operations: List of patch operations
+
+    Returns:
+        Patched copy of the document
+
+    Raises:
+        JSONPatchError: If any operation fails (the input is not modified)
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError("JSON Patch must be an array of operations")
+
+    result = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JSONPatchError(f"Invalid patch operation: {operation!r}")
+
+        op, path = operation['op'], operation['path']
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JSONPatchError(f"'{op}' operation requires a value")
+
+        if op == 'add':
+            _add(result, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(result, path)
+        elif op == 'replace':
+            _remove(result, path)
+            _add(result, path, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            from_path = operation.get('from')
+            if from_path is None:
+                raise JSONPatchError("'move' operation requires 'from'")
+            if path.startswith(from_path + '/'):
+                raise JSONPatchError("Cannot move a value into one of its children")
+            _add(result, path, _remove(result, from_path))
+        elif op == 'copy':
+            from_path = operation.get('from')
+            if from_path is None:
+                raise JSONPatchError("'copy' operation requires 'from'")
+            _add(result, path, copy.deepcopy(_resolve(result, parse_pointer(from_path))))
+        elif op == 'test':
+            if _resolve(result, parse_pointer(path)) != operation['value']:
+                raise JSONPatchError(f"Test failed at {path}")
+        else:
+            raise JSONPatchError(f"Unknown patch operation '{op}'")
+
+    return result
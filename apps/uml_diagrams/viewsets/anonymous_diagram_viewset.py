@@ -7,12 +7,16 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.throttling import AnonRateThrottle
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from base.swagger.anonymous_documentation import AnonymousDocumentation, UML_DIAGRAMS_SCHEMA
 from drf_spectacular.utils import extend_schema, extend_schema_view
 
 from ..models import UMLDiagram
+from ..services import get_diagram_session_store, is_session_store_enabled
+from ..services.diagram_patch import PatchFormatError, VersionConflictError, patch_diagram_content
 from ..serializers.anonymous_diagram_serializer import (
     AnonymousDiagramListSerializer,
     AnonymousDiagramDetailSerializer,
@@ -23,10 +27,19 @@ from ..serializers.anonymous_diagram_serializer import (
 )
 
 
+JSON_PATCH_MEDIA_TYPE = 'application/json-patch+json'
+
+
+class JSONPatchParser(JSONParser):
+    """Parses RFC 6902 request bodies."""
+    media_type = JSON_PATCH_MEDIA_TYPE
+
+
 @extend_schema_view(**UML_DIAGRAMS_SCHEMA)
 class AnonymousDiagramViewSet(viewsets.ModelViewSet):
     
     queryset = UMLDiagram.objects.all()
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, JSONPatchParser]
     permission_classes = [AllowAny]
     throttle_classes = [AnonRateThrottle]
     throttle_scope = 'anon'
@@ -76,6 +89,13 @@ class AnonymousDiagramViewSet(viewsets.ModelViewSet):
         
         diagram = self.get_object()
 
+        if self._is_patch_request(request):
+            return self._partial_update_patch(request, diagram)
+
+        response = self._update_live(request, diagram, partial=True)
+        if response is not None:
+            return response
+
         if 'content' in request.data:
             try:
 
@@ -111,12 +131,120 @@ class AnonymousDiagramViewSet(viewsets.ModelViewSet):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def _is_patch_request(self, request):
+        if request.content_type.startswith(JSON_PATCH_MEDIA_TYPE):
+            return True
+        return isinstance(request.data, dict) and ('patch' in request.data or 'delta' in request.data)
+
+    def _partial_update_patch(self, request, diagram):
+        """
+        Incremental auto-save.
+
+        Body is either an RFC 6902 array (Content-Type
+        application/json-patch+json, base version in If-Match) or
+        {"patch": [...]} / {"delta": {...} | [...]} with a "version" field.
+        Responds with the new version only; 409 on a version conflict.
+        """
+        if request.content_type.startswith(JSON_PATCH_MEDIA_TYPE):
+            json_patch, deltas, version = request.data, None, None
+        else:
+            json_patch, deltas = request.data.get('patch'), request.data.get('delta')
+            version = request.data.get('version')
+
+        if version is None:
+            version = request.headers.get('If-Match', '').replace('W/', '').strip('"') or None
+        try:
+            expected_version = int(version)
+        except (TypeError, ValueError):
+            return Response(
+                {'detail': 'Patch requests require the base content version (version field or If-Match header).'},
+                status=status.HTTP_428_PRECONDITION_REQUIRED
+            )
+
+        try:
+            _, new_version, persisted = patch_diagram_content(
+                diagram, expected_version, json_patch=json_patch, deltas=deltas
+            )
+        except VersionConflictError as e:
+            return Response(
+                {'detail': 'Diagram was modified by another client.', 'current_version': e.current_version},
+                status=status.HTTP_409_CONFLICT
+            )
+        except PatchFormatError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response({
+            'id': str(diagram.pk),
+            'version': new_version,
+            'persisted': persisted,
+            'last_modified': diagram.last_modified,
+        }, status=status.HTTP_200_OK)
+        response['ETag'] = f'"{new_version}"'
+        return response
+
+    def _update_live(self, request, diagram, partial):
+        """
+        Save for a diagram with an active room.
+
+        The content goes to the live session document and reaches the row
+        with the next batched flush, which also writes the session's
+        version. Other fields are saved directly, without content or
+        version, so the row never gets ahead of the session.
+
+        Returns None when the diagram has no live session.
+        """
+        import json
+
+        if not is_session_store_enabled():
+            return None
+        store = get_diagram_session_store()
+        if not store.is_live(diagram.pk):
+            return None
+
+        content = request.data.get('content')
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except json.JSONDecodeError:
+                return Response({'content': ['Invalid JSON content.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        other_fields = {key: value for key, value in request.data.items() if key != 'content'}
+        serializer = self.get_serializer(diagram, data=other_fields, partial=partial)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if 'content' in request.data:
+            try:
+                store.apply(diagram.pk, {
+                    'action': 'replace_content',
+                    'changes': {'content': {'operation': 'replace', 'value': content}},
+                })
+            except KeyError:
+                # The session was flushed and closed in the meantime
+                return None
+        snapshot = store.get_snapshot(diagram.pk)
+        if snapshot is not None:
+            diagram.content, diagram.version = snapshot
+
+        update_fields = [name for name in serializer.validated_data if name not in ('content', 'version')]
+        for name in update_fields:
+            setattr(diagram, name, serializer.validated_data[name])
+        if hasattr(request, 'session'):
+            diagram.session_id = serializer.get_or_create_session_id(request)
+            update_fields.append('session_id')
+        diagram.save(update_fields=[*update_fields, 'last_modified'])
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    
     def update(self, request, *args, **kwargs):
         """PUT /api/diagrams/{id}/ - Full update endpoint"""
         import logging
         logger = logging.getLogger('django')
         
         diagram = self.get_object()
+        response = self._update_live(request, diagram, partial=False)
+        if response is not None:
+            return response
+
         serializer = self.get_serializer(diagram, data=request.data)
         
         if serializer.is_valid():
@@ -0,0 +1,172 @@
+"""
+Streaming AI answers over the diagram WebSocket.
+
+A client connected to a diagram room sends
+
+    {"type": "ai_request", "request_id": "r1", "kind": "ask", "question": "..."}
+    {"type": "ai_request", "request_id": "r2", "kind": "command", "command": "...",
+     "model": "o4-mini", "current_diagram_data": {...}}
+
+and receives, on the same socket only, one frame per event of the answer:
+
+    {"type": "ai_stream", "request_id": "r1", "event": "token", "data": {"delta": "..."}}
+    {"type": "ai_stream", "request_id": "r2", "event": "element", "data": {...}}
+    {"type": "ai_stream", "request_id": "r1", "event": "done", "data": {...}}
+
+Events are the ones of the SSE endpoints (token, element, done, error).
+Each request runs as its own task, so the socket keeps relaying diagram
+frames meanwhile; AI_WS_STREAMS_PER_CONNECTION caps the requests in flight
+per connection and disconnecting cancels them.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.ai_assistant.serializers import AIAssistantQuestionSerializer, UMLCommandRequestSerializer
+from apps.ai_assistant.services.registry import AI_ASSISTANT, MODEL_ROUTER, aget_service
+
+logger = logging.getLogger('django')
+
+AI_REQUEST_TYPE = 'ai_request'
+AI_STREAM_TYPE = 'ai_stream'
+
+KIND_ASK = 'ask'
+KIND_COMMAND = 'command'
+
+
+def parse_ai_request(text_data: str) -> Optional[Dict[str, Any]]:
+    """Return the message if the frame is an ai_request, otherwise None."""
+    if AI_REQUEST_TYPE not in text_data:
+        return None
+    try:
+        message = json.loads(text_data)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get('type') != AI_REQUEST_TYPE:
+        return None
+    return message
+
+
+class AIStreamMixin:
+    """
+    Answers ai_request frames with streamed ai_stream frames.
+
+    Mix into a consumer that sets self.diagram_id, call handle_ai_request()
+    first in receive() and cancel_ai_streams() on disconnect.
+    """
+
+    ai_tasks = None
+
+    async def handle_ai_request(self, text_data: str) -> bool:
+        """
+        Start streaming the answer to an ai_request frame.
+
+        Returns:
+            True if the frame was an ai_request (and must not be relayed)
+        """
+        message = parse_ai_request(text_data)
+        if message is None:
+            return False
+
+        request_id = str(message.get('request_id') or uuid.uuid4())
+        if self.ai_tasks is None:
+            self.ai_tasks = set()
+
+        limit = getattr(settings, 'AI_WS_STREAMS_PER_CONNECTION', 2)
+        if len(self.ai_tasks) >= limit:
+            await self.send_ai_event(request_id, 'error', {
+                'error': 'Too many AI requests in progress',
+                'limit': limit,
+            })
+            return True
+
+        try:
+            events = self.ai_events(message)
+        except ValueError as e:
+            await self.send_ai_event(request_id, 'error', {'error': 'Invalid AI request', 'details': e.args[0]})
+            return True
+
+        task = asyncio.ensure_future(self._pump_ai_events(request_id, events))
+        self.ai_tasks.add(task)
+        task.add_done_callback(self.ai_tasks.discard)
+        return True
+
+    def ai_events(self, message: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Event iterator for a validated ai_request.
+
+        Raises:
+            ValueError: Unknown kind or invalid fields (args[0] holds the details)
+        """
+        kind = message.get('kind', KIND_ASK)
+        if kind == KIND_ASK:
+            serializer = AIAssistantQuestionSerializer(data={'question': message.get('question')})
+            if not serializer.is_valid():
+                raise ValueError(serializer.errors)
+            return self._ask_events(serializer.validated_data['question'])
+
+        if kind == KIND_COMMAND:
+            serializer = UMLCommandRequestSerializer(data={
+                key: message[key] for key in ('command', 'model', 'current_diagram_data') if key in message
+            })
+            if not serializer.is_valid():
+                raise ValueError(serializer.errors)
+            return self._command_events(serializer.validated_data)
+
+        raise ValueError({'kind': [f"Unknown kind '{kind}', expected '{KIND_ASK}' or '{KIND_COMMAND}'"]})
+
+    async def _ask_events(self, question: str) -> AsyncIterator[Tuple[str, Any]]:
+        ai_service = await aget_service(AI_ASSISTANT)
+        async for event in ai_service.astream_contextual_help(
+            user_question=question,
+            diagram_id=str(self.diagram_id),
+            context_type='diagram'
+        ):
+            yield event
+
+    async def _command_events(self, validated_data: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+        router_service = await aget_service(MODEL_ROUTER)
+        async for event in router_service.astream_command(
+            command=validated_data['command'],
+            model=validated_data.get('model'),
+            diagram_id=str(self.diagram_id),
+            current_diagram_data=validated_data.get('current_diagram_data')
+        ):
+            yield event
+
+    async def _pump_ai_events(self, request_id: str, events: AsyncIterator[Tuple[str, Any]]) -> None:
+        try:
+            async for event, data in events:
+                await self.send_ai_event(request_id, event, data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"AI stream {request_id} failed: {e}", exc_info=True)
+            try:
+                await self.send_ai_event(request_id, 'error', {'error': 'Stream failed', 'message': str(e)})
+            except Exception:
+                pass
+
+    async def send_ai_event(self, request_id: str, event: str, data: Any) -> None:
+        """Send one ai_stream frame to this connection only."""
+        await self.send(text_data=json.dumps({
+            'type': AI_STREAM_TYPE,
+            'request_id': request_id,
+            'event': event,
+            'data': data,
+        }, cls=JSONEncoder))
+
+    async def cancel_ai_streams(self) -> None:
+        """Cancel the requests still streaming, e.g. when the socket closes."""
+        if not self.ai_tasks:
+            return
+        tasks = list(self.ai_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
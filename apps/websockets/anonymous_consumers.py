@@ -5,13 +5,19 @@ import logging
 from datetime import datetime
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from apps.uml_diagrams.models import UMLDiagram
+from apps.uml_diagrams.services import get_diagram_session_store, is_session_store_enabled
+from .ai_stream import AIStreamMixin
+from .broadcast import RoomBroadcastMixin
+from .coalescing import build_position_coalescer
 
 logger = logging.getLogger('django')
 
-_active_connections = {}
-
-class AnonymousUMLDiagramConsumer(AsyncWebsocketConsumer):
+class AnonymousUMLDiagramConsumer(AIStreamMixin, RoomBroadcastMixin, AsyncWebsocketConsumer):
+    room_prefix = 'diagram_'
+    coalescer = None
+    session_store = None
 
     async def connect(self):
         
@@ -21,15 +27,22 @@ class AnonymousUMLDiagramConsumer(AsyncWebsocketConsumer):
             
             await self.accept()
             
-            if self.diagram_id not in _active_connections:
-                _active_connections[self.diagram_id] = []
-            _active_connections[self.diagram_id].append(self)
+            await self.join_room()
+            self.coalescer = build_position_coalescer(self.broadcast)
             
             try:
                 await self.add_session_to_diagram()
             except Exception as db_error:
                 pass
             
+            if is_session_store_enabled():
+                try:
+                    self.session_store = get_diagram_session_store()
+                    await database_sync_to_async(self.session_store.open)(self.diagram_id)
+                except Exception as store_error:
+                    logger.warning(f"Diagram session store unavailable for {self.diagram_id}: {store_error}")
+                    self.session_store = None
+            
         except Exception as e:
             try:
                 await self.close(code=4000)
@@ -40,12 +53,16 @@ class AnonymousUMLDiagramConsumer(AsyncWebsocketConsumer):
         try:
             session_id = getattr(self, 'session_id', 'unknown')
             
-            if hasattr(self, 'diagram_id') and self.diagram_id in _active_connections:
-                if self in _active_connections[self.diagram_id]:
-                    _active_connections[self.diagram_id].remove(self)
-                
-                if not _active_connections[self.diagram_id]:
-                    _active_connections.pop(self.diagram_id, None)
+            await self.cancel_ai_streams()
+            if self.coalescer is not None:
+                await self.coalescer.close()
+            await self.leave_room()
+            
+            if self.session_store is not None:
+                try:
+                    await database_sync_to_async(self.session_store.close)(self.diagram_id)
+                except Exception as store_error:
+                    logger.error(f"Failed to close diagram session {self.diagram_id}: {store_error}")
             
             try:
                 await self.remove_session_from_diagram()
@@ -58,27 +75,54 @@ class AnonymousUMLDiagramConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         try:
             
-            if hasattr(self, 'diagram_id') and self.diagram_id in _active_connections:
-                forwarded_count = 0
-                failed_peers = []
-                
-                for peer in _active_connections[self.diagram_id]:
-                    if peer is not self:
-                        try:
-                            await peer.send(text_data=text_data)
-                            forwarded_count += 1
-                        except Exception as send_error:
-                            failed_peers.append(peer)
-                
-                for failed_peer in failed_peers:
-                    try:
-                        _active_connections[self.diagram_id].remove(failed_peer)
-                    except ValueError:
-                        pass
+            if await self.handle_ai_request(text_data):
+                return
+            
+            if self.session_store is not None:
+                text_data = await self.apply_delta_frame(text_data)
+                if text_data is None:
+                    return
+            
+            if self.coalescer is not None:
+                await self.coalescer.submit(text_data)
+            elif hasattr(self, 'diagram_id'):
+                await self.broadcast(text_data)
                                 
         except Exception as e:
             pass
     
+    async def apply_delta_frame(self, text_data):
+        """
+        Apply a diagram_delta frame to the live document.
+
+        Returns the frame to relay (stamped with the new version), the frame
+        unchanged when it is not a DELTA, or None when the DELTA was rejected.
+        """
+        if 'diagram_delta' not in text_data:
+            return text_data
+        try:
+            message = json.loads(text_data)
+        except (TypeError, ValueError):
+            return text_data
+        if not isinstance(message, dict) or message.get('type') != 'diagram_delta':
+            return text_data
+
+        try:
+            version = await sync_to_async(self.session_store.apply)(
+                self.diagram_id, message.get('delta')
+            )
+        except Exception as e:
+            await self.send(text_data=json.dumps({
+                'type': 'delta_rejected',
+                'error': str(e),
+                'delta': message.get('delta'),
+                'timestamp': datetime.now().isoformat()
+            }))
+            return None
+
+        message['version'] = version
+        return json.dumps(message)
+    
     @database_sync_to_async
     def add_session_to_diagram(self):
         try:
@@ -109,7 +153,9 @@ class AnonymousUMLDiagramConsumer(AsyncWebsocketConsumer):
             return False
 
 
-class AnonymousDiagramChatConsumer(AsyncWebsocketConsumer):
+class AnonymousDiagramChatConsumer(RoomBroadcastMixin, AsyncWebsocketConsumer):
+    room_prefix = 'chat_'
+
     async def connect(self):
         
         try:
@@ -120,10 +166,7 @@ class AnonymousDiagramChatConsumer(AsyncWebsocketConsumer):
             
             await self.accept()
             
-            chat_room_id = f"chat_{self.diagram_id}"
-            if chat_room_id not in _active_connections:
-                _active_connections[chat_room_id] = []
-            _active_connections[chat_room_id].append(self)
+            await self.join_room()
             
         except Exception as e:
             try:
@@ -135,13 +178,7 @@ class AnonymousDiagramChatConsumer(AsyncWebsocketConsumer):
         try:
             session_id = getattr(self, 'session_id', 'unknown')
             
-            chat_room_id = f"chat_{self.diagram_id}"
-            if hasattr(self, 'diagram_id') and chat_room_id in _active_connections:
-                if self in _active_connections[chat_room_id]:
-                    _active_connections[chat_room_id].remove(self)
-                
-                if not _active_connections[chat_room_id]:
-                    _active_connections.pop(chat_room_id, None)
+            await self.leave_room()
                     
         except Exception as e:
             pass
@@ -150,19 +187,8 @@ class AnonymousDiagramChatConsumer(AsyncWebsocketConsumer):
         try:
             session_id = getattr(self, 'session_id', 'unknown')
             
-            chat_room_id = f"chat_{self.diagram_id}"
-            if hasattr(self, 'diagram_id') and chat_room_id in _active_connections:
-                forwarded_count = 0
-                for peer in _active_connections[chat_room_id]:
-                    if peer is not self:
-                        try:
-                            await peer.send(text_data=text_data)
-                            forwarded_count += 1
-                        except Exception as send_error:
-                            try:
-                                _active_connections[chat_room_id].remove(peer)
-                            except ValueError:
-                                pass
+            if hasattr(self, 'diagram_id'):
+                await self.broadcast(text_data)
                                 
         except Exception as e:
             try:
@@ -99,6 +99,29 @@ WEBSOCKET_CHAT_MESSAGES = {
             'timestamp': '2025-09-28T01:15:30Z'
         }
     ),
+    'ai_request': OpenApiExample(
+        'AI Request (streamed answer)',
+        value={
+            'type': 'ai_request',
+            'request_id': 'req-1',
+            'kind': 'command',
+            'command': 'Create class User with name and email',
+            'model': 'o4-mini',
+            'current_diagram_data': {'nodes': [], 'edges': []}
+        }
+    ),
+    'ai_stream': OpenApiExample(
+        'AI Stream Event (sent only to the requester)',
+        value={
+            'type': 'ai_stream',
+            'request_id': 'req-1',
+            'event': 'element',
+            'data': {
+                'type': 'node',
+                'data': {'id': 'class-user', 'data': {'label': 'User', 'attributes': [], 'methods': []}}
+            }
+        }
+    ),
     'user_joined': OpenApiExample(
         'User Joined Chat Notification',
         value={
@@ -127,7 +150,8 @@ WEBSOCKET_DOCUMENTATION = {
             '### Features\n'
             '- Real-time diagram updates\n'
             '- Cursor position tracking\n'
-            '- User presence notifications\n\n'
+            '- User presence notifications\n'
+            '- Streamed AI answers (`ai_request` -> `ai_stream` token/element/done events)\n\n'
             '### No Authentication Required\n'
             'Anonymous access with auto-generated guest nicknames.'
         ),
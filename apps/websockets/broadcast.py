@@ -0,0 +1,178 @@
+"""
+Room broadcast helpers for the anonymous collaboration consumers.
+
+Peers of a room are reached either through the process-local registry
+(single worker fast path) or through channel layer groups, so collaborators
+connected to different ASGI workers receive each other's frames. Delivery to
+each connection goes through its bounded outbound queue (see outbound.py).
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+from .outbound import OutboundQueue, POLICY_DROP_OLDEST
+
+logger = logging.getLogger('django')
+
+BROADCAST_MODE_LOCAL = 'local'
+BROADCAST_MODE_CHANNEL_LAYER = 'channel_layer'
+BROADCAST_MODE_AUTO = 'auto'
+
+IN_MEMORY_LAYER_BACKEND = 'channels.layers.InMemoryChannelLayer'
+
+_active_connections = {}
+
+
+def resolve_broadcast_mode(alias: str = 'default') -> str:
+    """
+    Resolve the effective broadcast mode for a channel layer alias.
+
+    'auto' selects the channel layer only when a cross-process backend
+    (e.g. channels_redis) is configured; the in-memory layer cannot reach
+    other workers, so the local registry is faster and equivalent there.
+    """
+    mode = getattr(settings, 'WEBSOCKET_BROADCAST_MODE', BROADCAST_MODE_AUTO)
+    if mode in (BROADCAST_MODE_LOCAL, BROADCAST_MODE_CHANNEL_LAYER):
+        return mode
+
+    layer_config = getattr(settings, 'CHANNEL_LAYERS', {}).get(alias, {})
+    backend = layer_config.get('BACKEND', '')
+    if backend and backend != IN_MEMORY_LAYER_BACKEND:
+        return BROADCAST_MODE_CHANNEL_LAYER
+    return BROADCAST_MODE_LOCAL
+
+
+def get_room_peers(room_name: str) -> list:
+    """Return the consumers registered locally for a room."""
+    return _active_connections.get(room_name, [])
+
+
+class RoomBroadcastMixin:
+    """
+    Relays text frames from one consumer to every other member of its room.
+
+    Mix into an AsyncWebsocketConsumer and call join_room() on connect,
+    leave_room() on disconnect and broadcast() from receive().
+    """
+
+    room_prefix = ''
+    relay_event_type = 'room.relay'
+    outbound = None
+
+    def get_room_name(self) -> str:
+        return f"{self.room_prefix}{self.diagram_id}"
+
+    def _start_outbound_queue(self) -> None:
+        queue_size = getattr(settings, 'WEBSOCKET_OUTBOUND_QUEUE_SIZE', 256)
+        if queue_size <= 0:
+            return
+        self.outbound = OutboundQueue(
+            send=self.send,
+            close=self.close,
+            maxsize=queue_size,
+            policy=getattr(settings, 'WEBSOCKET_SLOW_CONSUMER_POLICY', POLICY_DROP_OLDEST),
+            label=f"{self.room_prefix}{self.diagram_id}/{getattr(self, 'session_id', self.channel_name)}",
+        )
+        self.outbound.start()
+
+    async def deliver(self, text_data: str) -> bool:
+        """
+        Hand a frame to this connection.
+
+        Frames are queued for the writer task when an outbound queue is
+        configured; otherwise they are sent directly.
+        """
+        if self.outbound is not None:
+            return self.outbound.put(text_data)
+        await self.send(text_data=text_data)
+        return True
+
+    async def join_room(self) -> None:
+        self.room_name = self.get_room_name()
+        self._start_outbound_queue()
+        self.broadcast_mode = resolve_broadcast_mode(self.channel_layer_alias)
+
+        if self.broadcast_mode == BROADCAST_MODE_CHANNEL_LAYER:
+            if self.channel_layer is None:
+                self.broadcast_mode = BROADCAST_MODE_LOCAL
+            else:
+                try:
+                    await self.channel_layer.group_add(self.room_name, self.channel_name)
+                    return
+                except Exception as e:
+                    logger.warning(
+                        f"Channel layer group_add failed for {self.room_name} ({e}), "
+                        f"falling back to local broadcast"
+                    )
+                    self.broadcast_mode = BROADCAST_MODE_LOCAL
+
+        _active_connections.setdefault(self.room_name, []).append(self)
+
+    async def leave_room(self) -> None:
+        room_name = getattr(self, 'room_name', None)
+        if room_name is None:
+            return
+
+        if self.outbound is not None:
+            await self.outbound.stop()
+
+        if getattr(self, 'broadcast_mode', None) == BROADCAST_MODE_CHANNEL_LAYER:
+            try:
+                await self.channel_layer.group_discard(room_name, self.channel_name)
+            except Exception:
+                pass
+            return
+
+        peers = _active_connections.get(room_name)
+        if peers is None:
+            return
+        if self in peers:
+            peers.remove(self)
+        if not peers:
+            _active_connections.pop(room_name, None)
+
+    async def broadcast(self, text_data: str) -> Optional[int]:
+        """
+        Send a frame to every other room member.
+
+        Returns the number of local peers reached, or None when the frame
+        was handed to the channel layer (delivery happens in each worker).
+        """
+        if getattr(self, 'broadcast_mode', None) == BROADCAST_MODE_CHANNEL_LAYER:
+            await self.channel_layer.group_send(self.room_name, {
+                'type': self.relay_event_type,
+                'text_data': text_data,
+                'sender': self.channel_name,
+            })
+            return None
+
+        peers = _active_connections.get(getattr(self, 'room_name', None))
+        if not peers:
+            return 0
+
+        targets = [peer for peer in peers if peer is not self]
+        results = await asyncio.gather(
+            *(peer.deliver(text_data) for peer in targets),
+            return_exceptions=True,
+        )
+
+        forwarded_count = 0
+        for peer, result in zip(targets, results):
+            if result is True:
+                forwarded_count += 1
+                continue
+            try:
+                peers.remove(peer)
+            except ValueError:
+                pass
+
+        return forwarded_count
+
+    async def room_relay(self, event):
+        """Channel layer handler for frames broadcast by another room member."""
+        if event.get('sender') == self.channel_name:
+            return
+        await self.deliver(event['text_data'])
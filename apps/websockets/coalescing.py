@@ -0,0 +1,123 @@
+"""
+Coalescing of high-frequency position frames from a single connection.
+
+While a user drags a node the client emits a position frame on every mouse
+move. Peers only need the latest position per node, so position frames are
+buffered per node id and flushed once per tick; every other frame passes
+through immediately (after flushing pending positions, to preserve order).
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('django')
+
+DEFAULT_COALESCE_MESSAGE_TYPES = ('node_move', 'node_position', 'node_drag', 'cursor_position')
+
+NODE_ID_FIELDS = ('node_id', 'nodeId', 'id')
+
+
+def position_key(text_data: str, message_types) -> Optional[tuple]:
+    """
+    Return the coalescing key of a position frame, or None for other frames.
+
+    Node frames are keyed by node id; frames without one (cursor updates)
+    are keyed by the sending session.
+    """
+    try:
+        message = json.loads(text_data)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(message, dict):
+        return None
+
+    message_type = message.get('type')
+    if message_type not in message_types:
+        return None
+
+    payload = message.get('data') if isinstance(message.get('data'), dict) else {}
+    for field in NODE_ID_FIELDS:
+        node_id = message.get(field, payload.get(field))
+        if node_id is not None:
+            return (message_type, str(node_id))
+    return (message_type, 'session', str(message.get('session_id', '')))
+
+
+class PositionCoalescer:
+    """
+    Buffers the latest position frame per node and forwards them on a tick.
+
+    Args:
+        forward: Coroutine function relaying one frame to the room
+        tick_hz: Flush frequency
+        message_types: Frame types treated as position updates
+    """
+
+    def __init__(self, forward: Callable[[str], Awaitable], tick_hz: float = 30,
+                 message_types=DEFAULT_COALESCE_MESSAGE_TYPES):
+        self._forward = forward
+        self.interval = 1.0 / max(1.0, float(tick_hz))
+        self.message_types = frozenset(message_types)
+
+        self._pending = {}
+        self._timer = None
+
+        self.received = 0
+        self.forwarded = 0
+
+    async def submit(self, text_data: str) -> None:
+        self.received += 1
+        key = position_key(text_data, self.message_types)
+        if key is None:
+            await self.flush()
+            await self._send(text_data)
+            return
+
+        # Re-inserting moves the node to the end so flush order follows recency
+        self._pending.pop(key, None)
+        self._pending[key] = text_data
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._flush_after_tick())
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        frames = list(self._pending.values())
+        self._pending.clear()
+        for text_data in frames:
+            await self._send(text_data)
+
+    async def close(self) -> None:
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            self._pending.clear()
+
+    async def _send(self, text_data: str) -> None:
+        self.forwarded += 1
+        await self._forward(text_data)
+
+    async def _flush_after_tick(self) -> None:
+        await asyncio.sleep(self.interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Position coalescer flush failed: {e}")
+
+
+def build_position_coalescer(forward: Callable[[str], Awaitable]) -> Optional[PositionCoalescer]:
+    """Create a coalescer when WEBSOCKET_COALESCE_POSITIONS is enabled."""
+    if not getattr(settings, 'WEBSOCKET_COALESCE_POSITIONS', False):
+        return None
+    return PositionCoalescer(
+        forward,
+        tick_hz=getattr(settings, 'WEBSOCKET_COALESCE_TICK_HZ', 30),
+        message_types=getattr(settings, 'WEBSOCKET_COALESCE_MESSAGE_TYPES', DEFAULT_COALESCE_MESSAGE_TYPES),
+    )
@@ -1,9 +1,12 @@
 from channels.middleware import BaseMiddleware
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.core.cache import cache
-import time
 import logging
 
+from .throttle import MemoryThrottleBackend, RedisThrottleBackend, ThrottleLimits
+
+logger = logging.getLogger('django')
+
 
 class AnonymousWebSocketMiddleware(BaseMiddleware):
     
@@ -32,51 +35,92 @@ class ConnectionTrackingMiddleware(BaseMiddleware):
 
 
 class ConnectionThrottleMiddleware(BaseMiddleware):
-    MAX_CONNECTIONS_PER_IP = 50  
-    CONNECTION_WINDOW = 300      
-    RATE_LIMIT_WINDOW = 60       
-    MAX_CONNECTIONS_PER_MINUTE = 100  
-    
+    """
+    Per-IP WebSocket connection limiter (see throttle.py).
+
+    Each connection takes a slot on connect and gives it back when the inner
+    application returns, however it ends. Rejected connections are closed
+    with code 4003 before reaching the consumer. Counter errors let the
+    connection through.
+    """
+
+    MAX_CONNECTIONS_PER_IP = 50
+    CONNECTION_WINDOW = 3600
+    RATE_LIMIT_WINDOW = 60
+    MAX_CONNECTIONS_PER_MINUTE = 100
+
+    def __init__(self, inner, backend=None):
+        super().__init__(inner)
+        self.backend = backend
+
+    def get_backend(self):
+        if self.backend is None:
+            redis_url = getattr(settings, 'WEBSOCKET_THROTTLE_REDIS_URL', None)
+            self.backend = RedisThrottleBackend(redis_url) if redis_url else MemoryThrottleBackend()
+        return self.backend
+
+    def get_limits(self):
+        return ThrottleLimits(
+            max_per_window=getattr(settings, 'WEBSOCKET_THROTTLE_MAX_PER_MINUTE', self.MAX_CONNECTIONS_PER_MINUTE),
+            rate_window=self.RATE_LIMIT_WINDOW,
+            max_concurrent=getattr(settings, 'WEBSOCKET_THROTTLE_MAX_CONCURRENT', self.MAX_CONNECTIONS_PER_IP),
+            concurrent_ttl=getattr(settings, 'WEBSOCKET_THROTTLE_CONCURRENT_TTL', self.CONNECTION_WINDOW),
+        )
+
     async def __call__(self, scope, receive, send):
+        if scope.get('type') != 'websocket' or not getattr(settings, 'WEBSOCKET_THROTTLE_ENABLED', True):
+            return await super().__call__(scope, receive, send)
+
         client_ip = self.get_client_ip(scope)
-        logger = logging.getLogger('django')
-        
-        return await super().__call__(scope, receive, send)
-    
+        backend = self.get_backend()
+        try:
+            rejected = await backend.acquire(client_ip, self.get_limits())
+        except Exception as e:
+            logger.warning(f"WebSocket throttle unavailable ({e}); admitting {client_ip}")
+            return await super().__call__(scope, receive, send)
+
+        if rejected:
+            logger.warning(f"WebSocket connection from {client_ip} rejected: {rejected} limit")
+            message = await receive()
+            if message.get('type') == 'websocket.connect':
+                await self.reject_connection(send, f"Too many connections ({rejected} limit)")
+            return None
+
+        try:
+            return await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await backend.release(client_ip)
+            except Exception as e:
+                logger.warning(f"WebSocket throttle release failed for {client_ip}: {e}")
+
     def get_client_ip(self, scope):
+        """
+        Address to count connections against.
+
+        Each proxy appends the address it received the request from to
+        X-Forwarded-For, so only the last WEBSOCKET_THROTTLE_TRUSTED_PROXIES
+        entries can be trusted; anything to the left of them was sent by the
+        client. The entry the outermost trusted proxy added is the client.
+        """
         client = scope.get('client', ['unknown', 0])
-        return client[0] if client else 'unknown'
-    
-    async def check_rate_limit(self, client_ip):
-        cache_key = f"ws_rate_limit:{client_ip}"
-        current_count = cache.get(cache_key, 0)
-        
-        if current_count >= self.MAX_CONNECTIONS_PER_MINUTE:
-            return False
-        
-        cache.set(cache_key, current_count + 1, self.RATE_LIMIT_WINDOW)
-        return True
-    
-    async def check_concurrent_limit(self, client_ip):
-        cache_key = f"ws_concurrent:{client_ip}"
-        current_count = cache.get(cache_key, 0)
-        
-        return current_count < self.MAX_CONNECTIONS_PER_IP
-    
-    async def track_connection(self, client_ip):
-        cache_key = f"ws_concurrent:{client_ip}"
-        current_count = cache.get(cache_key, 0)
-        cache.set(cache_key, current_count + 1, self.CONNECTION_WINDOW)
-    
-    async def untrack_connection(self, client_ip):
-        cache_key = f"ws_concurrent:{client_ip}"
-        current_count = cache.get(cache_key, 0)
-        if current_count > 0:
-            cache.set(cache_key, current_count - 1, self.CONNECTION_WINDOW)
-    
+        client_ip = client[0] if client else 'unknown'
+        if not getattr(settings, 'WEBSOCKET_THROTTLE_USE_FORWARDED_FOR', False):
+            return client_ip
+
+        hops = max(1, getattr(settings, 'WEBSOCKET_THROTTLE_TRUSTED_PROXIES', 1))
+        forwarded = []
+        for name, value in scope.get('headers', []):
+            if name == b'x-forwarded-for':
+                forwarded.extend(entry.strip() for entry in value.decode('latin-1').split(','))
+        forwarded = [entry for entry in forwarded if entry]
+        if len(forwarded) < hops:
+            return client_ip
+        return forwarded[-hops]
+
     async def reject_connection(self, send, reason):
         await send({
             'type': 'websocket.close',
             'code': 4003,
-            'reason': reason.encode('utf-8')
+            'reason': reason
         })
@@ -0,0 +1,228 @@
+"""
+Bounded per-connection outbound queues for WebSocket consumers.
+
+Each connection owns a queue drained by its own writer task, so a slow
+client only backs up its own queue instead of stalling the sender and every
+peer behind it. When a queue is full the slow consumer policy decides what
+happens to the new frame.
+"""
+
+import asyncio
+import json
+import logging
+import weakref
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger('django')
+
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_COALESCE = 'coalesce'
+POLICY_DISCONNECT = 'disconnect'
+SLOW_CONSUMER_POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_DISCONNECT)
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+COALESCE_ID_FIELDS = ('node_id', 'nodeId', 'edge_id', 'edgeId', 'element_id', 'id')
+
+_stats = {
+    'enqueued': 0,
+    'sent': 0,
+    'dropped': 0,
+    'coalesced': 0,
+    'disconnected': 0,
+}
+
+_live_queues = weakref.WeakSet()
+
+
+def coalesce_key(text_data: str) -> Optional[tuple]:
+    """
+    Identify frames that supersede each other.
+
+    Two frames with the same key carry state for the same element, so only
+    the newest one needs to reach a lagging client.
+    """
+    try:
+        message = json.loads(text_data)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(message, dict) or 'type' not in message:
+        return None
+
+    payload = message.get('data') if isinstance(message.get('data'), dict) else message
+    for field in COALESCE_ID_FIELDS:
+        element_id = payload.get(field, message.get(field))
+        if element_id is not None:
+            return (message['type'], message.get('session_id'), str(element_id))
+    return None
+
+
+class OutboundQueue:
+    """
+    Bounded FIFO of text frames with a dedicated writer task.
+
+    Args:
+        send: Coroutine function sending a single frame (consumer.send)
+        close: Coroutine function closing the connection (consumer.close)
+        maxsize: Maximum number of queued frames
+        policy: One of SLOW_CONSUMER_POLICIES, applied when the queue is full
+        label: Identifier used in stats and logs
+    """
+
+    def __init__(self, send, close, maxsize: int = 256,
+                 policy: str = POLICY_DROP_OLDEST, label: str = ''):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+
+        self._send = send
+        self._close = close
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.label = label
+
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._writer_task = None
+        self._closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def start(self) -> None:
+        if self._writer_task is None:
+            self._writer_task = asyncio.ensure_future(self._run())
+            _live_queues.add(self)
+
+    async def stop(self) -> None:
+        self._closed = True
+        self._ready.set()
+        _live_queues.discard(self)
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._writer_task = None
+        self._frames.clear()
+
+    def put(self, text_data: str) -> bool:
+        """
+        Queue a frame without blocking.
+
+        Returns:
+            False when the frame was rejected (queue closed or consumer
+            disconnected by policy), True otherwise
+        """
+        if self._closed:
+            return False
+
+        _stats['enqueued'] += 1
+
+        if len(self._frames) >= self.maxsize and not self._make_room(text_data):
+            return not self._closed
+
+        self._frames.append(text_data)
+        self.high_water = max(self.high_water, len(self._frames))
+        self._ready.set()
+        return True
+
+    def _make_room(self, text_data: str) -> bool:
+        """Apply the slow consumer policy; returns whether to append the frame."""
+        if self.policy == POLICY_DISCONNECT:
+            self._record_drop(len(self._frames) + 1)
+            _stats['disconnected'] += 1
+            logger.warning(
+                f"Closing slow WebSocket consumer {self.label} (queue depth {len(self._frames)})"
+            )
+            self._closed = True
+            self._frames.clear()
+            self._ready.set()
+            asyncio.ensure_future(self._close_slow_consumer())
+            return False
+
+        if self.policy == POLICY_COALESCE:
+            key = coalesce_key(text_data)
+            if key is not None:
+                for index, queued in enumerate(self._frames):
+                    if coalesce_key(queued) == key:
+                        self._frames[index] = text_data
+                        self.coalesced += 1
+                        _stats['coalesced'] += 1
+                        return False
+
+        self._frames.popleft()
+        self._record_drop(1)
+        return True
+
+    def _record_drop(self, count: int) -> None:
+        self.dropped += count
+        _stats['dropped'] += count
+
+    async def _close_slow_consumer(self) -> None:
+        try:
+            await self._close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def _run(self) -> None:
+        while not self._closed:
+            if not self._frames:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            text_data = self._frames.popleft()
+            try:
+                await self._send(text_data=text_data)
+            except Exception:
+                self._closed = True
+                self._frames.clear()
+                break
+            self.sent += 1
+            _stats['sent'] += 1
+
+
+def get_outbound_stats(slow_peer_limit: int = 10) -> dict:
+    """
+    Snapshot of outbound queue metrics for this process.
+
+    Returns:
+        Totals since start plus current depth figures and the deepest queues
+    """
+    queues = [queue for queue in list(_live_queues) if not queue.closed]
+    depths = [queue.depth for queue in queues]
+    deepest = sorted(queues, key=lambda queue: queue.depth, reverse=True)[:slow_peer_limit]
+
+    return {
+        **_stats,
+        'active_queues': len(queues),
+        'total_depth': sum(depths),
+        'max_depth': max(depths) if depths else 0,
+        'slow_peers': [
+            {
+                'connection': queue.label,
+                'depth': queue.depth,
+                'high_water': queue.high_water,
+                'dropped': queue.dropped,
+                'coalesced': queue.coalesced,
+            }
+            for queue in deepest if queue.depth > 0 or queue.dropped > 0
+        ],
+    }
+
+
+def reset_outbound_stats() -> None:
+    for key in _stats:
+        _stats[key] = 0
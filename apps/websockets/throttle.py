@@ -0,0 +1,137 @@
+"""
+Per-IP WebSocket connection counters for ConnectionThrottleMiddleware.
+
+Two limits are enforced when a connection opens:
+
+- rate: connection attempts per IP in a fixed window (INCR, EXPIRE on the
+  first increment)
+- concurrency: open connections per IP (INCR on connect, DECR on
+  disconnect, with a TTL refreshed on every connect so counts left behind
+  by a crashed worker expire)
+
+The Redis backend runs each check as one Lua script on redis.asyncio, so
+the counters are atomic, shared by every ASGI worker and never block the
+event loop. Without Redis the memory backend keeps the same counters for
+the current process only.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger('django')
+
+REJECT_RATE = 'rate'
+REJECT_CONCURRENT = 'concurrent'
+
+# KEYS: rate key, concurrent key. ARGV: rate window, max per window,
+# concurrent TTL, max concurrent. Returns 0 (admitted), 1 (rate) or 2
+# (concurrent); a rejected connection does not keep its concurrent slot.
+ACQUIRE_SCRIPT = """
+local attempts = redis.call('INCR', KEYS[1])
+if attempts == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+if attempts > tonumber(ARGV[2]) then
+    return 1
+end
+local active = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if active > tonumber(ARGV[4]) then
+    redis.call('DECR', KEYS[2])
+    return 2
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+local active = redis.call('DECR', KEYS[1])
+if active <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return active
+"""
+
+_REJECT_REASONS = {1: REJECT_RATE, 2: REJECT_CONCURRENT}
+
+
+@dataclass(frozen=True)
+class ThrottleLimits:
+    """Limits applied per client IP."""
+
+    max_per_window: int
+    rate_window: int
+    max_concurrent: int
+    concurrent_ttl: int
+
+
+class MemoryThrottleBackend:
+    """Process-local counters; only correct with a single ASGI worker."""
+
+    PRUNE_THRESHOLD = 4096
+
+    def __init__(self):
+        self._attempts: Dict[str, Tuple[int, float]] = {}
+        self._active: Dict[str, int] = {}
+
+    async def acquire(self, client_ip: str, limits: ThrottleLimits) -> Optional[str]:
+        now = time.monotonic()
+        attempts, expires_at = self._attempts.get(client_ip, (0, 0.0))
+        if expires_at <= now:
+            attempts, expires_at = 0, now + limits.rate_window
+            if len(self._attempts) > self.PRUNE_THRESHOLD:
+                self._attempts = {ip: entry for ip, entry in self._attempts.items() if entry[1] > now}
+        attempts += 1
+        self._attempts[client_ip] = (attempts, expires_at)
+        if attempts > limits.max_per_window:
+            return REJECT_RATE
+
+        active = self._active.get(client_ip, 0)
+        if active >= limits.max_concurrent:
+            return REJECT_CONCURRENT
+        self._active[client_ip] = active + 1
+        return None
+
+    async def release(self, client_ip: str) -> None:
+        active = self._active.get(client_ip, 0) - 1
+        if active > 0:
+            self._active[client_ip] = active
+        else:
+            self._active.pop(client_ip, None)
+
+    async def get_active(self, client_ip: str) -> int:
+        return self._active.get(client_ip, 0)
+
+
+class RedisThrottleBackend:
+    """Counters in Redis shared by all workers, updated by Lua scripts."""
+
+    KEY_PREFIX = 'ws_throttle'
+
+    def __init__(self, redis_url: Optional[str] = None, client=None):
+        if client is None:
+            import redis.asyncio as aioredis
+            client = aioredis.Redis.from_url(redis_url, decode_responses=True)
+        self.client = client
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+
+    def _rate_key(self, client_ip: str) -> str:
+        return f"{self.KEY_PREFIX}:rate:{client_ip}"
+
+    def _concurrent_key(self, client_ip: str) -> str:
+        return f"{self.KEY_PREFIX}:concurrent:{client_ip}"
+
+    async def acquire(self, client_ip: str, limits: ThrottleLimits) -> Optional[str]:
+        result = await self._acquire(
+            keys=[self._rate_key(client_ip), self._concurrent_key(client_ip)],
+            args=[limits.rate_window, limits.max_per_window, limits.concurrent_ttl, limits.max_concurrent],
+        )
+        return _REJECT_REASONS.get(int(result))
+
+    async def release(self, client_ip: str) -> None:
+        await self._release(keys=[self._concurrent_key(client_ip)])
+
+    async def get_active(self, client_ip: str) -> int:
+        return int(await self.client.get(self._concurrent_key(client_ip)) or 0)
@@ -17,6 +17,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
 
 django_asgi_app = get_asgi_application()
 
+from apps.ai_assistant.services.registry import warm_services
+
+warm_services()
+
 from apps.websockets.routing import websocket_urlpatterns
 from apps.websockets.middleware import AnonymousWebSocketMiddleware, ConnectionThrottleMiddleware
 
@@ -48,7 +48,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'base.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -409,7 +409,8 @@ if CHANNEL_LAYERS_REDIS_URL:
             'default': {
                 'BACKEND': 'channels_redis.core.RedisChannelLayer',
                 'CONFIG': {
-                    'hosts': [CHANNEL_LAYERS_REDIS_URL],
+                    # socket_timeout must exceed the layer's 5s blocking receive
+                    'hosts': [{'address': CHANNEL_LAYERS_REDIS_URL, 'socket_timeout': 10}],
                     'capacity': 1500,
                     'expiry': 60,
                 },
@@ -442,6 +443,39 @@ else:
     import logging
     logging.info("Using InMemory channels (Redis not configured)")
 
+# 'auto' fans out through the channel layer only when it spans processes (Redis)
+WEBSOCKET_BROADCAST_MODE = env('WEBSOCKET_BROADCAST_MODE', default='auto')
+# Frames buffered per connection (0 sends inline); policy: drop_oldest | coalesce | disconnect
+WEBSOCKET_OUTBOUND_QUEUE_SIZE = env.int('WEBSOCKET_OUTBOUND_QUEUE_SIZE', default=256)
+WEBSOCKET_SLOW_CONSUMER_POLICY = env('WEBSOCKET_SLOW_CONSUMER_POLICY', default='drop_oldest')
+# Opt-in: relay only the latest position per node once per tick while dragging
+WEBSOCKET_COALESCE_POSITIONS = env.bool('WEBSOCKET_COALESCE_POSITIONS', default=False)
+WEBSOCKET_COALESCE_TICK_HZ = env.float('WEBSOCKET_COALESCE_TICK_HZ', default=30.0)
+WEBSOCKET_COALESCE_MESSAGE_TYPES = env.list(
+    'WEBSOCKET_COALESCE_MESSAGE_TYPES',
+    default=['node_move', 'node_position', 'node_drag', 'cursor_position'],
+)
+
+# Behind a proxy (Railway, docker/nginx) the client address is the proxy's; use
+# X-Forwarded-For, trusting as many entries from the right as there are proxies
+WEBSOCKET_THROTTLE_USE_FORWARDED_FOR = env.bool('WEBSOCKET_THROTTLE_USE_FORWARDED_FOR', default=IS_RAILWAY)
+WEBSOCKET_THROTTLE_TRUSTED_PROXIES = env.int('WEBSOCKET_THROTTLE_TRUSTED_PROXIES', default=1)
+# Per-IP WebSocket connection limits, shared through Redis when a URL is set.
+# Off unless the client address is known: behind an unconfigured proxy every
+# client would share the proxy's limits
+WEBSOCKET_THROTTLE_ENABLED = env.bool('WEBSOCKET_THROTTLE_ENABLED', default=WEBSOCKET_THROTTLE_USE_FORWARDED_FOR)
+WEBSOCKET_THROTTLE_REDIS_URL = env('WEBSOCKET_THROTTLE_REDIS_URL', default=CACHE_REDIS_URL)
+WEBSOCKET_THROTTLE_MAX_CONCURRENT = env.int('WEBSOCKET_THROTTLE_MAX_CONCURRENT', default=50)
+WEBSOCKET_THROTTLE_MAX_PER_MINUTE = env.int('WEBSOCKET_THROTTLE_MAX_PER_MINUTE', default=100)
+WEBSOCKET_THROTTLE_CONCURRENT_TTL = env.int('WEBSOCKET_THROTTLE_CONCURRENT_TTL', default=3600)
+
+# Live diagram documents for active rooms, persisted write-behind (backend: memory | redis)
+DIAGRAM_SESSION_STORE_ENABLED = env.bool('DIAGRAM_SESSION_STORE_ENABLED', default=False)
+DIAGRAM_SESSION_BACKEND = env('DIAGRAM_SESSION_BACKEND', default='memory')
+DIAGRAM_SESSION_REDIS_URL = env('DIAGRAM_SESSION_REDIS_URL', default=CACHE_REDIS_URL)
+DIAGRAM_SESSION_FLUSH_INTERVAL = env.float('DIAGRAM_SESSION_FLUSH_INTERVAL', default=5.0)
+DIAGRAM_SESSION_JOURNAL_DIR = env('DIAGRAM_SESSION_JOURNAL_DIR', default=str(BASE_DIR / 'journal'))
+
 ASGI_APPLICATION = 'base.asgi.application'
 
 OPENAI_AZURE_API_KEY = env('OPENAI_AZURE_API_KEY', default='')
@@ -456,6 +490,107 @@ AI_ASSISTANT_ENABLED = env.bool('AI_ASSISTANT_ENABLED', default=True)
 AI_ASSISTANT_RATE_LIMIT = env('AI_ASSISTANT_RATE_LIMIT', default='10000/hour')
 AI_ASSISTANT_DEFAULT_MODEL = env('AI_ASSISTANT_DEFAULT_MODEL')
 
+# Diagram context rendered into LLM prompts: token budget and memo size
+AI_DIAGRAM_CONTEXT_TOKEN_BUDGET = env.int('AI_DIAGRAM_CONTEXT_TOKEN_BUDGET', default=6000)
+AI_DIAGRAM_CONTEXT_CACHE_SIZE = env.int('AI_DIAGRAM_CONTEXT_CACHE_SIZE', default=256)
+
+# Leaf digests remembered per content hash root, so repeated edits to a
+# diagram update its hash without rehashing the whole document
+AI_CONTENT_HASH_LEAF_CACHE_SIZE = env.int('AI_CONTENT_HASH_LEAF_CACHE_SIZE', default=64)
+
+# Single-flight coalescing of identical AI calls: cross-process lock TTL and
+# how long a waiting caller polls before computing on its own (seconds)
+AI_SINGLE_FLIGHT_LOCK_TTL = env.int('AI_SINGLE_FLIGHT_LOCK_TTL', default=120)
+AI_SINGLE_FLIGHT_WAIT_TIMEOUT = env.int('AI_SINGLE_FLIGHT_WAIT_TIMEOUT', default=90)
+
+# AI response cache: in-process LRU tier in front of the shared cache, zlib
+# compression threshold for shared values and SCAN batch size for clears
+AI_CACHE_LOCAL_MAX_ENTRIES = env.int('AI_CACHE_LOCAL_MAX_ENTRIES', default=1024)
+AI_CACHE_LOCAL_MAX_BYTES = env.int('AI_CACHE_LOCAL_MAX_BYTES', default=32 * 1024 * 1024)
+AI_CACHE_LOCAL_TTL = env.int('AI_CACHE_LOCAL_TTL', default=30)
+AI_CACHE_COMPRESS_MIN_BYTES = env.int('AI_CACHE_COMPRESS_MIN_BYTES', default=4096)
+AI_CACHE_CLEAR_BATCH_SIZE = env.int('AI_CACHE_CLEAR_BATCH_SIZE', default=500)
+
+# AI rate limiter storage: 'auto' uses the atomic Redis script when the cache
+# is django-redis, 'redis' forces it, 'cache' keeps the generic cache list
+AI_RATE_LIMIT_BACKEND = env('AI_RATE_LIMIT_BACKEND', default='auto')
+
+# Most commands accepted by the batch incremental-command endpoint
+AI_INCREMENTAL_BATCH_MAX_COMMANDS = env.int('AI_INCREMENTAL_BATCH_MAX_COMMANDS', default=50)
+
+# Threads for blocking model calls (Bedrock) awaited by the async AI views
+AI_LLM_THREAD_POOL_SIZE = env.int('AI_LLM_THREAD_POOL_SIZE', default=32)
+
+# Connection pools of the LLM clients: Bedrock (one client shared by Llama 4
+# and Nova) and Azure OpenAI, sized for the LLM and hedge pool threads
+AI_BEDROCK_MAX_POOL_CONNECTIONS = env.int('AI_BEDROCK_MAX_POOL_CONNECTIONS', default=64)
+AI_BEDROCK_CONNECT_TIMEOUT = env.float('AI_BEDROCK_CONNECT_TIMEOUT', default=5.0)
+AI_BEDROCK_READ_TIMEOUT = env.float('AI_BEDROCK_READ_TIMEOUT', default=60.0)
+AI_BEDROCK_MAX_ATTEMPTS = env.int('AI_BEDROCK_MAX_ATTEMPTS', default=3)
+AI_BEDROCK_RETRY_MODE = env('AI_BEDROCK_RETRY_MODE', default='adaptive')
+AI_OPENAI_MAX_CONNECTIONS = env.int('AI_OPENAI_MAX_CONNECTIONS', default=64)
+AI_OPENAI_MAX_KEEPALIVE_CONNECTIONS = env.int('AI_OPENAI_MAX_KEEPALIVE_CONNECTIONS', default=32)
+AI_OPENAI_KEEPALIVE_EXPIRY = env.float('AI_OPENAI_KEEPALIVE_EXPIRY', default=60.0)
+AI_OPENAI_CONNECT_TIMEOUT = env.float('AI_OPENAI_CONNECT_TIMEOUT', default=5.0)
+
+# Vision result cache: perceptual-hash distance (bits of 256) and thumbnail
+# difference under which an upload reuses an earlier result, entry TTL and
+# entries kept per index band
+AI_VISION_CACHE_ENABLED = env.bool('AI_VISION_CACHE_ENABLED', default=True)
+AI_VISION_CACHE_MAX_DISTANCE = env.int('AI_VISION_CACHE_MAX_DISTANCE', default=10)
+AI_VISION_CACHE_MAX_BLOCK_DIFF = env.float('AI_VISION_CACHE_MAX_BLOCK_DIFF', default=8.0)
+AI_VISION_CACHE_TTL = env.int('AI_VISION_CACHE_TTL', default=86400)
+AI_VISION_CACHE_BUCKET_SIZE = env.int('AI_VISION_CACHE_BUCKET_SIZE', default=32)
+
+# Vision image preprocessing: greyscale, margin cropping and the output
+# format ('auto' keeps the upload's PNG or JPEG) of images before they are
+# scaled to the model's working resolution and sent
+AI_IMAGE_PREPROCESSING_ENABLED = env.bool('AI_IMAGE_PREPROCESSING_ENABLED', default=True)
+AI_IMAGE_GRAYSCALE = env.bool('AI_IMAGE_GRAYSCALE', default=True)
+AI_IMAGE_CROP_MARGINS = env.bool('AI_IMAGE_CROP_MARGINS', default=True)
+AI_IMAGE_CROP_PADDING = env.int('AI_IMAGE_CROP_PADDING', default=16)
+AI_IMAGE_OUTPUT_FORMAT = env('AI_IMAGE_OUTPUT_FORMAT', default='auto')
+AI_IMAGE_JPEG_QUALITY = env.int('AI_IMAGE_JPEG_QUALITY', default=85)
+
+# Tiled vision extraction: image size (longer side, pixels) above which the
+# vision router extracts in tiles, tile cell size and overlap, most tiles per
+# image, threads for the tile calls of all requests and how often a tile
+# whose answer was cut off is split into quarters
+AI_VISION_TILING_ENABLED = env.bool('AI_VISION_TILING_ENABLED', default=True)
+AI_VISION_TILE_MIN_DIMENSION = env.int('AI_VISION_TILE_MIN_DIMENSION', default=2400)
+AI_VISION_TILE_SIZE = env.int('AI_VISION_TILE_SIZE', default=1280)
+AI_VISION_TILE_OVERLAP = env.int('AI_VISION_TILE_OVERLAP', default=256)
+AI_VISION_MAX_TILES = env.int('AI_VISION_MAX_TILES', default=16)
+AI_VISION_TILE_THREAD_POOL_SIZE = env.int('AI_VISION_TILE_THREAD_POOL_SIZE', default=8)
+AI_VISION_TILE_SPLIT_DEPTH = env.int('AI_VISION_TILE_SPLIT_DEPTH', default=1)
+
+# Build the shared AI services (OpenAI and Bedrock clients, model router)
+# when the ASGI/WSGI application loads instead of on the first request
+AI_WARM_SERVICES_AT_STARTUP = env.bool('AI_WARM_SERVICES_AT_STARTUP', default=True)
+
+# Hedged command calls: seconds before the fallback model also runs (0 for
+# every call), threads for the hedged calls and answers kept per model for
+# the p50/p95/p99 latencies in the health endpoint
+AI_HEDGE_ENABLED = env.bool('AI_HEDGE_ENABLED', default=True)
+AI_HEDGE_DELAY = env.float('AI_HEDGE_DELAY', default=6.0)
+AI_HEDGE_THREAD_POOL_SIZE = env.int('AI_HEDGE_THREAD_POOL_SIZE', default=32)
+AI_HEDGE_STATS_WINDOW = env.int('AI_HEDGE_STATS_WINDOW', default=500)
+
+# Circuit breaker per AI model, shared through the cache: rolling window
+# (seconds and buckets), minimum calls before judging, failure and slow-call
+# rates that open the circuit, and how long it stays open before a probe
+AI_CIRCUIT_ENABLED = env.bool('AI_CIRCUIT_ENABLED', default=True)
+AI_CIRCUIT_WINDOW = env.int('AI_CIRCUIT_WINDOW', default=60)
+AI_CIRCUIT_BUCKETS = env.int('AI_CIRCUIT_BUCKETS', default=6)
+AI_CIRCUIT_MIN_CALLS = env.int('AI_CIRCUIT_MIN_CALLS', default=5)
+AI_CIRCUIT_FAILURE_RATE = env.float('AI_CIRCUIT_FAILURE_RATE', default=0.5)
+AI_CIRCUIT_SLOW_CALL_SECONDS = env.float('AI_CIRCUIT_SLOW_CALL_SECONDS', default=30.0)
+AI_CIRCUIT_SLOW_CALL_RATE = env.float('AI_CIRCUIT_SLOW_CALL_RATE', default=0.8)
+AI_CIRCUIT_OPEN_SECONDS = env.int('AI_CIRCUIT_OPEN_SECONDS', default=30)
+
+# AI answers streamed at once on one diagram WebSocket (ai_request frames)
+AI_WS_STREAMS_PER_CONNECTION = env.int('AI_WS_STREAMS_PER_CONNECTION', default=2)
+
 COMMAND_PROCESSING_MODELS = {
     'llama4-maverick': {
         'name': 'Llama 4 Maverick 17B',
@@ -10,6 +10,7 @@ from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from apps.websockets.outbound import get_outbound_stats
 from .api_schema import api_schema_view
 
 
@@ -40,7 +41,8 @@ def get_spectacular_urls():
             'properties': {
                 'status': {'type': 'string'},
                 'timestamp': {'type': 'string', 'format': 'date-time'},
-                'version': {'type': 'string'}
+                'version': {'type': 'string'},
+                'websocket_outbound': {'type': 'object'}
             }
         }
     }
@@ -52,7 +54,8 @@ def api_health_check(request):
     return Response({
         'status': 'healthy',
         'timestamp': timezone.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'websocket_outbound': get_outbound_stats()
     })
 
 
@@ -6,3 +6,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
 
 application = get_wsgi_application()
+
+from apps.ai_assistant.services.registry import warm_services  # noqa: E402
+
+warm_services()
@@ -0,0 +1,117 @@
+"""
+Shared bootstrap for the benchmark scripts.
+
+Benchmarks run outside the test runner, so this module prepares the Django
+environment and provides a local Redis server for the code paths that need
+one.
+"""
+
+import atexit
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    """Configure settings and call django.setup() for a standalone script."""
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+
+    os.makedirs(os.path.join(PROJECT_ROOT, 'logs'), exist_ok=True)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
+    os.environ.setdefault('AI_ASSISTANT_DEFAULT_MODEL', 'llama4-maverick')
+
+    import django
+    django.setup()
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _redis_server_executable():
+    executable = shutil.which('redis-server')
+    if executable:
+        return executable
+    try:
+        import redislite
+        return redislite.__redis_executable__
+    except ImportError:
+        return None
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"redis-server did not start on port {port}")
+
+
+def start_redis_server():
+    """
+    Provide a Redis server for the benchmark.
+
+    Uses BENCH_REDIS_URL when set, otherwise spawns a throwaway local
+    redis-server (from PATH or the redislite package). When no binary is
+    available it falls back to fakeredis' TCP server, which is fine for
+    request/response commands but can lose wakeups of blocking pops under
+    concurrency (channel layer receive).
+
+    Returns:
+        Redis URL of the running server
+    """
+    if os.environ.get('BENCH_REDIS_URL'):
+        return os.environ['BENCH_REDIS_URL']
+
+    port = _free_port()
+    executable = _redis_server_executable()
+    if executable:
+        process = subprocess.Popen(
+            [executable, '--port', str(port), '--save', '', '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        atexit.register(process.terminate)
+        _wait_for_port(port)
+        return f"redis://127.0.0.1:{port}/0"
+
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile (0-100) of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize_ms(samples):
+    """Format latency samples (seconds) as a p50/p95/p99 summary in ms."""
+    if not samples:
+        return "n/a"
+    return (
+        f"p50={percentile(samples, 50) * 1000:.2f}ms "
+        f"p95={percentile(samples, 95) * 1000:.2f}ms "
+        f"p99={percentile(samples, 99) * 1000:.2f}ms "
+        f"mean={statistics.mean(samples) * 1000:.2f}ms"
+    )
@@ -0,0 +1,267 @@
+"""
+Concurrency of the incremental-command endpoint against a fake LLM server.
+
+A local asyncio HTTP server answers Azure OpenAI chat completions after
+--latency seconds and records how many requests it is serving at once.
+--requests commands that need the AI fallback (distinct, so neither the
+cache nor single-flight collapses them) are sent at the same time through
+Django's ASGIHandler, the application daphne runs, in two modes:
+
+- sync: a DRF @api_view calling IncrementalCommandProcessor.process_command,
+  i.e. the endpoint before it became async; Django gives each request its
+  own thread, blocked for the whole LLM call
+- async: the async process_incremental_command view on AsyncAzureOpenAI
+
+Reported per mode: throughput, the peak number of LLM calls in flight as
+seen by the fake server, the peak thread count of the process and request
+latency. Django's ASGIHandler opens one thread per request for the sync
+middleware hooks in both modes, so the thread peak is similar; in async mode
+those threads sit idle while the model answers instead of running the call.
+
+Usage:
+    python -m benchmarks.bench_async_llm --requests 200 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from benchmarks._support import setup_django, summarize_ms
+
+os.environ.setdefault('OPENAI_AZURE_API_KEY', 'bench-key')
+os.environ.setdefault('OPENAI_AZURE_API_BASE', 'http://127.0.0.1:9')
+os.environ['AI_ASSISTANT_DEFAULT_MODEL'] = 'gpt-4o'
+setup_django()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.urls import path  # noqa: E402
+from rest_framework.decorators import api_view, permission_classes  # noqa: E402
+from rest_framework.permissions import AllowAny  # noqa: E402
+from rest_framework.response import Response  # noqa: E402
+
+from apps.ai_assistant import views  # noqa: E402
+from apps.ai_assistant.services import IncrementalCommandProcessor  # noqa: E402
+
+DIAGRAM = {
+    'nodes': [
+        {'id': f'class-{index}', 'data': {'label': f'Entity{index}', 'attributes': [], 'methods': []}}
+        for index in range(20)
+    ],
+    'edges': [],
+}
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def sync_incremental_command(request):
+    delta = IncrementalCommandProcessor().process_command(
+        command=request.data['command'],
+        diagram_id='bench',
+        current_diagram=request.data['current_diagram'],
+        session_id=request.data['session_id'],
+    )
+    return Response({'success': True, 'delta': delta})
+
+
+# This module is the ROOT_URLCONF while the benchmark runs
+urlpatterns = [
+    path('sync/', sync_incremental_command),
+    path('async/', views.process_incremental_command),
+]
+
+
+class FakeLLMServer:
+    """Minimal HTTP/1.1 server answering every request with a chat completion."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self.served = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True).start()
+        self._ready.wait()
+        return f"http://127.0.0.1:{self.port}"
+
+    def reset(self):
+        self.peak = self.served = 0
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, '127.0.0.1', 0, backlog=2048)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':', 1)[1])
+                await reader.readexactly(length)
+
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.active -= 1
+                self.served += 1
+
+                body = json.dumps(self._completion()).encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _completion(self):
+        delta = {
+            'action': 'update_node',
+            'node_id': 'class-0',
+            'changes': {'data.isAbstract': {'operation': 'replace', 'value': True}},
+            'description': 'Made Entity0 abstract',
+        }
+        return {
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'gpt-4o',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': json.dumps(delta)},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120},
+        }
+
+
+async def post(app, url, payload):
+    body = json.dumps(payload).encode()
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': url,
+        'raw_path': url.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 50000),
+        'server': ('127.0.0.1', 8000),
+    }
+    request_messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        if request_messages:
+            return request_messages.pop()
+        # The client never disconnects; Django cancels this wait itself
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def sample_threads(stop, peak):
+    while not stop.is_set():
+        peak[0] = max(peak[0], threading.active_count())
+        time.sleep(0.005)
+
+
+async def send_commands(app, mode, count, tag):
+    """Send count distinct AI-fallback commands at once; return statuses and latencies."""
+    latencies = []
+
+    async def one(index):
+        start = time.perf_counter()
+        status = await post(app, f'/{mode}/', {
+            'command': f'make Entity0 abstract ({tag} #{index})',
+            'current_diagram': DIAGRAM,
+            'session_id': f'bench-{tag}-{index}',
+        })
+        latencies.append(time.perf_counter() - start)
+        return status
+
+    statuses = await asyncio.gather(*[one(index) for index in range(count)])
+    return statuses, latencies
+
+
+async def run(app, mode, requests, warmup, server):
+    run_id = time.time_ns()
+    # First calls pay one-off costs (imports, tokenizer and client setup)
+    await send_commands(app, mode, warmup, f'{mode}-warmup-{run_id}')
+    server.reset()
+
+    stop, thread_peak = threading.Event(), [threading.active_count()]
+    sampler = threading.Thread(target=sample_threads, args=(stop, thread_peak), daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    statuses, latencies = await send_commands(app, mode, requests, f'{mode}-{run_id}')
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    failed = sum(status != 200 for status in statuses)
+    print(
+        f"{mode:>5}: {requests / elapsed:7.1f} req/s  elapsed={elapsed:.2f}s  "
+        f"peak_llm_in_flight={server.peak:4d}  peak_threads={thread_peak[0]:4d}  failed={failed}"
+    )
+    print(f"       latency {summarize_ms(latencies)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5, help='fake LLM response time in seconds')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests sent first')
+    parser.add_argument('--modes', default='sync,async')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    server = FakeLLMServer(args.latency)
+    api_base = server.start()
+    caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-async-llm'}}
+
+    with override_settings(
+        ROOT_URLCONF='benchmarks.bench_async_llm',
+        CACHES=caches,
+        OPENAI_AZURE_API_BASE=api_base,
+        ALLOWED_HOSTS=['*'],
+        SECURE_SSL_REDIRECT=False,
+    ):
+        app = get_asgi_application()
+        print(f"{args.requests} concurrent AI-fallback commands, fake LLM latency {args.latency * 1000:.0f}ms")
+        for mode in args.modes.split(','):
+            asyncio.run(run(app, mode, args.requests, args.warmup, server))
+
+
+if __name__ == '__main__':
+    main()
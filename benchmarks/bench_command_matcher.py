@@ -0,0 +1,151 @@
+"""
+Command matching throughput: per-language regex loop versus the combined matcher.
+
+Generates a corpus of English and Spanish commands covering every rule of
+IncrementalCommandProcessor (with varied class, attribute and type names,
+casing and a share of polite prefixes) plus free-form commands that no rule
+matches and fall through to the AI. Times, over the whole corpus:
+
+- loop: the previous implementation, detect_language() followed by each
+  pattern of that language in turn
+- combined: command_patterns.match_command(), a keyword prefilter and one
+  precompiled alternation per keyword covering both languages
+
+and reports commands per second for each, and how many commands the two
+resolve to a different rule or different groups.
+
+Usage:
+    python -m benchmarks.bench_command_matcher --size 20000 --rounds 5
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks._support import setup_django
+
+setup_django()
+
+from apps.ai_assistant.services.command_patterns import (  # noqa: E402
+    detect_language,
+    get_command_patterns,
+    match_command,
+)
+
+CLASSES = ['User', 'Order', 'Product', 'Invoice', 'Customer', 'Cliente', 'Pedido', 'Factura', 'Producto']
+FIELDS = ['email', 'name', 'total', 'fecha', 'precio', 'createdAt', 'status', 'cantidad']
+TYPES = ['String', 'int', 'Long', 'Date', 'boolean', 'Double']
+RELATIONS_EN = ['association', 'aggregation', 'composition', 'inheritance']
+RELATIONS_ES = ['asociacion', 'agregacion', 'composicion', 'herencia']
+
+TEMPLATES_EN = [
+    "add attribute {f} ({t}) to class {c}",
+    "remove attribute {f} from class {c}",
+    "change attribute {f} in class {c} to {f2} ({t})",
+    "add method {f}({f2}: {t}) returning {t} to class {c}",
+    "remove method {f} from class {c}",
+    "add {r} relationship from {c} to {c2} with multiplicity 1..*",
+    "add {r} from {c} to {c2}",
+    "remove relationship between {c} and {c2}",
+    "rename class {c} to {c2}",
+    "change visibility of {f} in class {c} to public",
+]
+
+TEMPLATES_ES = [
+    "agregar atributo {f} ({t}) a clase {c}",
+    "eliminar atributo {f} de clase {c}",
+    "cambiar atributo {f} en clase {c} a {f2} ({t})",
+    "agregar método {f}({f2}: {t}) retornando {t} a clase {c}",
+    "eliminar metodo {f} de clase {c}",
+    "agregar {r} relación de {c} a {c2} con multiplicidad 0..1",
+    "eliminar relación entre {c} y {c2}",
+    "renombrar clase {c} a {c2}",
+    "cambiar visibilidad de {f} en clase {c} a privado",
+]
+
+UNMATCHED = [
+    "Create class {c} with name string and age int",
+    "{c} has many {c2}s",
+    "Admin extends {c}",
+    "Crear clase {c} con atributos nombre y edad",
+    "ice cream shop database with {c} and {c2}",
+    "make {c} abstract and move {f} to {c2}",
+    "haz que {c} herede de {c2}",
+]
+
+PREFIXES = ['', '', '', 'please ', 'por favor ']
+
+
+def build_corpus(size, seed=7):
+    rng = random.Random(seed)
+    templates = TEMPLATES_EN + TEMPLATES_ES + UNMATCHED
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(templates)
+        relations = RELATIONS_ES if template in TEMPLATES_ES else RELATIONS_EN
+        command = rng.choice(PREFIXES) + template.format(
+            f=rng.choice(FIELDS), f2=rng.choice(FIELDS), t=rng.choice(TYPES),
+            c=rng.choice(CLASSES), c2=rng.choice(CLASSES), r=rng.choice(relations),
+        )
+        if rng.random() < 0.2:
+            command = command.upper() if rng.random() < 0.5 else command.capitalize()
+        corpus.append(command)
+    return corpus
+
+
+def loop_match(command):
+    language = detect_language(command)
+    for name, pattern in get_command_patterns(language).items():
+        match = pattern.search(command)
+        if match:
+            return language, name, match.groups()
+    return None
+
+
+def combined_match(command):
+    command_match = match_command(command)
+    if command_match is None:
+        return None
+    return command_match.language, command_match.rule, command_match.match.groups()
+
+
+def throughput(func, corpus, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for command in corpus:
+            func(command)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size)
+    loop_results = [loop_match(command) for command in corpus]
+    combined_results = [combined_match(command) for command in corpus]
+
+    matched = sum(result is not None for result in combined_results)
+    differing = [
+        (command, before, after)
+        for command, before, after in zip(corpus, loop_results, combined_results)
+        if before != after
+    ]
+
+    loop_rate = throughput(loop_match, corpus, args.rounds)
+    combined_rate = throughput(combined_match, corpus, args.rounds)
+
+    print(f"corpus: {len(corpus)} commands, {matched} matched by a rule, {len(differing)} resolved differently")
+    print(f"{'matcher':<10} {'commands/s':>12}")
+    print(f"{'loop':<10} {loop_rate:>12.0f}")
+    print(f"{'combined':<10} {combined_rate:>12.0f}  ({combined_rate / loop_rate:.1f}x)")
+    for command, before, after in differing[:5]:
+        print(f"  {command!r}: loop={before} combined={after}")
+
+
+if __name__ == '__main__':
+    main()
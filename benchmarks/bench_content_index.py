@@ -0,0 +1,158 @@
+"""
+Element lookups on UMLDiagram content: linear scans versus the content index.
+
+Builds synthetic React Flow documents with N classes (and N-1 relationships
+chaining them) and times, per size:
+
+- get_element_by_id for a relationship id (worst case for the scan, which
+  walks every class first)
+- update_element on a relationship
+- a case-insensitive label lookup
+
+The "scan" column reproduces the list-rebuild-and-scan implementation the
+model used before the index; "index" uses the model methods. Instances are
+never saved: save() is replaced with a no-op so only the content work is
+measured.
+
+Usage:
+    python -m benchmarks.bench_content_index --sizes 10 100 1000 10000
+"""
+
+import argparse
+import time
+
+from benchmarks._support import setup_django
+
+setup_django()
+
+from apps.uml_diagrams.content_index import _class_from_node, _relationship_from_edge  # noqa: E402
+from apps.uml_diagrams.models import UMLDiagram  # noqa: E402
+
+
+def synthetic_content(classes):
+    return {
+        'nodes': [
+            {'id': f"class-{index}", 'type': 'class', 'position': {'x': index * 10, 'y': 0},
+             'data': {'label': f"Class{index}", 'attributes': [], 'methods': []}}
+            for index in range(classes)
+        ],
+        'edges': [
+            {'id': f"edge-{index}", 'type': 'umlRelationship', 'source': f"class-{index}",
+             'target': f"class-{index + 1}", 'data': {'relationshipType': 'ASSOCIATION'}}
+            for index in range(classes - 1)
+        ],
+    }
+
+
+def make_diagram(classes):
+    diagram = UMLDiagram(title='bench', content=synthetic_content(classes))
+    diagram.save = lambda *args, **kwargs: None
+    return diagram
+
+
+def scan_classes(content):
+    return content.get('classes') or [
+        _class_from_node(node) for node in content.get('nodes', []) if node.get('type') == 'class'
+    ]
+
+
+def scan_relationships(content):
+    return content.get('relationships') or [
+        _relationship_from_edge(edge) for edge in content.get('edges', []) if edge.get('type') == 'umlRelationship'
+    ]
+
+
+def scan_get_element_by_id(content, element_id):
+    for cls in scan_classes(content):
+        if cls.get('id') == element_id:
+            return cls
+    for rel in scan_relationships(content):
+        if rel.get('id') == element_id:
+            return rel
+    return None
+
+
+def scan_update_element(content, element_id, element_data):
+    classes = scan_classes(content)
+    for i, cls in enumerate(classes):
+        if cls.get('id') == element_id:
+            classes[i] = {**cls, **element_data}
+            content['classes'] = classes
+            return True
+    relationships = scan_relationships(content)
+    for i, rel in enumerate(relationships):
+        if rel.get('id') == element_id:
+            relationships[i] = {**rel, **element_data}
+            content['relationships'] = relationships
+            return True
+    return False
+
+
+def scan_find_by_label(content, label):
+    label = label.lower()
+    for cls in scan_classes(content):
+        if str(cls.get('name', '')).lower() == label:
+            return cls
+    return None
+
+
+def time_per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(size, iterations):
+    target_edge = f"edge-{max(size - 2, 0)}"
+    target_label = f"class{size - 1}"
+    scan_content = synthetic_content(size)
+    diagram = make_diagram(size)
+
+    start = time.perf_counter()
+    diagram.content_index
+    build_us = (time.perf_counter() - start) * 1e6
+
+    rows = [
+        ('get_element_by_id',
+         time_per_call(lambda: scan_get_element_by_id(scan_content, target_edge), iterations),
+         time_per_call(lambda: diagram.get_element_by_id(target_edge), iterations)),
+        ('find_by_label',
+         time_per_call(lambda: scan_find_by_label(scan_content, target_label), iterations),
+         time_per_call(lambda: diagram.find_class_by_label(target_label), iterations)),
+    ]
+
+    # An edit followed by a read, as in an editing session: the index is
+    # patched in place, the scan rebuilds its lists for both calls
+    def scan_edit_then_read():
+        scan_update_element(scan_content, target_edge, {'label': 'x'})
+        scan_get_element_by_id(scan_content, target_edge)
+
+    def index_edit_then_read():
+        diagram.update_element(target_edge, {'label': 'x'})
+        diagram.get_element_by_id(target_edge)
+
+    edit_iterations = max(1, iterations // 10)
+    rows.append(('update+read',
+                 time_per_call(scan_edit_then_read, edit_iterations),
+                 time_per_call(index_edit_then_read, edit_iterations)))
+    return build_us, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'classes':>8} {'operation':<18} {'scan us':>12} {'index us':>12} {'speedup':>9}")
+    for size in args.sizes:
+        iterations = max(5, args.iterations * 100 // max(size, 100))
+        build_us, rows = run(size, iterations)
+        print(f"{size:>8} {'index build':<18} {'':>12} {build_us:>12.1f}")
+        for name, scan_us, index_us in rows:
+            print(f"{size:>8} {name:<18} {scan_us:>12.1f} {index_us:>12.1f} {scan_us / index_us:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Bytes sent and end-to-end latency of vision calls with and without image
+preprocessing.
+
+Runs NovaVisionService.process_uml_diagram on a corpus of synthetic UML
+diagrams as users upload them:
+
+- screenshot: 1200x800 PNG
+- retina: the same diagram at 2x, 2400x1600 PNG
+- 4k: at 3.2x, 3840x2560 PNG
+- margins: a 1200x800 diagram on a 3000x2200 white canvas, PNG
+- photo: a 4000x3000 JPEG (quality 90) with sensor noise and a grey cast
+
+The Bedrock client points at a local server that reads the request, waits
+--latency seconds for the model and len(body) / --uplink-mbps for the
+upload, since the request body is what travels to the region. Image tokens,
+and with them the model's time and cost, grow with the pixels sent;
+--ms-per-megapixel adds that time (0 by default, the stub has no real
+model). Reports per kind the request body size, the image size and
+megapixels sent and the end-to-end latency (validation, preprocessing, JSON
+encoding and the simulated transfer), with AI_IMAGE_PREPROCESSING_ENABLED
+off and on.
+
+Usage:
+    python -m benchmarks.bench_image_preprocessing --repeat 3 --uplink-mbps 20
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks._support import setup_django, summarize_ms
+
+setup_django()
+
+import boto3  # noqa: E402
+from django.conf import settings  # noqa: E402
+from PIL import Image, ImageChops  # noqa: E402
+
+from apps.ai_assistant.services.image_preprocessing import ImagePreprocessor  # noqa: E402
+from apps.ai_assistant.services.nova_vision_service import NovaVisionService  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from test_vision_cache import draw_diagram  # noqa: E402
+
+ANSWER = json.dumps({
+    'output': {'message': {'content': [{'text': '{"nodes": [{"id": "User"}], "edges": []}'}]}},
+    'usage': {'inputTokens': 1500, 'outputTokens': 300},
+}).encode()
+
+
+def make_handler(latency, uplink_mbps, ms_per_megapixel):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            model_time = latency
+            if ms_per_megapixel:
+                image = json.loads(body)['messages'][0]['content'][0]['image']
+                width, height = Image.open(io.BytesIO(base64.b64decode(image['source']['bytes']))).size
+                model_time += width * height / 1_000_000 * ms_per_megapixel / 1000
+            time.sleep(model_time + length * 8 / (uplink_mbps * 1_000_000))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(ANSWER)))
+            self.end_headers()
+            self.wfile.write(ANSWER)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def encode(image, image_format='PNG', **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def build_corpus(seed):
+    diagram = draw_diagram(seed)
+    canvas = Image.new('RGB', (3000, 2200), 'white')
+    canvas.paste(diagram, (700, 500))
+    photo = diagram.resize((4000, 3000), Image.LANCZOS)
+    noise = Image.merge('RGB', [Image.effect_noise(photo.size, 12)] * 3)
+    photo = ImageChops.multiply(photo, Image.new('RGB', photo.size, (225, 220, 210)))
+    photo = ImageChops.blend(photo, ImageChops.multiply(photo, noise), 0.15)
+    return {
+        'screenshot': encode(diagram),
+        'retina': encode(diagram.resize((2400, 1600), Image.LANCZOS)),
+        '4k': encode(diagram.resize((3840, 2560), Image.LANCZOS)),
+        'margins': encode(canvas),
+        'photo': encode(photo, 'JPEG', quality=90),
+    }
+
+
+class MeasuredClient:
+    """Bedrock client wrapper that keeps the size of each request body."""
+
+    def __init__(self, client):
+        self.client = client
+        self.body_bytes = 0
+
+    def invoke_model(self, body, **kwargs):
+        self.body_bytes = len(body)
+        return self.client.invoke_model(body=body, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=3, help='diagrams per kind')
+    parser.add_argument('--latency', type=float, default=0.2, help='model time per call, seconds')
+    parser.add_argument('--uplink-mbps', type=float, default=20.0)
+    parser.add_argument('--ms-per-megapixel', type=float, default=0.0, help='model time per megapixel sent')
+    args = parser.parse_args()
+
+    handler = make_handler(args.latency, args.uplink_mbps, args.ms_per_megapixel)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service = NovaVisionService.__new__(NovaVisionService)
+    service.client = MeasuredClient(boto3.client(
+        'bedrock-runtime',
+        region_name='us-east-1',
+        endpoint_url=f"http://127.0.0.1:{server.server_address[1]}",
+        aws_access_key_id='bench-key',
+        aws_secret_access_key='bench-secret',
+    ))
+
+    corpora = [build_corpus(seed) for seed in range(args.repeat)]
+    print(
+        f"uplink={args.uplink_mbps}Mbit/s model latency={args.latency * 1000:.0f}ms "
+        f"+{args.ms_per_megapixel:.0f}ms/MP diagrams per kind={args.repeat}"
+    )
+    for enabled in (False, True):
+        settings.AI_IMAGE_PREPROCESSING_ENABLED = enabled
+        ImagePreprocessor.reset_stats()
+        print(f"\npreprocessing {'on' if enabled else 'off'}")
+        for kind in corpora[0]:
+            body_bytes, samples, sizes, megapixels = [], [], set(), []
+            for corpus in corpora:
+                start = time.perf_counter()
+                result = service.process_uml_diagram(corpus[kind])
+                samples.append(time.perf_counter() - start)
+                body_bytes.append(service.client.body_bytes)
+                width, height = result['metadata']['image']['size']
+                sizes.add(f"{width}x{height}")
+                megapixels.append(width * height / 1_000_000)
+            print(
+                f"  {kind:>10} sent={sum(body_bytes) / len(body_bytes) / 1024:>5.0f}KiB "
+                f"{sum(megapixels) / len(megapixels):.1f}MP {summarize_ms(samples)}"
+            )
+            print(f"  {'':>10} size={','.join(sorted(sizes))}")
+        if enabled:
+            print(f"  {ImagePreprocessor.get_stats()}")
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+JSON extraction from model output: Llama 4's strategy cascade versus the shared extractor.
+
+Runs over the corpus of malformed generations in
+tests/data/llm_generations.jsonl plus --large synthetic answers of
+--elements elements each (the size of a full-diagram generation), in two
+modes:
+
+- legacy: Llama4CommandService._parse_response before the extractor, i.e.
+  adding missing braces, then trying complete extraction, direct parse,
+  brace counting from every "{", markdown and regex extraction and the
+  last-valid-object scan in turn
+- extractor: json_stream.extract_json(), one scan plus one json.loads
+
+For each mode it reports how many corpus entries yield the expected number
+of elements and the time per parse for the corpus and the large answers.
+Corpus entries are parsed with the keys each service requires, so the
+legacy cascade is only a baseline for the command entries.
+
+Usage:
+    python -m benchmarks.bench_json_extraction --rounds 200 --elements 40
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+from benchmarks._support import PROJECT_ROOT, setup_django, summarize_ms
+
+setup_django()
+
+from apps.ai_assistant.services.json_stream import extract_json  # noqa: E402
+
+CORPUS_PATH = os.path.join(PROJECT_ROOT, 'tests', 'data', 'llm_generations.jsonl')
+
+LLAMA4_TAGS = (
+    '<|eot_id|>', '<|begin_of_text|>', '<|start_header_id|>assistant<|end_header_id|>',
+    '<|start_header_id|>user<|end_header_id|>', '<|end_header_id|>',
+)
+
+
+def strip_tags(text):
+    for tag in LLAMA4_TAGS:
+        text = text.replace(tag, '')
+    return text.strip()
+
+
+def _balanced_from(text, start):
+    depth, in_string, escape = 0, False, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if escape:
+            escape = False
+            continue
+        if char == '\\':
+            escape = True
+            continue
+        if char == '"':
+            in_string = not in_string
+            continue
+        if not in_string:
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+    return None
+
+
+def _complete_extraction(text):
+    action = text.find('"action"')
+    if action == -1:
+        return None
+    start = next((i for i in range(action - 1, max(0, action - 100) - 1, -1) if text[i] == '{'), 0)
+    candidate = _balanced_from(text, start)
+    if candidate is None:
+        return None
+    parsed = json.loads(candidate)
+    return parsed if 'action' in parsed and isinstance(parsed.get('elements'), list) else None
+
+
+def _brace_counting(text):
+    for start in [i for i, char in enumerate(text) if char == '{']:
+        candidate = _balanced_from(text, start)
+        if candidate is None:
+            continue
+        try:
+            parsed = json.loads(candidate)
+        except ValueError:
+            continue
+        if 'action' in parsed and 'elements' in parsed:
+            return parsed
+    return None
+
+
+def _markdown(text):
+    match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
+    return json.loads(match.group(1)) if match else None
+
+
+def _json_block(text):
+    for pattern in (r'\{[^{}]*"action"[^{}]*"elements"[^{}]*\}', r'\{.*?"action".*?\}'):
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except ValueError:
+                continue
+    return None
+
+
+def _last_valid(text):
+    braces = sorted(
+        [(m.start(), '{') for m in re.finditer(r'\{', text)] + [(m.start(), '}') for m in re.finditer(r'\}', text)],
+        reverse=True,
+    )
+    for end, char in braces:
+        if char == '}':
+            for start, other in braces:
+                if other == '{' and start < end:
+                    try:
+                        return json.loads(text[start:end + 1])
+                    except ValueError:
+                        continue
+    return None
+
+
+def legacy_parse(text, required):
+    """The strategy cascade of Llama4CommandService._parse_response, without logging."""
+    cleaned = strip_tags(text)
+    if not cleaned.startswith('{'):
+        cleaned = '{' + cleaned
+    if not cleaned.endswith('}'):
+        cleaned = cleaned + '}'
+    strategies = (
+        _complete_extraction, lambda t: json.loads(t.strip()), _brace_counting,
+        _markdown, _json_block, _last_valid,
+    )
+    for strategy in strategies:
+        try:
+            result = strategy(cleaned)
+        except Exception:
+            continue
+        if isinstance(result, dict) and all(key in result for key in required):
+            return result
+    return None
+
+
+def extractor_parse(text, required, item_keys):
+    cleaned = strip_tags(text)
+    if cleaned.startswith('"'):
+        cleaned = '{' + cleaned
+    return extract_json(cleaned, required_keys=required, item_keys=item_keys)
+
+
+def large_answer(elements, seed):
+    nodes = [{
+        'type': 'node',
+        'data': {
+            'id': f'class-{seed}-{index}',
+            'data': {
+                'label': f'Entity{index}',
+                'nodeType': 'class',
+                'attributes': [
+                    {'id': f'attr-{index}-{field}', 'name': field, 'type': 'Map<String, List<Item>>', 'visibility': 'private'}
+                    for field in ('id', 'name', 'createdAt', 'status')
+                ],
+                'methods': [{'id': f'method-{index}', 'name': 'find', 'returnType': 'Optional<{T}>'}],
+            },
+            'position': {'x': 300 * (index % 5), 'y': 200 * (index // 5)},
+        },
+    } for index in range(elements)]
+    body = json.dumps({'action': 'create_class', 'elements': nodes, 'confidence': 0.9,
+                       'interpretation': 'Created the domain model'}, indent=2)
+    return 'Here is the diagram:\n```json\n' + body + '\n```\n'
+
+
+def time_parses(parse, texts, rounds):
+    samples = []
+    for _ in range(rounds):
+        for text, args in texts:
+            start = time.perf_counter()
+            parse(text, *args)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--elements', type=int, default=40, help='elements per large answer')
+    parser.add_argument('--large', type=int, default=5, help='number of large answers')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+        corpus = [json.loads(line) for line in corpus_file if line.strip()]
+
+    def items(entry, result):
+        return None if result is None else sum(len(result.get(key, [])) for key in entry['item_keys'])
+
+    def expected(entry):
+        return None if entry['expect'] is None else entry['expect']['items']
+
+    legacy_ok = extractor_ok = 0
+    print(f"{'entry':38} {'expected':>8} {'legacy':>7} {'extractor':>9}")
+    for entry in corpus:
+        legacy = items(entry, legacy_parse(entry['text'], entry['required']))
+        extracted = items(entry, extractor_parse(entry['text'], entry['required'], entry['item_keys']))
+        legacy_ok += legacy == expected(entry)
+        extractor_ok += extracted == expected(entry)
+        print(f"{entry['name']:38} {str(expected(entry)):>8} {str(legacy):>7} {str(extracted):>9}")
+    print(f"{'correct':38} {len(corpus):>8} {legacy_ok:>7} {extractor_ok:>9}\n")
+
+    corpus_texts = [(entry['text'], (entry['required'],)) for entry in corpus]
+    large = [large_answer(args.elements, seed) for seed in range(args.large)]
+    large_texts = [(text, (('action', 'elements'),)) for text in large]
+    truncated_texts = [(text[:int(len(text) * 0.8)], (('action', 'elements'),)) for text in large]
+    print(f"large answers: {len(large[0]) // 1024} KiB, {args.elements} elements; truncated at 80%")
+
+    for name, texts in (('corpus', corpus_texts), ('large', large_texts), ('large truncated', truncated_texts)):
+        legacy = time_parses(legacy_parse, texts, args.rounds)
+        extractor = time_parses(
+            lambda text, required: extractor_parse(text, required, ('elements',)), texts, args.rounds
+        )
+        print(f"{name:>16} legacy    {summarize_ms(legacy)}")
+        print(f"{'':>16} extractor {summarize_ms(extractor)}")
+
+
+if __name__ == '__main__':
+    main()
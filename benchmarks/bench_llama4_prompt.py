@@ -0,0 +1,112 @@
+"""
+Prompt build time and size for Llama4CommandService.
+
+Builds the command prompt for the example commands used in the README, the
+service tests and the prompt's own few-shot examples, against no diagram,
+the three-class diagram from those examples and a synthetic 200-class
+diagram. Reports the static prefix and per-section token counts once, then
+per command the tail tokens, total tokens and build time (first build and
+warm average).
+
+Token counts use the shared tiktoken encoding, or a length estimate when
+its encoding files are not available.
+
+Usage:
+    python -m benchmarks.bench_llama4_prompt --iterations 200
+"""
+
+import argparse
+import time
+
+from benchmarks._support import setup_django
+
+setup_django()
+
+from apps.ai_assistant.services.diagram_context import clear_diagram_context_cache, count_tokens  # noqa: E402
+from apps.ai_assistant.services.llama4_command_service import Llama4CommandService  # noqa: E402
+from apps.ai_assistant.services.llama4_prompt import STATIC_PREFIX, get_section_token_counts  # noqa: E402
+
+EXAMPLE_COMMANDS = [
+    "Create class User with name string and age int",
+    "Add method calculateAge to User class",
+    "Create class Product",
+    "User has many Orders",
+    "Admin extends User",
+    "Crear clase Usuario",
+    "Add attribute price to Service class",
+    "Add Employee class with relationship to Service",
+    "ice cream shop database",
+]
+
+
+def example_diagram():
+    labels = ['Customer', 'Car', 'Service']
+    return {
+        'nodes': [
+            {'id': f"class-{index + 1}", 'type': 'class', 'position': {'x': 100 + index * 300, 'y': 100},
+             'data': {'label': label, 'nodeType': 'class',
+                      'attributes': [{'name': 'id', 'type': 'Long', 'visibility': 'private'}], 'methods': []}}
+            for index, label in enumerate(labels)
+        ],
+        'edges': [
+            {'id': 'edge-1', 'source': 'class-1', 'target': 'class-2', 'data': {'relationshipType': 'ASSOCIATION'}},
+            {'id': 'edge-2', 'source': 'class-2', 'target': 'class-3', 'data': {'relationshipType': 'ASSOCIATION'}},
+        ],
+    }
+
+
+def large_diagram(classes=200):
+    return {
+        'nodes': [
+            {'id': f"class-{index}", 'type': 'class', 'position': {'x': index * 10, 'y': 0},
+             'data': {'label': f"Entity{index}", 'attributes': [
+                 {'name': f"field{n}", 'type': 'String', 'visibility': 'private'} for n in range(6)
+             ], 'methods': []}}
+            for index in range(classes)
+        ],
+        'edges': [
+            {'id': f"edge-{index}", 'source': f"class-{index}", 'target': f"class-{index + 1}",
+             'data': {'relationshipType': 'ASSOCIATION'}}
+            for index in range(classes - 1)
+        ],
+    }
+
+
+def measure(command, diagram, iterations):
+    clear_diagram_context_cache()
+    start = time.perf_counter()
+    prompt = Llama4CommandService._build_command_prompt(None, command, diagram)
+    first_us = (time.perf_counter() - start) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        Llama4CommandService._build_command_prompt(None, command, diagram)
+    warm_us = (time.perf_counter() - start) / iterations * 1e6
+
+    tail_tokens = count_tokens(prompt[len(STATIC_PREFIX):])
+    return first_us, warm_us, tail_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    counts = get_section_token_counts()
+    prefix_tokens = counts.pop('static_prefix')
+    print(f"static prefix: {prefix_tokens} tokens, {len(STATIC_PREFIX)} chars")
+    for name, tokens in counts.items():
+        print(f"  {name:<26} {tokens:>6}")
+    print()
+
+    diagrams = [('none', None), ('3 classes', example_diagram()), ('200 classes', large_diagram())]
+    print(f"{'diagram':<12} {'command':<50} {'tail tok':>9} {'total tok':>10} {'first us':>10} {'warm us':>9}")
+    for diagram_name, diagram in diagrams:
+        for command in EXAMPLE_COMMANDS:
+            first_us, warm_us, tail_tokens = measure(command, diagram, args.iterations)
+            print(f"{diagram_name:<12} {command[:50]:<50} {tail_tokens:>9} {prefix_tokens + tail_tokens:>10} "
+                  f"{first_us:>10.1f} {warm_us:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
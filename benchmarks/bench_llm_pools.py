@@ -0,0 +1,143 @@
+"""
+Default boto3 Bedrock client versus the shared, tuned one under concurrency.
+
+A local keep-alive HTTP server stands in for bedrock-runtime: it answers
+InvokeModel after --latency seconds and delays the first answer on each new
+connection by --handshake seconds, the TLS handshake to a remote region.
+Traffic comes in --bursts bursts of --threads concurrent calls (the LLM pool
+size by default), as when several users send commands at once, through:
+
+- default: boto3.client('bedrock-runtime') as each service built it. urllib3
+  keeps at most 10 idle connections, so after every burst all but 10 are
+  closed and the next burst opens (and handshakes) the rest again
+- pooled: the client config of llm_clients.get_bedrock_config(), metered by
+  PoolStats
+
+Reports latency, TCP connections the server accepted and, for the pooled
+client, the PoolStats counters.
+
+Usage:
+    python -m benchmarks.bench_llm_pools --threads 32 --bursts 10
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks._support import setup_django, summarize_ms
+
+setup_django()
+
+import boto3  # noqa: E402
+
+from apps.ai_assistant.services.llm_clients import (  # noqa: E402
+    BEDROCK_POOL,
+    PoolStats,
+    get_bedrock_config,
+    meter_bedrock_client,
+)
+
+ANSWER = json.dumps({'generation': '{"action": "create_class", "elements": []}'}).encode()
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+def make_handler(latency, handshake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            time.sleep(handshake)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(ANSWER)))
+            self.end_headers()
+            self.wfile.write(ANSWER)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def make_client(endpoint, config=None):
+    return boto3.client(
+        'bedrock-runtime',
+        region_name='us-east-1',
+        endpoint_url=endpoint,
+        aws_access_key_id='bench-key',
+        aws_secret_access_key='bench-secret',
+        config=config,
+    )
+
+
+def call(client):
+    start = time.perf_counter()
+    response = client.invoke_model(modelId='bench-model', body=b'{}')
+    response['body'].read()
+    return time.perf_counter() - start
+
+
+def run(client, threads, bursts):
+    samples = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in range(bursts):
+            samples.extend(executor.map(call, [client] * threads))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--bursts', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--handshake', type=float, default=0.05)
+    args = parser.parse_args()
+
+    # urllib3 warns once per discarded connection of the default pool
+    logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)
+
+    clients = {
+        'default': lambda endpoint: make_client(endpoint),
+        'pooled': lambda endpoint: meter_bedrock_client(make_client(endpoint, get_bedrock_config())),
+    }
+    for name, build in clients.items():
+        server = CountingServer(('127.0.0.1', 0), make_handler(args.latency, args.handshake))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = build(f"http://127.0.0.1:{server.server_address[1]}")
+        PoolStats.reset_stats()
+
+        samples = run(client, args.threads, args.bursts)
+
+        print(
+            f"{name:>8} pool={client.meta.config.max_pool_connections:<3} {summarize_ms(samples)} "
+            f"connections={server.connections}"
+        )
+        if name == 'pooled':
+            print(f"{'':>8} {PoolStats.get_stats()[BEDROCK_POOL]}")
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
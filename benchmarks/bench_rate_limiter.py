@@ -0,0 +1,98 @@
+"""
+Correctness and latency of RateLimiter.check_rate_limit under concurrency.
+
+Runs --workers threads, each doing --checks checks against one shared
+identifier with a limit of --limit requests per window, against a local
+Redis through django-redis. Both storage paths are measured on the same
+server:
+
+- cache: the get-modify-set list stored through the Django cache
+- redis: the atomic Lua script over a sorted set
+
+A correct limiter admits exactly --limit checks; more means lost updates.
+Latency is per check, as seen by the calling thread.
+
+Usage:
+    python -m benchmarks.bench_rate_limiter --workers 32 --checks 50 --limit 200
+"""
+
+import argparse
+import logging
+import threading
+import time
+
+from benchmarks._support import setup_django, start_redis_server, summarize_ms
+
+setup_django()
+
+from django.core.cache import cache  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from apps.ai_assistant.services.rate_limiter import RateLimiter  # noqa: E402
+
+
+def run(backend, workers, checks, limit):
+    identifier = f"bench-{backend}-{time.time_ns()}"
+    admitted = []
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers)
+
+    def worker():
+        local_admitted = 0
+        local_latencies = []
+        barrier.wait()
+        for _ in range(checks):
+            start = time.perf_counter()
+            allowed, _ = RateLimiter.check_rate_limit(identifier, "bench", limit, 3600)
+            local_latencies.append(time.perf_counter() - start)
+            local_admitted += allowed
+        with lock:
+            admitted.append(local_admitted)
+            latencies.extend(local_latencies)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    RateLimiter.reset_limit(identifier, "bench")
+    return sum(admitted), latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--checks', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=200)
+    args = parser.parse_args()
+
+    # Every rejected check logs a warning
+    logging.getLogger('apps.ai_assistant.services.rate_limiter').setLevel(logging.ERROR)
+
+    redis_url = start_redis_server()
+    caches = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': redis_url,
+            'OPTIONS': {'CONNECTION_POOL_KWARGS': {'max_connections': args.workers * 2}},
+            'KEY_PREFIX': 'bench',
+        }
+    }
+
+    total = args.workers * args.checks
+    print(f"{args.workers} workers x {args.checks} checks = {total}, limit {args.limit}, redis {redis_url}")
+    print(f"{'backend':<8} {'admitted':>9} {'over':>6} {'checks/s':>10}  latency")
+    for backend in ('cache', 'redis'):
+        with override_settings(CACHES=caches, AI_RATE_LIMIT_BACKEND=backend):
+            cache.clear()
+            admitted, latencies, elapsed = run(backend, args.workers, args.checks, args.limit)
+        print(f"{backend:<8} {admitted:>9} {admitted - args.limit:>6} {total / elapsed:>10.0f}  "
+              f"{summarize_ms(latencies)}")
+
+
+if __name__ == '__main__':
+    main()
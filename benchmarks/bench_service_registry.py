@@ -0,0 +1,125 @@
+"""
+Per-request service construction versus the warm service registry.
+
+For each AI view, times what the view did before it took its services from
+services/registry.py, in two modes:
+
+- per-request: build the services the view used to build on every request,
+  plus the AzureOpenAI client that its first sync OpenAI call then opened
+  (AIAssistantService, UMLCommandProcessorService, ModelRouterService with
+  its three backend services, IncrementalCommandProcessor with its
+  OpenAIService for the AI fallback)
+- registry: get_service() on a registry warmed once, as at worker startup
+
+Nothing is sent to a model; the Azure endpoint and AWS credentials are
+placeholders, since building clients does not connect.
+
+Usage:
+    python -m benchmarks.bench_service_registry --rounds 200
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from benchmarks._support import setup_django, summarize_ms
+
+os.environ.setdefault('OPENAI_AZURE_API_KEY', 'bench-key')
+os.environ.setdefault('OPENAI_AZURE_API_BASE', 'http://127.0.0.1:9')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench-key')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench-secret')
+setup_django()
+
+from apps.ai_assistant.services import (  # noqa: E402
+    AIAssistantService,
+    IncrementalCommandProcessor,
+    Llama4CommandService,
+    NovaCommandService,
+    OpenAIService,
+    UMLCommandProcessorService,
+)
+from apps.ai_assistant.services.registry import (  # noqa: E402
+    AI_ASSISTANT,
+    COMMAND_PROCESSOR,
+    INCREMENTAL_PROCESSOR,
+    MODEL_ROUTER,
+    ServiceRegistry,
+    get_service,
+)
+
+
+def ask_per_request():
+    AIAssistantService().openai_service.client
+
+
+def command_per_request():
+    UMLCommandProcessorService().openai_service.client
+
+
+def router_per_request():
+    # ModelRouterService._initialize_services before the registry
+    Llama4CommandService()
+    NovaCommandService()
+    UMLCommandProcessorService().openai_service.client
+
+
+def incremental_per_request():
+    IncrementalCommandProcessor()
+    OpenAIService().client
+
+
+def registry_view(name):
+    def view():
+        service = get_service(name)
+        if name == INCREMENTAL_PROCESSOR:
+            service._get_openai_service().client
+        elif name == MODEL_ROUTER:
+            service._services['o4-mini'].openai_service.client
+        else:
+            service.openai_service.client
+    return view
+
+
+VIEWS = (
+    ('ask', ask_per_request, AI_ASSISTANT),
+    ('process-command (o4-mini)', command_per_request, COMMAND_PROCESSOR),
+    ('process-command (router)', router_per_request, MODEL_ROUTER),
+    ('incremental-command', incremental_per_request, INCREMENTAL_PROCESSOR),
+)
+
+
+def time_calls(func, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    # First construction pays one-off imports and the tiktoken load; keep
+    # that out of both modes
+    for _, per_request, _ in VIEWS:
+        per_request()
+
+    start = time.perf_counter()
+    ServiceRegistry.reset()
+    warm = ServiceRegistry.warm()
+    print(f"registry warmed in {(time.perf_counter() - start) * 1000:.1f}ms: "
+          f"{[name for name, error in warm.items() if error is None]}\n")
+
+    for label, per_request, name in VIEWS:
+        print(f"{label:>26} per-request {summarize_ms(time_calls(per_request, args.rounds))}")
+        print(f"{'':>26} registry    {summarize_ms(time_calls(registry_view(name), args.rounds))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Row writes of the auto-save path versus the diagram session store.
+
+Simulates D diagrams with U collaborators each producing E edits/sec for a
+simulated minute, against a throwaway SQLite database:
+
+- autosave: every edit goes through the PATCH serializer path (full JSON
+  rewrite of the row per edit)
+- session_store: edits are applied as DELTAs in memory (journaled) and
+  flushed every --flush-interval simulated seconds, plus a final flush on
+  the last disconnect
+
+Usage:
+    python -m benchmarks.bench_session_store --diagrams 5 --users 4 --edits-per-sec 2
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks._support import setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+
+from apps.uml_diagrams.models import UMLDiagram  # noqa: E402
+from apps.uml_diagrams.serializers.anonymous_diagram_serializer import AnonymousDiagramUpdateSerializer  # noqa: E402
+from apps.uml_diagrams.services.delta_applier import apply_delta  # noqa: E402
+from apps.uml_diagrams.services.session_store import DiagramSessionStore, MemorySessionBackend  # noqa: E402
+
+
+class WriteCounter:
+    """Counts UPDATE statements against the diagrams table."""
+
+    def __init__(self):
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('UPDATE') and UMLDiagram._meta.db_table in sql:
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def use_scratch_database(path):
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    with connection.schema_editor() as editor:
+        editor.create_model(UMLDiagram)
+
+
+def seed_content(classes=30):
+    return {
+        'nodes': [
+            {'id': f"class-{index}", 'type': 'class', 'position': {'x': index * 10, 'y': 0},
+             'data': {'label': f"Class{index}", 'attributes': [], 'methods': []}}
+            for index in range(classes)
+        ],
+        'edges': [],
+    }
+
+
+def make_edit(sequence):
+    return {
+        'action': 'update_node',
+        'node_id': f"class-{sequence % 30}",
+        'changes': {'position': {'operation': 'replace', 'value': {'x': sequence, 'y': sequence % 7}}},
+    }
+
+
+def create_diagrams(count):
+    return [
+        str(UMLDiagram.objects.create(title=f"bench {index}", session_id='bench', content=seed_content()).pk)
+        for index in range(count)
+    ]
+
+
+def edit_schedule(diagram_ids, users, edits_per_sec, seconds):
+    interval = 1.0 / edits_per_sec
+    schedule = []
+    for diagram_id in diagram_ids:
+        for user in range(users):
+            t = user * interval / users
+            while t < seconds:
+                schedule.append((t, diagram_id))
+                t += interval
+    schedule.sort()
+    return schedule
+
+
+def run_autosave(diagram_ids, schedule):
+    documents = {diagram_id: seed_content() for diagram_id in diagram_ids}
+    counter = WriteCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        for sequence, (_, diagram_id) in enumerate(schedule):
+            apply_delta(documents[diagram_id], make_edit(sequence))
+            diagram = UMLDiagram.objects.get(pk=diagram_id)
+            # Mirrors AnonymousDiagramViewSet.partial_update
+            diagram.content = json.dumps(documents[diagram_id])
+            serializer = AnonymousDiagramUpdateSerializer(
+                diagram, data={'content': documents[diagram_id]}, partial=True
+            )
+            serializer.is_valid(raise_exception=True)
+            instance = serializer.save()
+            instance.save(update_fields=['last_modified'])
+    return counter.writes, time.perf_counter() - started
+
+
+def run_session_store(diagram_ids, schedule, flush_interval, journal_dir):
+    store = DiagramSessionStore(MemorySessionBackend(journal_dir), flush_interval=0)
+    for diagram_id in diagram_ids:
+        store.open(diagram_id)
+
+    counter = WriteCounter()
+    started = time.perf_counter()
+    next_flush = flush_interval
+    with connection.execute_wrapper(counter):
+        for sequence, (t, diagram_id) in enumerate(schedule):
+            while t >= next_flush:
+                store.flush_dirty()
+                next_flush += flush_interval
+            store.apply(diagram_id, make_edit(sequence))
+        store.flush_dirty()
+        for diagram_id in diagram_ids:
+            store.close(diagram_id)
+    return counter.writes, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--diagrams', type=int, default=5)
+    parser.add_argument('--users', type=int, default=4, help='collaborators per diagram')
+    parser.add_argument('--edits-per-sec', type=float, default=2.0, help='edits per user per second')
+    parser.add_argument('--seconds', type=float, default=60.0, help='simulated duration')
+    parser.add_argument('--flush-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        use_scratch_database(os.path.join(scratch, 'bench.sqlite3'))
+        diagram_ids = create_diagrams(args.diagrams)
+        schedule = edit_schedule(diagram_ids, args.users, args.edits_per_sec, args.seconds)
+        minutes = args.seconds / 60.0
+
+        print(f"{len(schedule)} edits over {args.seconds:.0f}s simulated, {args.diagrams} diagrams x {args.users} users")
+        for name, (writes, elapsed) in (
+            ('autosave', run_autosave(diagram_ids, schedule)),
+            ('session_store', run_session_store(diagram_ids, schedule, args.flush_interval, os.path.join(scratch, 'journal'))),
+        ):
+            print(
+                f"{name:<14} row_writes={writes:>6} writes/min={writes / minutes:>9,.1f} "
+                f"wall={elapsed * 1000:,.0f}ms per_edit={elapsed / len(schedule) * 1e6:,.1f}us"
+            )
+
+
+if __name__ == '__main__':
+    main()
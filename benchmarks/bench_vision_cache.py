@@ -0,0 +1,124 @@
+"""
+Perceptual-hash vision cache on a stream of screenshot uploads.
+
+Draws --diagrams synthetic UML screenshots (1200x800) and uploads each one
+as a PNG, then again as the same PNG, as a JPEG recompression (quality 70)
+and as an edited diagram (one class renamed), in random order. The vision
+call is a stub; the numbers are the cache's own:
+
+- fingerprint / lookup / store time per upload (local-memory cache)
+- hit rate, and wrong hits: edited diagrams served an older result (should
+  be 0)
+- model time and cost saved, at --model-seconds and --cost per call
+
+Usage:
+    python -m benchmarks.bench_vision_cache --diagrams 50
+"""
+
+import argparse
+import base64
+import io
+import os
+import random
+import sys
+import time
+
+from benchmarks._support import setup_django, summarize_ms
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+
+settings.CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-vision-cache',
+        # Each stored image takes 1 + AI_VISION_CACHE_MAX_DISTANCE + 1 keys
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
+from apps.ai_assistant.services.vision_cache import (  # noqa: E402
+    VisionResultCache,
+    decode_image,
+    fingerprint,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from test_vision_cache import draw_diagram  # noqa: E402
+
+
+def encode(image, image_format='PNG', **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--diagrams', type=int, default=50)
+    parser.add_argument('--model-seconds', type=float, default=9.0)
+    parser.add_argument('--cost', type=float, default=0.0028)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    uploads = []
+    for seed in range(args.diagrams):
+        image = draw_diagram(seed)
+        edited = draw_diagram(seed, names={0: 'RenamedClass'})
+        uploads.append((f'{seed}', 'first', encode(image)))
+        uploads.extend([
+            (f'{seed}', 'same', encode(image)),
+            (f'{seed}', 'jpeg', encode(image, 'JPEG', quality=70)),
+            (f'{seed}-edited', 'edited', encode(edited)),
+        ])
+    # Re-uploads come after the first upload of their diagram
+    firsts = [upload for upload in uploads if upload[1] == 'first']
+    others = [upload for upload in uploads if upload[1] != 'first']
+    rng.shuffle(others)
+    stream = firsts + others
+
+    fingerprint_samples = [
+        timed(lambda: fingerprint(decode_image(upload[2]))) for upload in stream[:args.diagrams]
+    ]
+
+    wrong_hits = {}
+    hit_kinds = {}
+    totals = []
+    for identity, kind, image in stream:
+        def compute(identity=identity):
+            return {
+                'nodes': [{'id': identity}],
+                'edges': [],
+                'metadata': {'processing_time_ms': int(args.model_seconds * 1000)},
+                'cost_info': {'request_cost_usd': args.cost},
+            }
+
+        start = time.perf_counter()
+        result = VisionResultCache.get_or_process('nova-pro', image, compute)
+        totals.append(time.perf_counter() - start)
+        if result['metadata'].get('cache_hit'):
+            hit_kinds[kind] = hit_kinds.get(kind, 0) + 1
+            if result['nodes'][0]['id'] != identity:
+                wrong_hits[kind] = wrong_hits.get(kind, 0) + 1
+
+    stats = VisionResultCache.get_stats()['models']['nova-pro']
+    print(f"uploads={len(stream)} diagrams={args.diagrams}")
+    print(f"fingerprint       {summarize_ms(fingerprint_samples)}")
+    print(f"cache per upload  {summarize_ms(totals)} (fingerprint + lookup, + store on a miss)")
+    print(
+        f"hit_rate={stats['hit_rate']} hits by upload={hit_kinds} rejected={stats['rejected']} "
+        f"wrong_hits={wrong_hits}"
+    )
+    print(f"saved model time={stats['saved_ms'] / 1000:.0f}s saved cost=${stats['saved_cost_usd']:.4f}")
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
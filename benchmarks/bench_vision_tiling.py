@@ -0,0 +1,110 @@
+"""
+Whole-image versus tiled extraction of a large UML diagram.
+
+Draws a --columns x --rows grid of class boxes (draw_grid_diagram from the
+tiling tests) and extracts it through VisionModelRouterService.process_image
+as one image and in tiles. The vision model is a stub that reads the boxes
+from their colours and behaves like the real one where it matters here:
+
+- it answers after --base-seconds plus --class-seconds per class it writes
+  out, since generation time grows with the answer
+- it writes at most --max-classes classes per answer, as max_gen_len (4096
+  tokens for Llama 4) cuts off the JSON of a large diagram, and reports
+  stop_reason 'length' then
+
+Reports classes and relationships recovered, calls and wall time.
+
+Usage:
+    python -m benchmarks.bench_vision_tiling --columns 6 --rows 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from benchmarks._support import setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+
+settings.CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-vision-tiling',
+    }
+}
+settings.AI_VISION_CACHE_ENABLED = False
+
+from apps.ai_assistant.services.vision_model_router import VisionModelRouterService  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+from test_vision_tiling import ColourVisionService, draw_grid_diagram, encode  # noqa: E402
+
+
+class TimedVisionService(ColourVisionService):
+    def __init__(self, layout, base_seconds, class_seconds, max_classes):
+        super().__init__(layout)
+        self.base_seconds = base_seconds
+        self.class_seconds = class_seconds
+        self.max_classes = max_classes
+
+    def process_uml_diagram(self, base64_image, session_id=None, existing_diagram=None):
+        result = super().process_uml_diagram(base64_image, session_id, existing_diagram)
+        written = result['nodes'][:self.max_classes]
+        ids = {node['id'] for node in written} | {node['data']['label'] for node in written}
+        if len(written) < len(result['nodes']):
+            result['metadata']['stop_reason'] = 'length'
+        result['nodes'] = written
+        result['edges'] = [edge for edge in result['edges'] if edge['source'] in ids and edge['target'] in ids]
+        time.sleep(self.base_seconds + self.class_seconds * len(written))
+        return result
+
+
+class StubRouter(VisionModelRouterService):
+    def __init__(self, service):
+        self.service = service
+        super().__init__()
+
+    def _initialize_services(self):
+        self._services['llama4-maverick'] = self.service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--columns', type=int, default=6)
+    parser.add_argument('--rows', type=int, default=5)
+    parser.add_argument('--base-seconds', type=float, default=0.5)
+    parser.add_argument('--class-seconds', type=float, default=0.15)
+    parser.add_argument('--max-classes', type=int, default=12)
+    args = parser.parse_args()
+
+    # Within the services' MAX_DIMENSION, beyond which uploads are rejected
+    size = (min(args.columns * 600, 4096), min(args.rows * 480, 4096))
+    image, layout = draw_grid_diagram(columns=args.columns, rows=args.rows, size=size, box=(300, 220))
+    upload = encode(image)
+    relationships = len(layout) - 1
+    print(
+        f"{image.width}x{image.height} image, {len(layout)} classes, {relationships} relationships, "
+        f"model: {args.base_seconds}s + {args.class_seconds}s/class, at most {args.max_classes} classes"
+    )
+
+    for name, tiled in (('whole', False), ('tiled', True)):
+        service = TimedVisionService(layout, args.base_seconds, args.class_seconds, args.max_classes)
+        router = StubRouter(service)
+
+        start = time.perf_counter()
+        result = router.process_image(upload, model='llama4-maverick', tiled=tiled)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{name:>6} classes={len(result['nodes'])}/{len(layout)} "
+            f"relationships={len(result['edges'])}/{relationships} calls={service.calls} "
+            f"tiles={result['metadata'].get('tiles', 1)} split={result['metadata'].get('split_tiles', 0)} "
+            f"time={elapsed:.2f}s"
+        )
+
+
+if __name__ == '__main__':
+    main()
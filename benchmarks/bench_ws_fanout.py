@@ -0,0 +1,130 @@
+"""
+WebSocket room fan-out benchmark.
+
+Simulates W ASGI workers (each with its own channel layer connection to a
+shared Redis) with C clients per worker joined to one diagram room. Every
+client sends M frames; the script reports end-to-end delivery latency and
+delivered messages/sec, and checks that every peer received every frame.
+
+Usage:
+    python -m benchmarks.bench_ws_fanout --workers 4 --clients 8 --messages 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._support import setup_django, start_redis_server, summarize_ms
+
+setup_django()
+
+from channels.testing import WebsocketCommunicator  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from apps.websockets.anonymous_consumers import AnonymousUMLDiagramConsumer  # noqa: E402
+
+
+class BenchDiagramConsumer(AnonymousUMLDiagramConsumer):
+    """Skips session bookkeeping so only the relay path is measured."""
+
+    async def add_session_to_diagram(self):
+        return True
+
+    async def remove_session_from_diagram(self):
+        return True
+
+
+def configure_layers(redis_url, workers):
+    layers = {'default': settings.CHANNEL_LAYERS['default']}
+    for index in range(workers):
+        layers[f"bench_worker_{index}"] = {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [{'address': redis_url, 'socket_timeout': 10}],
+                'capacity': 10000,
+                'expiry': 60,
+            },
+        }
+    settings.CHANNEL_LAYERS = layers
+
+    from channels.layers import channel_layers
+    channel_layers.backends = {}
+
+
+def worker_consumer(alias):
+    return type(f"Consumer_{alias}", (BenchDiagramConsumer,), {'channel_layer_alias': alias})
+
+
+async def open_client(consumer_class, diagram_id, index):
+    application = consumer_class.as_asgi()
+    communicator = WebsocketCommunicator(application, f"/ws/diagram/{diagram_id}/")
+    communicator.scope['url_route'] = {'kwargs': {'diagram_id': diagram_id, 'session_id': f"bench-{index}"}}
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+async def run(mode, workers, clients_per_worker, messages):
+    settings.WEBSOCKET_BROADCAST_MODE = mode
+    worker_count = workers if mode == 'channel_layer' else 1
+    diagram_id = f"bench-{mode}"
+
+    communicators = []
+    for worker in range(worker_count):
+        alias = f"bench_worker_{worker}" if mode == 'channel_layer' else 'default'
+        consumer_class = worker_consumer(alias)
+        for client in range(clients_per_worker):
+            communicators.append(await open_client(consumer_class, diagram_id, len(communicators)))
+
+    total_clients = len(communicators)
+    expected_per_client = (total_clients - 1) * messages
+    latencies = []
+
+    async def drain(communicator):
+        received = 0
+        while received < expected_per_client:
+            frame = await communicator.receive_from(timeout=30)
+            latencies.append(time.perf_counter() - json.loads(frame)['sent_at'])
+            received += 1
+        return received
+
+    async def send_all(communicator, sender):
+        for sequence in range(messages):
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'node_update', 'sender': sender, 'seq': sequence,
+                'sent_at': time.perf_counter(),
+            }))
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    drains = [asyncio.create_task(drain(c)) for c in communicators]
+    await asyncio.gather(*(send_all(c, i) for i, c in enumerate(communicators)))
+    delivered = sum(await asyncio.gather(*drains))
+    elapsed = time.perf_counter() - started
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+    print(
+        f"mode={mode:<13} workers={worker_count} clients={total_clients} "
+        f"delivered={delivered}/{expected_per_client * total_clients} "
+        f"rate={delivered / elapsed:,.0f} msg/s latency {summarize_ms(latencies)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8, help='clients per worker')
+    parser.add_argument('--messages', type=int, default=20, help='frames sent per client')
+    args = parser.parse_args()
+
+    configure_layers(start_redis_server(), args.workers)
+
+    asyncio.run(run('local', args.workers, args.clients, args.messages))
+    asyncio.run(run('channel_layer', args.workers, args.clients, args.messages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""
+Tests for streamed AI answers: the incremental element parser, the
+streaming OpenAI call, the SSE variants of the AI views and the ai_request
+WebSocket messages.
+"""
+
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import AsyncRequestFactory
+
+from apps.ai_assistant import views
+from apps.ai_assistant.services import CacheService, openai_service
+from apps.ai_assistant.services.command_processor_service import UMLCommandProcessorService
+from apps.ai_assistant.services.json_stream import JSONStreamExtractor
+from apps.ai_assistant.services.model_router_service import ModelRouterService
+from apps.ai_assistant.services.openai_service import OpenAIService
+from apps.websockets.ai_stream import AIStreamMixin, parse_ai_request
+from apps.websockets.anonymous_consumers import AnonymousUMLDiagramConsumer
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "ai-streaming-tests",
+    }
+}
+
+ELEMENTS = [
+    {"type": "node", "data": {"id": "class-user", "label": "User {\"admin\"} [x]"}},
+    {"type": "node", "data": {"id": "class-order", "label": "Order \\ path", "attributes": [{"name": "total"}]}},
+    {"type": "edge", "data": {"source": "class-user", "target": "class-order", "label": "places"}},
+]
+
+ANSWER = json.dumps({
+    "action": "create_class",
+    "interpretation": "Create \"elements\": [{...}] for User and Order",
+    "elements": ELEMENTS,
+    "confidence": 0.9,
+})
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = LOCMEM_CACHES
+    settings.OPENAI_AZURE_API_KEY = "test-key"
+    settings.OPENAI_AZURE_API_BASE = "http://127.0.0.1:9"
+    cache.clear()
+    CacheService.clear_local()
+    yield
+    cache.clear()
+    CacheService.clear_local()
+
+
+def split_randomly(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 40)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+class TestElementStreaming:
+    """Test incremental extraction of the elements array."""
+
+    def test_random_chunking_yields_every_element_once(self):
+        rng = random.Random(17)
+        for _ in range(300):
+            parser = JSONStreamExtractor()
+            found = []
+            for chunk in split_randomly(ANSWER, rng):
+                found.extend(parser.feed(chunk))
+            assert found == ELEMENTS
+            assert parser.emitted == 3
+
+    def test_element_is_emitted_when_its_brace_arrives(self):
+        parser = JSONStreamExtractor()
+        first_end = ANSWER.index('"type": "node", "data": {"id": "class-order"') - 4
+
+        assert parser.feed(ANSWER[:first_end]) == []
+        assert parser.feed(ANSWER[first_end:first_end + 1]) == [ELEMENTS[0]]
+
+    def test_ignores_prose_fences_and_nested_elements_keys(self):
+        text = (
+            "Here is the diagram {not json}:\n```json\n"
+            '{"meta": {"elements": [{"type": "ignored"}]}, "elements": [{"type": "node", "data": {}}]}\n```'
+        )
+        parser = JSONStreamExtractor()
+
+        assert [element for char in text for element in parser.feed(char)] == [{"type": "node", "data": {}}]
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        return chunk
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeStreamingClient:
+    """Stands in for AsyncAzureOpenAI and streams `text` in small deltas."""
+
+    text = "Hola mundo"
+    streams = []
+
+    def __init__(self, **options):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, stream=False, **params):
+        assert stream is True
+        chunks = [SimpleNamespace(choices=[])]
+        for start in range(0, len(self.text), 4):
+            delta = SimpleNamespace(content=self.text[start:start + 4])
+            chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=delta)]))
+        chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))]))
+        stream = FakeStream(chunks)
+        FakeStreamingClient.streams.append(stream)
+        return stream
+
+
+@pytest.fixture
+def streaming_client(monkeypatch):
+    monkeypatch.setattr(openai_service, "AsyncAzureOpenAI", FakeStreamingClient)
+    monkeypatch.setattr(openai_service, "_async_clients", openai_service.weakref.WeakKeyDictionary())
+    monkeypatch.setattr(FakeStreamingClient, "streams", [])
+    return FakeStreamingClient
+
+
+@pytest.mark.asyncio
+class TestStreamingServices:
+    """Test the streaming service methods."""
+
+    async def test_astream_api_yields_deltas_and_closes(self, streaming_client):
+        deltas = [delta async for delta in OpenAIService().astream_api([{"role": "user", "content": "hi"}])]
+
+        assert deltas == ["Hola", " mun", "do"]
+        assert streaming_client.streams[0].closed
+
+    async def test_command_stream_emits_elements_before_done(self, streaming_client, monkeypatch):
+        monkeypatch.setattr(streaming_client, "text", ANSWER)
+
+        events = [event async for event in UMLCommandProcessorService().astream_command("Create User and Order")]
+
+        kinds = [kind for kind, _ in events]
+        assert kinds[-1] == "done"
+        assert [data for kind, data in events if kind == "element"] == ELEMENTS
+        assert "".join(data["delta"] for kind, data in events if kind == "token") == ANSWER
+        assert events[-1][1]["elements"] == ELEMENTS
+        assert kinds.index("element") < len(kinds) - 2
+
+    async def test_router_without_streaming_service_yields_result_elements(self, monkeypatch):
+        result = {"action": "create_class", "elements": ELEMENTS[:2], "confidence": 0.8}
+
+        async def aprocess_command(self, command, model=None, diagram_id=None, current_diagram_data=None):
+            return result
+
+        monkeypatch.setattr(ModelRouterService, "_initialize_services", lambda self: None)
+        monkeypatch.setattr(ModelRouterService, "aprocess_command", aprocess_command)
+        router = ModelRouterService()
+        router._services = {}
+
+        events = [event async for event in router.astream_command("Create User", model="nova-pro")]
+
+        assert events == [("element", ELEMENTS[0]), ("element", ELEMENTS[1]), ("done", result)]
+
+
+async def read_sse(response):
+    body = "".join([
+        chunk.decode() if isinstance(chunk, bytes) else chunk async for chunk in response.streaming_content
+    ])
+    frames = []
+    for block in body.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        frames.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return frames
+
+
+@pytest.mark.asyncio
+class TestEventStreamViews:
+    """Test the SSE variants of the AI views."""
+
+    def post(self, path, data, **extra):
+        return AsyncRequestFactory().post(path, json.dumps(data), content_type="application/json", **extra)
+
+    async def test_ask_streams_tokens_then_done(self, streaming_client):
+        response = await views.ask_ai_assistant(
+            self.post("/api/ai-assistant/ask/?stream=true", {"question": "¿Qué es UML?"})
+        )
+
+        frames = await read_sse(response)
+        assert response["Content-Type"] == "text/event-stream"
+        assert response["Cache-Control"] == "no-cache"
+        assert [data["delta"] for event, data in frames if event == "token"] == ["Hola", " mun", "do"]
+        assert frames[-1][0] == "done"
+        assert frames[-1][1]["answer"] == "Hola mundo"
+
+    async def test_uml_command_selected_by_accept_header(self, monkeypatch):
+        async def astream_command(self, command, model=None, diagram_id=None, current_diagram_data=None):
+            yield "element", ELEMENTS[0]
+            raise RuntimeError("model went away")
+
+        monkeypatch.setattr(views.ModelRouterService, "_initialize_services", lambda self: None)
+        monkeypatch.setattr(views.ModelRouterService, "astream_command", astream_command)
+        response = await views.process_uml_command(self.post(
+            "/api/ai-assistant/process-command/", {"command": "Create class User"},
+            headers={"Accept": "text/event-stream"},
+        ))
+
+        frames = await read_sse(response)
+        assert frames[0] == ("element", ELEMENTS[0])
+        assert frames[1][0] == "error"
+        assert frames[1][1]["message"] == "model went away"
+
+    async def test_validation_errors_stay_json(self):
+        response = await views.ask_ai_assistant(self.post("/api/ai-assistant/ask/?stream=1", {"question": ""}))
+
+        assert response.status_code == 400
+        assert response["Content-Type"] == "application/json"
+
+
+class StreamingTestConsumer(AnonymousUMLDiagramConsumer):
+    """Diagram consumer without database bookkeeping and with a fake model."""
+
+    release = None
+
+    async def add_session_to_diagram(self):
+        return True
+
+    async def remove_session_from_diagram(self):
+        return True
+
+    def ai_events(self, message):
+        if message.get("kind") not in ("ask", "command"):
+            return super().ai_events(message)
+
+        async def events():
+            yield "token", {"delta": message.get("question") or message.get("command")}
+            await self.release.wait()
+            yield "done", {"answer": "ok"}
+
+        return events()
+
+
+async def connect(diagram_id="diagram-ai"):
+    communicator = WebsocketCommunicator(StreamingTestConsumer.as_asgi(), f"/ws/diagram/{diagram_id}/")
+    communicator.scope["url_route"] = {"kwargs": {"diagram_id": diagram_id, "session_id": "s1"}}
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+@pytest.mark.asyncio
+class TestWebSocketAIStream:
+    """Test ai_request / ai_stream frames on the diagram socket."""
+
+    async def test_stream_goes_only_to_requester(self, settings):
+        settings.AI_WS_STREAMS_PER_CONNECTION = 2
+        StreamingTestConsumer.release = asyncio.Event()
+        requester, peer = await connect(), await connect()
+
+        await requester.send_json_to({"type": "ai_request", "request_id": "r1", "kind": "ask", "question": "hola"})
+        token = await requester.receive_json_from()
+        StreamingTestConsumer.release.set()
+        done = await requester.receive_json_from()
+
+        assert token == {"type": "ai_stream", "request_id": "r1", "event": "token", "data": {"delta": "hola"}}
+        assert done["event"] == "done"
+        assert await peer.receive_nothing(timeout=0.1)
+        await requester.disconnect()
+        await peer.disconnect()
+
+    async def test_limit_errors_and_disconnect_cancels(self, settings):
+        settings.AI_WS_STREAMS_PER_CONNECTION = 1
+        StreamingTestConsumer.release = asyncio.Event()
+        communicator = await connect()
+
+        await communicator.send_json_to({"type": "ai_request", "request_id": "a", "kind": "command", "command": "x"})
+        await communicator.receive_json_from()
+        await communicator.send_json_to({"type": "ai_request", "request_id": "b", "kind": "ask", "question": "y"})
+        rejected = await communicator.receive_json_from()
+
+        assert rejected["request_id"] == "b"
+        assert rejected["event"] == "error"
+        assert rejected["data"]["limit"] == 1
+        await communicator.disconnect()
+
+    async def test_unknown_kind_is_reported(self):
+        communicator = await connect()
+
+        await communicator.send_json_to({"type": "ai_request", "request_id": "k", "kind": "translate"})
+        frame = await communicator.receive_json_from()
+
+        assert frame["event"] == "error"
+        assert "kind" in frame["data"]["details"]
+        await communicator.disconnect()
+
+
+def test_parse_ai_request():
+    assert parse_ai_request('{"type": "node_move", "x": 1}') is None
+    assert parse_ai_request('{"type": "ai_request"') is None
+    assert parse_ai_request('{"type": "ai_request", "kind": "ask"}') == {"type": "ai_request", "kind": "ask"}
+    assert issubclass(AnonymousUMLDiagramConsumer, AIStreamMixin)
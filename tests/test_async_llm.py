@@ -0,0 +1,258 @@
+"""
+Tests for the async LLM path: AsyncAzureOpenAI calls, async single-flight,
+the blocking-call thread pool and the async AI views.
+"""
+
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from django.core.cache import cache
+from django.test import AsyncRequestFactory
+from rest_framework.decorators import throttle_classes
+from rest_framework.response import Response
+from rest_framework.throttling import AnonRateThrottle
+
+from apps.ai_assistant import views
+from apps.ai_assistant.async_views import async_api_view
+from apps.ai_assistant.services import CacheService, SingleFlight, openai_service, run_in_llm_pool
+from apps.ai_assistant.services.openai_service import OpenAIService, async_retry_with_exponential_backoff
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "async-llm-tests",
+    }
+}
+
+KEY = {"method": "process_incremental_command", "command": "make order abstract", "diagram_hash": "h"}
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = LOCMEM_CACHES
+    settings.AI_SINGLE_FLIGHT_WAIT_TIMEOUT = 5
+    settings.OPENAI_AZURE_API_KEY = "test-key"
+    settings.OPENAI_AZURE_API_BASE = "http://127.0.0.1:9"
+    cache.clear()
+    CacheService.clear_local()
+    SingleFlight.reset_stats()
+    yield
+    cache.clear()
+    CacheService.clear_local()
+
+
+class FakeAsyncClient:
+    """Stands in for AsyncAzureOpenAI and answers every completion with `reply`."""
+
+    reply = '{"ok": true}'
+
+    def __init__(self, **options):
+        self.options = options
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **params):
+        self.calls.append(params)
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))],
+            usage=SimpleNamespace(total_tokens=3),
+        )
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    monkeypatch.setattr(openai_service, "AsyncAzureOpenAI", FakeAsyncClient)
+    monkeypatch.setattr(openai_service, "_async_clients", openai_service.weakref.WeakKeyDictionary())
+
+
+@pytest.fixture
+def diagram():
+    return {
+        "nodes": [
+            {"id": "user-1", "data": {"label": "User", "attributes": [], "methods": []}},
+            {"id": "order-1", "data": {"label": "Order", "attributes": [], "methods": []}},
+        ],
+        "edges": [],
+    }
+
+
+@pytest.mark.asyncio
+class TestAsyncOpenAI:
+    """Test acall_api on the async client."""
+
+    async def test_concurrent_calls_share_one_client(self, fake_client):
+        service = OpenAIService()
+
+        results = await asyncio.gather(*[
+            service.acall_api([{"role": "user", "content": "hi"}], response_format="json") for _ in range(5)
+        ])
+
+        client = service._get_async_client()
+        assert results == ['{"ok": true}'] * 5
+        assert len(client.calls) == 5
+        assert client.calls[0]["response_format"] == {"type": "json_object"}
+        assert OpenAIService()._get_async_client() is client
+
+    async def test_async_retry(self):
+        attempts = []
+
+        @async_retry_with_exponential_backoff(max_retries=3, base_delay=0.01)
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("reset")
+            return "done"
+
+        assert await flaky() == "done"
+        assert len(attempts) == 3
+
+
+@pytest.mark.asyncio
+class TestSingleFlightAsync:
+    """Test SingleFlight.ado() coalescing inside one event loop."""
+
+    async def test_concurrent_callers_share_one_computation(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return {"action": "update_node"}
+
+        results = await asyncio.gather(*[SingleFlight.ado(KEY, compute, ttl=60) for _ in range(8)])
+
+        assert len(calls) == 1
+        assert results == [{"action": "update_node"}] * 8
+        assert len({id(result) for result in results}) == 8
+        assert CacheService.get(KEY) == {"action": "update_node"}
+        stats = SingleFlight.get_stats()
+        assert (stats["leaders"], stats["coalesced_local"], stats["inflight"]) == (1, 7, 0)
+
+    async def test_followers_receive_leader_exception(self):
+        async def compute():
+            await asyncio.sleep(0.05)
+            raise ValueError("model failed")
+
+        results = await asyncio.gather(*[SingleFlight.ado(KEY, compute) for _ in range(3)], return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert CacheService.get(KEY) is None
+
+    async def test_cancelled_leader_does_not_fail_followers(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "value"
+
+        leader = asyncio.ensure_future(SingleFlight.ado(KEY, compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(SingleFlight.ado(KEY, compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "value"
+        assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+class TestLLMPool:
+    """Test the thread pool for blocking model calls."""
+
+    async def test_runs_off_the_event_loop(self):
+        loop_thread = threading.current_thread()
+
+        thread = await run_in_llm_pool(threading.current_thread)
+
+        assert thread is not loop_thread
+        assert thread.name.startswith("llm-call")
+
+
+class OncePerMinute(AnonRateThrottle):
+    rate = "1/minute"
+
+
+@async_api_view(["POST"])
+@throttle_classes([OncePerMinute])
+async def throttled_view(request):
+    return Response({"echo": request.data})
+
+
+@pytest.mark.asyncio
+class TestAsyncViews:
+    """Test the async endpoints through an ASGI request."""
+
+    def post(self, path, data):
+        body = data if isinstance(data, str) else json.dumps(data)
+        return AsyncRequestFactory().post(path, body, content_type="application/json")
+
+    async def test_incremental_command_pattern_match(self, diagram):
+        response = await views.process_incremental_command(
+            self.post("/api/ai-assistant/incremental-command/",
+                      {"command": "rename class User to Customer", "current_diagram": diagram})
+        )
+
+        body = json.loads(response.content)
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/json"
+        assert body["delta"]["matched_rule"] == "en:rename_class"
+
+    async def test_incremental_command_ai_fallback(self, diagram, fake_client, monkeypatch):
+        monkeypatch.setattr(FakeAsyncClient, "reply", json.dumps(
+            {"action": "update_node", "node_id": "order-1", "changes": {}, "description": "abstract"}
+        ))
+        request_data = {"command": "make Order abstract", "current_diagram": diagram}
+
+        responses = await asyncio.gather(*[
+            views.process_incremental_command(self.post("/api/ai-assistant/incremental-command/", request_data))
+            for _ in range(4)
+        ])
+
+        assert [response.status_code for response in responses] == [200] * 4
+        assert json.loads(responses[0].content)["delta"]["node_id"] == "order-1"
+        assert SingleFlight.get_stats()["leaders"] == 1
+
+    async def test_uml_command_runs_router_in_pool(self, monkeypatch):
+        threads = []
+
+        def process_command(self, command, model=None, diagram_id=None, current_diagram_data=None, critical=False):
+            threads.append(threading.current_thread().name)
+            return {"action": "create_class", "elements": [], "confidence": 0.9, "interpretation": command}
+
+        monkeypatch.setattr(views.ModelRouterService, "_initialize_services", lambda self: None)
+        monkeypatch.setattr(views.ModelRouterService, "process_command", process_command)
+        response = await views.process_uml_command(
+            self.post("/api/ai-assistant/process-command/", {"command": "Create class User"})
+        )
+
+        assert response.status_code == 200
+        assert json.loads(response.content)["interpretation"] == "Create class User"
+        assert threads[0].startswith("llm-call")
+
+    async def test_request_errors(self):
+        path = "/api/ai-assistant/incremental-command/"
+
+        bad_json = await views.process_incremental_command(self.post(path, "{not json"))
+        wrong_method = await views.process_incremental_command(AsyncRequestFactory().get(path))
+
+        assert bad_json.status_code == 400
+        assert "JSON parse error" in json.loads(bad_json.content)["detail"]
+        assert wrong_method.status_code == 405
+
+    async def test_throttle_classes_apply(self):
+        first = await throttled_view(self.post("/throttled/", {"a": 1}))
+        second = await throttled_view(self.post("/throttled/", {"a": 1}))
+
+        assert json.loads(first.content) == {"echo": {"a": 1}}
+        assert second.status_code == 429
+        assert int(second["Retry-After"]) > 0
+
+
+def test_async_views_keep_api_view_class():
+    assert "post" in views.process_incremental_command.cls.http_method_names
+    assert asyncio.iscoroutinefunction(views.ask_ai_assistant)
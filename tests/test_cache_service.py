@@ -0,0 +1,171 @@
+"""
+Tests for the two-tier AI response cache.
+"""
+
+import fakeredis
+import pytest
+from django.core.cache import cache
+
+from apps.ai_assistant.services import CacheService
+from apps.ai_assistant.services.cache_service import COMPRESSED_MAGIC
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "cache-service-tests",
+    }
+}
+
+
+def fake_redis_caches():
+    """django-redis backend talking to an in-memory fakeredis server."""
+    return {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": "redis://fake:6379/0",
+            "KEY_PREFIX": "springcode_cache",
+            "OPTIONS": {
+                "CONNECTION_POOL_KWARGS": {
+                    "connection_class": fakeredis.FakeConnection,
+                    "server": fakeredis.FakeServer(),
+                },
+            },
+        }
+    }
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(settings):
+    settings.CACHES = LOCMEM_CACHES
+    cache.clear()
+    CacheService.clear_local()
+    CacheService.reset_stats()
+    yield
+    CacheService.clear_local()
+
+
+def key(method, n=0):
+    return {"method": method, "question": f"question {n}"}
+
+
+class TestTiers:
+    """Test the local tier in front of the shared cache."""
+
+    def test_local_hit_skips_shared_cache(self):
+        CacheService.set(key("ask_question"), {"answer": "A"})
+        cache.clear()
+
+        assert CacheService.get(key("ask_question")) == {"answer": "A"}
+        assert CacheService.get_stats()["by_method"]["ask_question"]["local_hits"] == 1
+
+    def test_shared_hit_fills_local_tier(self):
+        CacheService.set(key("ask_question"), {"answer": "A"})
+        CacheService.clear_local()
+
+        assert CacheService.get(key("ask_question")) == {"answer": "A"}
+        assert CacheService.get(key("ask_question")) == {"answer": "A"}
+
+        counters = CacheService.get_stats()["by_method"]["ask_question"]
+        assert counters["shared_hits"] == 1
+        assert counters["local_hits"] == 1
+
+    def test_every_get_returns_a_copy(self):
+        CacheService.set(key("ask_question"), {"answer": "A", "sources": []})
+
+        CacheService.get(key("ask_question"))["sources"].append("mutated")
+
+        assert CacheService.get(key("ask_question"))["sources"] == []
+
+    def test_local_entries_expire(self, settings, monkeypatch):
+        settings.AI_CACHE_LOCAL_TTL = 10
+        clock = [1000.0]
+        monkeypatch.setattr("apps.ai_assistant.services.cache_service.time.monotonic", lambda: clock[0])
+        CacheService.set(key("ask_question"), {"answer": "A"})
+        cache.clear()
+
+        clock[0] += 11
+
+        assert CacheService.get(key("ask_question")) is None
+        assert CacheService.get_stats()["by_method"]["ask_question"]["misses"] == 1
+
+    def test_delete_drops_both_tiers(self):
+        CacheService.set(key("ask_question"), {"answer": "A"})
+
+        CacheService.delete(key("ask_question"))
+
+        assert CacheService.get(key("ask_question")) is None
+
+
+class TestEviction:
+    """Test the size bounds of the local tier."""
+
+    def test_entry_limit_evicts_least_recently_used(self, settings):
+        settings.AI_CACHE_LOCAL_MAX_ENTRIES = 2
+        CacheService.set(key("ask_question", 1), {"answer": 1})
+        CacheService.set(key("ask_question", 2), {"answer": 2})
+        CacheService.get(key("ask_question", 1))
+        CacheService.set(key("process_incremental_command", 3), {"answer": 3})
+        cache.clear()
+
+        assert CacheService.get(key("ask_question", 1)) == {"answer": 1}
+        assert CacheService.get(key("ask_question", 2)) is None
+
+        stats = CacheService.get_stats()
+        assert stats["by_method"]["ask_question"]["evictions"] == 1
+        assert stats["local"]["entries"] == 2
+
+    def test_byte_limit(self, settings):
+        settings.AI_CACHE_LOCAL_MAX_BYTES = 3000
+        CacheService.set(key("ask_question", 1), {"answer": "x" * 1000})
+        CacheService.set(key("ask_question", 2), {"answer": "y" * 1000})
+        CacheService.set(key("ask_question", 3), {"answer": "z" * 1500})
+
+        stats = CacheService.get_stats()
+        assert stats["local"]["bytes"] <= 3000
+        assert stats["totals"]["evictions"] == 1
+
+
+class TestCompression:
+    """Test zlib compression of large values in the shared cache."""
+
+    def test_large_values_are_compressed(self, settings):
+        settings.AI_CACHE_COMPRESS_MIN_BYTES = 1024
+        value = {"answer": "class User " * 500}
+        CacheService.set(key("ask_about_diagram"), value)
+
+        stored = cache.get(CacheService._generate_cache_key(key("ask_about_diagram")))
+        assert stored.startswith(COMPRESSED_MAGIC)
+        assert len(stored) < 1024
+
+        CacheService.clear_local()
+        assert CacheService.get(key("ask_about_diagram")) == value
+
+    def test_small_and_legacy_values_are_stored_as_is(self):
+        CacheService.set(key("ask_question"), {"answer": "short"})
+        assert cache.get(CacheService._generate_cache_key(key("ask_question"))) == {"answer": "short"}
+
+        cache.set(CacheService._generate_cache_key(key("ask_question", 9)), {"answer": "old"})
+        assert CacheService.get(key("ask_question", 9)) == {"answer": "old"}
+
+
+class TestClearPattern:
+    """Test SCAN-based invalidation against django-redis."""
+
+    def test_clears_matching_keys_in_batches(self, settings):
+        settings.CACHES = fake_redis_caches()
+        settings.AI_CACHE_CLEAR_BATCH_SIZE = 7
+        for n in range(30):
+            CacheService.set(key("ask_question", n), {"answer": n})
+        cache.set("rate_limit:ask_question:session", 1)
+
+        assert CacheService.clear_pattern("*") == 30
+
+        assert CacheService.get(key("ask_question", 0)) is None
+        assert CacheService.get_stats()["local"]["entries"] == 0
+        assert cache.get("rate_limit:ask_question:session") == 1
+
+    def test_backend_without_scan(self):
+        CacheService.set(key("ask_question"), {"answer": "A"})
+
+        assert CacheService.clear_pattern("*") == 0
+        assert CacheService.get_stats()["local"]["entries"] == 0
@@ -0,0 +1,231 @@
+"""
+Tests for the per-model circuit breaker and how the routers use it.
+"""
+
+import json
+
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from apps.ai_assistant import views
+from apps.ai_assistant.services import circuit_breaker
+from apps.ai_assistant.services.circuit_breaker import CircuitBreaker
+from apps.ai_assistant.services.hedging import ModelCallStats
+from apps.ai_assistant.services.model_router_service import ModelRouterService
+from apps.ai_assistant.services.nova_vision_service import AWSBedrockError, ImageValidationError
+from apps.ai_assistant.services.vision_model_router import VisionModelRouterService
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "circuit-breaker-tests",
+    }
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(settings, monkeypatch):
+    settings.CACHES = LOCMEM_CACHES
+    settings.AI_CIRCUIT_ENABLED = True
+    settings.AI_CIRCUIT_WINDOW = 60
+    settings.AI_CIRCUIT_BUCKETS = 6
+    settings.AI_CIRCUIT_MIN_CALLS = 4
+    settings.AI_CIRCUIT_FAILURE_RATE = 0.5
+    settings.AI_CIRCUIT_SLOW_CALL_SECONDS = 10.0
+    settings.AI_CIRCUIT_SLOW_CALL_RATE = 0.75
+    settings.AI_CIRCUIT_OPEN_SECONDS = 30
+    settings.AI_HEDGE_DELAY = 5.0
+    settings.MODEL_FALLBACK_ORDER = ["llama4-maverick", "nova-pro"]
+    settings.VISION_FALLBACK_ORDER = ["llama4-maverick", "nova-pro"]
+    cache.clear()
+    ModelCallStats.reset_stats()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "time", clock.time)
+    return clock
+
+
+def fail(model, count, seconds=0.1):
+    for _ in range(count):
+        CircuitBreaker.record(model, seconds, failed=True)
+
+
+class TestStates:
+    """Test closed -> open -> half-open -> closed/open."""
+
+    def test_failure_rate_opens_after_min_calls(self, clock):
+        fail("nova-pro", 3)
+        assert CircuitBreaker.get_state("nova-pro") == "closed"
+
+        fail("nova-pro", 1)
+
+        assert CircuitBreaker.get_state("nova-pro") == "open"
+        assert CircuitBreaker.allow("nova-pro") is False
+
+    def test_successes_keep_it_closed(self, clock):
+        for index in range(20):
+            CircuitBreaker.record("nova-pro", 0.1, failed=index % 4 == 1)
+
+        assert CircuitBreaker.get_state("nova-pro") == "closed"
+
+    def test_slow_calls_open(self, clock):
+        for _ in range(4):
+            CircuitBreaker.record("o4-mini", 12.0, failed=False)
+
+        assert CircuitBreaker.get_states(["o4-mini"])["o4-mini"]["reason"] == "slow_calls"
+
+    def test_old_failures_leave_the_window(self, clock):
+        fail("nova-pro", 3)
+        clock.now += 120
+        fail("nova-pro", 1)
+
+        assert CircuitBreaker.get_state("nova-pro") == "closed"
+
+    def test_half_open_lets_one_probe_through(self, clock):
+        fail("nova-pro", 4)
+        clock.now += 31
+
+        assert CircuitBreaker.get_state("nova-pro") == "half_open"
+        assert CircuitBreaker.allow("nova-pro") is True
+        assert CircuitBreaker.allow("nova-pro") is False
+
+        CircuitBreaker.record("nova-pro", 0.2, failed=False)
+
+        assert CircuitBreaker.get_state("nova-pro") == "closed"
+        assert CircuitBreaker.get_states(["nova-pro"])["nova-pro"]["calls"] == 0
+
+    def test_failed_probe_reopens(self, clock):
+        fail("nova-pro", 4)
+        clock.now += 31
+        assert CircuitBreaker.allow("nova-pro")
+
+        fail("nova-pro", 1)
+
+        state = CircuitBreaker.get_states(["nova-pro"])["nova-pro"]
+        assert state["state"] == "open"
+        assert state["reason"] == "probe_failed"
+        assert state["open_until"] == clock.now + 30
+
+    def test_cache_errors_fail_open(self, monkeypatch):
+        def broken(*args, **kwargs):
+            raise ConnectionError("cache down")
+
+        monkeypatch.setattr(circuit_breaker.cache, "get", broken)
+        monkeypatch.setattr(circuit_breaker.cache, "add", broken)
+
+        CircuitBreaker.record("nova-pro", 0.1, failed=True)
+        assert CircuitBreaker.allow("nova-pro") is True
+
+
+class FakeCommandService:
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = 0
+
+    def process_command(self, command, diagram_id=None, current_diagram_data=None):
+        self.calls += 1
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return dict(self.answer)
+
+
+GOOD = {"action": "create_class", "elements": [{"type": "node"}], "confidence": 0.9, "interpretation": "ok"}
+API_ERROR = {"action": "error", "elements": [], "confidence": 0.0, "interpretation": "x", "error": "Bedrock API error"}
+
+
+def command_router(monkeypatch, primary, fallback):
+    monkeypatch.setattr(ModelRouterService, "_initialize_services", lambda self: None)
+    router = ModelRouterService()
+    router._services = {"llama4-maverick": primary, "nova-pro": fallback}
+    return router
+
+
+class TestRouters:
+    """Test that the routers count results and skip open circuits."""
+
+    def test_command_router_skips_open_model(self, monkeypatch, clock):
+        primary, fallback = FakeCommandService(API_ERROR), FakeCommandService(GOOD)
+        router = command_router(monkeypatch, primary, fallback)
+
+        for _ in range(4):
+            router.process_command("crea clase User", model="llama4-maverick")
+        assert CircuitBreaker.is_open("llama4-maverick")
+
+        result = router.process_command("crea clase User", model="llama4-maverick")
+
+        assert primary.calls == 4
+        assert result["metadata"]["model_used"] == "nova-pro"
+        assert router._get_default_model() != "llama4-maverick"
+
+    def test_half_open_callers_without_probe_fall_back(self, monkeypatch, clock):
+        primary, fallback = FakeCommandService(GOOD), FakeCommandService(GOOD)
+        router = command_router(monkeypatch, primary, fallback)
+        fail("llama4-maverick", 4)
+        clock.now += 31
+        assert CircuitBreaker.allow("llama4-maverick")
+
+        result = router.process_command("crea clase User", model="llama4-maverick")
+
+        assert primary.calls == 0
+        assert result["metadata"]["model_used"] == "nova-pro"
+        assert result["metadata"]["hedge_reason"] == "primary_error"
+
+    def test_vision_router_ignores_invalid_images(self, monkeypatch, clock):
+        class FakeVisionService:
+            def __init__(self, error=None):
+                self.error = error
+
+            def process_uml_diagram(self, base64_image, session_id=None, existing_diagram=None):
+                if self.error:
+                    raise self.error
+                return {"nodes": [{"id": "a"}], "edges": [], "metadata": {}}
+
+        monkeypatch.setattr(VisionModelRouterService, "_initialize_services", lambda self: None)
+        router = VisionModelRouterService()
+        router._services = {
+            "llama4-maverick": FakeVisionService(ImageValidationError("too big")),
+            "nova-pro": FakeVisionService(),
+        }
+
+        for _ in range(4):
+            router.process_image("aGk=", model="llama4-maverick")
+        assert CircuitBreaker.get_state("llama4-maverick") == "closed"
+
+        router._services["llama4-maverick"] = FakeVisionService(AWSBedrockError("timeout"))
+        for _ in range(4):
+            router.process_image("aGk=", model="llama4-maverick")
+        result = router.process_image("aGk=", model="llama4-maverick")
+
+        assert CircuitBreaker.is_open("llama4-maverick")
+        assert result["metadata"]["model_used"] == "nova-pro"
+        assert result["metadata"]["model_requested"] == "llama4-maverick"
+
+
+def test_health_reports_circuits(settings, clock):
+    settings.OPENAI_AZURE_API_KEY = "test-key"
+    settings.OPENAI_AZURE_API_BASE = "http://127.0.0.1:9"
+    fail("nova-pro", 4)
+
+    response = views.ai_assistant_health(RequestFactory().get("/api/ai-assistant/health/"))
+    response.render()
+    circuits = json.loads(response.content)["circuits"]
+
+    assert circuits["nova-pro"]["state"] == "open"
+    assert circuits["nova-pro"]["failure_rate"] == 1.0
+    assert circuits["o4-mini"] == {
+        "state": "closed", "calls": 0, "failures": 0, "slow": 0, "failure_rate": None, "slow_rate": None,
+    }
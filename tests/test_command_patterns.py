@@ -0,0 +1,81 @@
+"""
+Tests for the combined bilingual command matcher.
+"""
+
+import pytest
+
+from apps.ai_assistant.services import IncrementalCommandProcessor
+from apps.ai_assistant.services.command_patterns import COMMAND_PATTERNS, match_command
+
+COMMANDS = [
+    ("add attribute email (String) to class User", "en", "add_attribute"),
+    ("please remove method save from class User", "en", "remove_method"),
+    ("ADD COMPOSITION FROM Order TO Item WITH MULTIPLICITY 1..*", "en", "add_relationship"),
+    ("change visibility of name in class User to protected", "en", "change_visibility"),
+    ("agregar atributo correo (String) a clase Usuario", "es", "add_attribute"),
+    ("agregar método login() retornando void a clase Usuario", "es", "add_method"),
+    ("eliminar relación entre Usuario y Pedido", "es", "remove_relationship"),
+    ("renombrar clase Usuario a Cliente", "es", "rename_class"),
+]
+
+
+class TestMatchCommand:
+    """Test rule selection and group numbering."""
+
+    @pytest.mark.parametrize("command,language,rule", COMMANDS)
+    def test_reports_rule_and_language(self, command, language, rule):
+        command_match = match_command(command)
+
+        assert (command_match.language, command_match.rule) == (language, rule)
+        assert command_match.rule_id == f"{language}:{rule}"
+
+    @pytest.mark.parametrize("command,language,rule", COMMANDS)
+    def test_groups_match_the_rule_pattern(self, command, language, rule):
+        expected = COMMAND_PATTERNS[language][rule].search(command)
+        command_match = match_command(command)
+
+        assert command_match.match.groups() == expected.groups()
+        assert command_match.match.lastindex == expected.lastindex
+        assert command_match.match.group(0) == expected.group(0)
+
+    def test_no_match(self):
+        assert match_command("Create class User with name string and age int") is None
+        assert match_command("") is None
+
+    def test_english_command_with_spanish_identifier(self):
+        # "metodo" made keyword-based language detection pick the Spanish rules
+        command_match = match_command("add attribute metodoPago (String) to class Factura")
+
+        assert command_match.rule_id == "en:add_attribute"
+        assert command_match.match.group(1) == "metodoPago"
+
+    def test_keyword_after_unmatched_occurrence(self):
+        command_match = match_command("add a note, then rename class User to Customer")
+
+        assert command_match.rule_id == "en:rename_class"
+        assert command_match.match.group(2) == "Customer"
+
+    def test_command_that_changes_length_when_lowercased(self):
+        command_match = match_command("İ rename class User to Customer")
+
+        assert command_match.match.group(1) == "User"
+
+
+class TestProcessorDispatch:
+    """Test the dispatch table in IncrementalCommandProcessor."""
+
+    def test_delta_reports_matched_rule(self):
+        diagram = {"nodes": [{"id": "u1", "data": {"label": "Usuario", "attributes": [], "methods": []}}],
+                   "edges": []}
+
+        delta = IncrementalCommandProcessor()._try_pattern_match("renombrar clase Usuario a Cliente", diagram)
+
+        assert delta["matched_rule"] == "es:rename_class"
+        assert delta["action"] == "update_node"
+
+    def test_every_rule_has_a_handler(self):
+        processor = IncrementalCommandProcessor()
+
+        for patterns in COMMAND_PATTERNS.values():
+            for rule in patterns:
+                assert callable(getattr(processor, processor.PATTERN_HANDLERS[rule]))
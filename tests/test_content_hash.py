@@ -0,0 +1,142 @@
+"""
+Tests for the structural content hash and its incremental updates.
+"""
+
+import copy
+import json
+import random
+
+import pytest
+
+from apps.ai_assistant.services import diagram_context
+from apps.ai_assistant.services.diagram_context import STYLE_DETAILED, render_diagram_context
+from apps.uml_diagrams.content_hash import ContentHash, clear_leaf_cache, compute_content_hash
+from apps.uml_diagrams.services import apply_delta, apply_deltas
+from apps.uml_diagrams.services.diagram_patch import apply_patch_to_content
+
+
+@pytest.fixture
+def content():
+    return {
+        "nodes": [
+            {"id": "user-1", "type": "class", "data": {"label": "User", "attributes": [{"name": "id"}], "methods": []}},
+            {"id": "order-1", "type": "class", "data": {"label": "Order", "attributes": [], "methods": []}},
+        ],
+        "edges": [{"id": "edge-1", "source": "user-1", "target": "order-1", "data": {}}],
+        "viewport": {"x": 0, "y": 0, "zoom": 1},
+    }
+
+
+def random_delta(rng, content, step):
+    node_ids = [node["id"] for node in content["nodes"]]
+    choice = rng.random()
+    if not node_ids or choice < 0.3:
+        node_id = f"n{step}"
+        return {"action": "add_node", "node_id": node_id,
+                "changes": {"node": {"operation": "create", "value": {"id": node_id, "data": {"label": node_id}}}}}
+    if choice < 0.5 and len(node_ids) > 1:
+        source, target = rng.sample(node_ids, 2)
+        return {"action": "add_edge", "edge_id": f"e{step}",
+                "changes": {"edge": {"operation": "create", "value": {"id": f"e{step}", "source": source, "target": target}}}}
+    if choice < 0.65:
+        return {"action": "delete_node", "node_id": rng.choice(node_ids)}
+    if choice < 0.7:
+        node_id = rng.choice(node_ids)
+        return {"action": "add_node", "node_id": node_id,
+                "changes": {"node": {"operation": "create", "value": {"id": node_id, "data": {"label": "replaced"}}}}}
+    return {"action": "update_node", "node_id": rng.choice(node_ids),
+            "changes": {"data.attributes": {"operation": "append", "value": {"name": f"a{step}"}}}}
+
+
+class TestComputeContentHash:
+    """Test what the root hash does and does not depend on."""
+
+    def test_independent_of_key_and_element_order(self, content):
+        reordered = json.loads(json.dumps(content, sort_keys=True))
+        reordered["nodes"].reverse()
+
+        assert compute_content_hash(reordered) == compute_content_hash(content)
+
+    def test_changes_with_any_element_or_field(self, content):
+        root = compute_content_hash(content)
+
+        renamed = copy.deepcopy(content)
+        renamed["nodes"][0]["data"]["label"] = "Customer"
+        moved = copy.deepcopy(content)
+        moved["viewport"]["zoom"] = 2
+
+        assert compute_content_hash(renamed) != root
+        assert compute_content_hash(moved) != root
+        assert len(root) == 64
+
+    def test_duplicate_elements_do_not_cancel(self, content):
+        doubled = copy.deepcopy(content)
+        doubled["edges"].append(copy.deepcopy(doubled["edges"][0]))
+        empty_edges = copy.deepcopy(content)
+        empty_edges["edges"] = []
+
+        assert len({compute_content_hash(c) for c in (content, doubled, empty_edges)}) == 3
+
+    def test_json_string_and_missing_lists(self, content):
+        assert compute_content_hash(json.dumps(content)) == compute_content_hash(content)
+        assert compute_content_hash({}) == compute_content_hash({"nodes": [], "edges": []})
+
+
+class TestIncrementalUpdates:
+    """Test that a ContentHash observer tracks the full recomputation."""
+
+    def test_random_delta_sequence(self, content):
+        rng = random.Random(3)
+        running = ContentHash(compute_content_hash(content), content=content)
+
+        for step in range(300):
+            apply_delta(content, random_delta(rng, content, step), running)
+            assert running.hexdigest == compute_content_hash(content)
+
+    def test_replace_content_rehashes(self, content):
+        running = ContentHash(content=content)
+        apply_deltas(content, [{"action": "replace_content",
+                                "changes": {"content": {"operation": "replace", "value": {"nodes": [{"id": "x"}]}}}}],
+                     running)
+
+        assert running.hexdigest == compute_content_hash({"nodes": [{"id": "x"}]})
+
+    def test_json_patch_rehashes(self, content):
+        running = ContentHash(content=content)
+        patched = apply_patch_to_content(content, json_patch=[{"op": "replace", "path": "/viewport/zoom", "value": 3}],
+                                         content_hash=running)
+
+        assert running.hexdigest == compute_content_hash(patched)
+
+
+    def test_leaves_remembered_for_the_next_edit(self, content):
+        clear_leaf_cache()
+        running = ContentHash(content=content)
+        apply_delta(content, {"action": "delete_node", "node_id": "order-1"}, running)
+
+        resumed = ContentHash(running.hexdigest)
+        apply_delta(content, {"action": "delete_node", "node_id": "user-1"}, resumed)
+
+        assert resumed.hexdigest == compute_content_hash(content)
+
+    def test_unknown_root_needs_the_document(self, content):
+        clear_leaf_cache()
+
+        with pytest.raises(ValueError):
+            ContentHash(compute_content_hash(content))
+        assert ContentHash(compute_content_hash(content), content=content).hexdigest == compute_content_hash(content)
+
+
+class TestRenderContentKey:
+    """Test that a caller-supplied key replaces hashing the diagram."""
+
+    def test_cached_under_content_key(self, content, monkeypatch):
+        def fail(diagram):
+            raise AssertionError("diagram should not be hashed")
+
+        monkeypatch.setattr(diagram_context, "_content_hash", fail)
+        first = render_diagram_context(content, STYLE_DETAILED, content_key="stored-root")
+        hits = diagram_context._stats["hits"]
+
+        assert render_diagram_context(content, STYLE_DETAILED, content_key="stored-root") == first
+        assert diagram_context._stats["hits"] == hits + 1
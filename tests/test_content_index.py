@@ -0,0 +1,120 @@
+"""
+Tests for the diagram content index and the UMLDiagram methods built on it.
+"""
+
+import pytest
+
+from apps.uml_diagrams.content_index import DiagramContentIndex
+from apps.uml_diagrams.models import UMLDiagram
+
+
+@pytest.fixture
+def content():
+    """React Flow document with three classes and two relationships."""
+    return {
+        "nodes": [
+            {"id": "user-1", "type": "class", "data": {"label": "User", "attributes": [], "methods": []}},
+            {"id": "order-1", "type": "class", "data": {"label": "Order", "attributes": [], "methods": []}},
+            {"id": "item-1", "type": "class", "data": {"label": "Item", "attributes": [], "methods": []}},
+            {"id": "note-1", "type": "note", "data": {"label": "Remember"}},
+        ],
+        "edges": [
+            {"id": "edge-1", "type": "umlRelationship", "source": "user-1", "target": "order-1",
+             "data": {"relationshipType": "ASSOCIATION"}},
+            {"id": "edge-2", "type": "umlRelationship", "source": "order-1", "target": "item-1",
+             "data": {"relationshipType": "COMPOSITION"}},
+        ],
+    }
+
+
+@pytest.fixture
+def diagram(content):
+    """Unsaved diagram whose save() is a no-op."""
+    diagram = UMLDiagram(title="Shop", content=content)
+    diagram.save = lambda *args, **kwargs: None
+    return diagram
+
+
+class TestDiagramContentIndex:
+    """Test index construction and lookups."""
+
+    def test_derives_classes_and_relationships(self, content):
+        index = DiagramContentIndex(content)
+
+        assert [cls["id"] for cls in index.classes] == ["user-1", "order-1", "item-1"]
+        assert index.get_relationship("edge-2")["relationship_type"] == "COMPOSITION"
+        assert index.classes_are_derived and index.relationships_are_derived
+
+    def test_explicit_lists_win(self, content):
+        content["classes"] = [{"id": "c1", "name": "Only"}]
+        index = DiagramContentIndex(content)
+
+        assert index.classes is content["classes"]
+        assert index.get_class("user-1") is None
+        assert index.find_class_by_label("only")["id"] == "c1"
+
+    def test_node_and_edge_maps(self, content):
+        index = DiagramContentIndex(content)
+
+        assert index.find_node_by_label("remember")["id"] == "note-1"
+        assert [edge["id"] for edge in index.get_edges_for_node("order-1")] == ["edge-1", "edge-2"]
+        assert index.find_edge_between("order-1", "user-1")["id"] == "edge-1"
+        assert index.find_edge_between("user-1", "item-1") is None
+
+    def test_json_string_content(self):
+        index = DiagramContentIndex('{"classes": [{"id": "c1", "name": "A"}]}')
+
+        assert index.get_class("c1")["name"] == "A"
+        assert DiagramContentIndex("not json").classes == []
+
+    def test_replace_class_with_new_label_reports_stale(self, content):
+        index = DiagramContentIndex(content)
+
+        assert index.replace_class(0, {**index.classes[0], "attributes": ["x"]})
+        assert index.find_class_by_label("user")["attributes"] == ["x"]
+        assert not index.replace_class(0, {**index.classes[0], "name": "Customer"})
+
+
+class TestUMLDiagramLookups:
+    """Test the model methods that use the index."""
+
+    def test_get_element_by_id(self, diagram):
+        assert diagram.get_element_by_id("order-1")["name"] == "Order"
+        assert diagram.get_element_by_id("edge-1")["target_id"] == "order-1"
+        assert diagram.get_element_by_id("missing") is None
+
+    def test_index_is_reused_until_content_changes(self, diagram):
+        index = diagram.content_index
+        assert diagram.content_index is index
+
+        diagram.content = {"classes": [{"id": "c1", "name": "Fresh"}]}
+        assert diagram.content_index is not index
+        assert diagram.find_class_by_label("fresh")["id"] == "c1"
+
+    def test_update_element_patches_index(self, diagram):
+        index = diagram.content_index
+
+        assert diagram.update_element("edge-1", {"label": "places"})
+        assert diagram.content_index is index
+        assert diagram.content["relationships"][0]["label"] == "places"
+        assert diagram.get_relationships_for_class("user-1")[0]["label"] == "places"
+
+    def test_update_class_rename_rebuilds_label_map(self, diagram):
+        assert diagram.update_class("user-1", {"name": "Customer"})
+
+        assert diagram.find_class_by_label("customer")["id"] == "user-1"
+        assert diagram.find_class_by_label("user") is None
+
+    def test_remove_class_drops_incident_relationships(self, diagram):
+        assert diagram.remove_class("item-1")
+
+        assert [cls["id"] for cls in diagram.get_classes()] == ["user-1", "order-1"]
+        assert [rel["id"] for rel in diagram.get_relationships()] == ["edge-1"]
+        assert diagram.get_element_by_id("edge-2") is None
+        assert not diagram.remove_class("item-1")
+
+    def test_add_class_invalidates(self, diagram):
+        diagram.get_classes()
+        diagram.add_class({"id": "new-1", "name": "Invoice"})
+
+        assert diagram.get_element_by_id("new-1")["name"] == "Invoice"
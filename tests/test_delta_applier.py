@@ -0,0 +1,94 @@
+"""
+Tests for server-side application of diagram DELTAs.
+"""
+
+import json
+
+import pytest
+
+from apps.uml_diagrams.services import DeltaApplyError, apply_delta, apply_deltas
+
+
+@pytest.fixture
+def content():
+    """Diagram with two classes and one relationship."""
+    return {
+        "nodes": [
+            {
+                "id": "user-1",
+                "type": "class",
+                "data": {
+                    "label": "User",
+                    "attributes": [{"id": "a1", "name": "id", "type": "Long", "visibility": "private"}],
+                    "methods": [],
+                },
+            },
+            {"id": "order-1", "type": "class", "data": {"label": "Order", "attributes": [], "methods": []}},
+        ],
+        "edges": [{"id": "edge-1", "source": "user-1", "target": "order-1", "data": {}}],
+    }
+
+
+class TestNodeDeltas:
+    """Test update/add/delete node actions."""
+
+    def test_append_attribute(self, content):
+        apply_delta(content, {
+            "action": "update_node",
+            "node_id": "user-1",
+            "changes": {"data.attributes": {"operation": "append", "value": {"name": "email", "type": "String"}}},
+        })
+        assert [a["name"] for a in content["nodes"][0]["data"]["attributes"]] == ["id", "email"]
+
+    def test_remove_and_update_by_filter(self, content):
+        apply_deltas(content, [
+            {
+                "action": "update_node",
+                "node_id": "user-1",
+                "changes": {"data.attributes": {"operation": "update", "filter": {"name": "id"}, "value": {"visibility": "public"}}},
+            },
+            {
+                "action": "update_node",
+                "node_id": "order-1",
+                "changes": {"data.label": {"operation": "replace", "value": "Purchase"}},
+            },
+        ])
+        assert content["nodes"][0]["data"]["attributes"][0]["visibility"] == "public"
+        assert content["nodes"][1]["data"]["label"] == "Purchase"
+
+        apply_delta(content, {
+            "action": "update_node",
+            "node_id": "user-1",
+            "changes": {"data.attributes": {"operation": "remove", "filter": {"name": "id"}}},
+        })
+        assert content["nodes"][0]["data"]["attributes"] == []
+
+    def test_delete_node_removes_incident_edges(self, content):
+        apply_delta(content, {"action": "delete_node", "node_id": "order-1"})
+        assert [n["id"] for n in content["nodes"]] == ["user-1"]
+        assert content["edges"] == []
+
+    def test_missing_node_raises(self, content):
+        with pytest.raises(DeltaApplyError):
+            apply_delta(content, {"action": "update_node", "node_id": "nope", "changes": {}})
+
+
+class TestEdgeAndContentDeltas:
+    """Test edge actions and whole-document replacement."""
+
+    def test_add_and_delete_edge(self, content):
+        new_edge = {"id": "edge-2", "source": "order-1", "target": "user-1", "data": {}}
+        apply_delta(content, {"action": "add_edge", "edge_id": "edge-2", "changes": {"edge": {"operation": "create", "value": new_edge}}})
+        apply_delta(content, {"action": "delete_edge", "edge_id": "edge-1", "changes": {"edge": {"operation": "delete"}}})
+        assert [e["id"] for e in content["edges"]] == ["edge-2"]
+
+    def test_replace_content_accepts_json_string_document(self):
+        result = apply_delta(json.dumps({"nodes": []}), {
+            "action": "replace_content",
+            "changes": {"content": {"operation": "replace", "value": {"nodes": [{"id": "n"}]}}},
+        })
+        assert result == {"nodes": [{"id": "n"}], "edges": []}
+
+    def test_unknown_action_raises(self, content):
+        with pytest.raises(DeltaApplyError):
+            apply_delta(content, {"action": "explode"})
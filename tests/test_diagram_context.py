@@ -0,0 +1,156 @@
+"""
+Tests for the shared diagram context renderer.
+"""
+
+import pytest
+
+from apps.ai_assistant.services import diagram_context
+from apps.ai_assistant.services.diagram_context import (
+    STYLE_ASSISTANT,
+    STYLE_DETAILED,
+    STYLE_NAMES,
+    STYLE_SUMMARY,
+    clear_diagram_context_cache,
+    count_tokens,
+    get_diagram_context_stats,
+    render_diagram_context,
+)
+
+
+def make_diagram(classes, attributes=3):
+    return {
+        "nodes": [
+            {
+                "id": f"class-{index}",
+                "position": {"x": index, "y": 0},
+                "data": {
+                    "label": f"Entity{index}",
+                    "attributes": [
+                        {"name": f"field{n}", "type": "String", "visibility": "private"} for n in range(attributes)
+                    ],
+                    "methods": [],
+                },
+            }
+            for index in range(classes)
+        ],
+        "edges": [
+            {"id": f"edge-{index}", "source": f"class-{index}", "target": f"class-{index + 1}",
+             "data": {"relationshipType": "ASSOCIATION"}}
+            for index in range(classes - 1)
+        ],
+    }
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    clear_diagram_context_cache()
+    yield
+    clear_diagram_context_cache()
+
+
+class TestRendering:
+    """Test the individual styles."""
+
+    def test_detailed_resolves_endpoint_names(self):
+        context = render_diagram_context(make_diagram(2), STYLE_DETAILED)
+
+        assert "1. Entity0 (ID: class-0)" in context
+        assert "Entity0 → Entity1 (ASSOCIATION)" in context
+        assert "Source ID: class-0" in context
+
+    def test_unknown_endpoint_falls_back_to_id(self):
+        diagram = make_diagram(1)
+        diagram["edges"] = [{"id": "e", "source": "class-0", "target": "ghost", "data": {}}]
+
+        assert "Entity0 → ghost" in render_diagram_context(diagram, STYLE_DETAILED)
+
+    def test_assistant_style_reads_model_shape(self):
+        diagram = {
+            "title": "Shop",
+            "classes": [{"id": "a", "name": "User", "isAbstract": True}, {"id": "b", "name": "Order"}],
+            "relationships": [{"source_id": "a", "target_id": "b", "type": "ASSOCIATION"}],
+        }
+        context = render_diagram_context(diagram, STYLE_ASSISTANT)
+
+        assert "* User (abstracta)" in context
+        assert "User --[ASSOCIATION]-> Order (1:1)" in context
+
+    def test_summary_and_names(self):
+        diagram = make_diagram(3)
+
+        assert "- ASSOCIATION: Entity1 -> Entity2" in render_diagram_context(diagram, STYLE_SUMMARY)
+        assert render_diagram_context(diagram, STYLE_NAMES).startswith("AVAILABLE CLASSES: Entity0, Entity1, Entity2")
+
+    def test_empty_and_unknown_style(self):
+        assert render_diagram_context(None) == ""
+        with pytest.raises(ValueError):
+            render_diagram_context(make_diagram(1), "bogus")
+
+
+class TestTokenBudget:
+    """Test deterministic truncation of large diagrams."""
+
+    def test_large_diagram_fits_budget(self):
+        context = render_diagram_context(make_diagram(300), STYLE_DETAILED, token_budget=2000)
+
+        assert count_tokens(context) <= 2000
+        assert "more classes not shown" in context or "(detail omitted)" in context
+        assert get_diagram_context_stats()["truncated"] == 1
+
+    def test_truncation_is_deterministic(self):
+        diagram = make_diagram(200)
+        first = render_diagram_context(diagram, STYLE_DETAILED, token_budget=1500)
+        clear_diagram_context_cache()
+
+        assert render_diagram_context(diagram, STYLE_DETAILED, token_budget=1500) == first
+
+    def test_focus_class_keeps_detail(self):
+        diagram = make_diagram(300)
+        context = render_diagram_context(
+            diagram, STYLE_DETAILED, token_budget=1500, focus="add email to Entity250"
+        )
+
+        assert "251. Entity250 (ID: class-250)\n   Position" in context
+        assert "300. Entity299 (ID: class-299)\n   Position" not in context
+
+    def test_max_items_caps_the_listing(self):
+        context = render_diagram_context(make_diagram(40), STYLE_SUMMARY, focus="what does Entity35 do?", max_items=10)
+
+        assert context.count(" attributes, ") == 10
+        assert context.count("- ASSOCIATION: ") == 10
+        assert "- Entity35: 3 attributes" in context and "- Entity10: " not in context
+        assert "- ... 30 more classes" in context and "- ... 29 more relationships" in context
+        assert "more" not in render_diagram_context(make_diagram(5), STYLE_SUMMARY, max_items=10)
+
+    def test_small_diagram_is_untouched(self):
+        diagram = make_diagram(3)
+
+        assert "omitted" not in render_diagram_context(diagram, STYLE_DETAILED, token_budget=100000)
+
+
+class TestMemoization:
+    """Test the content-hash memo."""
+
+    def test_same_content_hits_cache(self):
+        diagram = make_diagram(5)
+        render_diagram_context(diagram, STYLE_DETAILED)
+        render_diagram_context(dict(diagram), STYLE_DETAILED)
+
+        stats = get_diagram_context_stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    def test_changed_content_misses(self):
+        diagram = make_diagram(5)
+        before = render_diagram_context(diagram, STYLE_DETAILED)
+        diagram["nodes"][0]["data"]["label"] = "Renamed"
+
+        assert render_diagram_context(diagram, STYLE_DETAILED) != before
+        assert get_diagram_context_stats()["misses"] == 2
+
+    def test_cache_is_bounded(self, settings):
+        settings.AI_DIAGRAM_CONTEXT_CACHE_SIZE = 2
+        for size in range(1, 5):
+            render_diagram_context(make_diagram(size), STYLE_NAMES)
+
+        assert get_diagram_context_stats()["cached"] == 2
+        assert len(diagram_context._cache) == 2
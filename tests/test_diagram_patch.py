@@ -0,0 +1,72 @@
+"""
+Tests for JSON Patch and DELTA application in the patch auto-save mode.
+"""
+
+import pytest
+
+from apps.uml_diagrams.services import JSONPatchError, apply_json_patch
+from apps.uml_diagrams.services.diagram_patch import PatchFormatError, apply_patch_to_content
+
+
+@pytest.fixture
+def content():
+    return {
+        "nodes": [
+            {"id": "a", "position": {"x": 0, "y": 0}, "data": {"label": "A", "attributes": []}},
+            {"id": "b", "position": {"x": 10, "y": 0}, "data": {"label": "B", "attributes": []}},
+        ],
+        "edges": [],
+    }
+
+
+class TestJSONPatch:
+    """Test RFC 6902 operations."""
+
+    def test_replace_add_and_remove(self, content):
+        patched = apply_json_patch(content, [
+            {"op": "replace", "path": "/nodes/0/position/x", "value": 42},
+            {"op": "add", "path": "/nodes/1/data/attributes/-", "value": {"name": "id"}},
+            {"op": "remove", "path": "/nodes/0/data/label"},
+        ])
+        assert patched["nodes"][0]["position"]["x"] == 42
+        assert patched["nodes"][1]["data"]["attributes"] == [{"name": "id"}]
+        assert "label" not in patched["nodes"][0]["data"]
+
+    def test_move_copy_and_test(self, content):
+        patched = apply_json_patch(content, [
+            {"op": "test", "path": "/nodes/1/id", "value": "b"},
+            {"op": "copy", "from": "/nodes/0", "path": "/nodes/-"},
+            {"op": "move", "from": "/nodes/0", "path": "/nodes/1"},
+        ])
+        assert [node["id"] for node in patched["nodes"]] == ["b", "a", "a"]
+
+    def test_pointer_escapes(self):
+        patched = apply_json_patch({"a/b": {"~c": 1}}, [{"op": "replace", "path": "/a~1b/~0c", "value": 2}])
+        assert patched == {"a/b": {"~c": 2}}
+
+    def test_failed_operation_leaves_document_untouched(self, content):
+        with pytest.raises(JSONPatchError):
+            apply_json_patch(content, [
+                {"op": "replace", "path": "/nodes/0/position/x", "value": 99},
+                {"op": "test", "path": "/nodes/0/id", "value": "zzz"},
+            ])
+        assert content["nodes"][0]["position"]["x"] == 0
+
+
+class TestApplyPatchToContent:
+    """Test the shared entry point used by the PATCH endpoint."""
+
+    def test_accepts_single_delta_or_list(self, content):
+        delta = {"action": "update_node", "node_id": "b", "changes": {"data.label": {"operation": "replace", "value": "C"}}}
+        assert apply_patch_to_content(content, deltas=delta)["nodes"][1]["data"]["label"] == "C"
+        assert apply_patch_to_content(content, deltas=[delta, {"action": "delete_node", "node_id": "a"}])["nodes"][0]["id"] == "b"
+
+    def test_content_stored_as_json_string(self):
+        patched = apply_patch_to_content('{"nodes": []}', json_patch=[{"op": "add", "path": "/nodes/-", "value": {"id": "x"}}])
+        assert patched["nodes"] == [{"id": "x"}]
+
+    def test_errors_are_reported_as_patch_format_errors(self, content):
+        with pytest.raises(PatchFormatError):
+            apply_patch_to_content(content, json_patch=[{"op": "remove", "path": "/nodes/7"}])
+        with pytest.raises(PatchFormatError):
+            apply_patch_to_content(content, deltas=[])
@@ -0,0 +1,181 @@
+"""
+Tests for the preprocessing of images sent to the vision models.
+"""
+
+import base64
+import io
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+
+from apps.ai_assistant.services.image_preprocessing import ImagePreprocessor, content_box
+from apps.ai_assistant.services.llama4_vision_service import Llama4VisionService
+from apps.ai_assistant.services.nova_vision_service import NovaVisionService
+
+
+def draw_class_box(size=(1200, 800), box=(100, 100, 500, 400), mode='RGB', background='white'):
+    image = Image.new(mode, size, background)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle(box, outline='black', width=3)
+    draw.text((box[0] + 10, box[1] + 10), "User", fill='black')
+    draw.line([box[0], box[1] + 30, box[2], box[1] + 30], fill='black', width=3)
+    return image
+
+
+def encode(image, image_format='PNG', **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def prepare(base64_image, max_dimension=1568):
+    service = NovaVisionService.__new__(NovaVisionService)
+    base64_data, image_data, image = service._open_image(base64_image)
+    return ImagePreprocessor.prepare(image, image_data, base64_data, max_dimension)
+
+
+def decode(prepared):
+    return Image.open(io.BytesIO(base64.b64decode(prepared.base64)))
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    ImagePreprocessor.reset_stats()
+    yield
+    ImagePreprocessor.reset_stats()
+
+
+class TestImagePreprocessor:
+    """Test what is sent for each kind of upload."""
+
+    def test_large_screenshot_is_scaled_to_the_model_resolution(self):
+        image = draw_class_box(size=(3600, 2400), box=(0, 0, 3599, 2399))
+
+        prepared = prepare(encode(image))
+
+        sent = decode(prepared)
+        assert sent.format == 'PNG' and sent.mode == 'L'
+        assert sent.size == prepared.size == (1568, 1045)
+        assert prepared.original_size == (3600, 2400)
+        assert prepared.crop_box == (0, 0, 3600, 2400)
+        assert len(prepared.data) < prepared.original_bytes
+
+    def test_margins_are_cropped_with_padding(self, settings):
+        settings.AI_IMAGE_CROP_PADDING = 10
+
+        prepared = prepare(encode(draw_class_box()))
+
+        # Outline of width 3 around (100, 100)-(500, 400)
+        assert prepared.size == (401 + 20, 301 + 20)
+        assert prepared.crop_box == (90, 90, 511, 411)
+
+    def test_small_grey_diagram_is_sent_as_uploaded(self):
+        image = draw_class_box(size=(300, 200), box=(0, 0, 299, 199), mode='L')
+        upload = encode(image)
+
+        prepared = prepare('data:image/png;base64,' + upload)
+
+        assert prepared.base64 == upload
+        assert ImagePreprocessor.get_stats()['unchanged'] == 1
+
+    def test_jpeg_stays_jpeg(self):
+        image = draw_class_box(size=(4000, 3000), box=(0, 0, 3999, 2999))
+
+        prepared = prepare(encode(image, 'JPEG', quality=95))
+
+        sent = decode(prepared)
+        assert (prepared.format, sent.format, sent.mode) == ('jpeg', 'JPEG', 'L')
+        assert max(sent.size) == 1568
+
+    def test_output_format_and_colour_settings(self, settings):
+        settings.AI_IMAGE_OUTPUT_FORMAT = 'jpeg'
+        settings.AI_IMAGE_GRAYSCALE = False
+        # A photo of a whiteboard: noise compresses badly as PNG
+        image = Image.merge('RGB', [Image.effect_noise((3000, 2000), 40)] * 3)
+
+        sent = decode(prepare(encode(image)))
+
+        assert (sent.format, sent.mode) == ('JPEG', 'RGB')
+
+    def test_transparent_background_becomes_white(self):
+        image = draw_class_box(size=(3000, 2000), box=(0, 0, 2999, 1999), mode='RGBA', background=(0, 0, 0, 0))
+
+        sent = decode(prepare(encode(image)))
+
+        assert sent.getpixel((sent.width // 2, sent.height // 2)) == 255
+
+    def test_disabled_sends_the_upload(self, settings):
+        settings.AI_IMAGE_PREPROCESSING_ENABLED = False
+        upload = encode(draw_class_box(size=(3600, 2400)))
+
+        prepared = prepare(upload)
+
+        assert prepared.base64 == upload
+        assert ImagePreprocessor.get_stats()['images'] == 0
+
+    def test_stats(self):
+        prepare(encode(draw_class_box(size=(3600, 2400))))
+
+        stats = ImagePreprocessor.get_stats()
+
+        assert stats['images'] == 1
+        assert stats['sent_bytes'] < stats['original_bytes']
+        assert 0 < stats['ratio'] < 1
+        assert stats['avg_ms'] is not None
+
+
+class TestContentBox:
+    """Test the margin detection."""
+
+    def test_noisy_margins_of_a_photo_are_background(self):
+        image = draw_class_box(mode='L')
+        image.putpixel((5, 5), 230)
+
+        assert content_box(image, 0) == (100, 100, 501, 401)
+
+    def test_no_uniform_background_keeps_the_image(self):
+        image = Image.new('L', (200, 100), 'white')
+        image.paste(0, (0, 0, 200, 50))
+
+        assert content_box(image, 0) == (0, 0, 200, 100)
+
+
+class FakeBedrockClient:
+    def __init__(self, answer):
+        self.answer = answer
+        self.bodies = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.bodies.append(json.loads(body))
+        return {'body': io.BytesIO(json.dumps(self.answer).encode())}
+
+
+class TestVisionServices:
+    """Test the preprocessed image in the Bedrock requests."""
+
+    def test_nova_sends_the_prepared_image(self):
+        service = NovaVisionService.__new__(NovaVisionService)
+        service.client = FakeBedrockClient({
+            'output': {'message': {'content': [{'text': '{"nodes": [{"id": "User"}], "edges": []}'}]}},
+            'usage': {'inputTokens': 1000, 'outputTokens': 100},
+        })
+
+        result = service.process_uml_diagram(encode(draw_class_box(size=(3600, 2400))))
+
+        image = service.client.bodies[0]['messages'][0]['content'][0]['image']
+        sent = Image.open(io.BytesIO(base64.b64decode(image['source']['bytes'])))
+        assert image['format'] == 'png'
+        assert list(sent.size) == result['metadata']['image']['size']
+        assert result['metadata']['image']['original_size'] == [3600, 2400]
+
+    def test_llama4_sends_the_prepared_image(self):
+        service = Llama4VisionService.__new__(Llama4VisionService)
+        service.client = FakeBedrockClient({'generation': '{"nodes": [], "edges": []}'})
+
+        result = service.process_uml_diagram(encode(draw_class_box(size=(3600, 2400), box=(0, 0, 3599, 2399))))
+
+        prompt = service.client.bodies[0]['prompt']
+        sent = prompt.split('<image>', 1)[1].split('</image>', 1)[0]
+        assert Image.open(io.BytesIO(base64.b64decode(sent))).size == (1344, 896)
+        assert result['metadata']['image']['bytes'] < result['metadata']['image']['original_bytes']
@@ -0,0 +1,179 @@
+"""
+Tests for batch processing of incremental commands.
+"""
+
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+
+from apps.ai_assistant import views
+from apps.ai_assistant.services import CacheService, IncrementalCommandProcessor
+from apps.ai_assistant.services.incremental_command_processor import CommandNotRecognizedError
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "incremental-batch-tests",
+    }
+}
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = LOCMEM_CACHES
+    cache.clear()
+    CacheService.clear_local()
+    yield
+    CacheService.clear_local()
+
+
+@pytest.fixture
+def diagram():
+    return {
+        "nodes": [
+            {"id": "user-1", "data": {"label": "User", "attributes": [], "methods": []}},
+            {"id": "order-1", "data": {"label": "Order", "attributes": [], "methods": []}},
+        ],
+        "edges": [],
+    }
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    """Processor whose grouped AI call is recorded instead of made."""
+    processor = IncrementalCommandProcessor()
+    processor.ai_calls = []
+
+    def fake_ai(commands, diagram):
+        processor.ai_calls.append((list(commands), [node["data"]["label"] for node in diagram["nodes"]]))
+        return [
+            {"action": "update_node", "node_id": "order-1",
+             "changes": {"data.isAbstract": {"operation": "replace", "value": True}},
+             "description": command}
+            for command in commands
+        ]
+
+    monkeypatch.setattr(processor, "_process_batch_with_ai", fake_ai)
+    return processor
+
+
+class TestProcessBatch:
+    """Test sequential application and grouping of AI leftovers."""
+
+    def test_commands_see_earlier_changes(self, processor, diagram):
+        result = processor.process_batch(
+            ["rename class User to Customer", "add attribute email (String) to class Customer"], "d1", diagram
+        )
+
+        assert [entry["status"] for entry in result["results"]] == ["applied", "applied"]
+        assert result["deltas"][1]["node_id"] == "user-1"
+        assert result["ai_commands"] == 0
+        assert processor.ai_calls == []
+        assert diagram["nodes"][0]["data"]["label"] == "User"
+
+    def test_consecutive_leftovers_go_to_ai_in_one_call(self, processor, diagram):
+        result = processor.process_batch(
+            ["make Order abstract", "Order should be abstract too", "rename class User to Customer"], "d1", diagram
+        )
+
+        assert processor.ai_calls == [(["make Order abstract", "Order should be abstract too"], ["User", "Order"])]
+        assert [entry["source"] for entry in result["results"]] == ["ai", "ai", "pattern"]
+        assert (result["ai_commands"], result["ai_calls"]) == (2, 1)
+
+    def test_ai_commands_see_only_earlier_changes(self, processor, diagram):
+        result = processor.process_batch(
+            ["make Order abstract", "rename class User to Customer", "Order should be abstract too"], "d1", diagram
+        )
+
+        assert processor.ai_calls == [
+            (["make Order abstract"], ["User", "Order"]),
+            (["Order should be abstract too"], ["Customer", "Order"]),
+        ]
+        assert [entry["source"] for entry in result["results"]] == ["ai", "pattern", "ai"]
+        # Deltas come back in command order
+        assert result["deltas"][1]["matched_rule"] == "en:rename_class"
+        assert (result["ai_commands"], result["ai_calls"]) == (2, 2)
+
+    def test_pattern_commands_see_classes_created_by_ai(self, processor, diagram, monkeypatch):
+        def create_class(commands, diagram):
+            return [{"action": "add_node", "node_id": "invoice-1", "description": commands[0], "changes": {
+                "node": {"operation": "create", "value": {
+                    "id": "invoice-1", "data": {"label": "Invoice", "attributes": [], "methods": []},
+                }},
+            }}]
+
+        monkeypatch.setattr(processor, "_process_batch_with_ai", create_class)
+        result = processor.process_batch(
+            ["create an Invoice class for billing", "add attribute total (float) to class Invoice"], "d1", diagram
+        )
+
+        assert [entry["status"] for entry in result["results"]] == ["applied", "applied"]
+        assert [delta["node_id"] for delta in result["deltas"]] == ["invoice-1", "invoice-1"]
+
+    def test_errors_do_not_stop_the_batch(self, processor, diagram):
+        result = processor.process_batch(
+            ["add attribute x (int) to class Missing", "remove method save from class Order"], "d1", diagram
+        )
+
+        assert result["results"][0]["status"] == "error"
+        assert "Missing" in result["results"][0]["error"]
+        assert result["results"][1]["status"] == "applied"
+        assert len(result["deltas"]) == 1
+
+    def test_ai_failure_marks_only_leftovers(self, processor, diagram, monkeypatch):
+        def failing_ai(commands, diagram):
+            raise CommandNotRecognizedError("no model")
+
+        monkeypatch.setattr(processor, "_process_batch_with_ai", failing_ai)
+        result = processor.process_batch(["make Order abstract", "rename class User to Customer"], "d1", diagram)
+
+        assert [entry["status"] for entry in result["results"]] == ["error", "applied"]
+
+    def test_new_elements_get_distinct_ids(self, processor, diagram):
+        result = processor.process_batch(
+            ["add attribute a (int) to class User", "add attribute b (int) to class User"], "d1", diagram
+        )
+
+        ids = [delta["changes"]["data.attributes"]["value"]["id"] for delta in result["deltas"]]
+        assert ids[0] != ids[1]
+
+    def test_every_command_counts_against_the_rate_limit(self, processor, diagram, monkeypatch):
+        monkeypatch.setattr(
+            "apps.ai_assistant.services.incremental_command_processor.RATE_LIMIT_COMMANDS", 3
+        )
+        commands = ["rename class User to A", "rename class A to B"]
+
+        processor.process_batch(commands, "d1", diagram, use_cache=False, session_id="s1")
+        with pytest.raises(ValueError):
+            processor.process_batch(commands, "d1", diagram, use_cache=False, session_id="s1")
+
+    def test_batch_size_limit(self, processor, diagram, settings):
+        settings.AI_INCREMENTAL_BATCH_MAX_COMMANDS = 2
+
+        with pytest.raises(ValueError):
+            processor.process_batch(["rename class User to A"] * 3, "d1", diagram)
+        with pytest.raises(ValueError):
+            processor.process_batch([], "d1", diagram)
+
+
+class TestBatchView:
+    """Test the batch endpoint's request validation and response."""
+
+    def post(self, data):
+        request = APIRequestFactory().post("/api/ai-assistant/incremental-command/batch/", data, format="json")
+        return views.process_incremental_commands_batch(request)
+
+    def test_returns_combined_deltas(self, diagram):
+        response = self.post({
+            "commands": ["rename class User to Customer", "add attribute email (String) to class Customer"],
+            "current_diagram": diagram,
+        })
+
+        assert response.status_code == 200
+        assert response.data["success"]
+        assert len(response.data["deltas"]) == 2
+
+    def test_rejects_bad_commands(self, diagram):
+        assert self.post({"commands": "rename class User to A", "current_diagram": diagram}).status_code == 400
+        assert self.post({"commands": ["ok", ""], "current_diagram": diagram}).status_code == 400
+        assert self.post({"commands": ["rename class User to A"]}).status_code == 400
@@ -0,0 +1,189 @@
+"""
+Tests for the shared JSON extractor against a corpus of malformed model
+generations (tests/data/llm_generations.jsonl), with fuzzing over chunk
+boundaries, truncation points and random corruption.
+"""
+
+import json
+import os
+import random
+
+import pytest
+
+from apps.ai_assistant.services import llama4_command_service
+from apps.ai_assistant.services.command_processor_service import UMLCommandProcessorService
+from apps.ai_assistant.services.incremental_command_processor import IncrementalCommandProcessor
+from apps.ai_assistant.services.json_stream import JSONStreamExtractor, extract_json
+from apps.ai_assistant.services.llama4_command_service import Llama4CommandService
+from apps.ai_assistant.services.nova_command_service import NovaCommandService
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "llm_generations.jsonl")
+
+with open(CORPUS_PATH, encoding="utf-8") as corpus_file:
+    CORPUS = [json.loads(line) for line in corpus_file if line.strip()]
+
+CLEAN = next(entry for entry in CORPUS if entry["name"] == "clean")
+
+
+@pytest.fixture
+def llama4(monkeypatch):
+    monkeypatch.setattr(llama4_command_service, "get_llama4_command_client", lambda: None)
+    return Llama4CommandService()
+
+
+def prepared_text(entry):
+    if entry["preprocess"] == "llama4":
+        return Llama4CommandService._preprocess_response(None, entry["text"])
+    return entry["text"]
+
+
+def run_extractor(entry, chunks):
+    extractor = JSONStreamExtractor(item_keys=entry["item_keys"], required_keys=entry["required"])
+    emitted = []
+    for chunk in chunks:
+        emitted.extend(extractor.feed(chunk))
+    return extractor, emitted, extractor.finish()
+
+
+def item_count(entry, result):
+    return sum(len(result.get(key, [])) for key in entry["item_keys"])
+
+
+def split_randomly(text, rng):
+    if len(text) < 2:
+        return [text]
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 60))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("entry", CORPUS, ids=[entry["name"] for entry in CORPUS])
+class TestCorpus:
+    """Test every recorded generation, whole and in random chunks."""
+
+    def test_expected_result(self, entry):
+        extractor, emitted, result = run_extractor(entry, [prepared_text(entry)])
+
+        if entry["expect"] is None:
+            assert result is None
+            return
+        assert result is not None
+        assert all(key in result for key in entry["required"])
+        assert item_count(entry, result) == entry["expect"]["items"]
+        assert extractor.repaired == entry["expect"]["repaired"]
+
+    def test_chunking_does_not_change_the_result(self, entry):
+        text = prepared_text(entry)
+        _, whole_emitted, whole = run_extractor(entry, [text])
+        rng = random.Random(entry["name"])
+
+        for _ in range(50):
+            _, emitted, result = run_extractor(entry, split_randomly(text, rng))
+            assert result == whole
+            assert emitted == whole_emitted
+
+    def test_emitted_items_are_the_result_items(self, entry):
+        _, emitted, result = run_extractor(entry, [prepared_text(entry)])
+
+        if result is not None and emitted:
+            assert emitted == [item for key in entry["item_keys"] for item in result.get(key, [])]
+
+
+class TestTruncationFuzz:
+    """Cut a valid answer at every position."""
+
+    def test_every_prefix_yields_only_complete_elements(self):
+        full = json.loads(CLEAN["text"])
+        text = CLEAN["text"]
+
+        for end in range(len(text) + 1):
+            extractor = JSONStreamExtractor(required_keys=("action", "elements"))
+            emitted = extractor.feed(text[:end])
+            result = extractor.finish()
+            if result is None:
+                continue
+            assert result["elements"] == full["elements"][:len(result["elements"])]
+            assert emitted == result["elements"]
+            assert extractor.repaired == (end < len(text))
+
+    def test_truncated_answer_keeps_every_closed_element(self):
+        text = CLEAN["text"]
+        last_element_end = text.rindex('"type": "edge"') - 10
+
+        result = extract_json(text[:last_element_end], required_keys=("action", "elements"))
+
+        assert len(result["elements"]) == 2
+        assert result["action"] == "create_class"
+
+
+class TestCorruptionFuzz:
+    """Random edits never raise and never return partial elements."""
+
+    def test_random_edits(self):
+        rng = random.Random(2024)
+        alphabet = '{}[]",:\\ ax0\n'
+
+        for _ in range(2000):
+            chars = list(CLEAN["text"])
+            for _ in range(rng.randint(1, 4)):
+                position = rng.randrange(len(chars))
+                operation = rng.random()
+                if operation < 0.4:
+                    del chars[position]
+                elif operation < 0.8:
+                    chars.insert(position, rng.choice(alphabet))
+                else:
+                    chars[position] = rng.choice(alphabet)
+            text = "".join(chars)
+
+            extractor = JSONStreamExtractor()
+            emitted = []
+            for chunk in split_randomly(text, rng):
+                emitted.extend(extractor.feed(chunk))
+            result = extractor.finish()
+            assert all(isinstance(element, dict) for element in emitted)
+            assert result is None or isinstance(result, dict)
+            if extractor.repaired and isinstance(result.get("elements"), list):
+                assert [element for element in result["elements"] if isinstance(element, dict)] == emitted
+
+
+class TestServices:
+    """Test the services that parse model output with the extractor."""
+
+    def test_llama4_primed_and_truncated(self, llama4):
+        text = next(entry for entry in CORPUS if entry["name"] == "truncated_inside_element")["text"]
+
+        primed = llama4._parse_response(CLEAN["text"].strip()[1:].lstrip() + "<|eot_id|>")
+        truncated = llama4._parse_response(text)
+
+        assert len(primed["elements"]) == 3
+        assert len(truncated["elements"]) == 2
+        assert truncated["action"] == "create_class"
+
+    def test_llama4_without_answer_reports_diagnostics(self, llama4):
+        result = llama4._parse_response("I cannot help with that.")
+
+        assert result["action"] == "error"
+        assert result["diagnostics"]["has_action"] is False
+
+    def test_nova_ignores_braces_in_trailing_explanation(self):
+        text = next(entry for entry in CORPUS if entry["name"] == "explanation_with_braces_after")["text"]
+
+        result = NovaCommandService._parse_response(NovaCommandService.__new__(NovaCommandService), text)
+
+        assert len(result["elements"]) == 3
+
+    def test_o4_mini_extraction(self, settings):
+        settings.OPENAI_AZURE_API_KEY = "test-key"
+        settings.OPENAI_AZURE_API_BASE = "http://127.0.0.1:9"
+        service = UMLCommandProcessorService()
+
+        assert service._extract_and_parse_json("```json\n" + CLEAN["text"] + "\n```")["action"] == "create_class"
+        assert service._extract_and_parse_json("no json here") is None
+
+    def test_incremental_single_delta_is_not_repaired(self):
+        processor = IncrementalCommandProcessor()
+        batch = next(entry for entry in CORPUS if entry["name"] == "batch_deltas_truncated")["text"]
+
+        assert len(processor._parse_ai_content(batch, item_key="deltas")["deltas"]) == 2
+        with pytest.raises(ValueError):
+            processor._parse_ai_content('{"action": "update_node", "node_id": "class-user", "changes": {')
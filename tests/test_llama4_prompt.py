@@ -0,0 +1,74 @@
+"""
+Tests for the Llama 4 command prompt sections.
+"""
+
+from apps.ai_assistant.services import llama4_prompt
+from apps.ai_assistant.services.llama4_prompt import (
+    STATIC_PREFIX,
+    build_command_prompt,
+    get_prompt_stats,
+    get_section_token_counts,
+)
+
+DIAGRAM = {
+    "nodes": [
+        {"id": "class-1", "position": {"x": 100, "y": 100}, "data": {"label": "Customer", "attributes": []}},
+        {"id": "class-2", "position": {"x": 400, "y": 100}, "data": {"label": "Service", "attributes": []}},
+    ],
+    "edges": [{"id": "edge-1", "source": "class-1", "target": "class-2", "data": {}}],
+}
+
+
+class TestPromptStructure:
+    """Test the static prefix and the per-request tail."""
+
+    def test_prefix_is_shared_across_requests(self):
+        first = build_command_prompt("Create class Product", None, timestamp_ms=1)
+        second = build_command_prompt("Add attribute price to Service class", DIAGRAM, timestamp_ms=2)
+
+        assert first.startswith(STATIC_PREFIX)
+        assert second.startswith(STATIC_PREFIX)
+
+    def test_creation_mode_tail(self):
+        tail = build_command_prompt("Create class Product", None, timestamp_ms=123)[len(STATIC_PREFIX):]
+
+        assert "No existing diagram context" in tail
+        assert "ACTIVE MODE: MODE 1 - FULL DIAGRAM CREATION" in tail
+        assert 'Command: "Create class Product"' in tail
+        assert "Timestamp for IDs: 123" in tail
+        assert "FINAL REMINDER" not in tail
+        assert tail.endswith("Begin JSON response immediately:\n")
+
+    def test_incremental_mode_tail(self):
+        tail = build_command_prompt("Add attribute price to Service class", DIAGRAM)[len(STATIC_PREFIX):]
+
+        assert "2. Service (ID: class-2)" in tail
+        assert "Customer → Service" in tail
+        assert "Current diagram has 2 classes and 1 relationships" in tail
+        assert "ACTIVE MODE: MODE 2 - INCREMENTAL UPDATE" in tail
+        assert "FINAL REMINDER FOR THIS REQUEST" in tail
+
+    def test_example_ids_use_placeholder(self):
+        assert '"id": "class-TIMESTAMP-1"' in STATIC_PREFIX
+        assert "YOUR RESPONSE MUST START WITH { AND END WITH }" in STATIC_PREFIX
+
+
+class TestPromptStats:
+    """Test section token counts and build metrics."""
+
+    def test_section_token_counts(self):
+        counts = get_section_token_counts()
+        sections = [name for name, _ in llama4_prompt.STATIC_SECTIONS + llama4_prompt.TAIL_SECTIONS]
+
+        assert set(sections) < set(counts)
+        assert all(counts[name] > 0 for name in sections)
+        assert counts["static_prefix"] >= counts["rules_and_identity"]
+
+    def test_build_metrics(self):
+        before = get_prompt_stats()["builds"]
+        build_command_prompt("Create class Product")
+        stats = get_prompt_stats()
+
+        assert stats["builds"] == before + 1
+        assert stats["last_tail_tokens"] > 0
+        assert stats["static_prefix_tokens"] == get_section_token_counts()["static_prefix"]
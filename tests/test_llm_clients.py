@@ -0,0 +1,190 @@
+"""
+Tests for the shared LLM clients and their connection-pool metrics.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+
+from apps.ai_assistant.services import llm_clients
+from apps.ai_assistant.services.llama4_command_service import get_llama4_command_client
+from apps.ai_assistant.services.llama4_vision_service import get_llama4_vision_client
+from apps.ai_assistant.services.llm_clients import (
+    BEDROCK_POOL,
+    OPENAI_ASYNC_POOL,
+    OPENAI_POOL,
+    PoolStats,
+    build_openai_async_http_client,
+    build_openai_http_client,
+    get_bedrock_client,
+    get_bedrock_config,
+    meter_bedrock_client,
+)
+from apps.ai_assistant.services.nova_command_service import get_nova_command_client
+from apps.ai_assistant.services.nova_vision_service import get_nova_client
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Answers every request with a small JSON body over keep-alive."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        body = json.dumps({'ok': True}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _answer
+    do_POST = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), JSONHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients(settings, monkeypatch):
+    settings.AWS_ACCESS_KEY_ID = 'test-key'
+    settings.AWS_SECRET_ACCESS_KEY = 'test-secret'
+    monkeypatch.setattr(llm_clients, '_bedrock_client', None)
+    monkeypatch.setattr(llm_clients, '_openai_http_client', None)
+    monkeypatch.setattr(PoolStats, '_pools', {})
+
+
+class TestBedrockClient:
+    """Test the shared Bedrock client and its configuration."""
+
+    def test_config_comes_from_settings(self, settings):
+        settings.AI_BEDROCK_MAX_POOL_CONNECTIONS = 40
+        settings.AI_BEDROCK_READ_TIMEOUT = 20.0
+        settings.AI_BEDROCK_RETRY_MODE = 'standard'
+
+        config = get_bedrock_config()
+
+        assert config.max_pool_connections == 40
+        assert config.read_timeout == 20.0
+        assert config.retries == {'mode': 'standard', 'max_attempts': 3}
+        assert config.tcp_keepalive is True
+
+    def test_every_service_shares_one_client(self):
+        client = get_bedrock_client()
+
+        assert client is not None
+        assert get_llama4_command_client() is client
+        assert get_llama4_vision_client() is client
+        assert get_nova_command_client() is client
+        assert get_nova_client() is client
+        assert client.meta.config.max_pool_connections == 64
+        assert PoolStats.get_stats()[BEDROCK_POOL]['max_connections'] == 64
+
+    def test_setting_change_rebuilds_the_client(self, settings):
+        client = get_bedrock_client()
+
+        settings.AI_BEDROCK_MAX_POOL_CONNECTIONS = 8
+
+        rebuilt = get_bedrock_client()
+        assert rebuilt is not client
+        assert rebuilt.meta.config.max_pool_connections == 8
+
+    def test_requests_are_metered(self, http_server):
+        client = meter_bedrock_client(boto3.client(
+            'bedrock-runtime',
+            region_name='us-east-1',
+            endpoint_url=http_server,
+            aws_access_key_id='test-key',
+            aws_secret_access_key='test-secret',
+            config=get_bedrock_config(),
+        ))
+
+        for _ in range(3):
+            response = client.invoke_model(modelId='test-model', body=b'{}')
+            assert json.loads(response['body'].read()) == {'ok': True}
+
+        stats = PoolStats.get_stats()[BEDROCK_POOL]
+        assert stats['requests'] == 3
+        assert stats['in_use'] == 0
+        assert stats['peak_in_use'] == 1
+
+
+class TestOpenAIHttpClient:
+    """Test the pooled httpx clients for Azure OpenAI."""
+
+    def test_sync_client_is_shared_and_metered(self, http_server):
+        client = build_openai_http_client()
+        assert build_openai_http_client() is client
+
+        with client.stream('GET', http_server) as response:
+            assert PoolStats.get_stats()[OPENAI_POOL]['in_use'] == 1
+            response.read()
+        client.get(http_server)
+
+        stats = PoolStats.get_stats()[OPENAI_POOL]
+        assert stats['requests'] == 2
+        assert stats['in_use'] == 0
+        assert stats['max_connections'] == 64
+
+    def test_failed_request_releases_its_slot(self):
+        client = build_openai_http_client()
+
+        with pytest.raises(Exception):
+            client.get('http://127.0.0.1:9')
+
+        assert PoolStats.get_stats()[OPENAI_POOL]['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_async_client_is_metered(self, http_server):
+        client = build_openai_async_http_client()
+        try:
+            response = await client.get(http_server)
+        finally:
+            await client.aclose()
+
+        assert response.json() == {'ok': True}
+        stats = PoolStats.get_stats()[OPENAI_ASYNC_POOL]
+        assert (stats['requests'], stats['in_use']) == (1, 0)
+
+
+class TestPoolStats:
+    """Test the utilisation counters."""
+
+    def test_saturation_and_peak(self):
+        PoolStats.register('test', 2)
+        for _ in range(3):
+            PoolStats.acquire('test')
+        PoolStats.release('test')
+
+        stats = PoolStats.get_stats()['test']
+
+        assert stats['in_use'] == 2
+        assert stats['peak_in_use'] == 3
+        assert stats['saturated'] == 1
+        assert stats['utilisation'] == 1.0
+        assert stats['peak_utilisation'] == 1.5
+
+    def test_reset_keeps_connections_in_use(self):
+        PoolStats.register('test', 4)
+        PoolStats.acquire('test')
+        PoolStats.acquire('test')
+        PoolStats.release('test')
+
+        PoolStats.reset_stats()
+
+        stats = PoolStats.get_stats()['test']
+        assert (stats['in_use'], stats['peak_in_use'], stats['requests']) == (1, 1, 0)
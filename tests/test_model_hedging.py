@@ -0,0 +1,189 @@
+"""
+Tests for hedged command calls in ModelRouterService and the per-model
+latency and win-rate stats.
+"""
+
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+
+from apps.ai_assistant.services.hedging import ModelCallStats
+from apps.ai_assistant.services.model_router_service import ModelRouterService
+
+
+class FakeService:
+    """Command service answering after `delay` seconds."""
+
+    def __init__(self, name, delay=0.0, elements=1, error=None):
+        self.name = name
+        self.delay = delay
+        self.elements = elements
+        self.error = error
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self.calls = 0
+
+    def process_command(self, command, diagram_id=None, current_diagram_data=None):
+        self.calls += 1
+        self.started.set()
+        time.sleep(self.delay)
+        self.finished.set()
+        if self.error:
+            raise self.error
+        if not self.elements:
+            return {
+                'action': 'error',
+                'elements': [],
+                'confidence': 0.0,
+                'interpretation': 'empty',
+                'error': 'Empty elements array - fallback required',
+                'metadata': {'requires_fallback': True},
+            }
+        return {
+            'action': 'create_class',
+            'elements': [{'type': 'node', 'data': {'id': f'{self.name}-{i}'}} for i in range(self.elements)],
+            'confidence': 0.9,
+            'interpretation': self.name,
+        }
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'model-hedging-tests',
+    }
+}
+
+
+@pytest.fixture(autouse=True)
+def hedge_settings(settings):
+    settings.CACHES = LOCMEM_CACHES
+    cache.clear()
+    settings.AI_HEDGE_ENABLED = True
+    settings.AI_HEDGE_DELAY = 0.05
+    settings.MODEL_FALLBACK_ORDER = ['llama4-maverick', 'nova-pro']
+    ModelCallStats.reset_stats()
+    yield
+    ModelCallStats.reset_stats()
+
+
+def make_router(monkeypatch, primary, fallback):
+    monkeypatch.setattr(ModelRouterService, '_initialize_services', lambda self: None)
+    router = ModelRouterService()
+    router._services = {'llama4-maverick': primary, 'nova-pro': fallback}
+    return router
+
+
+class TestHedging:
+    """Test when the fallback runs and whose answer is returned."""
+
+    def test_fast_primary_is_not_hedged(self, monkeypatch):
+        primary, fallback = FakeService('llama'), FakeService('nova')
+        router = make_router(monkeypatch, primary, fallback)
+
+        result = router.process_command('crea clase User', model='llama4-maverick')
+
+        assert result['metadata']['model_used'] == 'llama4-maverick'
+        assert 'hedged' not in result['metadata']
+        assert fallback.calls == 0
+
+    def test_slow_primary_loses_to_hedge(self, monkeypatch):
+        primary, fallback = FakeService('llama', delay=0.6), FakeService('nova', delay=0.01)
+        router = make_router(monkeypatch, primary, fallback)
+
+        start = time.perf_counter()
+        result = router.process_command('crea clase User', model='llama4-maverick')
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.4
+        assert result['metadata']['model_used'] == 'nova-pro'
+        assert result['metadata']['hedged'] is True
+        assert result['metadata']['hedge_reason'] == 'slow_primary'
+        assert result['metadata']['fallback_used'] is True
+        assert result['metadata']['primary_model'] == 'llama4-maverick'
+
+        assert primary.finished.wait(2)
+        stats = ModelCallStats.get_stats()
+        assert stats['hedges']['hedge_wins'] == 1
+        assert stats['models']['nova-pro']['win_rate'] == 1.0
+
+    def test_failing_primary_falls_back_at_once(self, monkeypatch):
+        primary = FakeService('llama', error=RuntimeError('throttled'))
+        fallback = FakeService('nova')
+        router = make_router(monkeypatch, primary, fallback)
+
+        result = router.process_command('crea clase User', model='llama4-maverick')
+
+        assert result['metadata']['model_used'] == 'nova-pro'
+        assert result['metadata']['hedge_reason'] == 'primary_error'
+        assert result['metadata']['hedged'] is False
+        assert ModelCallStats.get_stats()['models']['llama4-maverick']['errors'] == 1
+
+    def test_empty_primary_falls_back(self, monkeypatch):
+        router = make_router(monkeypatch, FakeService('llama', elements=0), FakeService('nova', elements=2))
+
+        result = router.process_command('crea clase User', model='llama4-maverick')
+
+        assert len(result['elements']) == 2
+        assert result['metadata']['fallback_reason'] == 'empty_elements'
+
+    def test_critical_starts_both_and_primary_can_win(self, monkeypatch):
+        primary, fallback = FakeService('llama', delay=0.05), FakeService('nova', delay=0.3)
+        router = make_router(monkeypatch, primary, fallback)
+
+        result = router.process_command('crea clase User', model='llama4-maverick', critical=True)
+
+        assert result['metadata']['model_used'] == 'llama4-maverick'
+        assert result['metadata']['hedge_reason'] == 'critical'
+        assert fallback.finished.wait(2)
+        stats = ModelCallStats.get_stats()
+        assert stats['hedges']['primary_wins'] == 1
+        assert stats['models']['llama4-maverick']['win_rate'] == 1.0
+
+    def test_disabled_hedging_waits_for_the_primary(self, monkeypatch, settings):
+        settings.AI_HEDGE_ENABLED = False
+        primary, fallback = FakeService('llama', delay=0.15), FakeService('nova')
+        router = make_router(monkeypatch, primary, fallback)
+
+        result = router.process_command('crea clase User', model='llama4-maverick')
+
+        assert result['metadata']['model_used'] == 'llama4-maverick'
+        assert fallback.calls == 0
+
+    def test_every_model_failing_returns_error(self, monkeypatch):
+        router = make_router(
+            monkeypatch,
+            FakeService('llama', error=RuntimeError('down')),
+            FakeService('nova', error=RuntimeError('also down')),
+        )
+
+        result = router.process_command('crea clase User', model='llama4-maverick')
+
+        assert result['action'] == 'error'
+        assert result['error'] == 'down'
+        assert result['metadata']['error_occurred'] is True
+
+
+class TestModelCallStats:
+    """Test the latency percentiles."""
+
+    def test_percentiles_over_recorded_calls(self):
+        for ms in range(1, 101):
+            ModelCallStats.record_call('nova-pro', ms / 1000, 'ok')
+        ModelCallStats.record_call('nova-pro', 5.0, 'error')
+
+        stats = ModelCallStats.get_stats()['models']['nova-pro']
+
+        assert (stats['p50_ms'], stats['p95_ms'], stats['p99_ms']) == (51.0, 95.0, 99.0)
+        assert stats['calls'] == 101
+        assert stats['errors'] == 1
+        assert stats['win_rate'] is None
+
+    def test_window_keeps_recent_answers(self, settings):
+        settings.AI_HEDGE_STATS_WINDOW = 10
+        for ms in range(100):
+            ModelCallStats.record_call('o4-mini', ms / 1000, 'ok')
+
+        assert ModelCallStats.get_stats()['models']['o4-mini']['p50_ms'] == 94.0
@@ -0,0 +1,120 @@
+"""
+Tests for the sliding-window rate limiter on both storage backends.
+"""
+
+import threading
+
+import fakeredis
+import pytest
+from django.core.cache import cache
+
+from apps.ai_assistant.services import RateLimiter
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "rate-limiter-tests",
+    }
+}
+
+
+def fake_redis_caches():
+    """django-redis backend talking to an in-memory fakeredis server."""
+    return {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": "redis://fake:6379/0",
+            "KEY_PREFIX": "springcode_cache",
+            "OPTIONS": {
+                "CONNECTION_POOL_KWARGS": {
+                    "connection_class": fakeredis.FakeConnection,
+                    "server": fakeredis.FakeServer(),
+                },
+            },
+        }
+    }
+
+
+@pytest.fixture(params=["redis", "cache"])
+def backend(request, settings):
+    """Run a test against the Lua script and against the generic cache list."""
+    settings.CACHES = fake_redis_caches() if request.param == "redis" else LOCMEM_CACHES
+    settings.AI_RATE_LIMIT_BACKEND = request.param
+    cache.clear()
+    return request.param
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("apps.ai_assistant.services.rate_limiter.time.time", lambda: now[0])
+    return now
+
+
+class TestRateLimiter:
+    """Behaviour shared by both backends."""
+
+    def test_admits_up_to_limit(self, backend, clock):
+        results = [RateLimiter.check_rate_limit("s1", "ask_question", 3, 60) for _ in range(4)]
+
+        assert results[:3] == [(True, None)] * 3
+        assert results[3] == (False, 60)
+
+    def test_window_slides(self, backend, clock):
+        RateLimiter.check_rate_limit("s1", "ask_question", 2, 60)
+        clock[0] += 30
+        RateLimiter.check_rate_limit("s1", "ask_question", 2, 60)
+
+        allowed, retry_after = RateLimiter.check_rate_limit("s1", "ask_question", 2, 60)
+        assert not allowed and retry_after == 30
+
+        clock[0] += 31
+        assert RateLimiter.check_rate_limit("s1", "ask_question", 2, 60) == (True, None)
+
+    def test_cost_counts_several_requests(self, backend, clock):
+        assert RateLimiter.check_rate_limit("s1", "process_command", 5, 60, cost=3) == (True, None)
+        assert not RateLimiter.check_rate_limit("s1", "process_command", 5, 60, cost=3)[0]
+        assert RateLimiter.get_remaining_requests("s1", "process_command", 5, 60) == 2
+        assert RateLimiter.check_rate_limit("s1", "process_command", 5, 60, cost=2) == (True, None)
+
+    def test_remaining_and_reset(self, backend, clock):
+        for _ in range(2):
+            RateLimiter.check_rate_limit("s1", "ask_question", 5, 60)
+
+        assert RateLimiter.get_remaining_requests("s1", "ask_question", 5, 60) == 3
+        assert RateLimiter.get_remaining_requests("s2", "ask_question", 5, 60) == 5
+
+        assert RateLimiter.reset_limit("s1", "ask_question")
+        assert RateLimiter.get_remaining_requests("s1", "ask_question", 5, 60) == 5
+
+
+class TestRedisBackend:
+    """Atomicity of the Lua script."""
+
+    def test_concurrent_checks_never_exceed_limit(self, settings):
+        settings.CACHES = fake_redis_caches()
+        settings.AI_RATE_LIMIT_BACKEND = "auto"
+        allowed = []
+        barrier = threading.Barrier(10)
+
+        def worker():
+            barrier.wait()
+            for _ in range(10):
+                allowed.append(RateLimiter.check_rate_limit("shared", "process_command", 25, 60)[0])
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert allowed.count(True) == 25
+        assert RateLimiter.get_remaining_requests("shared", "process_command", 25, 60) == 0
+
+    def test_auto_falls_back_to_cache_list(self, settings):
+        settings.CACHES = LOCMEM_CACHES
+        settings.AI_RATE_LIMIT_BACKEND = "auto"
+
+        assert RateLimiter._get_redis_client() is None
+        assert RateLimiter.check_rate_limit("s1", "ask_question", 1, 60) == (True, None)
+        assert not RateLimiter.check_rate_limit("s1", "ask_question", 1, 60)[0]
@@ -0,0 +1,119 @@
+"""
+Tests for the process-wide registry of warm AI services.
+"""
+
+import threading
+import time
+
+import pytest
+
+from apps.ai_assistant.services import registry
+from apps.ai_assistant.services.registry import (
+    AI_ASSISTANT,
+    COMMAND_PROCESSOR,
+    INCREMENTAL_PROCESSOR,
+    OPENAI,
+    ServiceRegistry,
+    aget_service,
+    get_service,
+)
+
+
+@pytest.fixture(autouse=True)
+def openai_settings(settings):
+    settings.OPENAI_AZURE_API_KEY = "test-key"
+    settings.OPENAI_AZURE_API_BASE = "http://127.0.0.1:9"
+    ServiceRegistry.reset()
+    yield
+    ServiceRegistry.reset()
+
+
+@pytest.fixture
+def counting_factory(monkeypatch):
+    builds = []
+
+    def build():
+        builds.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setitem(registry.FACTORIES, "counted", build)
+    return builds
+
+
+class TestRegistry:
+    """Test building, sharing and resetting services."""
+
+    def test_concurrent_first_use_builds_once(self, counting_factory):
+        instances = []
+        threads = [threading.Thread(target=lambda: instances.append(get_service("counted"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(counting_factory) == 1
+        assert all(instance is instances[0] for instance in instances)
+        assert ServiceRegistry.get_stats()["counted"]["built"] is True
+
+    def test_failed_build_is_retried(self, monkeypatch):
+        attempts = []
+
+        def build():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ValueError("not configured yet")
+            return "service"
+
+        monkeypatch.setitem(registry.FACTORIES, "flaky", build)
+
+        with pytest.raises(ValueError):
+            get_service("flaky")
+        assert get_service("flaky") == "service"
+
+    def test_services_share_one_openai_service(self):
+        openai_service = get_service(OPENAI)
+
+        assert get_service(AI_ASSISTANT).openai_service is openai_service
+        assert get_service(COMMAND_PROCESSOR).openai_service is openai_service
+        assert get_service(INCREMENTAL_PROCESSOR)._get_openai_service() is openai_service
+
+    def test_setting_change_drops_instances(self, settings):
+        first = get_service(AI_ASSISTANT)
+
+        settings.OPENAI_AZURE_API_BASE = "http://127.0.0.1:10"
+
+        assert get_service(AI_ASSISTANT) is not first
+        assert get_service(OPENAI)._client_options["azure_endpoint"] == "http://127.0.0.1:10"
+
+    def test_incremental_processor_builds_without_openai(self, settings):
+        settings.OPENAI_AZURE_API_KEY = ""
+
+        assert get_service(INCREMENTAL_PROCESSOR)._openai_service is None
+        assert ServiceRegistry.warm([AI_ASSISTANT, INCREMENTAL_PROCESSOR]) == {
+            AI_ASSISTANT: "OPENAI_AZURE_API_KEY and OPENAI_AZURE_API_BASE must be configured in settings",
+            INCREMENTAL_PROCESSOR: None,
+        }
+
+    @pytest.mark.asyncio
+    async def test_aget_builds_on_pool_then_skips_it(self, counting_factory, monkeypatch):
+        first = await aget_service("counted")
+
+        async def no_pool(*args, **kwargs):
+            raise AssertionError("built service must not go through the pool")
+
+        monkeypatch.setattr(registry, "run_in_llm_pool", no_pool)
+
+        assert await aget_service("counted") is first
+        assert counting_factory[0].startswith("llm-call")
+
+
+def test_warm_services_respects_setting(settings, counting_factory):
+    settings.AI_WARM_SERVICES_AT_STARTUP = False
+    registry.warm_services()
+    assert ServiceRegistry.get_stats()[OPENAI]["built"] is False
+
+    settings.AI_WARM_SERVICES_AT_STARTUP = True
+    registry.warm_services()
+    assert ServiceRegistry.get_stats()[OPENAI]["built"] is True
+    assert counting_factory
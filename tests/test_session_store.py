@@ -0,0 +1,217 @@
+"""
+Tests for the diagram session store and its crash-safe journal.
+
+Persistence is exercised through a store subclass that records row writes
+instead of touching the database.
+"""
+
+import threading
+from unittest import mock
+
+import pytest
+from rest_framework.test import APIRequestFactory
+
+from apps.uml_diagrams.models import UMLDiagram
+from apps.uml_diagrams.services.delta_applier import DeltaApplyError
+from apps.uml_diagrams.services.diagram_patch import _patch_live_session
+from apps.uml_diagrams.services.session_store import (
+    DiagramSessionStore,
+    MemorySessionBackend,
+    VersionConflictError,
+)
+
+
+class RecordingSessionStore(DiagramSessionStore):
+    """Session store that keeps rows in a dict."""
+
+    def __init__(self, backend, rows):
+        super().__init__(backend, flush_interval=0)
+        self.rows = rows
+        self.writes = []
+
+    def _load_from_database(self, diagram_id):
+        return self.rows.get(diagram_id, {"nodes": [], "edges": []}), 0
+
+    def _write_to_database(self, diagram_id, content, version):
+        self.rows[diagram_id] = content
+        self.writes.append(diagram_id)
+
+
+def add_node(node_id):
+    return {"action": "add_node", "node_id": node_id, "changes": {"node": {"operation": "create", "value": {"id": node_id}}}}
+
+
+@pytest.fixture
+def rows():
+    return {"d1": {"nodes": [], "edges": []}}
+
+
+@pytest.fixture
+def store(tmp_path, rows):
+    return RecordingSessionStore(MemorySessionBackend(str(tmp_path)), rows)
+
+
+class TestWriteBehind:
+    """Test batching of edits into row writes."""
+
+    def test_edits_are_batched_into_one_write(self, store, rows):
+        store.open("d1")
+        for index in range(50):
+            store.apply("d1", add_node(f"n{index}"))
+
+        assert store.writes == []
+        assert store.flush_dirty() == 1
+        assert len(rows["d1"]["nodes"]) == 50
+        assert store.flush_dirty() == 0
+
+    def test_last_disconnect_flushes_and_evicts(self, store, rows):
+        store.open("d1")
+        store.open("d1")
+        store.apply("d1", add_node("a"))
+
+        store.close("d1")
+        assert store.writes == []
+        store.close("d1")
+
+        assert store.writes == ["d1"]
+        assert not store.is_live("d1")
+
+    def test_version_increments_per_delta(self, store):
+        store.open("d1")
+        assert store.apply("d1", add_node("a")) == 1
+        assert store.apply("d1", add_node("b")) == 2
+
+
+class TestVersionedApply:
+    """Test the compare-and-apply used by the PATCH endpoint."""
+
+    def test_stale_version_is_a_conflict(self, store):
+        store.open("d1")
+        store.apply("d1", add_node("a"))
+
+        with pytest.raises(VersionConflictError) as conflict:
+            store.apply_if_version("d1", 0, [add_node("b")])
+
+        assert conflict.value.current_version == 1
+        assert store.get_snapshot("d1") == ({"nodes": [{"id": "a"}], "edges": []}, 1)
+
+    def test_failing_delta_applies_none(self, store):
+        store.open("d1")
+
+        with pytest.raises(DeltaApplyError):
+            store.apply_if_version("d1", 0, [add_node("a"), {"action": "delete_node", "node_id": "missing"}])
+
+        assert store.get_snapshot("d1") == ({"nodes": [], "edges": []}, 0)
+        content, version = store.apply_if_version("d1", 0, [add_node("a"), add_node("b")])
+        assert (len(content["nodes"]), version) == (2, 2)
+
+    def test_concurrent_patches_on_one_base_version(self, store):
+        store.open("d1")
+        barrier = threading.Barrier(8)
+        outcomes = []
+
+        def patch(index):
+            barrier.wait()
+            try:
+                outcomes.append(_patch_live_session(store, "d1", 0, None, [add_node(f"n{index}")])[1])
+            except VersionConflictError:
+                outcomes.append("conflict")
+
+        threads = [threading.Thread(target=patch, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(outcomes, key=str) == [1] + ["conflict"] * 7
+        assert len(store.get_content("d1")["nodes"]) == 1
+
+
+class TestJournalRecovery:
+    """Test that unflushed edits survive a crashed process."""
+
+    def test_new_process_recovers_unflushed_deltas(self, tmp_path, rows):
+        crashed = RecordingSessionStore(MemorySessionBackend(str(tmp_path)), rows)
+        crashed.open("d1")
+        crashed.apply("d1", add_node("a"))
+        crashed.flush("d1")
+        crashed.apply("d1", add_node("b"))
+
+        restarted = RecordingSessionStore(MemorySessionBackend(str(tmp_path)), rows)
+        assert restarted.flush_dirty() == 1
+        assert [node["id"] for node in rows["d1"]["nodes"]] == ["a", "b"]
+
+    def test_replay_is_idempotent_after_flush(self, tmp_path, rows):
+        crashed = RecordingSessionStore(MemorySessionBackend(str(tmp_path)), rows)
+        crashed.open("d1")
+        crashed.apply("d1", add_node("a"))
+        crashed.flush("d1")
+
+        restarted = RecordingSessionStore(MemorySessionBackend(str(tmp_path)), rows)
+        assert restarted.open("d1")["nodes"] == [{"id": "a"}]
+
+
+class TestRedisBackend:
+    """Test the shared Redis backend against fakeredis."""
+
+    @pytest.fixture
+    def redis_store(self, rows):
+        fakeredis = pytest.importorskip("fakeredis")
+        from apps.uml_diagrams.services.session_store import RedisSessionBackend
+
+        backend = RedisSessionBackend("redis://localhost:6379/0")
+        backend.client = fakeredis.FakeRedis(decode_responses=True)
+        return RecordingSessionStore(backend, rows)
+
+    def test_workers_share_live_document(self, redis_store, rows):
+        other_worker = RecordingSessionStore(redis_store.backend, rows)
+        redis_store.open("d1")
+        other_worker.open("d1")
+
+        redis_store.apply("d1", add_node("a"))
+        assert other_worker.apply("d1", add_node("b")) == 2
+
+        redis_store.close("d1")
+        assert redis_store.writes == []
+        other_worker.close("d1")
+        assert [node["id"] for node in rows["d1"]["nodes"]] == ["a", "b"]
+        assert not redis_store.is_live("d1")
+
+    def test_compare_and_apply(self, redis_store):
+        redis_store.open("d1")
+
+        assert redis_store.apply_if_version("d1", 0, [add_node("a"), add_node("b")])[1] == 2
+        with pytest.raises(VersionConflictError):
+            redis_store.apply_if_version("d1", 0, [add_node("c")])
+        with pytest.raises(DeltaApplyError):
+            redis_store.apply_if_version("d1", 2, [add_node("c"), {"action": "delete_node", "node_id": "missing"}])
+        assert redis_store.get_snapshot("d1")[1] == 2
+        assert len(redis_store.get_content("d1")["nodes"]) == 2
+
+
+class TestLiveDiagramViews:
+    """Test PATCH and PUT of a diagram whose room is open."""
+
+    @pytest.mark.parametrize("method, action", [("patch", "partial_update"), ("put", "update")])
+    def test_content_goes_to_the_session_and_other_fields_to_the_row(self, store, settings, method, action):
+        from apps.uml_diagrams.viewsets import anonymous_diagram_viewset as module
+
+        settings.DIAGRAM_SESSION_STORE_ENABLED = True
+        diagram = UMLDiagram(title="Old", content={"nodes": [], "edges": []}, version=0, session_id="s")
+        diagram._state.adding = False
+        store.open(diagram.pk)
+        saves = []
+        request = getattr(APIRequestFactory(), method)(
+            "/api/diagrams/", {"title": "New", "content": {"nodes": [{"id": "a"}], "edges": []}}, format="json"
+        )
+
+        with mock.patch.object(module, "get_diagram_session_store", return_value=store), \
+                mock.patch.object(module.AnonymousDiagramViewSet, "get_object", return_value=diagram), \
+                mock.patch.object(UMLDiagram, "save", lambda self, **kwargs: saves.append(kwargs)):
+            response = module.AnonymousDiagramViewSet.as_view({method: action})(request, pk=str(diagram.pk))
+
+        assert response.status_code == 200
+        assert (response.data["title"], response.data["version"]) == ("New", 1)
+        assert store.get_snapshot(diagram.pk) == ({"nodes": [{"id": "a"}], "edges": []}, 1)
+        # Neither content nor version is written to the row outside the flush
+        assert saves == [{"update_fields": ["title", "last_modified"]}]
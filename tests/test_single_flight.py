@@ -0,0 +1,160 @@
+"""
+Tests for single-flight coalescing of cached AI calls.
+"""
+
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+
+from apps.ai_assistant.services import CacheService, IncrementalCommandProcessor, SingleFlight
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "single-flight-tests",
+    }
+}
+
+KEY = {"method": "ask_question", "question": "What is UML?", "context": None}
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """Local memory cache with fresh counters for every test."""
+    settings.CACHES = LOCMEM_CACHES
+    settings.AI_SINGLE_FLIGHT_WAIT_TIMEOUT = 5
+    cache.clear()
+    CacheService.clear_local()
+    SingleFlight.reset_stats()
+    yield
+    cache.clear()
+    CacheService.clear_local()
+
+
+def lock_key(key_components):
+    return f"{SingleFlight.LOCK_PREFIX}:{CacheService._generate_cache_key(key_components)}"
+
+
+def run_concurrently(func, count):
+    barrier = threading.Barrier(count)
+    results, errors = [None] * count, [None] * count
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = func()
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class TestInProcess:
+    """Test coalescing between threads of one process."""
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"answer": "A modelling language", "sources": []}
+
+        results, errors = run_concurrently(lambda: SingleFlight.do(KEY, compute, ttl=60), 8)
+
+        assert len(calls) == 1
+        assert errors == [None] * 8
+        assert all(result == {"answer": "A modelling language", "sources": []} for result in results)
+        assert len({id(result) for result in results}) == 8
+        assert CacheService.get(KEY)["answer"] == "A modelling language"
+
+        stats = SingleFlight.get_stats()
+        assert stats["leaders"] == 1
+        assert stats["coalesced_local"] == 7
+        assert stats["coalesced"] == 7
+        assert stats["inflight"] == 0
+
+    def test_exception_reaches_followers_and_is_not_cached(self):
+        def compute():
+            time.sleep(0.2)
+            raise ValueError("model unavailable")
+
+        results, errors = run_concurrently(lambda: SingleFlight.do(KEY, compute), 4)
+
+        assert all(isinstance(error, ValueError) for error in errors)
+        assert CacheService.get(KEY) is None
+        assert cache.get(lock_key(KEY)) is None
+        assert SingleFlight.get_stats()["coalesced_local"] == 3
+
+
+class TestAcrossProcesses:
+    """Test the shared-cache lock, with another process simulated by hand."""
+
+    def test_waits_for_lock_holder_result(self):
+        cache.add(lock_key(KEY), "other-process", timeout=60)
+
+        def other_process_finishes():
+            time.sleep(0.2)
+            CacheService.set(KEY, {"answer": "from elsewhere"}, ttl=60)
+            cache.delete(lock_key(KEY))
+
+        threading.Thread(target=other_process_finishes).start()
+
+        result = SingleFlight.do(KEY, lambda: pytest.fail("should not compute"))
+
+        assert result == {"answer": "from elsewhere"}
+        assert SingleFlight.get_stats()["coalesced_remote"] == 1
+
+    def test_computes_when_holder_releases_without_result(self):
+        cache.add(lock_key(KEY), "other-process", timeout=60)
+        threading.Timer(0.1, cache.delete, args=(lock_key(KEY),)).start()
+
+        result = SingleFlight.do(KEY, lambda: {"answer": "computed"})
+
+        assert result == {"answer": "computed"}
+        assert CacheService.get(KEY) == {"answer": "computed"}
+        assert cache.get(lock_key(KEY)) is None
+
+    def test_wait_timeout_computes_without_lock(self, settings):
+        settings.AI_SINGLE_FLIGHT_WAIT_TIMEOUT = 0
+        cache.add(lock_key(KEY), "stuck-process", timeout=60)
+
+        result = SingleFlight.do(KEY, lambda: {"answer": "computed"})
+
+        assert result == {"answer": "computed"}
+        assert cache.get(lock_key(KEY)) == "stuck-process"
+        assert SingleFlight.get_stats()["wait_timeouts"] == 1
+
+
+class TestProcessCommand:
+    """Test coalescing through IncrementalCommandProcessor.process_command."""
+
+    def test_identical_commands_resolve_once(self, monkeypatch):
+        processor = IncrementalCommandProcessor()
+        diagram = {"nodes": [{"id": "user-1", "data": {"label": "User", "attributes": [], "methods": []}}],
+                   "edges": []}
+        calls = []
+        original = processor._compute_delta
+
+        def slow_compute(command, current_diagram):
+            calls.append(command)
+            time.sleep(0.2)
+            return original(command, current_diagram)
+
+        monkeypatch.setattr(processor, "_compute_delta", slow_compute)
+
+        results, errors = run_concurrently(
+            lambda: processor.process_command("add attribute email (String) to class User", "d1", diagram), 5
+        )
+
+        assert errors == [None] * 5
+        assert len(calls) == 1
+        assert all(result == results[0] for result in results)
+        assert SingleFlight.get_stats()["coalesced_local"] == 4
@@ -0,0 +1,231 @@
+"""
+Tests for the perceptual-hash vision result cache.
+"""
+
+import base64
+import io
+import random
+
+import pytest
+from django.core.cache import cache
+from PIL import Image, ImageDraw
+
+from apps.ai_assistant.services.vision_cache import (
+    HASH_BITS,
+    VisionResultCache,
+    _bands,
+    block_difference,
+    fingerprint,
+    hamming_distance,
+)
+from apps.ai_assistant.services.vision_model_router import VisionModelRouterService
+
+
+def draw_diagram(seed, names=None, size=(1200, 800)):
+    """Class boxes with attributes, joined by lines, like a UML screenshot."""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    centres = []
+    for index in range(rng.randint(3, 6)):
+        x, y = rng.randint(20, size[0] - 260), rng.randint(20, size[1] - 220)
+        width, height = rng.randint(160, 240), rng.randint(120, 200)
+        draw.rectangle([x, y, x + width, y + height], outline='black', width=2)
+        draw.line([x, y + 30, x + width, y + 30], fill='black', width=2)
+        draw.text((x + 10, y + 8), (names or {}).get(index, f"Class{seed}_{index}"), fill='black')
+        for row in range(rng.randint(2, 5)):
+            draw.text((x + 10, y + 40 + row * 16), f"- attr{row}: String", fill='black')
+        centres.append((x + width // 2, y + height // 2))
+    for start, end in zip(centres, centres[1:]):
+        draw.line([start, end], fill='black', width=2)
+    return image
+
+
+def encode(image, image_format='PNG', **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class FakeExtraction:
+    """Stands in for a vision service call."""
+
+    def __init__(self, nodes=2, error=None):
+        self.calls = 0
+        self.nodes = nodes
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        metadata = {'processing_time_ms': 4000, 'node_count': self.nodes}
+        if self.error:
+            metadata['error'] = self.error
+        return {
+            'nodes': [{'id': f'node-{i}'} for i in range(self.nodes)],
+            'edges': [],
+            'metadata': metadata,
+            'cost_info': {'input_tokens': 1500, 'output_tokens': 500, 'request_cost_usd': 0.0028},
+        }
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vision-cache-tests',
+    }
+}
+
+
+@pytest.fixture(autouse=True)
+def vision_cache(settings):
+    settings.CACHES = LOCMEM_CACHES
+    cache.clear()
+    VisionResultCache.reset_stats()
+    yield
+    VisionResultCache.reset_stats()
+
+
+@pytest.fixture(scope='module')
+def diagram():
+    return draw_diagram(1)
+
+
+class TestVisionResultCache:
+    """Test which uploads reuse an earlier extraction."""
+
+    def test_recompressed_copy_hits(self, diagram):
+        compute = FakeExtraction()
+        VisionResultCache.get_or_process('nova-pro', encode(diagram), compute, session_id='first')
+
+        result = VisionResultCache.get_or_process(
+            'nova-pro', encode(diagram, 'JPEG', quality=70), compute, session_id='second'
+        )
+
+        assert compute.calls == 1
+        assert len(result['nodes']) == 2
+        assert result['metadata']['cache_hit'] is True
+        assert result['metadata']['session_id'] == 'second'
+        assert result['metadata']['saved_processing_time_ms'] == 4000
+        assert result['cost_info']['request_cost_usd'] == 0.0
+
+        stats = VisionResultCache.get_stats()['models']['nova-pro']
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+        assert stats['saved_ms'] == 4000
+        assert stats['saved_cost_usd'] == 0.0028
+
+    def test_data_url_prefix_is_the_same_image(self, diagram):
+        compute = FakeExtraction()
+        VisionResultCache.get_or_process('nova-pro', encode(diagram), compute)
+
+        result = VisionResultCache.get_or_process('nova-pro', 'data:image/png;base64,' + encode(diagram), compute)
+
+        assert compute.calls == 1
+        assert result['metadata']['cache_distance'] == 0
+
+    def test_renamed_class_is_not_served_the_old_result(self):
+        compute = FakeExtraction()
+        VisionResultCache.get_or_process('nova-pro', encode(draw_diagram(3)), compute)
+
+        VisionResultCache.get_or_process('nova-pro', encode(draw_diagram(3, names={0: 'RenamedClass'})), compute)
+
+        assert compute.calls == 2
+        assert VisionResultCache.get_stats()['models']['nova-pro']['rejected'] == 1
+
+    def test_edited_image_does_not_replace_the_original(self):
+        original, edited = draw_diagram(3), draw_diagram(3, names={0: 'RenamedClass'})
+        compute = FakeExtraction()
+        for image in (original, edited, original, edited):
+            VisionResultCache.get_or_process('nova-pro', encode(image), compute)
+
+        assert compute.calls == 2
+        assert VisionResultCache.get_stats()['models']['nova-pro']['hits'] == 2
+
+    def test_other_diagram_misses(self, diagram):
+        compute = FakeExtraction()
+        VisionResultCache.get_or_process('nova-pro', encode(diagram), compute)
+        VisionResultCache.get_or_process('nova-pro', encode(draw_diagram(2)), compute)
+
+        assert compute.calls == 2
+
+    def test_model_and_context_are_part_of_the_key(self, diagram):
+        compute = FakeExtraction()
+        image = encode(diagram)
+        VisionResultCache.get_or_process('nova-pro', image, compute)
+
+        VisionResultCache.get_or_process('llama4-maverick', image, compute)
+        VisionResultCache.get_or_process('nova-pro', image, compute, context={'nodes': [{'id': 'a'}]})
+
+        assert compute.calls == 3
+
+    def test_failed_extractions_are_not_cached(self, diagram):
+        for compute in (FakeExtraction(nodes=0), FakeExtraction(error='throttled')):
+            VisionResultCache.get_or_process('nova-pro', encode(diagram), compute)
+            VisionResultCache.get_or_process('nova-pro', encode(diagram), compute)
+            assert compute.calls == 2
+
+    def test_unreadable_image_goes_to_the_service(self):
+        compute = FakeExtraction()
+
+        VisionResultCache.get_or_process('nova-pro', 'not an image', compute)
+
+        assert compute.calls == 1
+        assert VisionResultCache.get_stats()['models']['nova-pro']['bypassed'] == 1
+
+    def test_disabled_cache_always_computes(self, diagram, settings):
+        settings.AI_VISION_CACHE_ENABLED = False
+        compute = FakeExtraction()
+
+        for _ in range(2):
+            VisionResultCache.get_or_process('nova-pro', encode(diagram), compute)
+
+        assert compute.calls == 2
+
+
+class TestFingerprint:
+    """Test the hash, its band index and the thumbnail check."""
+
+    def test_copies_are_near_and_other_diagrams_far(self, diagram):
+        original = fingerprint(base64.b64decode(encode(diagram)))
+        copy = fingerprint(base64.b64decode(encode(diagram, 'JPEG', quality=60)))
+        other = fingerprint(base64.b64decode(encode(draw_diagram(2))))
+
+        assert hamming_distance(original.hash, copy.hash) <= 10
+        assert hamming_distance(original.hash, other.hash) > 10
+        assert block_difference(original, copy) <= 8.0
+
+    def test_hashes_within_the_distance_share_a_band(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            value = rng.getrandbits(HASH_BITS)
+            near = value
+            for bit in rng.sample(range(HASH_BITS), 10):
+                near ^= 1 << bit
+            assert any(a == b for a, b in zip(_bands(value, 11), _bands(near, 11)))
+
+
+class FakeVisionService:
+    def __init__(self):
+        self.calls = 0
+
+    def process_uml_diagram(self, base64_image, session_id=None, existing_diagram=None):
+        self.calls += 1
+        return {'nodes': [{'id': 'User'}], 'edges': [], 'metadata': {'processing_time_ms': 3000}}
+
+
+class TestVisionRouterCache:
+    """Test the router's calls through the cache."""
+
+    def test_repeated_upload_skips_the_model(self, diagram, monkeypatch, settings):
+        settings.VISION_FALLBACK_ORDER = ['nova-pro']
+        service = FakeVisionService()
+        monkeypatch.setattr(VisionModelRouterService, '_initialize_services', lambda self: None)
+        router = VisionModelRouterService()
+        router._services = {'nova-pro': service}
+
+        first = router.process_image(encode(diagram), model='nova-pro')
+        second = router.process_image(encode(diagram, 'JPEG', quality=80), model='nova-pro')
+
+        assert service.calls == 1
+        assert 'cache_hit' not in first['metadata']
+        assert second['metadata']['cache_hit'] is True
+        assert second['metadata']['model_used'] == 'nova-pro'
@@ -0,0 +1,328 @@
+"""
+Tests for the tiled extraction of large diagram images.
+"""
+
+import base64
+import io
+import threading
+
+import pytest
+from django.core.cache import cache
+from PIL import Image, ImageChops, ImageDraw
+
+from apps.ai_assistant.services.nova_vision_service import NovaVisionService
+from apps.ai_assistant.services.vision_model_router import VisionModelRouterService
+from apps.ai_assistant.services.vision_tiling import Tile, merge_tile_results, plan_tiles
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vision-tiling-tests',
+    }
+}
+
+
+def draw_grid_diagram(columns=4, rows=3, size=(2000, 1400), box=(220, 160)):
+    """
+    Class boxes in a grid, each filled with its own colour and joined to
+    the next one by a line.
+
+    Returns:
+        (image, {colour: (label, (left, top, right, bottom))})
+    """
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    layout = {}
+    step_x, step_y = size[0] // columns, size[1] // rows
+    centres = []
+    for row in range(rows):
+        for column in range(columns):
+            index = row * columns + column
+            left = column * step_x + (step_x - box[0]) // 2
+            top = row * step_y + (step_y - box[1]) // 2
+            bounds = (left, top, left + box[0] - 1, top + box[1] - 1)
+            colour = (30 + index * 3, 220 - index * 3, 60 + index * 37 % 160)
+            draw.rectangle(bounds, fill=colour)
+            layout[colour] = (f"Class{index}", bounds)
+            centres.append((left + box[0] // 2, top + box[1] // 2))
+    for start, end in zip(centres, centres[1:]):
+        draw.line([start, end], fill='black', width=2)
+    return image, layout
+
+
+def encode(image):
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _colour_box(image, colour):
+    difference = ImageChops.difference(image, Image.new('RGB', image.size, colour)).convert('L')
+    return difference.point(lambda value: 255 if value == 0 else 0).getbbox()
+
+
+def find_colour(image, colour, step=8):
+    """Bounding box of a colour: found on every step-th pixel, then exactly around it."""
+    coarse = _colour_box(image.resize((image.width // step, image.height // step), Image.NEAREST), colour)
+    if coarse is None:
+        return _colour_box(image, colour)
+    region = (
+        max(0, (coarse[0] - 1) * step),
+        max(0, (coarse[1] - 1) * step),
+        min(image.width, (coarse[2] + 1) * step),
+        min(image.height, (coarse[3] + 1) * step),
+    )
+    left, top, right, bottom = _colour_box(image.crop(region), colour)
+    return left + region[0], top + region[1], right + region[0], bottom + region[1]
+
+
+class ColourVisionService(NovaVisionService):
+    """
+    Reads the class boxes of draw_grid_diagram() from their colours: a class
+    cut by the tile edge comes back with one attribute instead of two.
+    Uploads are validated as by Nova.
+    """
+
+    def __init__(self, layout, fail=False):
+        self.layout = layout
+        self.fail = fail
+        self.calls = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def process_uml_diagram(self, base64_image, session_id=None, existing_diagram=None):
+        with self._lock:
+            self.calls += 1
+            self.threads.add(threading.current_thread().name)
+        if self.fail:
+            raise RuntimeError("model down")
+        image = Image.open(io.BytesIO(base64.b64decode(base64_image))).convert('RGB')
+        present = {colour for _, colour in image.getcolors(1 << 16)}
+        nodes, seen = [], []
+        for colour, (label, bounds) in self.layout.items():
+            if colour not in present:
+                continue
+            left, top, right, bottom = find_colour(image, colour)
+            complete = (right - left, bottom - top) == (bounds[2] - bounds[0] + 1, bounds[3] - bounds[1] + 1)
+            nodes.append({
+                'id': f'n{len(nodes)}',
+                'data': {
+                    'label': label,
+                    'attributes': [{'name': 'id'}, {'name': 'name'}] if complete else [{'name': 'id'}],
+                    'methods': [],
+                },
+                'position': {'x': left, 'y': top},
+                'type': 'class',
+            })
+            seen.append(int(label[5:]))
+        edges = []
+        for node in nodes:
+            index = int(node['data']['label'][5:])
+            if index + 1 in seen:
+                target = nodes[seen.index(index + 1)]
+                # Endpoints by tile id, or by class name as some models do
+                edges.append({
+                    'id': f'e{index}',
+                    'source': node['id'],
+                    'target': target['data']['label'] if index % 2 else target['id'],
+                    'data': {'relationshipType': 'ASSOCIATION'},
+                })
+        return {
+            'nodes': nodes,
+            'edges': edges,
+            'metadata': {'processing_time_ms': 100},
+            'cost_info': {'input_tokens': 1000, 'request_cost_usd': 0.001},
+        }
+
+
+@pytest.fixture(autouse=True)
+def tiling_settings(settings):
+    settings.CACHES = LOCMEM_CACHES
+    settings.AI_VISION_TILE_MIN_DIMENSION = 1500
+    settings.AI_VISION_TILE_SIZE = 700
+    settings.AI_VISION_TILE_OVERLAP = 160
+    settings.VISION_FALLBACK_ORDER = ['llama4-maverick', 'nova-pro']
+    cache.clear()
+
+
+def make_router(monkeypatch, **services):
+    monkeypatch.setattr(VisionModelRouterService, '_initialize_services', lambda self: None)
+    router = VisionModelRouterService()
+    router._services = services
+    return router
+
+
+def inside(bounds, tile):
+    return tile.left <= bounds[0] and tile.top <= bounds[1] and bounds[2] < tile.right and bounds[3] < tile.bottom
+
+
+class TestPlanTiles:
+    """Test where large images are cut."""
+
+    def test_every_class_lies_whole_in_a_tile(self):
+        image, layout = draw_grid_diagram()
+
+        tiles = plan_tiles(image)
+
+        assert len(tiles) == 6
+        for label, bounds in layout.values():
+            assert any(inside(bounds, tile) for tile in tiles), label
+        # Cells of 1720 / 3 pixels, cuts moved up to 80 pixels into the whitespace
+        for tile in tiles:
+            assert tile.right - tile.left <= 1720 // 3 + 2 * 80 + 2 * 160
+
+    def test_margins_and_blank_tiles_are_skipped(self):
+        image = Image.new('RGB', (3000, 3000), 'white')
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((300, 300, 700, 600), outline='black', width=3)
+        draw.rectangle((2300, 2300, 2700, 2600), outline='black', width=3)
+
+        tiles = plan_tiles(image)
+
+        # 2400x2300 of content makes a 4x4 grid; only the corner cells have ink
+        assert len(tiles) == 2
+        assert tiles[0].left >= 300 - 160 and tiles[-1].bottom <= 2601 + 160
+
+    def test_small_content_is_one_tile(self):
+        image, _ = draw_grid_diagram(columns=1, rows=1, size=(600, 500))
+
+        assert len(plan_tiles(image)) == 1
+
+    def test_tile_count_is_capped(self, settings):
+        settings.AI_VISION_MAX_TILES = 4
+        image, _ = draw_grid_diagram(columns=6, rows=4, size=(4000, 2800))
+
+        assert len(plan_tiles(image)) <= 4
+
+
+class TestMergeTileResults:
+    """Test how overlapping extractions become one diagram."""
+
+    def test_classes_seen_twice_are_merged(self):
+        left = {
+            'nodes': [
+                {'id': 'a', 'data': {'label': 'User', 'attributes': [{'name': 'id'}]}, 'position': {'x': 500, 'y': 40}},
+                {'id': 'b', 'data': {'label': 'Order', 'attributes': []}, 'position': {'x': 10, 'y': 5}},
+            ],
+            'edges': [{'id': 'x', 'source': 'b', 'target': 'a', 'data': {'relationshipType': 'ASSOCIATION'}}],
+            # Sent at half size
+            'metadata': {'image': {'size': [400, 300], 'original_size': [800, 600]}},
+        }
+        right = {
+            'nodes': [{
+                'id': 'a',
+                'data': {'label': ' user ', 'attributes': [{'name': 'id'}, {'name': 'email'}]},
+                'position': {'x': 100, 'y': 20},
+            }],
+            'edges': [{
+                'id': 'y', 'source': 'Order', 'target': 'a',
+                'data': {'relationshipType': 'ASSOCIATION', 'targetMultiplicity': '*'},
+            }],
+        }
+
+        merged = merge_tile_results([(Tile(0, 0, 800, 600), left), (Tile(900, 0, 1700, 600), right)])
+
+        assert [node['data']['label'] for node in merged['nodes']] == ['Order', ' user ']
+        assert [node['id'] for node in merged['nodes']] == ['class-1', 'class-2']
+        user = merged['nodes'][1]
+        assert [attribute['name'] for attribute in user['data']['attributes']] == ['id', 'email']
+        assert user['position'] == {'x': 1000, 'y': 20}
+        assert merged['nodes'][0]['position'] == {'x': 20, 'y': 10}
+        assert merged['edges'] == [{
+            'id': 'edge-1', 'source': 'class-1', 'target': 'class-2',
+            'data': {'relationshipType': 'ASSOCIATION', 'targetMultiplicity': '*'},
+        }]
+
+    def test_positions_map_through_the_preprocessing_crop(self):
+        result = {
+            'nodes': [{'id': 'a', 'data': {'label': 'User'}, 'position': {'x': 10, 'y': 20}}],
+            'edges': [],
+            # Margins of 100 and 50 pixels cropped, the 400x300 left sent at half size
+            'metadata': {'image': {'size': [200, 150], 'original_size': [800, 600], 'crop_box': [100, 50, 500, 350]}},
+        }
+
+        merged = merge_tile_results([(Tile(1000, 500, 1800, 1100), result)])
+
+        assert merged['nodes'][0]['position'] == {'x': 1000 + 100 + 20, 'y': 500 + 50 + 40}
+
+    def test_existing_diagram_ids_are_kept(self):
+        result = {'nodes': [
+            {'id': 'n1', 'data': {'label': 'User'}, 'position': {'x': 0, 'y': 0}},
+            {'id': 'n2', 'data': {'label': 'Order'}, 'position': {'x': 0, 'y': 50}},
+        ], 'edges': []}
+        existing = {'nodes': [{'id': 'class-1', 'data': {'label': 'Order'}}]}
+
+        merged = merge_tile_results([(Tile(0, 0, 100, 100), result)], existing)
+
+        ids = {node['data']['label']: node['id'] for node in merged['nodes']}
+        assert ids == {'User': 'class-2', 'Order': 'class-1'}
+
+    def test_edges_to_unknown_classes_are_dropped(self):
+        result = {
+            'nodes': [{'id': 'n1', 'data': {'label': 'User'}}],
+            'edges': [{'id': 'e', 'source': 'n1', 'target': 'Offscreen', 'data': {}}],
+        }
+
+        assert merge_tile_results([(Tile(0, 0, 100, 100), result)])['edges'] == []
+
+
+class TestTiledRouter:
+    """Test large images through VisionModelRouterService.process_image."""
+
+    def test_large_image_is_extracted_in_tiles(self, monkeypatch):
+        image, layout = draw_grid_diagram()
+        service = ColourVisionService(layout)
+        router = make_router(monkeypatch, **{'llama4-maverick': service})
+
+        result = router.process_image(encode(image), model='llama4-maverick', session_id='s1')
+
+        metadata = result['metadata']
+        assert (metadata['tiled'], metadata['tiles'], metadata['failed_tiles']) == (True, 6, 0)
+        assert service.calls == 6
+        assert all(name.startswith('vision-tile') for name in service.threads)
+        assert sorted(node['data']['label'] for node in result['nodes']) == sorted(
+            label for label, _ in layout.values()
+        )
+        assert [node['id'] for node in result['nodes']] == [f'class-{n}' for n in range(1, 13)]
+        for node in result['nodes']:
+            assert len(node['data']['attributes']) == 2
+            bounds = next(bounds for label, bounds in layout.values() if label == node['data']['label'])
+            assert node['position'] == {'x': bounds[0], 'y': bounds[1]}
+        # Class3 -> Class4 and Class7 -> Class8 run across the whole diagram
+        # and share no tile
+        assert len(result['edges']) == 9
+        assert result['cost_info']['request_cost_usd'] == pytest.approx(0.006)
+        assert metadata['model_used'] == 'llama4-maverick'
+
+    def test_failed_tiles_use_the_fallback_model(self, monkeypatch):
+        image, layout = draw_grid_diagram()
+        primary, fallback = ColourVisionService(layout, fail=True), ColourVisionService(layout)
+        router = make_router(monkeypatch, **{'llama4-maverick': primary, 'nova-pro': fallback})
+
+        result = router.process_image(encode(image), model='llama4-maverick')
+
+        assert len(result['nodes']) == 12
+        assert fallback.calls == 6
+        assert result['metadata']['fallback_used'] is True
+
+    def test_images_the_service_rejects_are_not_tiled(self, monkeypatch):
+        image, layout = draw_grid_diagram(columns=8, rows=2, size=(4800, 1400))
+        service = ColourVisionService(layout)
+        router = make_router(monkeypatch, **{'llama4-maverick': service})
+
+        result = router.process_image(encode(image), model='llama4-maverick')
+
+        # Over MAX_DIMENSION: one call, which the real service rejects
+        assert service.calls == 1
+        assert 'tiled' not in result['metadata']
+
+    def test_small_or_untiled_images_go_whole(self, monkeypatch):
+        image, layout = draw_grid_diagram()
+        service = ColourVisionService(layout)
+        router = make_router(monkeypatch, **{'llama4-maverick': service})
+        small, _ = draw_grid_diagram(columns=2, rows=1, size=(900, 400))
+
+        router.process_image(encode(image), model='llama4-maverick', tiled=False)
+        router.process_image(encode(small), model='llama4-maverick')
+
+        assert service.calls == 2
@@ -0,0 +1,93 @@
+"""
+Tests for room fan-out of the anonymous diagram consumers.
+
+Covers the local registry fast path and the channel layer group path
+(exercised with the in-memory layer, which shares the group semantics of
+channels_redis).
+"""
+
+import pytest
+from channels.testing import WebsocketCommunicator
+from django.test import override_settings
+
+from apps.websockets.anonymous_consumers import AnonymousUMLDiagramConsumer
+from apps.websockets.broadcast import (
+    BROADCAST_MODE_CHANNEL_LAYER,
+    BROADCAST_MODE_LOCAL,
+    get_room_peers,
+    resolve_broadcast_mode,
+)
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+REDIS_LAYERS = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}}
+
+
+class SessionlessDiagramConsumer(AnonymousUMLDiagramConsumer):
+    """Consumer without the database session bookkeeping."""
+
+    async def add_session_to_diagram(self):
+        return True
+
+    async def remove_session_from_diagram(self):
+        return True
+
+
+async def connect(diagram_id, session_id):
+    communicator = WebsocketCommunicator(
+        SessionlessDiagramConsumer.as_asgi(), f"/ws/diagram/{diagram_id}/"
+    )
+    communicator.scope['url_route'] = {'kwargs': {'diagram_id': diagram_id, 'session_id': session_id}}
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+class TestResolveBroadcastMode:
+    """Test selection of the fan-out path."""
+
+    @override_settings(WEBSOCKET_BROADCAST_MODE='auto', CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+    def test_auto_uses_local_registry_for_in_memory_layer(self):
+        assert resolve_broadcast_mode() == BROADCAST_MODE_LOCAL
+
+    @override_settings(WEBSOCKET_BROADCAST_MODE='auto', CHANNEL_LAYERS=REDIS_LAYERS)
+    def test_auto_uses_channel_layer_for_redis(self):
+        assert resolve_broadcast_mode() == BROADCAST_MODE_CHANNEL_LAYER
+
+    @override_settings(WEBSOCKET_BROADCAST_MODE='local', CHANNEL_LAYERS=REDIS_LAYERS)
+    def test_explicit_mode_wins(self):
+        assert resolve_broadcast_mode() == BROADCAST_MODE_LOCAL
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('mode', [BROADCAST_MODE_LOCAL, BROADCAST_MODE_CHANNEL_LAYER])
+class TestRoomFanOut:
+    """Test that frames reach every peer except the sender."""
+
+    async def test_frame_reaches_peers_not_sender(self, mode):
+        with override_settings(WEBSOCKET_BROADCAST_MODE=mode, CHANNEL_LAYERS=IN_MEMORY_LAYERS):
+            sender = await connect('room-a', 's1')
+            peer = await connect('room-a', 's2')
+            outsider = await connect('room-b', 's3')
+
+            await sender.send_to(text_data='{"type": "node_update"}')
+
+            assert await peer.receive_from() == '{"type": "node_update"}'
+            assert await sender.receive_nothing()
+            assert await outsider.receive_nothing()
+
+            for communicator in (sender, peer, outsider):
+                await communicator.disconnect()
+
+    async def test_disconnect_leaves_room(self, mode):
+        with override_settings(WEBSOCKET_BROADCAST_MODE=mode, CHANNEL_LAYERS=IN_MEMORY_LAYERS):
+            first = await connect('room-c', 's1')
+            second = await connect('room-c', 's2')
+            await second.disconnect()
+
+            await first.send_to(text_data='ping')
+
+            assert await first.receive_nothing()
+            expected_local_peers = 1 if mode == BROADCAST_MODE_LOCAL else 0
+            assert len(get_room_peers('diagram_room-c')) == expected_local_peers
+            await first.disconnect()
+            assert get_room_peers('diagram_room-c') == []
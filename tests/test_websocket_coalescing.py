@@ -0,0 +1,75 @@
+"""
+Tests for coalescing of node position frames.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from apps.websockets.coalescing import PositionCoalescer, position_key
+
+MESSAGE_TYPES = ('node_move', 'cursor_position')
+
+
+def move(node_id, x):
+    return json.dumps({'type': 'node_move', 'node_id': node_id, 'position': {'x': x, 'y': 0}})
+
+
+@pytest.fixture
+def forwarded():
+    return []
+
+
+@pytest.fixture
+def coalescer(forwarded):
+    async def forward(text_data):
+        forwarded.append(text_data)
+
+    return PositionCoalescer(forward, tick_hz=50, message_types=MESSAGE_TYPES)
+
+
+class TestPositionKey:
+    """Test recognition of position frames."""
+
+    def test_node_frames_keyed_by_node_id(self):
+        assert position_key(move('a', 1), MESSAGE_TYPES) == position_key(move('a', 9), MESSAGE_TYPES)
+        assert position_key(move('a', 1), MESSAGE_TYPES) != position_key(move('b', 1), MESSAGE_TYPES)
+
+    def test_cursor_frames_keyed_by_session(self):
+        frame = json.dumps({'type': 'cursor_position', 'session_id': 's1', 'position': {'x': 1, 'y': 2}})
+        assert position_key(frame, MESSAGE_TYPES) == ('cursor_position', 'session', 's1')
+
+    def test_other_frames_are_not_positions(self):
+        assert position_key(json.dumps({'type': 'diagram_update'}), MESSAGE_TYPES) is None
+        assert position_key('not json', MESSAGE_TYPES) is None
+
+
+@pytest.mark.asyncio
+class TestPositionCoalescer:
+    """Test buffering and flushing per tick."""
+
+    async def test_only_latest_position_per_node_is_flushed(self, coalescer, forwarded):
+        for x in range(20):
+            await coalescer.submit(move('a', x))
+        await coalescer.submit(move('b', 1))
+
+        assert forwarded == []
+        await asyncio.sleep(coalescer.interval * 3)
+
+        assert forwarded == [move('a', 19), move('b', 1)]
+
+    async def test_other_frames_pass_through_after_pending_positions(self, coalescer, forwarded):
+        update = json.dumps({'type': 'diagram_update', 'content': {}})
+
+        await coalescer.submit(move('a', 1))
+        await coalescer.submit(update)
+
+        assert forwarded == [move('a', 1), update]
+
+    async def test_close_flushes_pending_frames(self, coalescer, forwarded):
+        await coalescer.submit(move('a', 5))
+        await coalescer.close()
+
+        assert forwarded == [move('a', 5)]
+        assert coalescer.received == 1
@@ -0,0 +1,137 @@
+"""
+Tests for per-connection outbound queues and slow consumer policies.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from apps.websockets.outbound import (
+    OutboundQueue,
+    POLICY_COALESCE,
+    POLICY_DISCONNECT,
+    POLICY_DROP_OLDEST,
+    SLOW_CONSUMER_CLOSE_CODE,
+    coalesce_key,
+    get_outbound_stats,
+)
+
+
+class FakeConnection:
+    """Records frames; blocks sends until released to simulate a slow client."""
+
+    def __init__(self, blocked=False):
+        self.frames = []
+        self.close_codes = []
+        self.released = asyncio.Event()
+        if not blocked:
+            self.released.set()
+
+    async def send(self, text_data):
+        await self.released.wait()
+        self.frames.append(text_data)
+
+    async def close(self, code=None):
+        self.close_codes.append(code)
+
+
+def move(node_id, x):
+    return json.dumps({'type': 'node_move', 'node_id': node_id, 'position': {'x': x, 'y': 0}})
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+class TestOutboundQueue:
+    """Test the writer task and overflow handling."""
+
+    async def test_frames_delivered_in_order(self):
+        connection = FakeConnection()
+        queue = OutboundQueue(connection.send, connection.close, maxsize=8)
+        queue.start()
+
+        for index in range(5):
+            assert queue.put(f"frame-{index}")
+        await settle()
+
+        assert connection.frames == [f"frame-{index}" for index in range(5)]
+        assert queue.depth == 0
+        await queue.stop()
+
+    async def test_drop_oldest_keeps_newest_frames(self):
+        connection = FakeConnection(blocked=True)
+        queue = OutboundQueue(connection.send, connection.close, maxsize=3, policy=POLICY_DROP_OLDEST)
+        queue.start()
+        await settle()
+
+        for index in range(6):
+            queue.put(f"frame-{index}")
+        await settle()
+
+        assert queue.dropped >= 2
+        connection.released.set()
+        await settle()
+        assert connection.frames[-3:] == ['frame-3', 'frame-4', 'frame-5']
+        await queue.stop()
+
+    async def test_coalesce_replaces_superseded_frame(self):
+        connection = FakeConnection(blocked=True)
+        queue = OutboundQueue(connection.send, connection.close, maxsize=2, policy=POLICY_COALESCE)
+        queue.start()
+        queue.put(move('a', 0))
+        await settle()
+
+        queue.put(move('a', 1))
+        queue.put(move('b', 1))
+        queue.put(move('a', 2))
+
+        assert queue.coalesced == 1
+        assert queue.dropped == 0
+        connection.released.set()
+        await settle()
+        assert connection.frames == [move('a', 0), move('a', 2), move('b', 1)]
+        await queue.stop()
+
+    async def test_disconnect_policy_closes_slow_consumer(self):
+        connection = FakeConnection(blocked=True)
+        queue = OutboundQueue(connection.send, connection.close, maxsize=2, policy=POLICY_DISCONNECT)
+        queue.start()
+        await settle()
+
+        results = [queue.put(f"frame-{index}") for index in range(4)]
+        await settle()
+
+        assert results[-1] is False
+        assert queue.closed
+        assert connection.close_codes == [SLOW_CONSUMER_CLOSE_CODE]
+        await queue.stop()
+
+    async def test_stats_report_depth_of_slow_peer(self):
+        connection = FakeConnection(blocked=True)
+        queue = OutboundQueue(connection.send, connection.close, maxsize=10, label='diagram_x/slow')
+        queue.start()
+        for index in range(4):
+            queue.put(f"frame-{index}")
+        await settle()
+
+        stats = get_outbound_stats()
+        slow_peer = next(peer for peer in stats['slow_peers'] if peer['connection'] == 'diagram_x/slow')
+        assert slow_peer['depth'] == 3
+        assert stats['max_depth'] >= 3
+        await queue.stop()
+
+
+class TestCoalesceKey:
+    """Test identification of superseding frames."""
+
+    def test_key_uses_type_and_element_id(self):
+        assert coalesce_key(move('a', 1)) == coalesce_key(move('a', 2))
+        assert coalesce_key(move('a', 1)) != coalesce_key(move('b', 1))
+
+    def test_frames_without_identity_are_not_coalesced(self):
+        assert coalesce_key('not json') is None
+        assert coalesce_key(json.dumps({'type': 'chat', 'message': 'hi'})) is None
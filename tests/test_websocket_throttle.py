@@ -0,0 +1,131 @@
+"""
+Tests for the per-IP WebSocket connection limiter.
+"""
+
+import pytest
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from fakeredis import aioredis as fake_aioredis
+
+from apps.websockets.middleware import ConnectionThrottleMiddleware
+from apps.websockets.throttle import (
+    REJECT_CONCURRENT,
+    REJECT_RATE,
+    MemoryThrottleBackend,
+    RedisThrottleBackend,
+    ThrottleLimits,
+)
+
+
+class EchoConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+
+
+def make_backend(kind):
+    if kind == "memory":
+        return MemoryThrottleBackend()
+    return RedisThrottleBackend(client=fake_aioredis.FakeRedis(decode_responses=True))
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    return make_backend(request.param)
+
+
+async def open_connection(app, ip="10.0.0.1"):
+    communicator = WebsocketCommunicator(app, "/ws/test/")
+    communicator.scope["client"] = [ip, 50000]
+    connected, code = await communicator.connect()
+    return communicator, connected, code
+
+
+@pytest.mark.asyncio
+class TestBackends:
+    """Counter semantics shared by both backends."""
+
+    async def test_concurrent_slots_are_released(self, backend):
+        limits = ThrottleLimits(max_per_window=100, rate_window=60, max_concurrent=2, concurrent_ttl=60)
+
+        assert await backend.acquire("ip", limits) is None
+        assert await backend.acquire("ip", limits) is None
+        assert await backend.acquire("ip", limits) == REJECT_CONCURRENT
+        assert await backend.get_active("ip") == 2
+
+        await backend.release("ip")
+        assert await backend.acquire("ip", limits) is None
+        assert await backend.acquire("other", limits) is None
+
+    async def test_rate_limit_counts_attempts(self, backend):
+        limits = ThrottleLimits(max_per_window=2, rate_window=60, max_concurrent=10, concurrent_ttl=60)
+
+        for _ in range(2):
+            assert await backend.acquire("ip", limits) is None
+            await backend.release("ip")
+
+        assert await backend.acquire("ip", limits) == REJECT_RATE
+        assert await backend.get_active("ip") == 0
+
+    async def test_release_never_goes_negative(self, backend):
+        await backend.release("ip")
+        await backend.release("ip")
+
+        assert await backend.get_active("ip") == 0
+
+
+@pytest.mark.asyncio
+class TestMiddleware:
+    """Connections through ConnectionThrottleMiddleware."""
+
+    async def test_rejects_over_limit_with_4003_and_releases_on_disconnect(self, backend, settings):
+        settings.WEBSOCKET_THROTTLE_ENABLED = True
+        settings.WEBSOCKET_THROTTLE_MAX_CONCURRENT = 1
+        app = ConnectionThrottleMiddleware(EchoConsumer.as_asgi(), backend=backend)
+
+        first, connected, _ = await open_connection(app)
+        assert connected
+
+        second, connected, code = await open_connection(app)
+        assert not connected
+        assert code == 4003
+
+        other_ip, connected, _ = await open_connection(app, ip="10.0.0.2")
+        assert connected
+
+        await first.disconnect()
+        await other_ip.disconnect()
+        assert await backend.get_active("10.0.0.1") == 0
+
+        third, connected, _ = await open_connection(app)
+        assert connected
+        await third.disconnect()
+
+    async def test_forwarded_for_header(self, settings):
+        settings.WEBSOCKET_THROTTLE_USE_FORWARDED_FOR = True
+        app = ConnectionThrottleMiddleware(EchoConsumer.as_asgi(), backend=MemoryThrottleBackend())
+        # The client sent a made-up first entry; the proxy appended its address
+        scope = {"client": ["172.16.0.1", 1], "headers": [(b"x-forwarded-for", b"198.51.100.1, 203.0.113.7")]}
+
+        assert app.get_client_ip(scope) == "203.0.113.7"
+
+    async def test_forwarded_for_through_two_proxies(self, settings):
+        settings.WEBSOCKET_THROTTLE_USE_FORWARDED_FOR = True
+        settings.WEBSOCKET_THROTTLE_TRUSTED_PROXIES = 2
+        app = ConnectionThrottleMiddleware(EchoConsumer.as_asgi(), backend=MemoryThrottleBackend())
+        scope = {
+            "client": ["172.16.0.1", 1],
+            "headers": [(b"x-forwarded-for", b"198.51.100.1, 203.0.113.7, 10.1.0.9")],
+        }
+
+        assert app.get_client_ip(scope) == "203.0.113.7"
+        scope["headers"] = []
+        assert app.get_client_ip(scope) == "172.16.0.1"
+
+    async def test_disabled(self, settings):
+        settings.WEBSOCKET_THROTTLE_ENABLED = False
+        settings.WEBSOCKET_THROTTLE_MAX_CONCURRENT = 0
+        app = ConnectionThrottleMiddleware(EchoConsumer.as_asgi(), backend=MemoryThrottleBackend())
+
+        communicator, connected, _ = await open_connection(app)
+        assert connected
+        await communicator.disconnect()